@@ -16,6 +16,9 @@ class ProjectFileAdmin(admin.ModelAdmin):
     list_display = ('id', 'project', 'path', 'file_type', 'size', 'updated_at')
     list_filter = ('file_type',)
     search_fields = ('path', 'project__name')
+    # One blob row per distinct content across all projects: far too many
+    # for a <select>.
+    raw_id_fields = ('blob',)
 
 
 # Agent models
@@ -20,11 +20,14 @@ from .views import (
     preview_input,
     preview_navigate,
     preview_resize,
+    preview_stream,
     VersionControlHistoryView, VersionControlResetView,
     CreateAppView,
     ProjectDirectoriesView,
     # Agent views
     agent_stream,
+    agent_run_stream,
+    agent_run_cancel,
     conversations_list_create,
     conversation_detail,
     conversation_accept,
@@ -45,7 +48,10 @@ builder_patterns = [
     path('<int:project_id>/pages/', ProjectPagesView.as_view(), name='api-project-pages'),
     # The frame/input/navigate/resize endpoints are async views: preview
     # traffic runs on the thread pool instead of ASGI's single sync thread.
+    # The stream endpoint pushes frames as the page repaints (SSE) and holds
+    # no thread at all; frame/ remains the polling fallback.
     path('<int:project_id>/preview/frame/', preview_frame, name='api-preview-frame'),
+    path('<int:project_id>/preview/stream/', preview_stream, name='api-preview-stream'),
     path('<int:project_id>/preview/input/', preview_input, name='api-preview-input'),
     path('<int:project_id>/preview/navigate/', preview_navigate, name='api-preview-navigate'),
     path('<int:project_id>/preview/resize/', preview_resize, name='api-preview-resize'),
@@ -65,6 +71,10 @@ builder_patterns = [
 
 agents_patterns = [
     path('agent/stream/', agent_stream, name='agent_stream'),
+    # Runs outlive their streams: reattach (replaying from Last-Event-ID)
+    # or stop one by the run id its stream announced.
+    path('runs/<str:run_id>/stream/', agent_run_stream, name='agent_run_stream'),
+    path('runs/<str:run_id>/cancel/', agent_run_cancel, name='agent_run_cancel'),
     path('conversations/', conversations_list_create, name='conversations_list_create'),
     path('conversations/<int:conversation_id>/', conversation_detail, name='conversation_detail'),
     path('conversations/<int:conversation_id>/cancel/', conversation_cancel, name='conversation_cancel'),
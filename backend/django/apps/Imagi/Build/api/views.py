@@ -19,8 +19,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from asgiref.sync import sync_to_async
 from django.db import IntegrityError, transaction
-from django.db.models import Case, IntegerField, Value, When
-from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Case, IntegerField, OuterRef, Subquery, TextField, Value, When
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.views.decorators.cache import never_cache
@@ -34,6 +34,10 @@ from ..services.create_file_service import CreateFileService
 from ..services.view_file_service import ViewFileService
 from ..services.delete_file_service import DeleteFileService
 from ..services.models_service import get_model_by_id
+from ..services import (
+    agent_runs, commit_history, conversation_history, conversation_usage, preview_frames,
+    preview_screencast, run_queue,
+)
 from ..services.safe_paths import resolve_safe
 from ..services.browser_preview_service import (
     BrowserNotRunning,
@@ -275,9 +279,10 @@ class ProjectPagesView(BrowserPreviewBaseView):
 # ---------------------------------------------------------------------------
 # Under ASGI, every sync view in the process shares ONE thread, so a frame
 # poll or scroll batch would queue behind whatever other sync view happens to
-# be running (file saves, version control, ...). These four endpoints carry
-# all of the preview's interactive traffic, so they are plain async views
-# that push the blocking CDP work onto the thread pool instead. The installed
+# be running (file saves, version control, ...). These endpoints carry all
+# of the preview's interactive traffic, so they are plain async views that
+# talk to Chromium over the service's asyncio DevTools client: a request
+# waiting on the browser holds no thread at all. The installed
 # DRF has no async APIView support, so they mirror agent_stream's pattern:
 # manual token-only auth, and csrf_exempt is safe for the same reason it is
 # there — only the Authorization header authenticates, and browsers never
@@ -307,15 +312,19 @@ def _preview_json_body(request):
     return data if isinstance(data, dict) else None
 
 
-async def _run_preview_call(request, project_id, call):
-    """Authenticate, resolve the project, then run ``call(service)``.
+async def _run_preview_call(request, project_id, call, frames=None, base_etag=None):
+    """Authenticate, resolve the project, then await ``call(service)``.
 
     ORM work (token auth, project fetch) stays on sync_to_async's default
     thread-sensitive executor — Django's managed sync thread and DB
-    connection. The preview call runs with thread_sensitive=False: it only
-    touches sockets, state files and psutil, never the ORM, and the CDP pool
-    serializes each browser's connection behind its per-entry lock, so
-    concurrent pool threads are safe.
+    connection. ``call`` returns one of the service's async methods
+    (``aframe`` ...), which run on this event loop.
+
+    ``frames`` is the frame encoding the client negotiated (see
+    preview_frames): with one, the payload's frame goes out as the binary
+    body, against the client's ``base_etag``. Tile encoding decodes and
+    re-encodes JPEGs, so it runs on a pool thread; a plain binary frame is
+    just a base64 decode.
     """
     user = await _authenticate_stream_request(request)
     if user is None:
@@ -326,18 +335,33 @@ async def _run_preview_call(request, project_id, call):
         return JsonResponse({'detail': 'Project not found'}, status=404)
 
     try:
-        # The service is constructed inside the pool thread too: its
-        # constructor touches the filesystem, which must not block the loop.
-        payload = await sync_to_async(
-            lambda: call(BrowserPreviewService(project)), thread_sensitive=False
-        )()
+        # The constructor touches the filesystem (sidecar directories).
+        service = await sync_to_async(BrowserPreviewService, thread_sensitive=False)(project)
+        payload = await call(service)
+        if frames == 'tiles':
+            result = await sync_to_async(preview_frames.render, thread_sensitive=False)(
+                payload, project.id, frames, base_etag=base_etag,
+            )
+        elif frames:
+            result = preview_frames.render(payload, project.id, frames, base_etag=base_etag)
+        else:
+            result = payload
     except BrowserNotRunning as e:
         # Session died (browser killed, container restarted): 409 tells the
         # client to offer a restart rather than showing a hard failure.
         return JsonResponse({'running': False, 'error': str(e)}, status=409)
     except BrowserPreviewError as e:
         return JsonResponse({'error': str(e)}, status=400)
-    return JsonResponse(payload)
+    if frames is None:
+        return JsonResponse(result)
+
+    content_type, body, state = result
+    if content_type is None:
+        response = HttpResponse(status=204)
+    else:
+        response = HttpResponse(body, content_type=content_type)
+    response[preview_frames.STATE_HEADER] = preview_frames.state_header(state)
+    return response
 
 
 @csrf_exempt
@@ -348,10 +372,58 @@ async def preview_frame(request, project_id):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     etag = request.GET.get('etag')
     return await _run_preview_call(
-        request, project_id, lambda service: service.frame(etag=etag)
+        request, project_id, lambda service: service.aframe(etag=etag),
+        frames=preview_frames.negotiate(request), base_etag=etag,
     )
 
 
+@csrf_exempt
+@never_cache
+async def preview_stream(request, project_id):
+    """Stream the page as SSE: a frame whenever it repaints, status on changes.
+
+    Replaces frame polling (see preview_screencast). Errors before the
+    stream opens are plain JSON like the other preview endpoints; a 501
+    means this server cannot stream and the client should keep polling.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if preview_screencast.ws_connect is None:
+        return JsonResponse({'error': 'Frame streaming is not available'}, status=501)
+    user = await _authenticate_stream_request(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    project = await sync_to_async(_preview_project)(user, project_id)
+    if project is None:
+        return JsonResponse({'detail': 'Project not found'}, status=404)
+
+    def resolve():
+        service = BrowserPreviewService(project)
+        return (service, *service.screencast_target())
+
+    try:
+        service, state, ws_url = await sync_to_async(resolve, thread_sensitive=False)()
+    except BrowserNotRunning as e:
+        return JsonResponse({'running': False, 'error': str(e)}, status=409)
+    except BrowserPreviewError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    async def event_stream():
+        try:
+            async for event in preview_screencast.screencast(service, state, ws_url):
+                yield _sse(event)
+        except BrowserNotRunning as e:
+            yield _sse({'type': 'stopped', 'error': str(e)})
+        except BrowserPreviewError as e:
+            yield _sse({'type': 'error', 'error': str(e)})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @csrf_exempt
 @never_cache
 async def preview_input(request, project_id):
@@ -363,9 +435,10 @@ async def preview_input(request, project_id):
         return JsonResponse({'error': 'Invalid JSON body'}, status=400)
     return await _run_preview_call(
         request, project_id,
-        lambda service: service.dispatch_input(
+        lambda service: service.adispatch_input(
             data.get('events') or [], etag=data.get('etag')
         ),
+        frames=preview_frames.negotiate(request), base_etag=data.get('etag'),
     )
 
 
@@ -380,7 +453,7 @@ async def preview_navigate(request, project_id):
         return JsonResponse({'error': 'Invalid JSON body'}, status=400)
     return await _run_preview_call(
         request, project_id,
-        lambda service: service.navigate(
+        lambda service: service.anavigate(
             data.get('action') or 'goto', path=data.get('path')
         ),
     )
@@ -397,7 +470,7 @@ async def preview_resize(request, project_id):
         return JsonResponse({'error': 'Invalid JSON body'}, status=400)
     return await _run_preview_call(
         request, project_id,
-        lambda service: service.resize(
+        lambda service: service.aresize(
             data.get('width'), data.get('height'),
             device_scale_factor=data.get('device_scale_factor'),
         ),
@@ -542,19 +615,28 @@ class VersionControlHistoryView(APIView):
             raise NotFound('Project not found')
 
     def get(self, request, project_id):
-        """Get commit history for the project."""
+        """Get one page of commit history (?before=<hash>&limit=N)."""
         try:
             # Get project
             project = self.get_project(project_id)
             
+            try:
+                limit = int(request.query_params.get('limit', commit_history.DEFAULT_PAGE_SIZE))
+            except (TypeError, ValueError):
+                limit = commit_history.DEFAULT_PAGE_SIZE
+            before = request.query_params.get('before') or None
+            
             # Use VersionControlService to get history
             version_service = VersionControlService(project=project)
-            result = version_service.get_commit_history(request.user, project_id)
+            result = version_service.get_commit_history(
+                request.user, project_id, before=before, limit=limit
+            )
             
             if result.get('success'):
                 return Response({
                     'success': True,
-                    'versions': result.get('commits', [])
+                    'versions': result.get('commits', []),
+                    'next_cursor': result.get('next_cursor'),
                 })
             else:
                 return Response({
@@ -776,9 +858,37 @@ def add_cors_headers(response):
     return response
 
 
-def _sse(event: dict) -> str:
-    """Frame one event as an SSE message."""
-    return f"data: {json.dumps(event)}\n\n"
+def _sse(event: dict, event_id=None) -> str:
+    """Frame one event as an SSE message.
+
+    event_id is the event's position in its run's log; a client that lost
+    the stream sends the last one back as Last-Event-ID to resume after it.
+    """
+    if event_id is None:
+        return f"data: {json.dumps(event)}\n\n"
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+
+def _run_event_stream(run_id, after=None):
+    """A StreamingHttpResponse tailing an agent run's event log."""
+    async def event_stream():
+        try:
+            async for event_id, event in agent_runs.tail(run_id, after=after):
+                yield _sse(event, event_id)
+        except Exception as e:  # pragma: no cover - defensive
+            logger.error(f"Error in agent stream: {e}")
+            logger.error(traceback.format_exc())
+            yield _sse({"type": "error", "error": str(e)})
+
+    response = StreamingHttpResponse(
+        event_stream(),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer this response; without it the whole stream is
+    # held back and delivered at once, which defeats the point.
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 async def _authenticate_stream_request(request):
@@ -811,6 +921,10 @@ async def agent_stream(request):
     Same work as the blocking `agent` endpoint, but the client sees text and
     tool activity as they happen instead of waiting for the whole run. The
     terminal "done" event carries the payload `agent` would have returned.
+
+    The first event is {"type": "run", "run_id": ...}, and every event has
+    an SSE id: the run keeps going if this stream drops, and the client
+    resumes it at agent_run_stream with the last id it saw.
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
@@ -850,17 +964,17 @@ async def agent_stream(request):
     # shared canonical tree, so only one of those may be live per project;
     # kind='task' runs edit their own git worktree, so a task is blocked only
     # while that same conversation is already running — tasks run in parallel
-    # with the lead and with each other. Best-effort guard, not a lock: two
-    # simultaneous submits may both pass, which is acceptable — this protects
-    # against a user launching runs that trample each other's file edits, not
-    # against a determined race.
+    # with the lead and with each other. This check also covers runs outside
+    # the run queue (the initial build's); the queue repeats it for queued
+    # runs under its lock when the run is enqueued below, so two
+    # simultaneous submits cannot both pass.
     conversation = None
     if conversation_id:
         conversation = await sync_to_async(
             AgentConversation.objects.filter(id=conversation_id, user=user).first
         )()
     if conversation is not None and conversation.kind == 'task':
-        if _conversation_is_running(conversation):
+        if await sync_to_async(_conversation_is_running)(conversation):
             return JsonResponse({'detail': 'agent_busy'}, status=409)
     else:
         busy = await sync_to_async(_project_has_running_conversation)(
@@ -869,58 +983,96 @@ async def agent_stream(request):
         if busy:
             return JsonResponse({'detail': 'agent_busy'}, status=409)
 
-    # Concurrency ceiling, checked with the allowance below: the allowance is
-    # read before a run and written after it, so unbounded parallel runs would
-    # each be admitted against the same pre-run total.
-    running = await sync_to_async(_user_running_run_count)(
-        user, exclude_conversation_id=conversation_id
+    # Plan usage limits: refuse before the stream opens, following the same
+    # pre-stream JSON contract as the agent_busy 409 above.
+    allowed, limit_payload = await sync_to_async(check_usage_allowed)(user)
+    if not allowed:
+        return JsonResponse(limit_payload, status=429)
+
+    agent_service = ImagiAgentService(model=model, reasoning_effort=reasoning_effort)
+
+    # The run is detached from this response: it executes on the worker's
+    # run scheduler and this stream only tails its log, so a dropped
+    # connection no longer stops it (see agent_runs). It waits in the host's
+    # run queue for a slot rather than being refused when the host, the
+    # model or the user is at capacity; the stream reports its place in line.
+    events = agent_service.process_stream(
+        user_input=message,
+        user=user,
+        model=model,
+        project_id=project_id,
+        current_file=payload.get('current_file'),
+        conversation_id=conversation_id,
+        reasoning_effort=reasoning_effort,
     )
-    if running >= MAX_CONCURRENT_RUNS_PER_USER:
+    try:
+        run_id = await sync_to_async(agent_runs.start)(user.id, events, admission={
+            'project_id': project_id,
+            'conversation_id': conversation_id,
+            'kind': conversation.kind if conversation is not None else 'chat',
+            'model': model,
+        })
+    except run_queue.Busy:
+        await events.aclose()
+        return JsonResponse({'detail': 'agent_busy'}, status=409)
+    except run_queue.QueueFull:
+        await events.aclose()
         return JsonResponse(
             {
-                'error': 'too_many_concurrent_runs',
+                'error': 'too_many_queued_runs',
                 'detail': (
-                    'You already have the maximum number of agent runs in '
-                    'progress. Wait for one to finish and try again.'
+                    'You already have the maximum number of agent runs waiting '
+                    'to start. Wait for one to start and try again.'
                 ),
             },
             status=429,
         )
+    return _run_event_stream(run_id)
 
-    # Plan usage limits: refuse before the stream opens, following the same
-    # pre-stream JSON contract as the agent_busy 409 above.
-    allowed, limit_payload = await sync_to_async(check_usage_allowed)(user)
-    if not allowed:
-        return JsonResponse(limit_payload, status=429)
 
-    agent_service = ImagiAgentService(model=model, reasoning_effort=reasoning_effort)
+@csrf_exempt
+async def agent_run_stream(request, run_id):
+    """Resume an agent run's event stream (SSE).
 
-    async def event_stream():
-        try:
-            async for event in agent_service.process_stream(
-                user_input=message,
-                user=user,
-                model=model,
-                project_id=project_id,
-                current_file=payload.get('current_file'),
-                conversation_id=conversation_id,
-                reasoning_effort=reasoning_effort,
-            ):
-                yield _sse(event)
-        except Exception as e:  # pragma: no cover - defensive
-            logger.error(f"Error in agent stream: {e}")
-            logger.error(traceback.format_exc())
-            yield _sse({"type": "error", "error": str(e)})
+    Replays the run's events after the Last-Event-ID header (or the
+    last_event_id query parameter), then follows the run live until it
+    ends. Authenticated like agent_stream.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
 
-    response = StreamingHttpResponse(
-        event_stream(),
-        content_type='text/event-stream',
-    )
-    response['Cache-Control'] = 'no-cache'
-    # Tell nginx not to buffer this response; without it the whole stream is
-    # held back and delivered at once, which defeats the point.
-    response['X-Accel-Buffering'] = 'no'
-    return response
+    user = await _authenticate_stream_request(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        # A file read: off the event loop, like the preview views' disk work.
+        owner = await sync_to_async(agent_runs.owner, thread_sensitive=False)(run_id)
+    except agent_runs.RunNotFound:
+        owner = None
+    if owner is None or owner.get('user_id') != user.id:
+        return JsonResponse({'error': 'Run not found'}, status=404)
+
+    raw_after = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    try:
+        after = int(raw_after) if raw_after not in (None, '') else None
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid Last-Event-ID'}, status=400)
+    return _run_event_stream(run_id, after=after)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def agent_run_cancel(request, run_id):
+    """Stop an agent run, whichever worker is executing it."""
+    try:
+        owner = agent_runs.owner(run_id)
+    except agent_runs.RunNotFound:
+        owner = None
+    if owner is None or owner.get('user_id') != request.user.id:
+        return Response({'error': 'Run not found'}, status=status.HTTP_404_NOT_FOUND)
+    stopping = agent_runs.cancel(run_id)
+    return Response({'stopping': stopping}, status=status.HTTP_200_OK)
 
 
 # ---------------------------------------------------------------------------
@@ -928,36 +1080,56 @@ async def agent_stream(request):
 # ---------------------------------------------------------------------------
 
 # A run whose marker hasn't been refreshed within this window is treated as
-# not running: a crashed worker never clears run_started_at. Long legitimate
-# runs stay fresh via the streaming loop's heartbeat (base_agent.py), so this
-# measures silence since the last event, not total run duration.
+# not running: a crashed worker never clears run_started_at. Only runs outside
+# the run queue rely on it (the initial build's blocking runs); a queued run is
+# judged by its lease, which expires within a minute of its worker going quiet.
+# Long legitimate runs stay fresh via the streaming loop's heartbeat
+# (base_agent.py), so this measures silence since the last event, not total
+# run duration.
 RUN_STALENESS_WINDOW = timedelta(minutes=10)
 
-# Ceiling on one user's simultaneously-running agent runs, across every project
-# and conversation kind. Task runs are meant to run in parallel with the lead
-# and each other, so this is deliberately above 1 — it exists to bound the
-# usage-allowance overshoot in _user_running_run_count, not to serialize work.
-MAX_CONCURRENT_RUNS_PER_USER = 3
 
+def _fresh_marker(started, lost_since):
+    """Is a run_started_at a run in flight?
+
+    ``lost_since`` is when the run queue reclaimed the conversation's lease,
+    if it did: a marker from before then was left by that dead run.
+    """
+    if not started or timezone.now() - started >= RUN_STALENESS_WINDOW:
+        return False
+    return lost_since is None or started.timestamp() > lost_since
+
+
+def _conversation_is_running(conversation, queue=None):
+    """Is a run of this conversation queued or in flight?
 
-def _conversation_is_running(conversation):
-    started = conversation.run_started_at
-    return bool(started and timezone.now() - started < RUN_STALENESS_WINDOW)
+    ``queue`` is a run_queue.snapshot(); a view serializing many
+    conversations takes one and passes it to each, so the registry is read
+    once per request rather than once per row.
+    """
+    if queue is None:
+        queue = run_queue.snapshot()
+    if conversation.id in queue['leases']:
+        return True
+    return _fresh_marker(conversation.run_started_at, queue['lost'].get(conversation.id))
 
 
 def _project_has_running_conversation(
     user, project_id, exclude_conversation_id=None, kinds=CANONICAL_TREE_KINDS
 ):
-    """Does any conversation of these kinds have a fresh run in this project?
+    """Does any conversation of these kinds have a live run in this project?
 
     Backs the 409 agent_busy guards. Scoped to the canonical-tree kinds
     (chat/lead) by default: those runs edit the shared canonical tree and
     must be serialized, while kind='task' runs edit only their own git
     worktree — tasks neither block nor are blocked by this guard, so they
-    run in parallel with the lead and with each other. The staleness window
-    matches is_running, so a crashed worker that never cleared
-    run_started_at cannot wedge the project.
+    run in parallel with the lead and with each other. A run queue lease
+    (queued or running) counts; so does a fresh run_started_at, unless the
+    queue saw that conversation's run die — a crashed worker cannot wedge
+    the project.
     """
+    if run_queue.project_busy(user.id, project_id, kinds, exclude_conversation_id):
+        return True
     threshold = timezone.now() - RUN_STALENESS_WINDOW
     qs = AgentConversation.objects.filter(
         user=user,
@@ -967,50 +1139,47 @@ def _project_has_running_conversation(
     )
     if exclude_conversation_id:
         qs = qs.exclude(id=exclude_conversation_id)
-    return qs.exists()
-
-
-def _user_running_run_count(user, exclude_conversation_id=None):
-    """How many of this user's runs are in flight, across every project.
-
-    The plan allowance is checked before a run and only debited after it, so
-    concurrent runs all read the same pre-run total and all pass. Capping the
-    number in flight bounds how far past the allowance that can carry: without
-    it a user can start arbitrarily many runs on a single window's headroom.
-    Uses the same fresh-run_started_at signal (and staleness window) as the
-    agent_busy guards, so a crashed worker cannot wedge a user out.
-    """
-    threshold = timezone.now() - RUN_STALENESS_WINDOW
-    qs = AgentConversation.objects.filter(user=user, run_started_at__gt=threshold)
-    if exclude_conversation_id:
-        qs = qs.exclude(id=exclude_conversation_id)
-    return qs.count()
+    markers = list(qs.values_list('id', 'run_started_at'))
+    if not markers:
+        return False
+    lost = run_queue.lost_conversations()
+    return any(_fresh_marker(started, lost.get(cid)) for cid, started in markers)
+
+
+def _latest_content(**filters):
+    """Subquery: content of a conversation's newest message matching filters."""
+    return Subquery(
+        AgentMessage.objects.filter(conversation=OuterRef('pk'), **filters)
+        .order_by('-created_at', '-id')
+        .values('content')[:1]
+    )
 
 
-def _conversation_total_tokens(conversation):
-    """Sum input+output tokens across the conversation's message usage.
+def _with_list_summaries(queryset):
+    """Annotate what _serialize_conversation reads from messages.
 
-    None (not 0) when no message carries usage: absent usage means the run's
-    tokens were never captured, never that it was free. Aggregated in Python
-    because usage lives inside the metadata JSONField.
+    Listing used to run three message queries per conversation (last
+    message, last assistant message, opening user message); as correlated
+    subqueries they ride along in the one query that fetches the rows.
     """
-    total = None
-    metadatas = conversation.messages.exclude(metadata__isnull=True).values_list(
-        'metadata', flat=True
+    return queryset.annotate(
+        last_message_content=_latest_content(),
+        last_assistant_content=_latest_content(role='assistant'),
+        # Only a task's brief falls back to its opening message.
+        opening_user_content=Case(
+            When(kind='task', then=Subquery(
+                AgentMessage.objects.filter(conversation=OuterRef('pk'), role='user')
+                .order_by('created_at', 'id').values('content')[:1]
+            )),
+            default=Value(None),
+            output_field=TextField(),
+        ),
     )
-    for metadata in metadatas:
-        usage = metadata.get('usage') if isinstance(metadata, dict) else None
-        if not isinstance(usage, dict):
-            continue
-        input_tokens = usage.get('input_tokens')
-        output_tokens = usage.get('output_tokens')
-        if not isinstance(input_tokens, int) or not isinstance(output_tokens, int):
-            continue
-        total = (total or 0) + input_tokens + output_tokens
-    return total
 
 
 PREVIEW_LIMIT = 300
+# Largest ?limit= the conversation list honours.
+CONVERSATION_PAGE_MAX = 200
 # A brief is a ticket written for the subagent, not a status line: it opens
 # with the goal and then spends paragraphs on specifics. Only the opening is
 # ever shown, and only when the lead wrote no user-facing goal to show
@@ -1068,23 +1237,39 @@ def _conversation_brief(conversation) -> str:
     goal = (getattr(conversation, 'goal', '') or '').strip()
     if goal:
         return goal
-    opening = conversation.messages.filter(role='user').order_by('created_at').first()
-    source = opening.content if opening else (conversation.queued_prompt or '')
+    if hasattr(conversation, 'opening_user_content'):
+        opening = conversation.opening_user_content
+    else:
+        opening = conversation.messages.filter(role='user').order_by(
+            'created_at', 'id'
+        ).values_list('content', flat=True).first()
+    source = opening if opening is not None else (conversation.queued_prompt or '')
     return _message_preview(source, limit=BRIEF_LIMIT)
 
 
-def _serialize_conversation(conversation):
-    last_message = conversation.messages.order_by('-created_at').first()
-    preview = _message_preview(last_message.content) if last_message else ''
+def _serialize_conversation(conversation, queue=None):
+    """The conversation's API shape.
+
+    Rows from _with_list_summaries serialize without further queries; a
+    bare row looks up its latest messages itself. ``queue`` is the request's
+    run_queue.snapshot() (see _conversation_is_running).
+    """
+    if hasattr(conversation, 'last_message_content'):
+        last_content = conversation.last_message_content
+        last_assistant_content = conversation.last_assistant_content
+    else:
+        newest = conversation.messages.order_by('-created_at', '-id')
+        last_content = newest.values_list('content', flat=True).first()
+        last_assistant_content = newest.filter(role='assistant').values_list(
+            'content', flat=True
+        ).first()
+    preview = _message_preview(last_content) if last_content is not None else ''
     # The task's closing words — its summary of the changes, or the question
     # it stopped on. The dispatch card renders this in full, so it is a
     # separate, generously-capped field rather than the list-row preview.
-    last_assistant = conversation.messages.filter(
-        role='assistant'
-    ).order_by('-created_at').first()
     summary = (
-        _message_preview(last_assistant.content, limit=SUMMARY_LIMIT)
-        if last_assistant else ''
+        _message_preview(last_assistant_content, limit=SUMMARY_LIMIT)
+        if last_assistant_content is not None else ''
     )
     return {
         'id': conversation.id,
@@ -1107,8 +1292,13 @@ def _serialize_conversation(conversation):
         # What this task was asked to do — the dispatch card reports it while
         # the run is live, where there is no result to show yet.
         'brief': _conversation_brief(conversation),
-        'is_running': _conversation_is_running(conversation),
-        'total_tokens': _conversation_total_tokens(conversation),
+        'is_running': _conversation_is_running(conversation, queue),
+        # Running counters kept at write time (services.conversation_usage):
+        # None while no message has carried usage — unknown, never free.
+        'total_tokens': conversation.total_tokens,
+        'cost_usd': float(conversation.cost_usd or 0),
+        # Share of the input served from the provider's prompt cache.
+        'cache_hit_rate': conversation.cache_hit_rate,
         # A dispatched-but-not-yet-run task's brief: the client fires the run
         # with it (and _prepare_run clears it when that run starts).
         'queued_prompt': conversation.queued_prompt or '',
@@ -1156,8 +1346,24 @@ def conversations_list_create(request):
                 qs = qs.filter(project_id=int(project_id))
             except (ValueError, TypeError):
                 return create_error_response('Invalid project_id', status.HTTP_400_BAD_REQUEST)
-        data = [_serialize_conversation(c) for c in qs.order_by('-updated_at')]
-        return Response(data, status=status.HTTP_200_OK)
+        qs = qs.order_by('-updated_at', '-id')
+        # Optional ?limit=&offset= paging; the body stays a plain list and
+        # the unpaged total travels in X-Total-Count.
+        total = None
+        if 'limit' in request.query_params:
+            try:
+                limit = max(1, min(int(request.query_params['limit']), CONVERSATION_PAGE_MAX))
+                offset = max(int(request.query_params.get('offset', 0)), 0)
+            except (ValueError, TypeError):
+                return create_error_response('Invalid limit or offset', status.HTTP_400_BAD_REQUEST)
+            total = qs.count()
+            qs = qs[offset:offset + limit]
+        queue = run_queue.snapshot()
+        data = [_serialize_conversation(c, queue) for c in _with_list_summaries(qs)]
+        response = Response(data, status=status.HTTP_200_OK)
+        if total is not None:
+            response['X-Total-Count'] = str(total)
+        return response
 
     # POST -> create
     try:
@@ -1303,17 +1509,18 @@ def conversation_detail(request, conversation_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def conversation_cancel(request, conversation_id):
-    """Release a conversation's running-run marker.
+    """Stop a conversation's run and release its running-run marker.
 
     Used by the Stop button when this tab has no live stream to abort
-    (restored after a reload, opened elsewhere, or a crashed worker). There
-    is no server-side task handle for a run driven by another tab's stream,
-    so this cannot halt the agent itself — it clears run_started_at so
-    is_running flips false and the project's agent_busy guard lifts.
+    (restored after a reload, opened elsewhere, or a crashed worker). The
+    run itself is stopped through the run scheduler, whichever worker runs
+    it; run_started_at is cleared either way so is_running flips false and
+    the project's agent_busy guard lifts, even for a run whose worker died.
     """
     conversation = get_object_or_404(
         AgentConversation, id=conversation_id, user=request.user
     )
+    agent_runs.cancel_conversation(conversation.id)
     if conversation.run_started_at is not None:
         conversation.run_started_at = None
         conversation.save(update_fields=['run_started_at'])
@@ -1384,6 +1591,11 @@ def conversation_restore_checkpoint(request, conversation_id):
     prompt_text = message.content
     conversation.messages.filter(created_at__gt=message.created_at).delete()
     conversation.messages.filter(created_at=message.created_at, id__gte=message.id).delete()
+    # A compaction checkpoint that summarized removed messages goes with them.
+    conversation_history.rewind(conversation, message.id)
+    # The token counters drop the removed replies' usage, as the old
+    # per-read sum over surviving messages did; metered cost stays spent.
+    conversation_usage.recompute(AgentConversation.objects.filter(pk=conversation.pk))
     # The rewind removed the reply that made a task reviewable.
     if conversation.kind == 'task' and conversation.review_status == 'ready':
         conversation.review_status = 'active'
@@ -1546,7 +1758,7 @@ def _resolve_conversation_check_ins(conversation):
     ).update(status='resolved', resolved_at=timezone.now())
 
 
-def _serialize_check_in(check_in):
+def _serialize_check_in(check_in, queue=None):
     task = check_in.conversation
     return {
         'id': check_in.id,
@@ -1566,7 +1778,7 @@ def _serialize_check_in(check_in):
             'review_status': task.review_status,
             'variant_group': task.variant_group,
             'has_worktree': bool(task.worktree_path),
-            'is_running': _conversation_is_running(task),
+            'is_running': _conversation_is_running(task, queue),
         },
     }
 
@@ -1621,7 +1833,8 @@ def check_ins_list(request):
             output_field=IntegerField(),
         )
     )
-    data = [_serialize_check_in(ci) for ci in qs.order_by('urgency', 'created_at')]
+    queue = run_queue.snapshot()
+    data = [_serialize_check_in(ci, queue) for ci in qs.order_by('urgency', 'created_at')]
     return Response(data, status=status.HTTP_200_OK)
 
 
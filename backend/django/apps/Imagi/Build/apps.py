@@ -1,6 +1,39 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Entry points of the processes that serve requests (gunicorn's uvicorn
+# workers in production). Management commands, tests and shells do not.
+_SERVER_COMMANDS = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn')
+
+
+def _serves_requests(argv=None, environ=None) -> bool:
+    """Whether this process is a server that can own preview sessions."""
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if not argv:
+        return False
+    if os.path.basename(argv[0]) in _SERVER_COMMANDS:
+        return True
+    if len(argv) > 1 and argv[1] == 'runserver':
+        # The autoreloader's parent only watches files; its child serves.
+        return environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return False
+
+
 class BuildConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.Imagi.Build'
     label = 'Build'
+
+    def ready(self):
+        from django.conf import settings
+
+        # Reap idle previews on a schedule from boot, not from the first
+        # preview request: a worker that serves none would otherwise never
+        # reclaim sessions left by the workers before a restart. The web tier
+        # runs no previews.
+        if settings.IMAGI_ROLE != 'web' and _serves_requests():
+            from .services import preview_sessions
+            preview_sessions.ensure_reaper()
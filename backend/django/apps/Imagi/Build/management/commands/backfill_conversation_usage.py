@@ -0,0 +1,44 @@
+"""
+Compute the usage counters on existing agent conversations.
+
+AgentConversation.input_tokens / output_tokens / cost_usd are maintained as
+messages and usage events are written; conversations from before the
+counters existed start at unknown / $0. This rebuilds them from the stored
+message metadata and Payments' usage events. Re-running it is harmless.
+
+Usage:
+    python manage.py backfill_conversation_usage
+
+    # Limit to one user's conversations
+    python manage.py backfill_conversation_usage --user 42
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.Imagi.Build.models import AgentConversation
+from apps.Imagi.Build.services import conversation_usage
+
+
+class Command(BaseCommand):
+    help = "Recompute token and cost counters on agent conversations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, default=None,
+            help="Only backfill this user's conversations.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Conversations recomputed per batch.',
+        )
+
+    def handle(self, *args, **options):
+        conversations = AgentConversation.objects.all()
+        if options['user']:
+            conversations = conversations.filter(user_id=options['user'])
+        updated = conversation_usage.recompute(
+            conversations, batch_size=max(1, options['batch_size'])
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed usage counters on {updated} conversations"
+        ))
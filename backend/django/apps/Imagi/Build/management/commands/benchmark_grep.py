@@ -0,0 +1,185 @@
+"""
+Benchmark grep_files: the indexed search against the old linear scan.
+
+Generates a synthetic project (2,000 files by default, shaped like a
+generated Vue + Django project) in a temporary directory, or searches an
+existing tree, and times a set of typical agent search patterns through:
+
+- ``linear``: the pre-index implementation — walk, stat, read and regex
+  every file on every call;
+- ``indexed (cold)``: ``grep_impl`` against a freshly built file index
+  (the first search of a run pays the walk and the reads);
+- ``indexed (warm)``: ``grep_impl`` again, the case for every later search
+  in the same run.
+
+Usage:
+    python manage.py benchmark_grep
+    python manage.py benchmark_grep --files 5000 --repeat 5
+    python manage.py benchmark_grep --path /data/projects/42
+"""
+
+import fnmatch
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.Imagi.Build.services import file_index
+from apps.Imagi.Build.services.tools import (
+    GREP_MAX_FILE_BYTES,
+    GREP_MAX_LINE_CHARS,
+    GREP_MAX_RESULTS,
+    _compile_search_pattern,
+    _iter_project_files,
+    grep_impl,
+)
+
+# (pattern, include) pairs in the shape the agent actually sends.
+PATTERNS = [
+    (r'createRouter', None),
+    (r'class\s+\w+View', None),
+    (r'defineProps<', '*.vue'),
+    (r'useAuthStore|usePaymentStore', None),
+    (r'TODO', None),
+    (r'import\s+\w+\s+from', '*.ts'),
+]
+
+_VOCAB = (
+    'const let return import export default from props emit computed ref '
+    'watch async await template div span class button input form router '
+    'store state action getter model view serializer queryset response '
+    'request user item list detail create update delete fetch value data'
+).split()
+
+
+def _linear_grep(root, pattern, include=None, max_results=GREP_MAX_RESULTS):
+    """The pre-index grep_impl loop, kept verbatim as the baseline."""
+    regex = _compile_search_pattern(pattern)
+    matches = []
+    for abs_path, rel_path in _iter_project_files(root):
+        if include and not fnmatch.fnmatch(os.path.basename(abs_path), include) \
+                and not fnmatch.fnmatch(rel_path, include):
+            continue
+        try:
+            if os.path.getsize(abs_path) > GREP_MAX_FILE_BYTES:
+                continue
+            with open(abs_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        for lineno, line in enumerate(text.splitlines(), start=1):
+            if regex.search(line[:GREP_MAX_LINE_CHARS]):
+                matches.append({'file': rel_path, 'line': lineno})
+                if len(matches) >= max_results:
+                    return matches
+    return matches
+
+
+def _generate_project(root, count, seed=7):
+    """Write ``count`` files of plausible Vue/TS/Python source under ``root``."""
+    rng = random.Random(seed)
+    kinds = [
+        ('frontend/vuejs/src/apps/{app}/views', '{name}View.vue'),
+        ('frontend/vuejs/src/apps/{app}/components', '{name}.vue'),
+        ('frontend/vuejs/src/apps/{app}/stores', '{name}.ts'),
+        ('backend/django/apps/{app}', '{name}_views.py'),
+    ]
+    for i in range(count):
+        directory, filename = kinds[i % len(kinds)]
+        app = f'app{i % 40}'
+        name = f'Thing{i}'
+        path = os.path.join(root, directory.format(app=app), filename.format(name=name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = [
+            ' '.join(rng.choice(_VOCAB) for _ in range(rng.randint(4, 12)))
+            for _ in range(rng.randint(40, 160))
+        ]
+        # Sprinkle the rarer identifiers the patterns look for.
+        if i % 97 == 0:
+            lines.insert(3, "import { createRouter } from 'vue-router'")
+        if i % 31 == 0:
+            lines.insert(5, f'class {name}View(APIView):')
+        if i % 53 == 0:
+            lines.insert(7, 'const store = useAuthStore()')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "Benchmark indexed grep_files against the old linear scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--files', type=int, default=2000,
+            help='Size of the generated project (ignored with --path).',
+        )
+        parser.add_argument(
+            '--path', default=None,
+            help='Benchmark against an existing project directory instead.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Runs per measurement; the median is reported.',
+        )
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        if options['path']:
+            root = os.path.realpath(options['path'])
+            if not os.path.isdir(root):
+                raise CommandError(f"Not a directory: {options['path']}")
+            cleanup = False
+        else:
+            root = tempfile.mkdtemp(prefix='grep_bench_')
+            cleanup = True
+            self.stdout.write(f"Generating {options['files']} files in {root}...")
+            _generate_project(root, options['files'])
+
+        project = SimpleNamespace(project_path=root)
+        try:
+            self.stdout.write(
+                f"{'pattern':<34} {'linear ms':>10} {'cold ms':>10} {'warm ms':>10} {'speedup':>8}"
+            )
+            for pattern, include in PATTERNS:
+                linear = _time(lambda: _linear_grep(root, pattern, include), repeat)
+
+                def cold():
+                    file_index.discard(root)
+                    grep_impl(project, pattern, include=include)
+                cold_ms = _time(cold, repeat)
+
+                grep_impl(project, pattern, include=include)
+                warm = _time(lambda: grep_impl(project, pattern, include=include), repeat)
+
+                # Same answers, or the numbers mean nothing.
+                expected = [(m['file'], m['line']) for m in _linear_grep(root, pattern, include)]
+                got = [
+                    (m['file'], m['line'])
+                    for m in grep_impl(project, pattern, include=include)['matches']
+                ]
+                if expected != got:
+                    raise CommandError(f"Indexed results differ from the linear scan for {pattern!r}")
+
+                label = pattern + (f'  [{include}]' if include else '')
+                self.stdout.write(
+                    f"{label:<34} {linear:>10.1f} {cold_ms:>10.1f} {warm:>10.1f} "
+                    f"{linear / warm if warm else float('inf'):>7.1f}x"
+                )
+        finally:
+            file_index.discard(root)
+            if cleanup:
+                shutil.rmtree(root, ignore_errors=True)
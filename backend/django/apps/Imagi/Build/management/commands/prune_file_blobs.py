@@ -0,0 +1,22 @@
+"""
+Delete project file blobs no ProjectFile row points at any more.
+
+Edits and deletes leave the blob a file used to hold behind (blobs are
+shared and immutable, so the write paths never delete them). Run this
+periodically, off-peak, to reclaim the space.
+
+Usage:
+    python manage.py prune_file_blobs
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.Imagi.Build.services import file_blobs
+
+
+class Command(BaseCommand):
+    help = "Delete project file blobs that no ProjectFile references."
+
+    def handle(self, *args, **options):
+        deleted = file_blobs.prune_orphans()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} orphaned file blobs"))
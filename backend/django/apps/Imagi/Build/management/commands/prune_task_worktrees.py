@@ -0,0 +1,63 @@
+"""
+Report task worktree disk usage and delete worktrees no task owns any more.
+
+Accepting, dismissing or deleting a task removes its worktree, but a worker
+that dies in between (or a project directory restored from elsewhere)
+leaves the directory, its branch and its bookkeeping behind. A worktree is
+leaked when no conversation records it as its worktree_path; ones younger
+than --min-age are left alone, since a dispatch records the path only after
+the worktree is created.
+
+Usage:
+    python manage.py prune_task_worktrees [--dry-run] [--min-age MINUTES]
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.Imagi.Build.models import AgentConversation
+from apps.Imagi.Build.services import task_worktrees
+from apps.Imagi.Build.services.version_control_service import VersionControlService
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = "Report task worktree disk usage and delete leaked task worktrees."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report only; delete nothing.")
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help="Only delete leaked worktrees untouched for this many minutes (default 60).",
+        )
+
+    def handle(self, *args, **options):
+        worktrees = list(task_worktrees.find_worktrees())
+        owned = set(
+            AgentConversation.objects.filter(id__in=[cid for _w, _p, cid in worktrees])
+            .exclude(worktree_path='')
+            .values_list('worktree_path', flat=True)
+        )
+        cutoff = time.time() - options['min_age'] * 60
+        service = VersionControlService()
+        total = reclaimed = pruned = 0
+        for worktree_path, project_path, conversation_id in worktrees:
+            usage = task_worktrees.disk_usage(worktree_path)
+            total += usage
+            leaked = worktree_path not in owned and os.path.getmtime(worktree_path) < cutoff
+            self.stdout.write(
+                f"{worktree_path}: {usage / MB:.1f} MB{' (leaked)' if leaked else ''}"
+            )
+            if not leaked or options['dry_run']:
+                continue
+            if service.remove_task_worktree(project_path, conversation_id).get('success'):
+                reclaimed += usage
+                pruned += 1
+
+        self.stdout.write(f"{len(worktrees)} task worktrees, {total / MB:.1f} MB")
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {pruned} leaked task worktrees, reclaiming {reclaimed / MB:.1f} MB"
+        ))
@@ -58,8 +58,9 @@ class Command(BaseCommand):
                     continue
                 result = project_files_service.import_project_from_disk(project)
                 self.stdout.write(self.style.SUCCESS(
-                    f"[{project.id}] {project.name}: {result['synced']} files -> db, "
-                    f"{result['pruned']} stale rows pruned"
+                    f"[{project.id}] {project.name}: {result['synced']} files -> db "
+                    f"({result['created']} created, {result['updated']} updated, "
+                    f"{result['unchanged']} unchanged), {result['pruned']} stale rows pruned"
                 ))
             else:
                 if not project.files.exists():
@@ -0,0 +1,46 @@
+# Content hash + disk mtime on ProjectFile, so import_project_from_disk can
+# skip unchanged files. Existing rows get their hash backfilled here; their
+# mtime stays 0, so the first import after this re-reads each file once,
+# finds the hash unchanged, and only records the mtime.
+
+import hashlib
+
+from django.db import migrations, models
+
+BACKFILL_BATCH = 500
+
+
+def backfill_content_hashes(apps, schema_editor):
+    ProjectFile = apps.get_model('Build', 'ProjectFile')
+    batch = []
+    for row in ProjectFile.objects.only('id', 'content').iterator(chunk_size=BACKFILL_BATCH):
+        row.content_hash = hashlib.sha256(
+            (row.content or '').encode('utf-8', errors='ignore')
+        ).hexdigest()
+        batch.append(row)
+        if len(batch) >= BACKFILL_BATCH:
+            ProjectFile.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        ProjectFile.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0012_review_status_failed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectfile',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='mtime_ns',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+    ]
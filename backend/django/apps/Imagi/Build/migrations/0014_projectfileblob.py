@@ -0,0 +1,126 @@
+# Content-addressed blob storage for the ProjectFile mirror.
+#
+# ProjectFile.content (a TextField per row) becomes inline_content — same
+# database column, renamed in model state only — and rows gain a blob
+# foreign key into the new Build_projectfileblob table. Existing rows are
+# moved into blobs here, deduplicated by content hash and zlib-compressed
+# where that saves space; their inline column is emptied. Reversing the
+# migration copies blob contents back inline first.
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH = 500
+MIN_COMPRESS_BYTES = 256
+
+
+def _encode(raw):
+    if len(raw) >= MIN_COMPRESS_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed, 'zlib'
+    return raw, ''
+
+
+def move_content_into_blobs(apps, schema_editor):
+    ProjectFile = apps.get_model('Build', 'ProjectFile')
+    ProjectFileBlob = apps.get_model('Build', 'ProjectFileBlob')
+    stored = set(ProjectFileBlob.objects.values_list('hash', flat=True))
+    while True:
+        rows = list(
+            ProjectFile.objects.filter(blob__isnull=True)
+            .only('id', 'inline_content', 'content_hash')[:BATCH]
+        )
+        if not rows:
+            break
+        blobs = []
+        for row in rows:
+            raw = (row.inline_content or '').encode('utf-8', errors='ignore')
+            digest = hashlib.sha256(raw).hexdigest()
+            if digest not in stored:
+                data, compression = _encode(raw)
+                blobs.append(ProjectFileBlob(
+                    hash=digest, data=data, compression=compression, size=len(raw),
+                ))
+                stored.add(digest)
+            row.content_hash = digest
+            row.blob_id = digest
+            row.inline_content = ''
+        ProjectFileBlob.objects.bulk_create(blobs, ignore_conflicts=True)
+        ProjectFile.objects.bulk_update(rows, ['content_hash', 'blob', 'inline_content'])
+
+
+def copy_blobs_inline(apps, schema_editor):
+    ProjectFile = apps.get_model('Build', 'ProjectFile')
+    rows = []
+    for row in ProjectFile.objects.filter(blob__isnull=False).select_related('blob').iterator(
+        chunk_size=BATCH
+    ):
+        data = bytes(row.blob.data)
+        if row.blob.compression == 'zlib':
+            data = zlib.decompress(data)
+        elif row.blob.compression:
+            raise RuntimeError(
+                f"Cannot inline a {row.blob.compression!r} blob in a migration; "
+                "decompress it first"
+            )
+        row.inline_content = data.decode('utf-8')
+        row.blob_id = None
+        rows.append(row)
+        if len(rows) >= BATCH:
+            ProjectFile.objects.bulk_update(rows, ['inline_content', 'blob'])
+            rows = []
+    if rows:
+        ProjectFile.objects.bulk_update(rows, ['inline_content', 'blob'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0013_projectfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectFileBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('compression', models.CharField(blank=True, default='', max_length=8)),
+                ('size', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'Build_projectfileblob',
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='projectfile',
+                    old_name='content',
+                    new_name='inline_content',
+                ),
+                migrations.AlterField(
+                    model_name='projectfile',
+                    name='inline_content',
+                    field=models.TextField(blank=True, db_column='content', default=''),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='blob',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='files',
+                to='Build.projectfileblob',
+            ),
+        ),
+        migrations.RunPython(move_content_into_blobs, copy_blobs_inline),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0014_projectfileblob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agentmessage',
+            index=models.Index(fields=['conversation', 'role', 'created_at'], name='Agents_agen_convers_6d5af2_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:26
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0015_agentmessage_role_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentconversation',
+            name='cost_usd',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='agentconversation',
+            name='input_tokens',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agentconversation',
+            name='output_tokens',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
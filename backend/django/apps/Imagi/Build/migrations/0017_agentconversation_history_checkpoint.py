@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0016_agentconversation_usage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentconversation',
+            name='history_compacted_through',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agentconversation',
+            name='history_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Build', '0017_agentconversation_history_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentconversation',
+            name='cached_input_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
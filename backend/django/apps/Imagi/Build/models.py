@@ -1,17 +1,20 @@
 """
 Models for the Build app.
 
-Contains the builder workspace models (ProjectLayout, ProjectFile) and the
-agent models (AgentConversation, SystemPrompt, AgentMessage), merged from
-the former Builder and Agents sub-apps.
+Contains the builder workspace models (ProjectLayout, ProjectFile,
+ProjectFileBlob) and the agent models (AgentConversation, SystemPrompt,
+AgentMessage), merged from the former Builder and Agents sub-apps.
 
 Every model pins `db_table` to the table name it had under its original
 app label ('Builder' / 'Agents'), so merging the apps required no schema
 changes on existing databases.
 """
 
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth import get_user_model
+from .services import file_blobs
 from .services.models_service import (
     get_model_choices,
     get_provider_choices,
@@ -98,6 +101,30 @@ class ProjectLayout(models.Model):
         return f"Layout for Project {self.project_id} - User {self.user.username}"
 
 
+class ProjectFileBlob(models.Model):
+    """One distinct file content, shared by every ProjectFile holding it.
+
+    Keyed by the sha256 of the UTF-8 content, so the scaffold files every
+    project ships are stored once, not once per project. ``data`` is the
+    content as encoded by services.file_blobs (``compression`` names the
+    codec; '' is raw UTF-8). Immutable once written.
+    """
+    hash = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    compression = models.CharField(max_length=8, blank=True, default='')
+    size = models.IntegerField(default=0)  # uncompressed bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'Build_projectfileblob'
+
+    def text(self) -> str:
+        return file_blobs.decode(self.data, self.compression)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} bytes)"
+
+
 class ProjectFile(models.Model):
     """Database copy of a single file in a user's project.
 
@@ -115,9 +142,24 @@ class ProjectFile(models.Model):
         related_name='files',
     )
     path = models.CharField(max_length=500)  # project-relative, POSIX separators
-    content = models.TextField(blank=True, default='')
+    # Content lives in the shared blob store; inline_content only holds rows
+    # written before it existed (or created directly, e.g. in tests). Read
+    # either through the ``content`` property.
+    inline_content = models.TextField(blank=True, default='', db_column='content')
+    blob = models.ForeignKey(
+        ProjectFileBlob,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name='files',
+    )
     file_type = models.CharField(max_length=20, blank=True, default='')
     size = models.IntegerField(default=0)
+    # sha256 of the UTF-8 content, and the disk file's mtime when the row was
+    # written: import_project_from_disk skips files whose size and mtime (or,
+    # failing that, hash) still match, instead of rewriting every row.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    mtime_ns = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -128,6 +170,17 @@ class ProjectFile(models.Model):
             models.Index(fields=['project', 'path']),
         ]
 
+    @property
+    def content(self) -> str:
+        if self.blob_id:
+            return self.blob.text()
+        return self.inline_content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self.inline_content = value or ''
+        self.blob = None
+
     def __str__(self):
         return f"{self.path} (project {self.project_id})"
 
@@ -174,6 +227,24 @@ class AgentConversation(models.Model):
     # old timestamps as "not running" (staleness guard) because a crashed
     # worker never gets to clear this.
     run_started_at = models.DateTimeField(null=True, blank=True)
+    # Running usage counters, maintained at write time by
+    # services.conversation_usage so listing never re-reads message metadata.
+    # The token counters sum the usage recorded on the thread's messages and
+    # stay NULL until a message carries some (absent means unknown, never
+    # free); cost_usd sums what Payments metered for the thread's runs.
+    # cached_input_tokens is the share of input_tokens the provider served
+    # from its prompt cache.
+    input_tokens = models.BigIntegerField(null=True, blank=True)
+    output_tokens = models.BigIntegerField(null=True, blank=True)
+    cached_input_tokens = models.BigIntegerField(default=0)
+    cost_usd = models.DecimalField(
+        max_digits=12, decimal_places=6, default=Decimal('0')
+    )
+    # Compaction checkpoint, kept by services.conversation_history: the
+    # one-line summaries of the messages folded out of the history, and the
+    # id of the last of them. A run loads only the messages after it.
+    history_summary = models.TextField(blank=True, default='')
+    history_compacted_through = models.BigIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = 'Agents_agentconversation'
@@ -192,6 +263,21 @@ class AgentConversation(models.Model):
     def __str__(self):
         return f"Agent Conversation {self.id} - {self.user.username} using {self.model_name} ({self.provider})"
 
+    @property
+    def total_tokens(self):
+        """input+output tokens across the thread, or None when unknown."""
+        if self.input_tokens is None and self.output_tokens is None:
+            return None
+        return (self.input_tokens or 0) + (self.output_tokens or 0)
+
+    @property
+    def cache_hit_rate(self):
+        """Share of the thread's input tokens served from the prompt cache,
+        or None before any input was recorded."""
+        if not self.input_tokens:
+            return None
+        return round(self.cached_input_tokens / self.input_tokens, 4)
+
     @property
     def project_name(self):
         """Get the project name from the ProjectManager app"""
@@ -283,6 +369,11 @@ class AgentMessage(models.Model):
     class Meta:
         db_table = 'Agents_agentmessage'
         ordering = ['created_at']
+        indexes = [
+            # Newest / opening message of a role, per conversation: the
+            # conversation list's per-row subqueries.
+            models.Index(fields=['conversation', 'role', 'created_at']),
+        ]
 
     def __str__(self):
         return f"{self.role.capitalize()} message in Conversation {self.conversation.id}"
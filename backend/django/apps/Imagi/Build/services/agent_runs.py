@@ -0,0 +1,427 @@
+"""
+Detached agent runs with a replayable event log.
+
+An agent run used to live inside the agent_stream response: the SSE
+generator drove ImagiAgentService.process_stream, so the run lasted exactly
+as long as the HTTP connection. A sleeping tab, a proxy timeout or a
+dropped connection killed it mid-edit, and dispatched tasks only ran while
+some client held their streams open.
+
+Runs now execute on a scheduler thread in each worker process, with their
+own event loop, and every event they produce is appended to a per-run log.
+The SSE endpoints only tail that log:
+
+    run_id = agent_runs.start(user.id, agent_service.process_stream(...))
+    async for event_id, event in agent_runs.tail(run_id, after=last_event_id):
+        ...  # id: <event_id> / data: <event>
+
+Log: one JSON-lines file per run under AGENT_RUN_LOG_ROOT (PROJECTS_ROOT/
+.agent_runs by default), ``{"id": n, "event": {...}}`` per line. Record 0
+is the run's own ``{"type": "run", "run_id": ...}`` event and carries its
+owner (the user, and the writing process so a tail can tell a dead run from
+a quiet one); a final ``{"end": true}`` record closes it. Only the owning
+worker writes a log, so appends need no lock; any worker on the host can
+tail it, which is how a client reconnecting with ``Last-Event-ID`` lands on
+whichever worker and replays what it missed. Finished logs are deleted
+after AGENT_RUN_LOG_RETENTION seconds.
+
+Stopping: cancel(run_id) drops a marker file beside the log. The owning
+worker polls for it and cancels the run's task, which unwinds
+process_stream the same way a closed client stream used to (the partial
+reply is kept, the run marker is cleared).
+
+Admission: a run started with ``admission=`` (what agent_stream passes)
+holds a lease in the host's run queue (see run_queue). It waits there for a
+slot, logging a ``{"type": "queued", "position", "eta_seconds"}`` event
+whenever its place in line changes, heartbeats the lease while it runs and
+releases it when it ends. A run whose lease is reclaimed anyway (its
+heartbeats stalled past the TTL) is stopped with ``run_lost``: its slot may
+already be another run's, and it must not go on running outside the queue.
+
+A run still dies with the process that runs it (a deploy recycling the
+worker); its tail then reports ``run_lost`` instead of waiting forever.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import psutil
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import port_leases, run_queue
+
+logger = logging.getLogger(__name__)
+
+LOG_SUFFIX = '.jsonl'
+CANCEL_SUFFIX = '.cancel'
+
+# How often (seconds) an idle tail re-reads its log, and a run checks for a
+# cancel marker.
+TAIL_POLL_INTERVAL = 0.1
+CANCEL_POLL_INTERVAL = 0.5
+
+# Logged when a queued run's lease is gone: it never got back its place in
+# line, or was stopped after the lease was reclaimed.
+RUN_LOST_EVENT = {
+    'type': 'error',
+    'code': 'run_lost',
+    'error': 'The agent run lost its place in the queue. Please try again.',
+}
+
+# Finished logs are pruned this often (seconds) at most, per worker.
+PRUNE_INTERVAL = 600
+
+_lock = threading.Lock()
+_scheduler = None  # (pid, loop, thread)
+_runs = {}  # run_id -> asyncio.Task on the scheduler loop
+_last_prune = 0.0
+
+
+class RunNotFound(Exception):
+    """No log exists for the run id (never started, or already pruned)."""
+
+
+def _log_root():
+    return getattr(settings, 'AGENT_RUN_LOG_ROOT', None) or os.path.join(
+        settings.PROJECTS_ROOT, '.agent_runs'
+    )
+
+
+def _retention():
+    return getattr(settings, 'AGENT_RUN_LOG_RETENTION', 3600)
+
+
+def _log_path(run_id):
+    # Run ids are generated here (hex); anything else is not a run.
+    if not run_id or not all(c in '0123456789abcdef' for c in run_id):
+        raise RunNotFound(run_id)
+    return os.path.join(_log_root(), run_id + LOG_SUFFIX)
+
+
+def _conversation_pointer(conversation_id):
+    return os.path.join(_log_root(), f'conversation-{conversation_id}.run')
+
+
+class RunLog:
+    """The append side of one run's log; used only by the run itself."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.path = _log_path(run_id)
+        self.next_id = 0
+
+    @classmethod
+    def create(cls, run_id, user_id):
+        os.makedirs(_log_root(), exist_ok=True)
+        log = cls(run_id)
+        try:
+            started = psutil.Process().create_time()
+        except psutil.Error:
+            started = None
+        log.append(
+            {'type': 'run', 'run_id': run_id},
+            owner={'user_id': user_id, 'pid': os.getpid(), 'started': started},
+        )
+        return log
+
+    def append(self, event, **extra):
+        record = {'id': self.next_id, 'event': event, **extra}
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps(record) + '\n')
+        self.next_id += 1
+        return record['id']
+
+    def close(self):
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps({'end': True}) + '\n')
+
+
+def owner(run_id):
+    """The run's owner record ``{'user_id', 'pid', 'started'}``.
+
+    Raises RunNotFound when there is no such run.
+    """
+    try:
+        with open(_log_path(run_id), 'r') as fh:
+            return json.loads(fh.readline())['owner']
+    except (OSError, ValueError, KeyError):
+        raise RunNotFound(run_id)
+
+
+def _writer_alive(run_owner):
+    return port_leases._process_alive(run_owner.get('pid'), run_owner.get('started'))
+
+
+async def tail(run_id, after=None):
+    """Yield ``(event_id, event)`` for each event after ``after``, following
+    the log until the run ends.
+
+    Raises RunNotFound when there is no such run.
+    """
+    path = _log_path(run_id)
+    run_owner = owner(run_id)
+    after = -1 if after is None else after
+    offset = 0
+    pending = b''
+    while True:
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            chunk = fh.read()
+        offset += len(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            record = json.loads(line)
+            if record.get('end'):
+                return
+            if record['id'] > after:
+                yield record['id'], record['event']
+        if not lines:
+            if not _writer_alive(run_owner):
+                # Re-read once: the writer may have closed the log and exited
+                # between the read above and this check.
+                with open(path, 'rb') as fh:
+                    fh.seek(offset)
+                    if fh.read():
+                        continue
+                yield None, {
+                    'type': 'error',
+                    'code': 'run_lost',
+                    'error': 'The agent run was interrupted by a server restart.',
+                }
+                return
+            await asyncio.sleep(TAIL_POLL_INTERVAL)
+
+
+def _scheduler_loop():
+    """This worker's scheduler event loop, started on first use."""
+    global _scheduler
+    with _lock:
+        # A forked worker inherits the parent's bookkeeping, not its threads.
+        if _scheduler and _scheduler[0] == os.getpid() and _scheduler[2].is_alive():
+            return _scheduler[1]
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name='agent-run-scheduler', daemon=True)
+        _scheduler = (os.getpid(), loop, thread)
+        _runs.clear()
+        thread.start()
+        return loop
+
+
+def start(user_id, events, admission=None):
+    """Run ``events`` (an agent's async event generator, not yet started) on
+    the scheduler, logging each event; returns the run id.
+
+    ``admission`` (run_queue.enqueue's keyword arguments) queues the run for
+    a slot first; run_queue.Busy and run_queue.QueueFull propagate, before
+    any log exists.
+    """
+    _prune_if_due()
+    run_id = uuid.uuid4().hex
+    if admission is not None:
+        run_queue.enqueue(run_id, user_id=user_id, **admission)
+    log = RunLog.create(run_id, user_id)
+    conversation_id = (admission or {}).get('conversation_id')
+    # A queued run of a known conversation can be stopped before it starts.
+    _write_pointer(conversation_id, run_id)
+    asyncio.run_coroutine_threadsafe(
+        _execute(log, events, queued=admission is not None, conversation_id=conversation_id),
+        _scheduler_loop(),
+    )
+    return run_id
+
+
+async def _execute(log, events, queued=False, conversation_id=None):
+    task = asyncio.current_task()
+    with _lock:
+        _runs[log.run_id] = task
+    watcher = asyncio.ensure_future(_watch_for_cancel(log.run_id, task))
+    keeper = None
+    lease_lost = asyncio.Event()
+    # Each run gets its own thread for sync_to_async calls, as each request
+    # does under ASGI, so one run's ORM work never queues behind another's.
+    async with ThreadSensitiveContext():
+        try:
+            if queued:
+                await _wait_for_slot(log)
+                keeper = asyncio.ensure_future(_keep_lease(log.run_id, task, lease_lost))
+            async for event in events:
+                if event.get('type') == 'start' and event.get('conversation_id') != conversation_id:
+                    conversation_id = event.get('conversation_id')
+                    _write_pointer(conversation_id, log.run_id)
+                    if queued:
+                        await _queue_call(run_queue.bind, log.run_id, conversation_id)
+                log.append(event)
+                if event.get('type') == 'done' and queued:
+                    # The run's work is over; what may follow (the thread's
+                    # title) holds no slot and keeps nobody waiting.
+                    queued = False
+                    keeper.cancel()
+                    await _queue_call(run_queue.release, log.run_id)
+        except asyncio.CancelledError:
+            if lease_lost.is_set():
+                log.append(RUN_LOST_EVENT)
+            else:
+                log.append({'type': 'error', 'code': 'cancelled', 'error': 'The agent run was stopped.'})
+        except run_queue.LeaseLost:
+            log.append(RUN_LOST_EVENT)
+        except Exception as e:  # pragma: no cover - process_stream reports its own
+            logger.exception(f"Agent run {log.run_id} failed")
+            log.append({'type': 'error', 'error': str(e)})
+        finally:
+            watcher.cancel()
+            if keeper is not None:
+                keeper.cancel()
+            if queued:
+                await _queue_call(run_queue.release, log.run_id)
+            log.close()
+            _remove(_log_path(log.run_id)[:-len(LOG_SUFFIX)] + CANCEL_SUFFIX)
+            if conversation_id is not None:
+                _clear_pointer(conversation_id, log.run_id)
+            with _lock:
+                _runs.pop(log.run_id, None)
+            await sync_to_async(connections.close_all)()
+
+
+async def _queue_call(fn, *args):
+    # Off the run's own thread: that one may sit in a long blocking call,
+    # and the lease must not miss its heartbeats behind it.
+    return await sync_to_async(fn, thread_sensitive=False)(*args)
+
+
+async def _wait_for_slot(log):
+    """Poll the run queue until the run is admitted, logging each change in
+    its place in line."""
+    reported = None
+    while True:
+        status = await _queue_call(run_queue.poll, log.run_id)
+        if status['admitted']:
+            return
+        place = (status['position'], status['eta_seconds'])
+        if place != reported:
+            log.append({'type': 'queued', 'position': place[0], 'eta_seconds': place[1]})
+            reported = place
+        await asyncio.sleep(run_queue.POLL_INTERVAL)
+
+
+async def _keep_lease(run_id, task, lost):
+    """Heartbeat the run's lease; stop the run if the lease was reclaimed."""
+    while True:
+        await asyncio.sleep(run_queue.HEARTBEAT_INTERVAL)
+        if not await _queue_call(run_queue.heartbeat, run_id):
+            logger.warning(f"Agent run {run_id} lost its run queue lease; stopping it")
+            lost.set()
+            task.cancel()
+            return
+
+
+async def _watch_for_cancel(run_id, task):
+    marker = _log_path(run_id)[:-len(LOG_SUFFIX)] + CANCEL_SUFFIX
+    while not task.done():
+        if os.path.exists(marker):
+            logger.info(f"Stopping agent run {run_id}")
+            task.cancel()
+            return
+        await asyncio.sleep(CANCEL_POLL_INTERVAL)
+
+
+def cancel(run_id):
+    """Ask the run's worker to stop it. Returns False if it already ended
+    (or its log was pruned meanwhile)."""
+    path = _log_path(run_id)
+    try:
+        if _ended(path) or not _writer_alive(owner(run_id)):
+            return False
+    except (OSError, RunNotFound):
+        return False
+    open(path[:-len(LOG_SUFFIX)] + CANCEL_SUFFIX, 'w').close()
+    return True
+
+
+def cancel_conversation(conversation_id):
+    """Stop the run a conversation has in flight, if any."""
+    try:
+        with open(_conversation_pointer(conversation_id), 'r') as fh:
+            run_id = fh.read().strip()
+        return cancel(run_id)
+    except (OSError, RunNotFound):
+        return False
+
+
+def _write_pointer(conversation_id, run_id):
+    if conversation_id is None:
+        return
+    path = _conversation_pointer(conversation_id)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fh:
+        fh.write(run_id)
+    os.replace(tmp, path)
+
+
+def _clear_pointer(conversation_id, run_id):
+    path = _conversation_pointer(conversation_id)
+    try:
+        with open(path, 'r') as fh:
+            if fh.read().strip() != run_id:
+                return  # a newer run of the conversation took over
+    except OSError:
+        return
+    _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _prune_if_due(now=None):
+    global _last_prune
+    now = time.time() if now is None else now
+    with _lock:
+        if now - _last_prune < PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    try:
+        prune(now)
+    except OSError as e:
+        logger.warning(f"Could not prune agent run logs: {e}")
+
+
+def prune(now=None):
+    """Delete logs untouched for AGENT_RUN_LOG_RETENTION whose run is over
+    (ended, or its worker is gone). Returns how many were deleted."""
+    now = time.time() if now is None else now
+    deleted = 0
+    for path in glob.glob(os.path.join(_log_root(), '*' + LOG_SUFFIX)):
+        try:
+            if now - os.path.getmtime(path) < _retention():
+                continue
+            run_id = os.path.basename(path)[:-len(LOG_SUFFIX)]
+            with _lock:
+                if run_id in _runs:
+                    continue
+            if _writer_alive(owner(run_id)) and not _ended(path):
+                continue  # a long, quiet run
+        except (OSError, RunNotFound):
+            pass
+        _remove(path)
+        deleted += 1
+    return deleted
+
+
+def _ended(path):
+    with open(path, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        fh.seek(max(0, fh.tell() - 64))
+        return b'"end"' in fh.read()
+
@@ -0,0 +1,97 @@
+"""
+Pre-booted Django dev server for the preview pool (see preview_pool.py).
+
+Started with the restricted child environment and no project. It imports
+the parts of Django every generated backend loads before it can serve,
+announces itself, then blocks on stdin for one JSON line binding it to a
+project:
+
+    {"cwd": ".../backend/django", "port": 8123, "env": {...}}
+
+Bound, it becomes ``manage.py runserver 127.0.0.1:<port>`` in ``cwd``. The
+first server runs in a fork of this already-warm process, as the reloader's
+child; when it exits to reload (code 3) this process takes over as the
+ordinary reloader parent, so later reloads behave exactly as under
+``manage.py runserver``. EOF on stdin while idle means the pool's owner is
+gone, and the runtime exits.
+"""
+
+import importlib
+import json
+import os
+import sys
+
+READY_MARKER = 'imagi-preview-pool: ready'
+
+WARM_MODULES = (
+    'django.core.management.commands.runserver',
+    'django.core.handlers.wsgi',
+    'django.contrib.admin',
+    'django.db.models',
+    'django.db.backends.sqlite3.base',
+    'django.template',
+    'django.urls',
+    'corsheaders',
+)
+
+
+def _warm():
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # Anything that needs settings (or is not installed) loads after
+            # binding instead, as it would on a cold start.
+            pass
+
+
+def _exit_code(status):
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return 128 + os.WTERMSIG(status)
+
+
+def main():
+    _warm()
+    print(READY_MARKER, flush=True)
+
+    line = sys.stdin.readline()
+    if not line.strip():
+        return 0
+    binding = json.loads(line)
+
+    cwd = binding['cwd']
+    os.chdir(cwd)
+    os.environ.update(binding.get('env') or {})
+    sys.path.insert(0, cwd)
+    sys.argv = [
+        os.path.join(cwd, 'manage.py'), 'runserver', f"127.0.0.1:{binding['port']}",
+    ]
+
+    from django.core.management import execute_from_command_line
+    from django.utils import autoreload
+
+    pid = os.fork()
+    if pid == 0:
+        os.environ[autoreload.DJANGO_AUTORELOAD_ENV] = 'true'
+        code = 1
+        try:
+            execute_from_command_line(sys.argv)
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    code = _exit_code(status)
+    if code == 3:
+        # A code change: restart the way runserver's own reloader does.
+        return autoreload.restart_with_reloader()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
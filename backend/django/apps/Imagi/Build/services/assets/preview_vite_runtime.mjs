@@ -0,0 +1,51 @@
+// Pre-booted Vite dev server for the preview pool (see preview_pool.py).
+//
+// Copied into a shared frontend dependency store slot, so `vite` resolves to
+// the same install every project of that slot links its node_modules at.
+// Started with the restricted child environment and no project: it loads
+// Vite and the Vue plugin, announces itself, then waits on stdin for one JSON
+// line binding it to a project:
+//
+//   {"root": ".../frontend/vuejs", "port": 5190, "host": "127.0.0.1", "env": {...}}
+//
+// Bound, it serves that root exactly as `vite --port <port> --host <host>`
+// would (the project's own vite.config is loaded then). EOF on stdin while
+// idle means the pool's owner is gone, and the runtime exits.
+
+import { createInterface } from 'node:readline'
+
+const READY_MARKER = 'imagi-preview-pool: ready'
+
+const vite = await import('vite')
+try {
+  await import('@vitejs/plugin-vue')
+} catch {
+  // Not every slot has it; the project's config loads it if it needs it.
+}
+console.log(READY_MARKER)
+
+const input = createInterface({ input: process.stdin })
+let bound = false
+
+input.once('line', async (line) => {
+  bound = true
+  input.close()
+  const binding = JSON.parse(line)
+  Object.assign(process.env, binding.env || {})
+  process.chdir(binding.root)
+  try {
+    const server = await vite.createServer({
+      root: binding.root,
+      server: { port: binding.port, host: binding.host },
+    })
+    await server.listen()
+    server.printUrls()
+  } catch (e) {
+    console.error(e)
+    process.exit(1)
+  }
+})
+
+input.on('close', () => {
+  if (!bound) process.exit(0)
+})
@@ -7,11 +7,14 @@ compaction), the agent run loop, and extraction of structured run metadata
 (plan, tool calls, changed files) for the workspace UI.
 """
 
+import asyncio
 import json
 import os
 import re
 import logging
+import threading
 import time
+import weakref
 from typing import Optional, Dict, Any, List
 from dataclasses import dataclass, field
 from dotenv import load_dotenv
@@ -39,6 +42,7 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
 from ..models import AgentConversation, AgentMessage, SystemPrompt
+from . import conversation_history, conversation_usage
 from .models_service import compute_cost_usd
 
 # Load environment variables
@@ -105,13 +109,6 @@ LEAD_DISPATCH_FAILED_NOTE = (
 # than total run duration (legitimate runs can outlive the window).
 RUN_HEARTBEAT_INTERVAL = 60
 
-# Character budget for conversation history sent to the model. When exceeded,
-# older messages are compacted into a short summary (auto-compaction, like
-# Claude Code) so long-running conversations keep working instead of growing
-# without bound.
-HISTORY_MAX_CHARS = 60_000
-COMPACTED_SNIPPET_CHARS = 120
-
 # How many pages a capped run's note names before summarizing the rest.
 CAPPED_NOTE_MAX_PAGES = 6
 
@@ -138,22 +135,45 @@ def _clean_title(raw: str) -> Optional[str]:
     return title[:80] or None
 
 
-def generate_conversation_title(user_input: str, assistant_reply: str) -> Optional[str]:
+# A title is cosmetic: give up on it rather than keep the run's stream open.
+TITLE_TIMEOUT_SECONDS = 10
+
+# One AsyncOpenAI client per event loop, reused by every title request on it,
+# since its connection pool belongs to the loop that opened it (a worker runs
+# its agent runs on one loop; tests and async_to_sync callers may run several).
+_title_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+_title_clients_lock = threading.Lock()
+
+# Title jobs in flight; asyncio keeps only weak references to tasks.
+_title_jobs = set()
+
+
+def _title_client():
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    with _title_clients_lock:
+        client = _title_clients.get(loop)
+        if client is None:
+            client = _title_clients[loop] = AsyncOpenAI(
+                api_key=OPENAI_API_KEY, timeout=TITLE_TIMEOUT_SECONDS, max_retries=1
+            )
+        return client
+
+
+async def generate_conversation_title(user_input: str, assistant_reply: str) -> Optional[str]:
     """Ask a small model for a concise title describing the conversation.
 
     Draws on the opening request and the agent's reply so the name reflects
     what the thread is actually about. Returns a cleaned 3-6 word title, or
-    None when unavailable (no key, API error) so the caller can fall back to
-    the provisional first-line title.
+    None when unavailable (no key, API error, TITLE_TIMEOUT_SECONDS passed)
+    so the caller can fall back to the provisional first-line title.
     """
     if not OPENAI_API_KEY:
         return None
     try:
-        from openai import OpenAI
-
         from .models_service import get_backend_model_id
 
-        client = OpenAI(api_key=OPENAI_API_KEY)
         prompt = (
             "Write a short, specific title for this coding-assistant conversation.\n"
             "Rules: 3-6 words, Title Case, no quotes, no ending punctuation, and "
@@ -161,11 +181,14 @@ def generate_conversation_title(user_input: str, assistant_reply: str) -> Option
             f"User request:\n{(user_input or '').strip()[:800]}\n\n"
             f"Assistant reply:\n{(assistant_reply or '').strip()[:800]}"
         )
-        response = client.responses.create(
-            model=get_backend_model_id(TITLE_SUITE_MODEL),
-            input=prompt,
-            max_output_tokens=500,
-            reasoning={"effort": "minimal"},
+        response = await asyncio.wait_for(
+            _title_client().responses.create(
+                model=get_backend_model_id(TITLE_SUITE_MODEL),
+                input=prompt,
+                max_output_tokens=500,
+                reasoning={"effort": "minimal"},
+            ),
+            TITLE_TIMEOUT_SECONDS,
         )
         return _clean_title(getattr(response, "output_text", "") or "")
     except Exception as e:
@@ -328,46 +351,54 @@ def build_model_settings(
         return ModelSettings()
 
 
-def compact_history(messages: List[Dict[str, str]], max_chars: int = HISTORY_MAX_CHARS) -> List[Dict[str, str]]:
-    """Compact a conversation history to fit within a character budget.
+# Built agents, shared by every service instance in the process. An agent is
+# stateless between runs (its per-run context arrives through the run), and
+# rebuilding it per request re-serialized the same instructions and tool
+# schemas every time; keeping one per (model, effort, kind) also keeps the
+# prompt prefix they produce byte-identical across runs.
+_agents: Dict[tuple, Agent] = {}
+_agents_lock = threading.Lock()
+
+
+def get_agent(model: str, reasoning_effort: Optional[str], kind: str) -> Agent:
+    """The shared agent for a model, reasoning effort and conversation kind."""
+    key = (model, reasoning_effort, kind)
+    with _agents_lock:
+        agent = _agents.get(key)
+        if agent is None:
+            from .coding_agent import create_coding_agent
+            agent = _agents[key] = create_coding_agent(
+                model, reasoning_effort, kind=kind
+            )
+        return agent
+
+
+def current_file_note(current_file: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """The run-input message naming the file the user has open, or None.
+
+    It changes from one message to the next, so it travels with the new user
+    message instead of in the instructions, which lead the prompt and must
+    stay byte-stable for the provider's prompt cache to hit.
+    """
+    path = (current_file or {}).get('path')
+    if not path:
+        return None
+    return {"role": "developer", "content": f"The user is currently viewing file: {path}"}
+
+
+def compact_history(
+    messages: List[Dict[str, str]],
+    max_tokens: int = conversation_history.HISTORY_MAX_TOKENS,
+) -> List[Dict[str, str]]:
+    """Compact a conversation history to fit within a token budget.
 
     Keeps the most recent messages verbatim and replaces older ones with a
     single summary message listing what was discussed, so the model retains
-    a thread of the conversation without the full text.
+    a thread of the conversation without the full text. Stateless; a
+    conversation's runs compact incrementally through conversation_history.
     """
-    total = sum(len(m.get("content") or "") for m in messages)
-    if total <= max_chars:
-        return messages
-
-    # Walk backwards keeping recent messages until the budget is half-spent;
-    # the rest of the budget stays available for the summary + new input.
-    kept: List[Dict[str, str]] = []
-    budget = max_chars // 2
-    used = 0
-    for msg in reversed(messages):
-        size = len(msg.get("content") or "")
-        if kept and used + size > budget:
-            break
-        kept.append(msg)
-        used += size
-    kept.reverse()
-
-    dropped = messages[:len(messages) - len(kept)]
-    if not dropped:
-        return kept
-
-    lines = []
-    for msg in dropped:
-        first_line = (msg.get("content") or "").strip().splitlines()
-        snippet = first_line[0][:COMPACTED_SNIPPET_CHARS] if first_line else ""
-        lines.append(f"- {msg.get('role', 'user')}: {snippet}")
-
-    summary = (
-        f"[Conversation compacted: {len(dropped)} earlier messages were summarized "
-        "to fit the context window. One-line summaries of the omitted messages:]\n"
-        + "\n".join(lines)
-    )
-    return [{"role": "user", "content": summary}] + kept
+    summary, folded = conversation_history.compact('', messages, max_tokens)
+    return conversation_history.render(summary, messages[folded:])
 
 
 # Argument keys surfaced with tool_call SSE events so the workspace activity
@@ -486,6 +517,8 @@ def extract_dispatched_tasks(output) -> Optional[List[Dict[str, Any]]]:
 def extract_usage(result, model_id: str) -> Optional[Dict[str, Any]]:
     """Token usage (with cost when priceable) from an SDK run result, or None.
 
+    ``cached_input_tokens`` is included when the provider reported it.
+
     The SDK aggregates usage on the run's context wrapper. An all-zero
     reading means nothing was tracked (a real run always spends input
     tokens), so it is treated as unavailable rather than reported as free.
@@ -501,7 +534,12 @@ def extract_usage(result, model_id: str) -> Optional[Dict[str, Any]]:
         "input_tokens": input_tokens,
         "output_tokens": output_tokens,
     }
-    cost = compute_cost_usd(model_id, input_tokens, output_tokens)
+    # Input tokens the provider served from its prompt cache (a subset of
+    # input_tokens, billed at the cached rate). Absent when not reported.
+    cached = getattr(getattr(usage, 'input_tokens_details', None), 'cached_tokens', None)
+    if isinstance(cached, int):
+        payload["cached_input_tokens"] = cached
+    cost = compute_cost_usd(model_id, input_tokens, output_tokens, cached or 0)
     if cost is not None:
         payload["cost_usd"] = cost
     return payload
@@ -711,9 +749,6 @@ class ImagiAgentService:
         self.model = model
         self.reasoning_effort = reasoning_effort
         self.agent_kind = agent_kind
-        # Agents cached per conversation kind: lead runs carry the delegation
-        # tool, task runs carry ask_user (+ its stop behavior).
-        self._agents: Dict[str, Agent] = {}
         # The kind of the conversation currently being run; set by
         # _prepare_run so the `agent` property builds the right variant.
         self._run_kind: Optional[str] = None
@@ -726,10 +761,9 @@ class ImagiAgentService:
             os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
 
     def _apply_reasoning_effort(self, reasoning_effort: Optional[str]) -> None:
-        """Update the reasoning effort, invalidating the cached agents if it changed."""
-        if reasoning_effort is not None and reasoning_effort != self.reasoning_effort:
+        """Update the reasoning effort the next run's agent is built with."""
+        if reasoning_effort is not None:
             self.reasoning_effort = reasoning_effort
-            self._agents = {}
 
     @property
     def agent(self) -> Agent:
@@ -738,14 +772,10 @@ class ImagiAgentService:
         _prepare_run stamps _run_kind before any caller reaches this, so the
         lead thread gets its delegation tool and task runs get ask_user;
         callers outside a run (tests, scripts) fall back to the plain agent.
+        Agents are shared process-wide (get_agent): lead runs carry the
+        delegation tool, task runs carry ask_user (+ its stop behavior).
         """
-        kind = self._run_kind or 'chat'
-        if kind not in self._agents:
-            from .coding_agent import create_coding_agent
-            self._agents[kind] = create_coding_agent(
-                self.model, self.reasoning_effort, kind=kind
-            )
-        return self._agents[kind]
+        return get_agent(self.model, self.reasoning_effort, self._run_kind or 'chat')
 
     # -------------------------------------------------------------------------
     # Conversation Management
@@ -819,15 +849,28 @@ class ImagiAgentService:
         content: str,
         metadata: Optional[Dict[str, Any]] = None,
     ) -> AgentMessage:
-        """Add an assistant message, with optional run metadata, to the conversation."""
-        return AgentMessage.objects.create(
+        """Add an assistant message, with optional run metadata, to the conversation.
+
+        The usage the metadata records is added to the conversation's token
+        counters (best-effort: a failed counter update never loses the
+        message).
+        """
+        message = AgentMessage.objects.create(
             conversation=conversation,
             role="assistant",
             content=content,
             metadata=metadata,
         )
+        try:
+            conversation_usage.add_message_usage(conversation, metadata)
+        except Exception as e:
+            logger.warning(f"Could not update conversation token counters: {e}")
+        return message
 
-    def autoname_from_first_reply(
+    def _is_first_reply(self, conversation: AgentConversation) -> bool:
+        return conversation.messages.filter(role="assistant").count() == 1
+
+    async def autoname_from_first_reply(
         self,
         conversation: AgentConversation,
         user_input: str,
@@ -846,13 +889,13 @@ class ImagiAgentService:
         try:
             if getattr(conversation, 'kind', 'chat') == 'lead':
                 return None
-            if conversation.messages.filter(role="assistant").count() != 1:
+            if not await sync_to_async(self._is_first_reply)(conversation):
                 return None
-            title = generate_conversation_title(user_input, response_content)
+            title = await generate_conversation_title(user_input, response_content)
             if not title:
                 return None
             conversation.title = title
-            conversation.save(update_fields=["title", "updated_at"])
+            await sync_to_async(conversation.save)(update_fields=["title", "updated_at"])
             return title
         except Exception as e:
             logger.warning(f"Auto-naming conversation {conversation.id} failed: {e}")
@@ -875,7 +918,7 @@ class ImagiAgentService:
             return
         try:
             from .usage_limits import record_usage
-            record_usage(
+            event = record_usage(
                 user,
                 model or self.model,
                 usage.get('input_tokens'),
@@ -884,25 +927,25 @@ class ImagiAgentService:
                 # the run conservatively instead of treating it as free.
                 cost_usd=usage.get('cost_usd'),
                 conversation_id=conversation.id if conversation else None,
+                cached_input_tokens=usage.get('cached_input_tokens') or 0,
             )
         except Exception as e:
             logger.warning(f"Could not record usage event: {e}")
+            return
+        if event is None or conversation is None:
+            return
+        try:
+            conversation_usage.add_metered_cost(conversation, event.cost_usd)
+        except Exception as e:
+            logger.warning(f"Could not update conversation cost counter: {e}")
 
     def build_conversation_history(self, conversation: AgentConversation) -> List[Dict[str, str]]:
-        """Build conversation history for the agent, compacting when long."""
-        messages = []
-
-        history_messages = AgentMessage.objects.filter(
-            conversation=conversation
-        ).order_by('created_at')
-
-        for msg in history_messages:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        """Build conversation history for the agent, compacting when long.
 
-        return compact_history(messages)
+        Loads only the messages after the conversation's compaction
+        checkpoint (see conversation_history).
+        """
+        return conversation_history.build(conversation)
 
     def get_project_info(self, project_id: Optional[int], user) -> Dict[str, Any]:
         """Get project information."""
@@ -942,10 +985,19 @@ class ImagiAgentService:
     # Main Processing
     # -------------------------------------------------------------------------
 
-    def _run_config(self, user) -> RunConfig:
+    def _run_config(self, user, conversation=None) -> RunConfig:
+        """The run's config. A conversation's runs share a prompt cache key,
+        so the provider routes them to where their common prefix (the
+        instructions, tools and history so far) is already cached."""
+        kwargs = {}
+        if conversation is not None and ModelSettings is not None:
+            kwargs['model_settings'] = ModelSettings(
+                extra_args={'prompt_cache_key': f'imagi-conversation-{conversation.id}'}
+            )
         return RunConfig(
             workflow_name="imagi_agent",
             trace_metadata={"user_id": str(user.id)},
+            **kwargs,
         )
 
     def _prepare_run(
@@ -1052,7 +1104,12 @@ class ImagiAgentService:
                 and conversation_history[-1]["content"] == user_input:
             conversation_history = conversation_history[:-1]
 
+        # Everything that differs per message goes after the history, so the
+        # prompt up to here repeats the previous run's.
         input_messages = list(conversation_history)
+        note = current_file_note(current_file)
+        if note:
+            input_messages.append(note)
         input_messages.append({"role": "user", "content": user_input})
 
         if run_state is not None:
@@ -1457,6 +1514,28 @@ class ImagiAgentService:
         except Exception as e:  # pragma: no cover - best effort
             logger.warning(f"Could not refresh run_started_at: {e}")
 
+    def _open_mirror_batch(self, context) -> Optional[int]:
+        """Batch the run's DB-mirror writes; returns the project id to close.
+
+        Only canonical-tree runs mirror at all (a task's worktree writes are
+        disk-only), so only they open a batch. The run's many edits then
+        reach the database as one flush per interval and one at run end,
+        instead of a round-trip per write.
+        """
+        if context is None or not context.project_id or not context.project_path:
+            return None
+        if context.effective_project_path != context.project_path:
+            return None
+        from .project_files_service import open_mirror_batch
+        open_mirror_batch(context.project_id, context.project_path)
+        return context.project_id
+
+    def _close_mirror_batch(self, project_id: Optional[int]) -> None:
+        """Flush the run's batched mirror writes (never raises)."""
+        if project_id:
+            from .project_files_service import close_mirror_batch
+            close_mirror_batch(project_id)
+
     async def process_stream(
         self,
         user_input: str,
@@ -1607,7 +1686,8 @@ class ImagiAgentService:
         Same work as process(), but streamed so the workspace can show text
         and tool activity while the run is still going. Yields dicts shaped
         {"type": ..., ...}; the terminal "done" event carries the same payload
-        process() returns, so both paths agree on the contract.
+        process() returns, so both paths agree on the contract. Only a
+        conversation's first reply is followed by anything: its "title".
 
         The assistant's reply is persisted even if the client disconnects
         mid-run: the agent has already edited files by then, so dropping the
@@ -1623,12 +1703,14 @@ class ImagiAgentService:
         result = None
         text_parts: List[str] = []
         persisted = False
+        title_job = None
         # Filled by _prepare_run just before it commits run_started_at: if the
         # awaiting task is cancelled (stop/tab close) while the worker thread
         # is still inside _prepare_run, the tuple assignment below never runs
         # but the marker may already be committed — cleanup resolves the
         # conversation through this holder instead.
         run_state: Dict[str, Any] = {}
+        mirror_project_id = None
 
         try:
             if not project_id:
@@ -1648,6 +1730,7 @@ class ImagiAgentService:
                 reasoning_effort=reasoning_effort,
                 run_state=run_state,
             )
+            mirror_project_id = self._open_mirror_batch(context)
 
             start_event = {"type": "start", "conversation_id": conversation.id}
             if run_state.get("user_message_id"):
@@ -1664,7 +1747,7 @@ class ImagiAgentService:
                 input=input_messages,
                 context=context,
                 max_turns=self._max_turns_for(conversation),
-                run_config=self._run_config(user),
+                run_config=self._run_config(user, conversation),
             )
 
             async for event in self._pump_stream_events(result, conversation, context, text_parts):
@@ -1696,7 +1779,7 @@ class ImagiAgentService:
                     ],
                     context=context,
                     max_turns=self._max_turns_for(conversation),
-                    run_config=self._run_config(user),
+                    run_config=self._run_config(user, conversation),
                 )
                 async for event in self._pump_stream_events(result, conversation, context, retry_parts):
                     yield event
@@ -1734,18 +1817,15 @@ class ImagiAgentService:
                 user, model, usage, conversation
             )
 
-            # Name the thread from its opening exchange (once). Emitting the
-            # title before "done" lets the sidebar swap the provisional
-            # first-line name for the AI one as the run wraps up.
-            new_title = await sync_to_async(self.autoname_from_first_reply)(
+            # Name the thread from its opening exchange (once), in the
+            # background: "done" goes out now, and the title event follows it
+            # when the naming call returns (see the end of this method). The
+            # job saves the title even if nobody is left to read the event.
+            title_job = asyncio.ensure_future(self.autoname_from_first_reply(
                 conversation, user_input, response_content
-            )
-            if new_title:
-                yield {
-                    "type": "title",
-                    "title": new_title,
-                    "conversation_id": conversation.id,
-                }
+            ))
+            _title_jobs.add(title_job)
+            title_job.add_done_callback(_title_jobs.discard)
 
             done_event = {
                 "type": "done",
@@ -1851,9 +1931,24 @@ class ImagiAgentService:
                     await sync_to_async(self._record_usage_event)(
                         user, model, interrupted_usage, conversation
                     )
+            if mirror_project_id:
+                await sync_to_async(self._close_mirror_batch)(mirror_project_id)
             if conversation is not None:
                 await sync_to_async(self._clear_run_started)(conversation)
 
+        # After the finally block, so the run marker is already cleared: the
+        # thread takes its next message while its title is still on the way.
+        # Shielded: a run cancelled after "done" stops waiting for the title,
+        # but the job still finishes and saves it.
+        if title_job is not None:
+            new_title = await asyncio.shield(title_job)
+            if new_title:
+                yield {
+                    "type": "title",
+                    "title": new_title,
+                    "conversation_id": conversation.id,
+                }
+
     def process(
         self,
         user_input: str,
@@ -1889,6 +1984,7 @@ class ImagiAgentService:
         conversation = None
         context = None
         run_state: Dict[str, Any] = {}
+        mirror_project_id = None
         try:
             if not user_input:
                 return {"success": False, "error": "Message is required"}
@@ -1903,6 +1999,7 @@ class ImagiAgentService:
                 reasoning_effort=reasoning_effort,
                 run_state=run_state,
             )
+            mirror_project_id = self._open_mirror_batch(context)
 
             run_kwargs: Dict[str, Any] = {}
             bounds_hook = make_run_bounds_hook(
@@ -1916,7 +2013,7 @@ class ImagiAgentService:
                 input=input_messages,
                 context=context,
                 max_turns=max_turns or self._max_turns_for(conversation),
-                run_config=self._run_config(user),
+                run_config=self._run_config(user, conversation),
                 **run_kwargs,
             )
 
@@ -1941,7 +2038,7 @@ class ImagiAgentService:
                     ],
                     context=context,
                     max_turns=max_turns or self._max_turns_for(conversation),
-                    run_config=self._run_config(user),
+                    run_config=self._run_config(user, conversation),
                     **run_kwargs,
                 )
                 response_content = result.final_output or ""
@@ -2032,6 +2129,7 @@ class ImagiAgentService:
         finally:
             # _prepare_run marked the run in flight; the blocking path ends
             # here (the holder covers a raise between its commit and return).
+            self._close_mirror_batch(mirror_project_id)
             if conversation is None:
                 conversation = run_state.get("conversation")
             if conversation is not None:
@@ -10,13 +10,24 @@ frames and sends input events through the normal authenticated API, so the
 exact same setup works in local development and on Railway.
 
 Process model (mirrors PreviewService's): Chromium is a plain subprocess
-tracked by PID/state files beside the project directory. All page state
+tracked by PID/state files beside the project directory — or, with
+BROWSER_PREVIEW_SHARED, one browser context in a Chromium shared by the
+whole host (see shared_browser), tracked by context id. All page state
 (current URL, history, session storage) lives in Chromium itself, so any
 Django worker can serve any request. Workers keep one pooled CDP connection
 per browser purely as a transport optimization — losing it costs nothing but
 a reconnect.
+
+Two transports share that model. The interaction methods (frame, input,
+navigate, resize) have async twins (``aframe`` ...) for the async preview
+views: an asyncio DevTools client whose reader task matches replies to
+requests by id, so concurrent calls to one browser pipeline on one socket
+and no thread waits on Chromium. Start, stop and the sync DRF views keep the
+blocking client. Each page operation is written once, as a generator of CDP
+commands (the ``*_steps`` methods), and run by either driver.
 """
 
+import asyncio
 import glob
 import hashlib
 import json
@@ -27,13 +38,25 @@ import subprocess
 import sys
 import threading
 import time
+import weakref
 
 import psutil
 import requests
 from django.conf import settings
 from websocket import create_connection, WebSocketException
 
+try:
+    from websockets.asyncio.client import connect as ws_connect
+    from websockets.exceptions import ConnectionClosed, WebSocketException as AsyncWebSocketException
+except ImportError:  # pragma: no cover - depends on the installed server
+    # Without the asyncio client (it ships with uvicorn[standard]) the async
+    # methods run the blocking client on a pool thread instead.
+    ws_connect = None
+    ConnectionClosed = AsyncWebSocketException = None
+
+from . import port_leases, preview_sessions, shared_browser
 from .preview_service import (
+    BROWSER_PID_SUFFIX,
     BROWSER_PROFILE_SUFFIX,
     BROWSER_STATE_SUFFIX,
     PreviewService,
@@ -44,7 +67,6 @@ logger = logging.getLogger(__name__)
 
 # Per-project files this service writes beside the dev-server PID files
 # (cleanup-relevant suffixes live in preview_service so its sweeps cover them).
-BROWSER_PID_SUFFIX = '_browser.pid'
 BROWSER_LOG_SUFFIX = '_browser.log'
 
 # Defaults until the client reports its pane size.
@@ -58,6 +80,9 @@ MAX_EVENTS_PER_REQUEST = 64
 FRAME_JPEG_QUALITY = 70
 MOTION_JPEG_QUALITY = 55
 
+# Reply timeout of one DevTools command on the asyncio client.
+CDP_CALL_TIMEOUT = 15
+
 # How long to wait for the Vite dev server to answer HTTP before pointing
 # Chromium at it. Vite itself is up in a couple of seconds; the generous
 # ceiling covers first-run dependency optimization.
@@ -196,20 +221,189 @@ class CdpConnection:
             pass
 
 
+class AsyncCdpConnection:
+    """Asyncio Chrome DevTools Protocol client for one target.
+
+    A reader task resolves each command's future by its id, so any number
+    of callers can have commands in flight on the one socket at once —
+    unlike CdpConnection there is nothing to serialize. Protocol events are
+    dropped unless the connection was opened with ``events=True``, in which
+    case ``next_event`` hands them out in order.
+    """
+
+    def __init__(self, ws, events=False):
+        self._ws = ws
+        self._next_id = 0
+        self._pending = {}
+        self._events = asyncio.Queue() if events else None
+        self._closed = None
+        # Same session-scoped bookkeeping as CdpConnection's.
+        self.applied_viewport = None
+        self.console_watch_registered = False
+        self._reader = asyncio.create_task(self._read())
+
+    @classmethod
+    async def open(cls, ws_url, events=False):
+        if ws_connect is None:
+            raise BrowserNotRunning('The asyncio DevTools client is not available.')
+        try:
+            # Frames can exceed the default 1 MiB message limit. No Origin
+            # header is sent, which Chromium requires of DevTools clients.
+            ws = await ws_connect(
+                ws_url, max_size=None, compression=None, open_timeout=CDP_CALL_TIMEOUT,
+            )
+        except (OSError, asyncio.TimeoutError, AsyncWebSocketException) as e:
+            raise BrowserNotRunning(f'Could not attach to browser page: {e}')
+        return cls(ws, events=events)
+
+    @property
+    def closed(self):
+        return self._closed is not None
+
+    async def _read(self):
+        try:
+            async for message in self._ws:
+                payload = json.loads(message)
+                future = self._pending.pop(payload.get('id'), None)
+                if future is not None:
+                    if not future.done():
+                        future.set_result(payload)
+                elif self._events is not None and 'method' in payload:
+                    self._events.put_nowait(payload)
+            self._closed = BrowserNotRunning('The preview browser closed the connection.')
+        except ConnectionClosed as e:
+            self._closed = BrowserNotRunning(f'The preview browser connection closed: {e}')
+        except Exception as e:  # pragma: no cover - defensive
+            logger.warning(f"DevTools connection failed: {e}")
+            self._closed = BrowserNotRunning(f'The preview browser connection failed: {e}')
+        finally:
+            # Also on cancellation (close()): commands still in flight fail
+            # now rather than waiting out their timeout.
+            if self._closed is None:
+                self._closed = BrowserNotRunning('The preview browser connection was closed.')
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(self._closed)
+            self._pending.clear()
+            if self._events is not None:
+                self._events.put_nowait(None)
+
+    async def send(self, method, params=None):
+        """Send a command without waiting for its reply."""
+        if self._closed:
+            raise self._closed
+        self._next_id += 1
+        await self._ws.send(json.dumps({
+            'id': self._next_id, 'method': method, 'params': params or {},
+        }))
+        return self._next_id
+
+    async def call(self, method, params=None, timeout=CDP_CALL_TIMEOUT):
+        if self._closed:
+            raise self._closed
+        self._next_id += 1
+        msg_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = future
+        try:
+            await self._ws.send(json.dumps({'id': msg_id, 'method': method, 'params': params or {}}))
+            payload = await asyncio.wait_for(future, timeout)
+        except (ConnectionClosed, asyncio.TimeoutError) as e:
+            raise BrowserNotRunning(f'{method}: no reply from the preview browser ({e!r})')
+        finally:
+            self._pending.pop(msg_id, None)
+        if 'error' in payload:
+            raise CdpError(f"{method}: {payload['error'].get('message', 'unknown CDP error')}")
+        return payload.get('result', {})
+
+    async def next_event(self, timeout):
+        """The next protocol event, or None after ``timeout`` seconds.
+
+        Raises BrowserNotRunning once the connection is gone.
+        """
+        try:
+            event = await asyncio.wait_for(self._events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is None:
+            self._events.put_nowait(None)  # stay closed for later calls
+            raise self._closed
+        return event
+
+    async def close(self):
+        if self._closed is None:
+            self._closed = BrowserNotRunning('The preview browser connection was closed.')
+        self._reader.cancel()
+        try:
+            await self._ws.close()
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Command drivers
+# ---------------------------------------------------------------------------
+# Page operations are generators that yield ``(method, params)`` for each
+# CDP command and receive its result; a CdpError is thrown back in at the
+# yield, so operations handle failures with plain try/except. Yielding a
+# number pauses for that many seconds. The drivers below run one on a
+# blocking or an asyncio connection, and the generator's return value is
+# theirs.
+
+def _drive(conn, steps):
+    result, error = None, None
+    while True:
+        try:
+            command = steps.throw(error) if error else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        if isinstance(command, (int, float)):
+            time.sleep(command)
+            continue
+        try:
+            result = conn.call(*command)
+        except CdpError as e:
+            error = e
+
+
+async def _adrive(conn, steps):
+    result, error = None, None
+    while True:
+        try:
+            command = steps.throw(error) if error else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result, error = None, None
+        if isinstance(command, (int, float)):
+            await asyncio.sleep(command)
+            continue
+        try:
+            result = await conn.call(*command)
+        except CdpError as e:
+            error = e
+
+
 # ---------------------------------------------------------------------------
 # Per-process CDP connection pool
 # ---------------------------------------------------------------------------
-# One long-lived connection per browser (keyed by DevTools port). Reusing it
-# saves two HTTP round-trips (/json/version, /json/list) plus a websocket
+# One long-lived connection per preview page, keyed by _pool_key: the
+# DevTools port, plus the page's target id when the page lives in the shared
+# browser (see shared_browser), where one port serves many projects. Reusing
+# it saves two HTTP round-trips (/json/version, /json/list) plus a websocket
 # handshake on every frame/input/navigate request. Entries also carry the
 # resolved page target and a lock: the target so callers skip /json/list on
 # the hot path, the lock because a single websocket cannot interleave two
 # requests' send/recv cycles.
 
-_cdp_pool = {}  # cdp_port -> {'ws_url', 'conn', 'page', 'lock'}
+_cdp_pool = {}  # (cdp_port, target_id) -> {'ws_url', 'conn', 'page', 'lock'}
 _cdp_pool_lock = threading.Lock()
 
 
+def _pool_key(state):
+    return (state['cdp_port'], state.get('target_id'))
+
+
 def _resolve_page_target(port, state):
     """Find (or open) the app's page target via the DevTools HTTP endpoint."""
     try:
@@ -217,6 +411,14 @@ def _resolve_page_target(port, state):
     except (requests.RequestException, ValueError) as e:
         raise BrowserNotRunning(f'Browser session is not reachable: {e}')
 
+    if state.get('target_id'):
+        # A page of the shared browser: only that exact target is this
+        # project's, and a closed one means its context is gone too.
+        page = next((t for t in targets if t.get('id') == state['target_id']), None)
+        if not page:
+            raise BrowserNotRunning('The preview page went away.')
+        return page
+
     page = next(
         (t for t in targets
          if t.get('type') == 'page' and not t.get('url', '').startswith('devtools://')),
@@ -234,14 +436,15 @@ def _resolve_page_target(port, state):
     return page
 
 
-def _pool_checkout(port, state):
-    """Return the pooled entry for a port, creating it on cache miss."""
+def _pool_checkout(state):
+    """Return the pooled entry for a session's page, creating it on cache miss."""
+    key = _pool_key(state)
     with _cdp_pool_lock:
-        entry = _cdp_pool.get(port)
+        entry = _cdp_pool.get(key)
     if entry is not None:
         return entry
 
-    page = _resolve_page_target(port, state)
+    page = _resolve_page_target(key[0], state)
     try:
         conn = CdpConnection(page['webSocketDebuggerUrl'])
     except (WebSocketException, OSError, KeyError) as e:
@@ -254,16 +457,16 @@ def _pool_checkout(port, state):
         'lock': threading.Lock(),
     }
     with _cdp_pool_lock:
-        existing = _cdp_pool.get(port)
+        existing = _cdp_pool.get(key)
         if existing is not None:
             # Another thread connected while we did; keep theirs.
             conn.close()
             return existing
-        _cdp_pool[port] = entry
+        _cdp_pool[key] = entry
     return entry
 
 
-def _pool_invalidate(port, entry=None):
+def _pool_invalidate(key, entry=None):
     """Drop (and close) a pooled connection.
 
     With ``entry``, only unmaps it if it is still the pooled one — a
@@ -272,15 +475,69 @@ def _pool_invalidate(port, entry=None):
     """
     current = None
     with _cdp_pool_lock:
-        current = _cdp_pool.get(port)
+        current = _cdp_pool.get(key)
         if entry is None or current is entry:
-            _cdp_pool.pop(port, None)
+            _cdp_pool.pop(key, None)
     if entry is not None:
         entry['conn'].close()
     elif current is not None:
         current['conn'].close()
 
 
+# The asyncio pool: one AsyncCdpConnection per browser *per event loop*,
+# since an asyncio socket belongs to the loop that opened it (a worker runs
+# one loop; tests and async_to_sync callers may run several). Entries hold
+# no lock — the connection multiplexes. A connecting entry is a task, so
+# concurrent first requests share one handshake instead of racing.
+
+_async_cdp_pools = weakref.WeakKeyDictionary()  # event loop -> {pool key: task -> entry}
+
+
+def _async_pool():
+    loop = asyncio.get_running_loop()
+    with _cdp_pool_lock:
+        return _async_cdp_pools.setdefault(loop, {})
+
+
+async def _async_connect(state):
+    # /json/list is a blocking HTTP call, but only on a pool miss.
+    page = await asyncio.to_thread(_resolve_page_target, state['cdp_port'], state)
+    ws_url = page.get('webSocketDebuggerUrl')
+    if not ws_url:
+        raise BrowserNotRunning('The preview page cannot be attached to.')
+    return {'conn': await AsyncCdpConnection.open(ws_url), 'page': page}
+
+
+async def _async_pool_checkout(state):
+    """The pooled asyncio entry for a session's page, connecting on a miss."""
+    key = _pool_key(state)
+    pool = _async_pool()
+    task = pool.get(key)
+    if task is not None and task.done() and (
+        task.cancelled() or task.exception() or task.result()['conn'].closed
+    ):
+        task = None
+    if task is None:
+        task = pool[key] = asyncio.ensure_future(_async_connect(state))
+    try:
+        # Shielded: one caller giving up must not cancel the others' connect.
+        return await asyncio.shield(task)
+    except BaseException:
+        if task.done() and pool.get(key) is task:
+            pool.pop(key, None)
+        raise
+
+
+async def _async_pool_invalidate(key, entry):
+    """Drop a pooled asyncio entry (if still current) and close its socket."""
+    pool = _async_pool()
+    task = pool.get(key)
+    if task is not None and task.done() and not task.cancelled() \
+            and not task.exception() and task.result() is entry:
+        pool.pop(key, None)
+    await entry['conn'].close()
+
+
 class BrowserPreviewService:
     """Drives a per-project headless Chromium for the workspace preview."""
 
@@ -311,7 +568,7 @@ class BrowserPreviewService:
         Idempotent: an already-healthy session is reused, so the workspace
         can call this on every mount without restarting anything.
         """
-        reap_idle_sessions()
+        preview_sessions.ensure_reaper()
 
         server_state = self.servers.ensure_preview()
         # The dev servers report a localhost preview URL; dual-stack projects
@@ -340,33 +597,37 @@ class BrowserPreviewService:
         if fresh:
             # Opening the app URL directly keeps about:blank out of the
             # page's history, so "back" never leads outside the app.
-            state = self._launch_chromium(width, height, dsf, app_url + '/')
+            state = self._open_session(width, height, dsf, app_url + '/')
         else:
             state['viewport'] = [width, height]
 
         state['app_url'] = app_url
         state['last_active'] = time.time()
         self._save_state(state)
+        preview_sessions.track(self.state_file, state['last_active'])
 
-        def body(conn, _page):
-            self._apply_viewport(conn, state)
+        def body(conn):
+            yield from self._apply_viewport_steps(conn, state)
             # Ask the live page where it is — the pooled target info records
             # the URL from when the connection was first resolved.
-            history = conn.call('Page.getNavigationHistory')
+            history = yield ('Page.getNavigationHistory', {})
             entries = history.get('entries', [])
             index = history.get('currentIndex', 0)
             current = entries[index].get('url', '') if 0 <= index < len(entries) else ''
             # A reused browser may sit on a network error page from before
             # the dev servers were (re)started; bring it back to the app.
             if not fresh and not current.startswith(app_url):
-                conn.call('Page.navigate', {'url': app_url + '/'})
-                time.sleep(0.3)  # let the first paint land in the frame below
-            payload = self._status_payload(conn, state)
-            self._attach_frame(conn, payload, None)
+                yield ('Page.navigate', {'url': app_url + '/'})
+                yield 0.3  # let the first paint land in the frame below
+            payload = yield from self._status_steps(conn, state)
+            yield from self._attach_frame_steps(payload, None)
             return payload
 
         status = self._with_page(state, body)
         status['servers'] = server_state.get('message', '')
+        # Present when this call (re)started the dev servers.
+        if server_state.get('startup'):
+            status['startup'] = server_state['startup']
         return status
 
     def stop(self):
@@ -381,26 +642,45 @@ class BrowserPreviewService:
     # ------------------------------------------------------------------
     # Interaction (served over the worker's pooled CDP connection)
     # ------------------------------------------------------------------
+    # Each has an async twin for the async views. The state-file read they
+    # start with runs on a pool thread there (asyncio.to_thread); only the
+    # CDP round-trips stay on the event loop.
 
     def frame(self, etag=None):
         """Return the current screenshot (unless it matches ``etag``) + nav state."""
         state = self._require_state(touch=True)
+        return self._with_page(state, lambda conn: self._frame_steps(conn, state, etag))
 
-        def body(conn, _page):
-            self._apply_viewport(conn, state)
-            payload = self._status_payload(conn, state)
-            self._attach_frame(conn, payload, etag)
-            return payload
+    async def aframe(self, etag=None):
+        # State-file reads and liveness checks are disk and /proc work: they
+        # take a pool thread briefly, but the CDP round-trips hold none.
+        state = await asyncio.to_thread(self._require_state, True)
+        return await self._awith_page(state, lambda conn: self._frame_steps(conn, state, etag))
 
-        return self._with_page(state, body)
+    def _frame_steps(self, conn, state, etag):
+        yield from self._apply_viewport_steps(conn, state)
+        payload = yield from self._status_steps(conn, state)
+        yield from self._attach_frame_steps(payload, etag)
+        return payload
 
     def dispatch_input(self, events, etag=None):
         """Forward a batch of mouse/keyboard/wheel events, then return a frame."""
+        state, steps = self._input_steps(events, etag)
+        # Not idempotent: a retry would dispatch the whole event batch twice.
+        return self._with_page(state, steps, idempotent=False)
+
+    async def adispatch_input(self, events, etag=None):
+        state, steps = await asyncio.to_thread(self._input_steps, events, etag)
+        return await self._awith_page(state, steps, idempotent=False)
+
+    def _input_steps(self, events, etag):
         if not isinstance(events, list) or len(events) > MAX_EVENTS_PER_REQUEST:
             raise BrowserPreviewError('Invalid input event batch.')
 
         state = self._require_state(touch=True)
         width, height = state.get('viewport', DEFAULT_VIEWPORT)
+        # The whole batch is validated before any of it reaches the page.
+        commands = [self._translate_event(event, width, height) for event in events]
         # Scroll/drag batches arrive back-to-back while the user's gesture is
         # in progress, so their frames prioritize latency over fidelity.
         motion = any(
@@ -408,82 +688,140 @@ class BrowserPreviewService:
             for e in events
         )
 
-        def body(conn, _page):
-            self._apply_viewport(conn, state)
-            for event in events:
-                method, params = self._translate_event(event, width, height)
-                conn.call(method, params)
-            payload = self._status_payload(conn, state)
-            self._attach_frame(
-                conn, payload, etag,
+        def steps(conn):
+            yield from self._apply_viewport_steps(conn, state)
+            for command in commands:
+                yield command
+            payload = yield from self._status_steps(conn, state)
+            yield from self._attach_frame_steps(
+                payload, etag,
                 quality=MOTION_JPEG_QUALITY if motion else FRAME_JPEG_QUALITY,
             )
             return payload
 
-        # Not idempotent: a retry would dispatch the whole event batch twice.
-        return self._with_page(state, body, idempotent=False)
+        return state, steps
 
     def navigate(self, action, path=None):
         """goto/back/forward/reload, then return a frame."""
         state = self._require_state(touch=True)
-        app_url = state.get('app_url', '')
-
-        def body(conn, _page):
-            self._apply_viewport(conn, state)
-            if action == 'goto':
-                # Only paths on the project's own frontend are addressable
-                # from the URL bar; the preview is not a general browser.
-                clean = self._normalize_path(path)
-                conn.call('Page.navigate', {'url': app_url + clean})
-            elif action in ('back', 'forward'):
-                history = conn.call('Page.getNavigationHistory')
-                index = history.get('currentIndex', 0) + (1 if action == 'forward' else -1)
-                entries = history.get('entries', [])
-                if 0 <= index < len(entries):
-                    conn.call('Page.navigateToHistoryEntry', {'entryId': entries[index]['id']})
-            elif action == 'reload':
-                conn.call('Page.reload', {'ignoreCache': False})
-            else:
-                raise BrowserPreviewError(f"Unknown navigation action: {action}")
-
-            # Give the navigation a beat to paint before the first frame.
-            time.sleep(0.15)
-            payload = self._status_payload(conn, state)
-            self._attach_frame(conn, payload, None)
-            return payload
-
         # Not idempotent: a retried 'back' navigates back twice, a retried
         # goto/reload re-fires the navigation.
-        return self._with_page(state, body, idempotent=False)
+        return self._with_page(
+            state, lambda conn: self._navigate_steps(conn, state, action, path), idempotent=False,
+        )
+
+    async def anavigate(self, action, path=None):
+        state = await asyncio.to_thread(self._require_state, True)
+        return await self._awith_page(
+            state, lambda conn: self._navigate_steps(conn, state, action, path), idempotent=False,
+        )
+
+    def _navigate_steps(self, conn, state, action, path):
+        app_url = state.get('app_url', '')
+        yield from self._apply_viewport_steps(conn, state)
+        if action == 'goto':
+            # Only paths on the project's own frontend are addressable
+            # from the URL bar; the preview is not a general browser.
+            clean = self._normalize_path(path)
+            yield ('Page.navigate', {'url': app_url + clean})
+        elif action in ('back', 'forward'):
+            history = yield ('Page.getNavigationHistory', {})
+            index = history.get('currentIndex', 0) + (1 if action == 'forward' else -1)
+            entries = history.get('entries', [])
+            if 0 <= index < len(entries):
+                yield ('Page.navigateToHistoryEntry', {'entryId': entries[index]['id']})
+        elif action == 'reload':
+            yield ('Page.reload', {'ignoreCache': False})
+        else:
+            raise BrowserPreviewError(f"Unknown navigation action: {action}")
+
+        # Give the navigation a beat to paint before the first frame.
+        yield 0.15
+        payload = yield from self._status_steps(conn, state)
+        yield from self._attach_frame_steps(payload, None)
+        return payload
 
     def resize(self, width, height, device_scale_factor=None):
         """Adopt the client pane's size (CSS pixels)."""
+        state = self._resized_state(width, height, device_scale_factor)
+        self._with_page(state, lambda conn: self._apply_viewport_steps(conn, state))
+        return {'viewport': state['viewport']}
+
+    async def aresize(self, width, height, device_scale_factor=None):
+        state = await asyncio.to_thread(self._resized_state, width, height, device_scale_factor)
+        await self._awith_page(state, lambda conn: self._apply_viewport_steps(conn, state))
+        return {'viewport': state['viewport']}
+
+    def _resized_state(self, width, height, device_scale_factor):
         state = self._require_state(touch=True)
         state['viewport'] = list(self._clamp_viewport(width, height))
         if device_scale_factor:
             state['device_scale_factor'] = self._clamp_dsf(device_scale_factor)
         self._save_state(state)
-        self._with_page(state, lambda conn, _page: self._apply_viewport(conn, state))
-        return {'viewport': state['viewport']}
+        return state
+
+    def screencast_target(self):
+        """(state, page websocket URL) for a frame stream (preview_screencast).
+
+        The stream opens a DevTools session of its own: the pooled connection
+        serves request/response calls and must not sit behind a long-lived
+        event stream.
+        """
+        state = self._require_state(touch=True)
+        page = _resolve_page_target(state['cdp_port'], state)
+        ws_url = page.get('webSocketDebuggerUrl')
+        if not ws_url:
+            raise BrowserNotRunning('The preview page cannot be attached to.')
+        return state, ws_url
 
     # ------------------------------------------------------------------
     # Chromium process management
     # ------------------------------------------------------------------
 
-    def _launch_chromium(self, width, height, dsf, initial_url='about:blank'):
+    def _open_session(self, width, height, dsf, initial_url):
+        """A fresh browser session showing ``initial_url``: a context of the
+        shared browser when that is enabled, else a browser of our own."""
         executable = find_chromium()
         if not executable:
             raise BrowserPreviewError(
                 'No Chromium/Chrome executable found. Install Chromium or set '
                 'BROWSER_PREVIEW_EXECUTABLE to a browser binary.'
             )
+        if shared_browser.enabled():
+            return self._open_shared_context(executable, width, height, dsf, initial_url)
+        return self._launch_chromium(executable, width, height, dsf, initial_url)
+
+    def _open_shared_context(self, executable, width, height, dsf, initial_url):
+        self._kill_browser(keep_profile=True)
+        try:
+            session = shared_browser.open_context(
+                sidecar_stem(self.project), initial_url, self.state_file, executable,
+                viewport=(width, height),
+            )
+        except (shared_browser.SharedBrowserError, port_leases.PortsExhausted) as e:
+            raise BrowserPreviewError(f'Could not open a preview in the shared browser: {e}')
+        logger.info(
+            f"Opened preview context for {self.project.name} in the shared browser "
+            f"(CDP port {session['cdp_port']})"
+        )
+        # No window flags here: the viewport and scale factor reach the page
+        # through start()'s emulation override alone.
+        state = {
+            **session,
+            'viewport': [width, height],
+            'device_scale_factor': dsf,
+            'last_active': time.time(),
+        }
+        self._save_state(state)
+        return state
 
+    def _launch_chromium(self, executable, width, height, dsf, initial_url='about:blank'):
         self._kill_browser(keep_profile=True)
 
-        cdp_port = self.servers._find_available_port_excluding(9300, 9400)
+        cdp_port = self.servers._lease_port('cdp')
         # The port range recycles: drop any pooled connection to a previous
         # browser that happened to use this port.
-        _pool_invalidate(cdp_port)
+        _pool_invalidate((cdp_port, None))
         os.makedirs(self.profile_dir, exist_ok=True)
         self._clear_singleton_locks()
 
@@ -515,6 +853,7 @@ class BrowserPreviewService:
 
         with open(self.pid_file, 'w') as f:
             f.write(str(process.pid))
+        port_leases.attach(cdp_port, process.pid)
 
         state = {
             'cdp_port': cdp_port,
@@ -560,11 +899,19 @@ class BrowserPreviewService:
                 pass
 
     def _kill_browser(self, keep_profile=False):
-        self.servers._kill_from_pid_file(self.pid_file)
         state = self._load_state()
-        if state and state.get('cdp_port'):
-            _pool_invalidate(state['cdp_port'])
-            self.servers._kill_by_port(state['cdp_port'])
+        preview_sessions.forget(self.state_file)
+        if state and state.get('context_id'):
+            # A context of the shared browser: close it, never the process
+            # (or the port) every other preview is using.
+            _pool_invalidate(_pool_key(state))
+            shared_browser.close_context(state['context_id'])
+        else:
+            self.servers._kill_from_pid_file(self.pid_file)
+            if state and state.get('cdp_port'):
+                _pool_invalidate(_pool_key(state))
+                self.servers._kill_by_port(state['cdp_port'])
+            port_leases.release_owner(sidecar_stem(self.project), kinds=('cdp',))
         try:
             os.remove(self.state_file)
         except OSError:
@@ -591,6 +938,10 @@ class BrowserPreviewService:
         except psutil.NoSuchProcess:
             return False
         if probe:
+            if state.get('context_id'):
+                # The shared browser outlives its contexts: ask whether ours
+                # is still open (it may have been evicted for memory).
+                return shared_browser.has_context(state['context_id'])
             try:
                 requests.get(f'http://127.0.0.1:{port}/json/version', timeout=2)
             except requests.RequestException:
@@ -616,36 +967,64 @@ class BrowserPreviewService:
     # CDP helpers
     # ------------------------------------------------------------------
 
-    def _with_page(self, state, body, idempotent=True):
-        """Run ``body(conn, page)`` on the pooled CDP connection for this browser.
+    def _with_page(self, state, steps, idempotent=True):
+        """Run ``steps(conn)`` on the pooled CDP connection for this browser.
 
-        The pooled connection is shared across requests and never closed by a
-        request; a transport or CDP failure invalidates the pool entry, the
-        page target is re-resolved and the body retried once (this covers a
-        connection gone stale behind the cache, e.g. after a browser restart).
-        A second failure propagates.
+        ``steps`` returns a command generator (see _drive) for the connection
+        it is given. The pooled connection is shared across requests and never
+        closed by a request; a transport or CDP failure invalidates the pool
+        entry, the page target is re-resolved and the steps retried once (this
+        covers a connection gone stale behind the cache, e.g. after a browser
+        restart). A second failure propagates.
 
-        ``idempotent=False`` disables the retry: input and navigation bodies
+        ``idempotent=False`` disables the retry: input and navigation steps
         perform their side effects before the trailing status/screenshot calls,
-        so re-running the whole body after a late failure would replay clicks,
+        so re-running them all after a late failure would replay clicks,
         keystrokes and history navigations against the live page.
         """
-        port = state['cdp_port']
+        key = _pool_key(state)
         last_error = None
         for attempt in (0, 1):
-            entry = _pool_checkout(port, state)
+            entry = _pool_checkout(state)
             with entry['lock']:
                 try:
-                    return body(entry['conn'], entry['page'])
+                    return _drive(entry['conn'], steps(entry['conn']))
                 except (WebSocketException, CdpError, ConnectionError, OSError) as e:
                     # Always drop the entry so the next request reconnects.
-                    _pool_invalidate(port, entry)
+                    _pool_invalidate(key, entry)
                     last_error = e
                     if attempt or not idempotent:
                         raise
             logger.info(f"Pooled CDP connection failed ({last_error}); reconnecting once")
 
-    def _apply_viewport(self, conn, state):
+    async def _awith_page(self, state, steps, idempotent=True):
+        """_with_page on the worker's asyncio connection pool.
+
+        Nothing is locked: concurrent requests for one browser pipeline their
+        commands on the shared connection, so unlike _with_page a CDP error
+        reply neither drops the connection nor retries; only transport
+        failures do.
+        Without the asyncio client the blocking path runs on a pool thread.
+        """
+        if ws_connect is None:
+            return await asyncio.to_thread(self._with_page, state, steps, idempotent)
+        key = _pool_key(state)
+        last_error = None
+        for attempt in (0, 1):
+            entry = await _async_pool_checkout(state)
+            try:
+                return await _adrive(entry['conn'], steps(entry['conn']))
+            except (BrowserNotRunning, OSError) as e:
+                # Only a broken transport drops the connection; a CdpError is
+                # the browser's reply to one command on a healthy socket that
+                # other requests are still using, so it just propagates.
+                await _async_pool_invalidate(key, entry)
+                last_error = e
+                if attempt or not idempotent:
+                    raise
+            logger.info(f"Pooled CDP connection failed ({last_error}); reconnecting once")
+
+    def _apply_viewport_steps(self, conn, state):
         width, height = state.get('viewport', DEFAULT_VIEWPORT)
         dsf = float(state.get('device_scale_factor', 1))
         requested = [int(width), int(height), dsf]
@@ -657,7 +1036,7 @@ class BrowserPreviewService:
         # None, forcing one apply.
         if conn.applied_viewport == requested:
             return
-        conn.call('Emulation.setDeviceMetricsOverride', {
+        yield ('Emulation.setDeviceMetricsOverride', {
             'width': requested[0],
             'height': requested[1],
             'deviceScaleFactor': dsf,
@@ -669,17 +1048,17 @@ class BrowserPreviewService:
     # param (Chrome 104+); flipped off on the first rejection.
     _fast_screenshots = True
 
-    def _capture_screenshot(self, conn, quality):
+    def _capture_screenshot_steps(self, quality):
         params = {'format': 'jpeg', 'quality': int(quality)}
         if BrowserPreviewService._fast_screenshots:
             try:
-                return conn.call('Page.captureScreenshot', {**params, 'optimizeForSpeed': True})
+                return (yield ('Page.captureScreenshot', {**params, 'optimizeForSpeed': True}))
             except CdpError:
                 BrowserPreviewService._fast_screenshots = False
-        return conn.call('Page.captureScreenshot', params)
+        return (yield ('Page.captureScreenshot', params))
 
-    def _attach_frame(self, conn, payload, etag, quality=FRAME_JPEG_QUALITY):
-        shot = self._capture_screenshot(conn, quality)
+    def _attach_frame_steps(self, payload, etag, quality=FRAME_JPEG_QUALITY):
+        shot = yield from self._capture_screenshot_steps(quality)
         data = shot.get('data', '')
         # The etag only has to change when the frame does, so hash the base64
         # text as-is — decoding it first would just burn CPU per frame.
@@ -691,8 +1070,16 @@ class BrowserPreviewService:
             payload['frame'] = data
 
     def _status_payload(self, conn, state):
-        self._ensure_console_watch(conn)
-        history = conn.call('Page.getNavigationHistory')
+        return _drive(conn, self._status_steps(conn, state))
+
+    def _status_steps(self, conn, state):
+        yield from self._ensure_console_watch_steps(conn)
+        history = yield ('Page.getNavigationHistory', {})
+        console_errors = yield from self._collect_console_errors_steps()
+        return self._status_from(history, console_errors, state)
+
+    def _status_from(self, history, console_errors, state):
+        """The status payload for a Page.getNavigationHistory result."""
         entries = history.get('entries', [])
         index = history.get('currentIndex', 0)
         current = entries[index] if 0 <= index < len(entries) else {}
@@ -704,10 +1091,10 @@ class BrowserPreviewService:
             'can_go_forward': index < len(entries) - 1,
             'viewport': state.get('viewport', list(DEFAULT_VIEWPORT)),
             'device_scale_factor': state.get('device_scale_factor', 1),
-            'console_errors': self._collect_console_errors(conn),
+            'console_errors': console_errors,
         }
 
-    def _ensure_console_watch(self, conn):
+    def _ensure_console_watch_steps(self, conn):
         """Arm the console collector for documents the page navigates to next.
 
         Registered once per pooled connection (registrations live exactly as
@@ -720,10 +1107,10 @@ class BrowserPreviewService:
         try:
             # Verified against real Chrome: the registration is inert until
             # the Page domain is enabled. Enabling makes Chromium emit Page
-            # events on this socket between requests; call()'s recv loop
-            # already skips them, and they only fire on navigations.
-            conn.call('Page.enable')
-            conn.call('Page.addScriptToEvaluateOnNewDocument', {'source': _CONSOLE_WATCH_JS})
+            # events on this socket between requests; both clients skip
+            # them, and they only fire on navigations.
+            yield ('Page.enable', {})
+            yield ('Page.addScriptToEvaluateOnNewDocument', {'source': _CONSOLE_WATCH_JS})
         except CdpError as e:
             # The collector still installs lazily on every poll; only errors
             # raised before a document's first poll would be missed.
@@ -732,13 +1119,21 @@ class BrowserPreviewService:
 
     def _collect_console_errors(self, conn):
         """Read (installing if needed) the page's recent console-error buffer."""
+        return _drive(conn, self._collect_console_errors_steps())
+
+    def _collect_console_errors_steps(self):
         try:
-            result = conn.call('Runtime.evaluate', {
+            result = yield ('Runtime.evaluate', {
                 'expression': _CONSOLE_COLLECT_JS,
                 'returnByValue': True,
             })
         except CdpError:
             return []  # diagnostics must never fail a frame
+        return self._parse_console_errors(result)
+
+    @staticmethod
+    def _parse_console_errors(result):
+        """The validated error list from a _CONSOLE_COLLECT_JS evaluation."""
         if result.get('exceptionDetails'):
             return []
         raw = result.get('result', {}).get('value')
@@ -830,6 +1225,9 @@ class BrowserPreviewService:
             if now - state.get('last_active', 0) > 30:
                 state['last_active'] = now
                 self._save_state(state)
+            # Also how a worker that did not start the session learns of it.
+            preview_sessions.track(self.state_file, state.get('last_active', 0))
+            preview_sessions.ensure_reaper()
         return state
 
     def _load_state(self):
@@ -918,61 +1316,3 @@ def find_chromium():
                 return candidate
 
     return None
-
-
-def reap_idle_sessions():
-    """Shut down preview sessions (browser + dev servers) idle past the limit.
-
-    Runs opportunistically when any preview starts. Works purely from the
-    per-project files on disk so it needs no database access and covers
-    every user's projects.
-    """
-    timeout = getattr(settings, 'BROWSER_PREVIEW_IDLE_TIMEOUT', 1800)
-    if not timeout:
-        return
-
-    root = getattr(settings, 'PROJECTS_ROOT', None)
-    if not root or not os.path.isdir(root):
-        return
-
-    now = time.time()
-    for state_file in glob.glob(os.path.join(root, '*', f'*{BROWSER_STATE_SUFFIX}')):
-        try:
-            with open(state_file, 'r') as f:
-                state = json.load(f)
-            if not isinstance(state, dict):
-                continue
-            if now - state.get('last_active', 0) < timeout:
-                continue
-
-            prefix = state_file[:-len(BROWSER_STATE_SUFFIX)]
-            logger.info(f"Reaping idle preview session: {os.path.basename(prefix)}")
-            # Browser first, then the dev servers recorded by PreviewService.
-            _kill_pid_file(prefix + BROWSER_PID_SUFFIX)
-            _kill_pid_file(prefix + '_frontend.pid')
-            _kill_pid_file(prefix + '_backend.pid')
-            for leftover in (state_file, prefix + '_preview_ports.json'):
-                try:
-                    os.remove(leftover)
-                except OSError:
-                    pass
-            shutil.rmtree(prefix + BROWSER_PROFILE_SUFFIX, ignore_errors=True)
-        except Exception as e:
-            logger.warning(f"Could not reap preview session {state_file}: {e}")
-
-
-def _kill_pid_file(pid_file):
-    if not os.path.exists(pid_file):
-        return
-    try:
-        with open(pid_file, 'r') as f:
-            pid = int(f.read().strip())
-        process = psutil.Process(pid)
-        for proc in process.children(recursive=True) + [process]:
-            PreviewService._stop_process(proc)
-    except (OSError, ValueError, psutil.NoSuchProcess, psutil.AccessDenied):
-        pass
-    try:
-        os.remove(pid_file)
-    except OSError:
-        pass
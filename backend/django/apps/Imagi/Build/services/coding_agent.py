@@ -279,8 +279,11 @@ def get_dynamic_coding_instructions(
     """Generate dynamic instructions for the agent based on context.
 
     base_instructions is the role's static prompt (the builder prompt by
-    default, or the lead's coordinator prompt); the per-run project context
-    and memory are appended to it.
+    default, or the lead's coordinator prompt); the project context and
+    memory are appended to it. Only what is fixed for the project belongs
+    here: the instructions lead every prompt, so they must read the same on
+    every run for the provider's prompt cache to hit (the file the user has
+    open travels with the run input instead).
     """
     ctx = context.context
     instructions = base_instructions
@@ -289,7 +292,6 @@ def get_dynamic_coding_instructions(
         project_name = getattr(ctx, 'project_name', None)
         project_description = getattr(ctx, 'project_description', None)
         project_path = getattr(ctx, 'project_path', None)
-        current_file = getattr(ctx, 'current_file', None)
 
         additional_context = []
 
@@ -299,11 +301,6 @@ def get_dynamic_coding_instructions(
         if project_description:
             additional_context.append(f"Project Description: {project_description}")
 
-        if current_file:
-            file_path = current_file.get('path')
-            if file_path:
-                additional_context.append(f"\nThe user is currently viewing file: {file_path}")
-
         if additional_context:
             instructions += "\n\nCurrent Context:\n" + "\n".join(additional_context)
 
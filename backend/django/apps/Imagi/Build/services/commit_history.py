@@ -0,0 +1,260 @@
+"""
+Paged, cached commit history for the version-history API.
+
+Long-lived projects carry thousands of auto-checkpoint commits, and the
+history view is polled. Listing it used to run ``git log`` over the whole
+history on every GET and return all of it. Instead:
+
+- Pages are cursor-based: ``page(path, before=<hash>, limit=N)`` returns
+  the ``N`` commits after ``before`` in ``git log`` order (the newest ``N``
+  without a cursor) and the cursor for the next page.
+- ``git log`` runs with a NUL-delimited machine format (``-z`` and unit
+  separators), so any subject — pipes included — parses exactly.
+- Each repo keeps the prefix of its log walked so far, keyed by the HEAD
+  it was walked from. A poll of an unchanged repo costs one HEAD lookup
+  (a ``rev-parse``, or none at all with the pygit2 backend); deeper pages
+  walk only the commits not walked yet.
+- When HEAD moves forward (new commits on top), only ``old..new`` is walked
+  and put in front of the cached prefix. Anything else — a reset, a merge
+  that doesn't descend from the cached HEAD — drops the cache.
+
+Relative dates ("3 hours ago") are computed per response from the commit
+timestamp, so cached entries never go stale.
+"""
+
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from . import git_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Commits walked per `git log` call when a page reaches past the cached
+# prefix (at least a page's worth).
+WALK_BATCH = 200
+
+# Repos whose history is kept per process, least recently used evicted first.
+HISTORY_MAX_REPOS = 64
+
+# Field order in the log format. The subject is last so that splitting on
+# the unit separator can never cut it short.
+_FIELDS = ('hash', 'parents', 'author', 'date', 'timestamp', 'message')
+_LOG_FORMAT = '%x1f'.join(('%H', '%P', '%an', '%ai', '%at', '%s'))
+
+
+class UnknownCursor(ValueError):
+    """``before`` names no commit in the current history."""
+
+
+# A full commit hash (SHA-1 or SHA-256), the only form page() hands out.
+_COMMIT_HASH_RE = re.compile(r'^[0-9a-f]{40}(?:[0-9a-f]{24})?$')
+
+
+def _in_history(project_path, commit, head):
+    """Whether ``commit`` is reachable from ``head``, asked of git directly
+    so a bogus cursor fails without walking the log in search of it."""
+    if not _COMMIT_HASH_RE.match(commit or ''):
+        return False
+    result = subprocess.run(
+        ['git', 'merge-base', '--is-ancestor', commit, head],
+        cwd=project_path, capture_output=True,
+    )
+    return result.returncode == 0
+
+
+def _run_log(project_path, *revs, skip=0, count=None):
+    args = ['git', 'log', '-z', f'--format={_LOG_FORMAT}']
+    if skip:
+        args.append(f'--skip={skip}')
+    if count is not None:
+        args.append(f'-n{count}')
+    args.extend(revs)
+    args.append('--')
+    result = subprocess.run(args, cwd=project_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise git_backend.GitBackendError(result.stderr.strip() or 'git log failed')
+    commits = []
+    for record in result.stdout.split('\0'):
+        record = record.lstrip('\n')
+        if not record:
+            continue
+        values = record.split('\x1f', len(_FIELDS) - 1)
+        if len(values) != len(_FIELDS):
+            logger.warning(f"Skipping unparseable git log record in {project_path}")
+            continue
+        commit = dict(zip(_FIELDS, values))
+        commit['parents'] = commit['parents'].split()
+        commit['timestamp'] = int(commit['timestamp'] or 0)
+        commits.append(commit)
+    return commits
+
+
+class _RepoHistory:
+    """The walked prefix of one repo's log, valid for one HEAD."""
+
+    def __init__(self, path):
+        self.path = path
+        self.head = None
+        self.commits = []
+        self.positions = {}  # hash -> index in commits
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def _reset(self, head):
+        self.head = head
+        self.commits = []
+        self.positions = {}
+        self.complete = head is None
+
+    def _reindex(self):
+        self.positions = {c['hash']: i for i, c in enumerate(self.commits)}
+
+    def _extend(self, count):
+        """Walk up to ``count`` more commits past the cached prefix."""
+        if self.complete:
+            return
+        walked = _run_log(self.path, self.head, skip=len(self.commits), count=count)
+        base = len(self.commits)
+        for offset, commit in enumerate(walked):
+            self.positions[commit['hash']] = base + offset
+        self.commits.extend(walked)
+        if len(walked) < count:
+            self.complete = True
+
+    def _advance(self, head):
+        """Follow HEAD to ``head``, reusing the cached prefix when it can."""
+        if head == self.head:
+            return
+        if self.head is None or head is None or not self.commits:
+            self._reset(head)
+            return
+        new = _run_log(self.path, f'{self.head}..{head}')
+        # Only a plain fast-forward keeps the old log a suffix of the new
+        # one: the oldest new commit must sit directly on the old HEAD.
+        if new and new[-1]['parents'] == [self.head] and all(
+            len(c['parents']) == 1 for c in new
+        ):
+            self.commits = new + self.commits
+            self.head = head
+            self._reindex()
+        else:
+            self._reset(head)
+
+    def page(self, head, before, limit):
+        with self.lock:
+            self._advance(head)
+            start = 0
+            if before:
+                if before not in self.positions and (
+                    self.complete or not _in_history(self.path, before, self.head)
+                ):
+                    raise UnknownCursor(before)
+                while before not in self.positions and not self.complete:
+                    self._extend(max(WALK_BATCH, limit))
+                if before not in self.positions:
+                    raise UnknownCursor(before)
+                start = self.positions[before] + 1
+            # One extra commit tells whether another page exists.
+            wanted = start + limit + 1
+            if len(self.commits) < wanted and not self.complete:
+                self._extend(max(WALK_BATCH, wanted - len(self.commits)))
+            window = self.commits[start:start + limit]
+            has_more = len(self.commits) > start + limit
+            return list(window), has_more
+
+
+_histories = OrderedDict()  # realpath(repo) -> _RepoHistory
+_histories_lock = threading.Lock()
+
+
+def _history_for(project_path):
+    key = os.path.realpath(project_path)
+    with _histories_lock:
+        history = _histories.get(key)
+        if history is None:
+            history = _RepoHistory(key)
+            _histories[key] = history
+            while len(_histories) > HISTORY_MAX_REPOS:
+                _histories.popitem(last=False)
+        else:
+            _histories.move_to_end(key)
+    return history
+
+
+def discard(project_path):
+    """Forget a repo's cached history (e.g. when its directory is removed)."""
+    with _histories_lock:
+        _histories.pop(os.path.realpath(project_path), None)
+
+
+def relative_date(timestamp, now=None):
+    """The same wording ``git log --format=%ar`` uses."""
+    now = time.time() if now is None else now
+    diff = int(now - timestamp)
+    if diff < 0:
+        return 'in the future'
+    if diff < 90:
+        return _ago(diff, 'second')
+    minutes = (diff + 30) // 60
+    if minutes < 90:
+        return _ago(minutes, 'minute')
+    hours = (minutes + 30) // 60
+    if hours < 36:
+        return _ago(hours, 'hour')
+    days = (hours + 12) // 24
+    if days < 14:
+        return _ago(days, 'day')
+    if days < 70:
+        return _ago((days + 3) // 7, 'week')
+    if days < 365:
+        return _ago((days + 15) // 30, 'month')
+    if days < 1825:
+        total_months = (days * 12 * 2 + 365) // (365 * 2)
+        years, months = divmod(total_months, 12)
+        if months:
+            return f"{_count(years, 'year')}, {_ago(months, 'month')}"
+        return _ago(years, 'year')
+    return _ago((days + 183) // 365, 'year')
+
+
+def _count(n, unit):
+    return f"{n} {unit}{'' if n == 1 else 's'}"
+
+
+def _ago(n, unit):
+    return f"{_count(n, unit)} ago"
+
+
+def page(project_path, before=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of history: ``(commits, next_cursor)``.
+
+    ``next_cursor`` is the hash to pass as ``before`` for the following
+    page, or None on the last one. Raises UnknownCursor for a ``before``
+    not in the current history (say, after a reset removed it).
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    head = git_backend.get_backend().head(project_path)
+    if head is None:
+        return [], None
+    window, has_more = _history_for(project_path).page(head, before, limit)
+    now = time.time()
+    commits = [
+        {
+            'hash': c['hash'],
+            'message': c['message'],
+            'author': c['author'],
+            'date': c['date'],
+            'relative_date': relative_date(c['timestamp'], now),
+        }
+        for c in window
+    ]
+    next_cursor = commits[-1]['hash'] if has_more and commits else None
+    return commits, next_cursor
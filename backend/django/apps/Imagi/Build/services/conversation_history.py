@@ -0,0 +1,202 @@
+"""
+Conversation history for agent runs, compacted incrementally.
+
+Every run used to load all of its conversation's messages and re-run
+compaction over them: a budget in characters, and a summary rebuilt from
+scratch. A long-lived lead thread re-read megabytes of history per message,
+and once it was over budget the compacted window moved with every message,
+so the prompt prefix never repeated and provider-side prompt caching never
+hit.
+
+Compaction now leaves a checkpoint on the conversation
+(AgentConversation.history_summary and history_compacted_through, the id
+of the last message folded into the summary):
+
+    history = conversation_history.build(conversation)
+
+loads only the messages after the checkpoint. When those (plus the summary)
+run over HISTORY_MAX_TOKENS, the oldest are folded into the summary until
+the rest fit in half the budget, and the checkpoint moves forward. Between
+compactions the history therefore only grows at its end — summary first,
+then the same messages in the same order — so every run's prompt starts
+with the previous run's. The summary keeps one line per folded message, and
+its oldest lines are dropped once it passes SUMMARY_MAX_TOKENS.
+
+Budgets are in model tokens, counted with tiktoken when it is installed
+(and approximated from the length otherwise). Counts are cached by a digest
+of the text, so a message is tokenized once per worker rather than once per
+run without the cache holding on to every message it has seen.
+
+A restore that truncates the thread to before the checkpoint discards it
+(``rewind``); the next run rebuilds it from the remaining messages.
+"""
+
+import functools
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ..models import AgentConversation, AgentMessage
+
+try:  # Exact token counts; otherwise approximated from the length
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Token budget for the history sent to the model, summary included.
+HISTORY_MAX_TOKENS = 15_000
+# The summary's own share; its oldest lines go first past this.
+SUMMARY_MAX_TOKENS = HISTORY_MAX_TOKENS // 5
+COMPACTED_SNIPPET_CHARS = 120
+
+# The GPT-4o/GPT-5 family's encoding, and the ratio used without tiktoken.
+TOKEN_ENCODING = 'o200k_base'
+CHARS_PER_TOKEN = 4
+# Token counts this worker keeps, keyed by text digest.
+TOKEN_CACHE_SIZE = 16_384
+
+SUMMARY_HEADER = (
+    "[Conversation compacted: earlier messages were summarized to fit the "
+    "context window. One-line summaries of the omitted messages:]"
+)
+DROPPED_LINE = "- (older summaries omitted)"
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:  # pragma: no cover - encoding files unavailable offline
+        return None
+
+
+_token_counts = OrderedDict()  # digest of text -> token count
+_token_counts_lock = threading.Lock()
+
+
+def _encode_count(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str) -> int:
+    """Model tokens in ``text``."""
+    if not text:
+        return 0
+    key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = _encode_count(text)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        while len(_token_counts) > TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def _message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content") or "")
+
+
+def _summary_line(message: Dict[str, str]) -> str:
+    first_line = (message.get("content") or "").strip().splitlines()
+    snippet = first_line[0][:COMPACTED_SNIPPET_CHARS] if first_line else ""
+    return f"- {message.get('role', 'user')}: {snippet}"
+
+
+def _trim_summary(lines: List[str], max_tokens: int) -> List[str]:
+    total = sum(count_tokens(line) for line in lines)
+    start = 0
+    while total > max_tokens and start < len(lines) - 1:
+        total -= count_tokens(lines[start])
+        start += 1
+    if start == 0:
+        return lines
+    kept = lines[start:]
+    return kept if kept[0] == DROPPED_LINE else [DROPPED_LINE] + kept
+
+
+def compact(
+    summary: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int = HISTORY_MAX_TOKENS,
+    summary_max_tokens: int = SUMMARY_MAX_TOKENS,
+) -> Tuple[str, int]:
+    """Fold the oldest ``messages`` into ``summary`` if over budget.
+
+    Returns ``(summary, folded)``: the new summary and how many of the
+    leading messages it now stands for (0 when everything fits). The most
+    recent message is always kept.
+    """
+    total = count_tokens(summary) + sum(_message_tokens(m) for m in messages)
+    if total <= max_tokens or len(messages) < 2:
+        return summary, 0
+
+    # Walk backwards keeping recent messages until half the budget is spent;
+    # the rest stays available for the summary and the new input.
+    budget = max_tokens // 2
+    used = 0
+    kept = 0
+    for message in reversed(messages):
+        size = _message_tokens(message)
+        if kept and used + size > budget:
+            break
+        kept += 1
+        used += size
+    folded = len(messages) - kept
+    if not folded:
+        return summary, 0
+
+    lines = summary.splitlines() if summary else []
+    lines += [_summary_line(m) for m in messages[:folded]]
+    lines = _trim_summary(lines, summary_max_tokens)
+    return "\n".join(lines), folded
+
+
+def render(summary: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """The history the model sees: the summary (if any), then the messages."""
+    if not summary:
+        return list(messages)
+    return [{"role": "user", "content": f"{SUMMARY_HEADER}\n{summary}"}] + list(messages)
+
+
+def build(conversation, max_tokens: int = HISTORY_MAX_TOKENS) -> List[Dict[str, str]]:
+    """The conversation's history for its next run, moving its compaction
+    checkpoint forward when the messages since it run over budget."""
+    through = conversation.history_compacted_through
+    qs = AgentMessage.objects.filter(conversation=conversation)
+    if through is not None:
+        qs = qs.filter(id__gt=through)
+    rows = list(qs.order_by('created_at', 'id').values_list('id', 'role', 'content'))
+    messages = [{"role": role, "content": content} for _id, role, content in rows]
+
+    summary, folded = compact(conversation.history_summary, messages, max_tokens)
+    if folded:
+        through = rows[folded - 1][0]
+        AgentConversation.objects.filter(id=conversation.id).update(
+            history_summary=summary, history_compacted_through=through
+        )
+        conversation.history_summary = summary
+        conversation.history_compacted_through = through
+        messages = messages[folded:]
+    return render(summary, messages)
+
+
+def rewind(conversation, first_removed_id: Optional[int]) -> None:
+    """Discard the checkpoint if messages it summarizes were removed (from
+    ``first_removed_id`` on)."""
+    through = conversation.history_compacted_through
+    if through is None or first_removed_id is None or first_removed_id > through:
+        return
+    conversation.history_summary = ''
+    conversation.history_compacted_through = None
+    conversation.save(update_fields=['history_summary', 'history_compacted_through'])
@@ -0,0 +1,142 @@
+"""
+Per-conversation usage counters (AgentConversation.input_tokens,
+output_tokens, cached_input_tokens, cost_usd).
+
+A conversation's token total used to be recomputed on every serialization
+by loading every message's metadata JSON and summing its usage in Python.
+The counters are now kept at write time instead:
+
+- ``add_message_usage`` runs as an assistant message is persisted and adds
+  the usage recorded in its metadata — exactly what the old per-read sum
+  counted, so ``total_tokens`` keeps its meaning (and stays None until a
+  message carries usage). The cached share of the input is added alongside,
+  for the conversation's prompt-cache hit rate.
+- ``add_metered_cost`` runs as Payments records a UsageEvent for the
+  conversation and adds that event's cost, so ``cost_usd`` matches the
+  metering, interrupted and corrective rounds included.
+
+Both are single ``UPDATE ... SET col = col + n`` statements (F expressions),
+so concurrent runs never lose an increment. ``recompute`` rebuilds the
+counters from messages and usage events (the backfill_conversation_usage
+command, and a checkpoint restore after it deletes the later messages); it
+sets absolute values, so it is safe to re-run.
+"""
+
+from decimal import Decimal
+
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+
+def message_usage(metadata):
+    """(input_tokens, output_tokens) a message's metadata records, or None.
+
+    Only integer counts are trusted: anything else means the run's usage was
+    not captured, which must read as unknown rather than zero.
+    """
+    usage = metadata.get('usage') if isinstance(metadata, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    input_tokens = usage.get('input_tokens')
+    output_tokens = usage.get('output_tokens')
+    if not isinstance(input_tokens, int) or not isinstance(output_tokens, int):
+        return None
+    return input_tokens, output_tokens
+
+
+def message_cached_tokens(metadata) -> int:
+    """Input tokens a message's usage says were served from the prompt cache.
+
+    0 when not reported: older messages, and providers without caching.
+    """
+    usage = metadata.get('usage') if isinstance(metadata, dict) else None
+    cached = usage.get('cached_input_tokens') if isinstance(usage, dict) else None
+    return cached if isinstance(cached, int) else 0
+
+
+def add_message_usage(conversation, metadata) -> bool:
+    """Add one persisted message's usage to its conversation's counters."""
+    from apps.Imagi.Build.models import AgentConversation
+
+    tokens = message_usage(metadata)
+    if tokens is None:
+        return False
+    input_tokens, output_tokens = tokens
+    cached = message_cached_tokens(metadata)
+    AgentConversation.objects.filter(pk=conversation.id).update(
+        input_tokens=Coalesce(F('input_tokens'), 0) + input_tokens,
+        output_tokens=Coalesce(F('output_tokens'), 0) + output_tokens,
+        cached_input_tokens=F('cached_input_tokens') + cached,
+    )
+    # Keep the caller's instance in step without re-reading the row.
+    seen_in = getattr(conversation, 'input_tokens', None) or 0
+    seen_out = getattr(conversation, 'output_tokens', None) or 0
+    seen_cached = getattr(conversation, 'cached_input_tokens', None) or 0
+    conversation.input_tokens = seen_in + input_tokens
+    conversation.output_tokens = seen_out + output_tokens
+    conversation.cached_input_tokens = seen_cached + cached
+    return True
+
+
+def add_metered_cost(conversation, cost_usd) -> None:
+    """Add a UsageEvent's metered cost to its conversation's counter."""
+    from apps.Imagi.Build.models import AgentConversation
+
+    if not cost_usd:
+        return
+    cost = Decimal(str(cost_usd))
+    AgentConversation.objects.filter(pk=conversation.id).update(
+        cost_usd=F('cost_usd') + cost
+    )
+    seen = getattr(conversation, 'cost_usd', None) or 0
+    conversation.cost_usd = Decimal(str(seen)) + cost
+
+
+def recompute(conversations, batch_size=500) -> int:
+    """Rebuild the counters of ``conversations`` (a queryset) from scratch.
+
+    Tokens come from the messages' metadata and cost from Payments'
+    UsageEvents. Returns the number of conversations updated.
+    """
+    from apps.Imagi.Build.models import AgentConversation, AgentMessage
+    from apps.Payments.models import UsageEvent
+
+    ids = list(conversations.order_by('pk').values_list('pk', flat=True))
+    updated = 0
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        tokens = {}
+        cached = {}
+        rows = AgentMessage.objects.filter(
+            conversation_id__in=chunk, metadata__isnull=False
+        ).values_list('conversation_id', 'metadata')
+        for conversation_id, metadata in rows:
+            usage = message_usage(metadata)
+            if usage is None:
+                continue
+            seen_in, seen_out = tokens.get(conversation_id, (0, 0))
+            tokens[conversation_id] = (seen_in + usage[0], seen_out + usage[1])
+            cached[conversation_id] = (
+                cached.get(conversation_id, 0) + message_cached_tokens(metadata)
+            )
+        costs = dict(
+            UsageEvent.objects.filter(conversation_id__in=chunk)
+            .values('conversation_id')
+            .annotate(total=Sum('cost_usd'))
+            .values_list('conversation_id', 'total')
+        )
+        batch = []
+        for conversation_id in chunk:
+            input_tokens, output_tokens = tokens.get(conversation_id, (None, None))
+            batch.append(AgentConversation(
+                pk=conversation_id,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_input_tokens=cached.get(conversation_id, 0),
+                cost_usd=costs.get(conversation_id) or Decimal('0'),
+            ))
+        AgentConversation.objects.bulk_update(
+            batch, ['input_tokens', 'output_tokens', 'cached_input_tokens', 'cost_usd']
+        )
+        updated += len(batch)
+    return updated
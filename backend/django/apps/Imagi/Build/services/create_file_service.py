@@ -8,6 +8,7 @@ import logging
 from datetime import datetime
 from rest_framework.exceptions import ValidationError, NotFound
 from apps.Imagi.ProjectManager.models import Project
+from . import file_index
 from .safe_paths import resolve_safe
 
 logger = logging.getLogger(__name__)
@@ -273,6 +274,7 @@ const emit = defineEmits<{{
             # Write content to file with UTF-8 encoding
             with open(full_file_path, 'w', encoding='utf-8') as f:
                 f.write(content)
+            file_index.note_file_written(project_path, file_path, content)
 
             # Write through to the database copy of the project
             project = self._resolve_project(project_id)
@@ -6,6 +6,7 @@ import os
 import logging
 from rest_framework.exceptions import ValidationError, NotFound
 from apps.Imagi.ProjectManager.models import Project
+from . import file_index
 from .safe_paths import resolve_safe
 
 logger = logging.getLogger(__name__)
@@ -65,6 +66,7 @@ class DeleteFileService:
             
             # Delete the physical file
             os.remove(full_path)
+            file_index.note_path_removed(project_path, file_path)
             
             # Delete the database copy of this file
             project = self.project
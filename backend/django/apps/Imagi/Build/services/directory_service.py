@@ -7,6 +7,7 @@ import shutil
 import logging
 from rest_framework.exceptions import ValidationError, NotFound
 from apps.Imagi.ProjectManager.models import Project
+from . import file_index
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +79,7 @@ class DirectoryService:
             full_path = self._validate_path(project_path, dir_path)
 
             os.makedirs(full_path, exist_ok=True)
+            file_index.note_directory_created(project_path, dir_path)
 
             logger.info(f"Successfully created directory: {dir_path}")
             return {
@@ -120,6 +122,7 @@ class DirectoryService:
             else:
                 # os.rmdir only removes empty directories
                 os.rmdir(full_path)
+            file_index.note_path_removed(project_path, dir_path)
 
             # Delete the database copies of every file under this directory
             try:
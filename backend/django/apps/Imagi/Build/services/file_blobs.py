@@ -0,0 +1,124 @@
+"""
+Content-addressed storage for the ProjectFile mirror.
+
+Every generated project starts from the same scaffold, so most of the
+mirror is the same few hundred files repeated once per project. A
+ProjectFile row therefore points at a ProjectFileBlob keyed by the sha256 of
+its content (the row's ``content_hash``): each distinct content is stored
+once however many projects hold it, and optionally compressed.
+
+Compression is chosen by ``settings.PROJECT_FILE_BLOB_COMPRESSION``:
+'zlib' (the default), 'zstd' (needs the optional ``zstandard`` package,
+and falls back to zlib without it) or '' for none. A blob is stored
+compressed only when that actually saves space; each blob records its own
+codec, so changing the setting never strands existing blobs.
+
+Blobs are immutable and never deleted by the write paths: a blob the last
+row stopped pointing at stays until ``prune_orphans`` (the prune_file_blobs
+command) collects it.
+"""
+
+import logging
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Contents shorter than this are stored raw: the codec header would eat
+# most of the saving.
+MIN_COMPRESS_BYTES = 256
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Hashes per existence query / blobs per insert.
+STORE_BATCH_SIZE = 500
+
+
+def _codec() -> str:
+    codec = getattr(settings, 'PROJECT_FILE_BLOB_COMPRESSION', 'zlib')
+    if codec == 'zstd' and zstandard is None:
+        return 'zlib'
+    return codec if codec in ('zlib', 'zstd') else ''
+
+
+def encode(content: str):
+    """(data, compression) to store for a text."""
+    raw = content.encode('utf-8', errors='ignore')
+    codec = _codec()
+    if not codec or len(raw) < MIN_COMPRESS_BYTES:
+        return raw, ''
+    if codec == 'zstd':
+        packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        packed = zlib.compress(raw, ZLIB_LEVEL)
+    if len(packed) >= len(raw):
+        return raw, ''
+    return packed, codec
+
+
+def decode(data, compression: str) -> str:
+    """The text a blob's (data, compression) encodes."""
+    data = bytes(data)  # Postgres hands BinaryField back as a memoryview
+    if compression == 'zlib':
+        data = zlib.decompress(data)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("A zstd-compressed file blob needs the 'zstandard' package")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+def store(contents: dict) -> int:
+    """Make sure a blob exists for every ``{hash: content}``.
+
+    Only hashes not already stored are encoded and inserted; a concurrent
+    writer storing the same content is harmless (same key, same bytes).
+    Returns the number of blobs created.
+    """
+    from apps.Imagi.Build.models import ProjectFileBlob
+
+    hashes = sorted(contents)
+    created = 0
+    for i in range(0, len(hashes), STORE_BATCH_SIZE):
+        chunk = hashes[i:i + STORE_BATCH_SIZE]
+        known = set(
+            ProjectFileBlob.objects.filter(hash__in=chunk).values_list('hash', flat=True)
+        )
+        blobs = []
+        for digest in chunk:
+            if digest in known:
+                continue
+            content = contents[digest]
+            data, compression = encode(content)
+            blobs.append(ProjectFileBlob(
+                hash=digest,
+                data=data,
+                compression=compression,
+                size=len(content.encode('utf-8', errors='ignore')),
+            ))
+        if blobs:
+            ProjectFileBlob.objects.bulk_create(blobs, ignore_conflicts=True)
+            created += len(blobs)
+    return created
+
+
+def prune_orphans() -> int:
+    """Delete blobs no ProjectFile row points at. Returns blobs deleted.
+
+    Meant for an off-peak maintenance run: a write that reuses a blob in the
+    instant it is pruned fails its foreign key and is retried (batched
+    flushes re-queue) or re-run, never silently lost.
+    """
+    from apps.Imagi.Build.models import ProjectFileBlob
+
+    deleted, _ = ProjectFileBlob.objects.filter(files__isnull=True).delete()
+    if deleted:
+        logger.info(f"Pruned {deleted} orphaned project file blobs")
+    return deleted
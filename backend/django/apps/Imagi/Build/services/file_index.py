@@ -0,0 +1,438 @@
+"""
+In-memory index of a project tree for the agent's discovery tools.
+
+``grep_files``, ``glob_files`` and ``get_project_tree`` are called dozens of
+times in one agent turn, and each call used to re-walk the project with
+``os.walk``, re-stat every file and re-read every file it searched. This
+module keeps one index per tree root — the canonical project directory and
+each task worktree are different directories, so each gets its own — holding
+the directory structure, every file's size and mtime, and (filled lazily by
+the first search that needs it) the file's decoded text.
+
+Keeping it current
+------------------
+- The write paths that already exist report what they changed
+  (``note_file_written`` / ``note_path_removed`` / ``note_directory_created``),
+  and the index is patched in place: an agent's own edits never force a
+  rescan.
+- Operations that rewrite a tree wholesale (a version reset, a task merge)
+  call ``invalidate``. The next access re-walks the tree, but re-reads only
+  files whose size or mtime changed.
+- Anything else that touches disk (another worker process, the scaffold
+  writers) is bounded by ``INDEX_MAX_AGE_SECONDS``: an older index is
+  re-validated the same way before it is used.
+
+Disk stays the source of truth. The index is a per-process cache of it, and
+losing it (a worker restart, LRU eviction) costs one walk.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .search_index import LiteralIndex
+
+logger = logging.getLogger(__name__)
+
+# Directories that are never indexed (same set the tools skip).
+SKIP_DIRS = {
+    'node_modules', '__pycache__', '.git', 'dist', 'build',
+    'staticfiles', 'media', '.venv', 'venv',
+}
+
+# Files larger than this are listed but their text is never cached; the
+# tools skip them when searching anyway.
+INDEX_MAX_TEXT_BYTES = 1_000_000
+
+# How long an index is trusted without re-validating it against disk. Writes
+# made through this process's file services land immediately; this only
+# bounds how long a change made behind the services' backs can go unseen.
+INDEX_MAX_AGE_SECONDS = 30
+
+# Indexes kept per process, least recently used evicted first. A worker
+# serves a handful of live projects (plus their task worktrees) at a time.
+INDEX_MAX_ROOTS = 32
+
+
+def _is_skipped_dir(name: str) -> bool:
+    return name in SKIP_DIRS or name.startswith('.')
+
+
+def _walk_key(rel_path: str, is_file: bool = True) -> tuple:
+    """Sort key reproducing ``os.walk`` order with sorted dirs and files.
+
+    A walk yields a directory's own files before descending into any of its
+    subdirectories, so a file name sorts ahead of every directory name at the
+    same depth.
+    """
+    parts = rel_path.split(os.sep) if rel_path else []
+    if not is_file:
+        return tuple((1, p) for p in parts)
+    return tuple((1, p) for p in parts[:-1]) + ((0, parts[-1]),)
+
+
+class _FileEntry:
+    __slots__ = ('size', 'mtime_ns', 'text', 'loaded')
+
+    def __init__(self, size: int, mtime_ns: int):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.text = None     # decoded content, once loaded (None if unreadable)
+        self.loaded = False
+
+
+class ProjectIndex:
+    """Index of one tree root: directories, file stats, and cached text.
+
+    Paths are relative to the root with OS separators, exactly as
+    ``os.path.relpath`` produces them, so results read the same as the
+    walk-based code they replaced. All methods are thread-safe: agent tools
+    run in SDK worker threads, several of which can hit one index at once.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.RLock()
+        self._files = {}       # rel_path -> _FileEntry
+        self._dirs = {}        # rel_dir ('' for the root) -> sorted child dir names
+        self._ordered = None   # cached walk-ordered file list
+        self._built_at = None  # monotonic time of the last walk, None = never
+        self._literals = LiteralIndex()  # grep prefilter postings over loaded texts
+
+    # -- building ---------------------------------------------------------
+
+    def _stale(self) -> bool:
+        return (
+            self._built_at is None
+            or time.monotonic() - self._built_at > INDEX_MAX_AGE_SECONDS
+        )
+
+    def ensure_fresh(self) -> None:
+        """Walk the tree if the index was never built, invalidated, or aged out.
+
+        Cached text survives a re-walk for every file whose size and mtime
+        are unchanged, so a refresh costs a walk and a stat per file, not a
+        re-read of the project.
+        """
+        with self._lock:
+            if self._stale():
+                self._rebuild()
+
+    def _rebuild(self) -> None:
+        files = {}
+        dirs = {}
+        for current, subdirs, filenames in os.walk(self.root):
+            subdirs[:] = sorted(d for d in subdirs if not _is_skipped_dir(d))
+            rel_dir = os.path.relpath(current, self.root)
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            dirs[rel_dir] = list(subdirs)
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                rel_path = os.path.join(rel_dir, filename) if rel_dir else filename
+                try:
+                    st = os.stat(os.path.join(current, filename))
+                except OSError:
+                    continue
+                previous = self._files.get(rel_path)
+                if previous is not None and previous.size == st.st_size \
+                        and previous.mtime_ns == st.st_mtime_ns:
+                    files[rel_path] = previous
+                else:
+                    files[rel_path] = _FileEntry(st.st_size, st.st_mtime_ns)
+        for rel_path, entry in self._files.items():
+            if files.get(rel_path) is not entry:
+                self._literals.discard(rel_path)
+        self._files = files
+        self._dirs = dirs
+        self._ordered = None
+        self._built_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Force a re-walk on next access (cached text is kept where valid)."""
+        with self._lock:
+            self._built_at = None
+
+    # -- incremental maintenance ------------------------------------------
+
+    def _register_parents(self, rel_path: str) -> bool:
+        """Make sure every ancestor directory of ``rel_path`` is indexed.
+
+        Returns False when the path lies under a skipped or hidden directory
+        (and so does not belong in the index at all).
+        """
+        parts = rel_path.split(os.sep)[:-1]
+        if any(_is_skipped_dir(p) for p in parts):
+            return False
+        parent = ''
+        for part in parts:
+            child = os.path.join(parent, part) if parent else part
+            if child not in self._dirs:
+                self._dirs[child] = []
+                siblings = self._dirs.setdefault(parent, [])
+                if part not in siblings:
+                    siblings.append(part)
+                    siblings.sort()
+            parent = child
+        return True
+
+    def _forget(self, rel_path: str) -> None:
+        if self._files.pop(rel_path, None) is not None:
+            self._ordered = None
+        self._literals.discard(rel_path)
+
+    def file_written(self, rel_path: str, text=None) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            if os.path.basename(rel_path).startswith('.') or not self._register_parents(rel_path):
+                return
+            try:
+                st = os.stat(os.path.join(self.root, rel_path))
+            except OSError:
+                self._forget(rel_path)
+                return
+            entry = _FileEntry(st.st_size, st.st_mtime_ns)
+            if text is not None and st.st_size <= INDEX_MAX_TEXT_BYTES:
+                entry.text = text
+                entry.loaded = True
+            if rel_path not in self._files:
+                self._ordered = None
+            self._files[rel_path] = entry
+            if entry.loaded:
+                self._literals.update(rel_path, text)
+            else:
+                self._literals.discard(rel_path)
+
+    def directory_created(self, rel_dir: str) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            # Registering a placeholder child registers the directory itself.
+            self._register_parents(os.path.join(rel_dir, '_'))
+
+    def path_removed(self, rel_path: str) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            prefix = rel_path + os.sep
+            self._forget(rel_path)
+            for p in [p for p in self._files if p.startswith(prefix)]:
+                self._forget(p)
+            if rel_path in self._dirs:
+                for d in [d for d in self._dirs if d == rel_path or d.startswith(prefix)]:
+                    del self._dirs[d]
+                parent, name = os.path.split(rel_path)
+                siblings = self._dirs.get(parent)
+                if siblings and name in siblings:
+                    siblings.remove(name)
+
+    # -- reading ----------------------------------------------------------
+
+    def files(self, under: str = '') -> list:
+        """Walk-ordered project-relative paths of every indexed file.
+
+        ``under`` limits the result to one subdirectory (relative to the
+        root; '' for all of it).
+        """
+        self.ensure_fresh()
+        with self._lock:
+            if self._ordered is None:
+                self._ordered = sorted(self._files, key=_walk_key)
+            ordered = self._ordered
+        if not under:
+            return list(ordered)
+        prefix = under.rstrip(os.sep) + os.sep
+        return [p for p in ordered if p.startswith(prefix)]
+
+    def stat(self, rel_path: str):
+        """(size, mtime_ns) for an indexed file, or None."""
+        with self._lock:
+            entry = self._files.get(rel_path)
+            return (entry.size, entry.mtime_ns) if entry else None
+
+    def read_text(self, rel_path: str):
+        """Decoded UTF-8 text of an indexed file, read from disk at most once.
+
+        Returns None for files over ``INDEX_MAX_TEXT_BYTES``, files that are
+        not valid UTF-8, and files that vanished since the last walk.
+        """
+        with self._lock:
+            entry = self._files.get(rel_path)
+            if entry is None:
+                return None
+            if entry.loaded:
+                return entry.text
+        text = None
+        if entry.size <= INDEX_MAX_TEXT_BYTES:
+            try:
+                with open(os.path.join(self.root, rel_path), 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                text = None
+        with self._lock:
+            # Only cache against the entry we read for; a concurrent write
+            # may have replaced it meanwhile.
+            if self._files.get(rel_path) is entry:
+                entry.text = text
+                entry.loaded = True
+                if text is not None:
+                    self._literals.update(rel_path, text)
+        return text
+
+    def narrow(self, paths: list, alternatives) -> list:
+        """Drop the paths the literal index proves cannot match a query plan.
+
+        ``alternatives`` is a ``search_index.plan_query`` plan. Files whose
+        text is not loaded yet are kept — nothing is known about them until
+        the search reads them (which indexes them for the next one).
+        """
+        with self._lock:
+            texts = {
+                rel_path: entry.text
+                for rel_path, entry in self._files.items()
+                if entry.loaded and entry.text is not None
+            }
+            hits = self._literals.candidates(alternatives, texts)
+        return [p for p in paths if p in hits or p not in texts]
+
+    def directory_tree(self, max_depth: int = 5, extensions=None) -> dict:
+        """``{rel_dir or '.': {'dirs': [...], 'files': [...]}}`` in walk order.
+
+        Same shape as ``ViewFileService.get_directory_tree``: directories
+        deeper than ``max_depth`` are listed by their parent but not expanded,
+        and only files with one of ``extensions`` (all, when None) are shown.
+        """
+        self.ensure_fresh()
+        with self._lock:
+            files_by_dir = {}
+            for rel_path in self._files:
+                rel_dir, filename = os.path.split(rel_path)
+                if extensions is None or os.path.splitext(filename)[1].lower() in extensions:
+                    files_by_dir.setdefault(rel_dir, []).append(filename)
+            tree = {}
+            for rel_dir in sorted(self._dirs, key=lambda d: _walk_key(d, is_file=False)):
+                depth = rel_dir.count(os.sep) if rel_dir else 0
+                if depth >= max_depth:
+                    continue
+                tree[rel_dir or '.'] = {
+                    'dirs': list(self._dirs[rel_dir]),
+                    'files': sorted(files_by_dir.get(rel_dir, [])),
+                }
+            return tree
+
+
+# ---------------------------------------------------------------------------
+# Per-process registry
+# ---------------------------------------------------------------------------
+
+_indexes = OrderedDict()  # realpath(root) -> ProjectIndex
+_indexes_lock = threading.Lock()
+
+
+def _key(root: str) -> str:
+    return os.path.realpath(root)
+
+
+def get_index(root: str) -> ProjectIndex:
+    """The (fresh) index for a tree root, building it on first use."""
+    key = _key(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = ProjectIndex(key)
+            _indexes[key] = index
+            while len(_indexes) > INDEX_MAX_ROOTS:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+    index.ensure_fresh()
+    return index
+
+
+def _existing(root: str):
+    if not root:
+        return None
+    with _indexes_lock:
+        return _indexes.get(_key(root))
+
+
+def _relative(index: ProjectIndex, root: str, rel_path: str):
+    """``rel_path`` (relative to ``root``) re-expressed relative to the index root."""
+    full = os.path.normpath(os.path.join(
+        os.path.realpath(root), rel_path.lstrip('/').replace('/', os.sep)
+    ))
+    rel = os.path.relpath(full, index.root)
+    if rel == '.' or rel.startswith('..'):
+        return None
+    return rel
+
+
+def note_file_written(root: str, rel_path: str, content: str = None) -> None:
+    """Record that a file under ``root`` was created or overwritten.
+
+    Pass the new ``content`` when the caller has it in hand, so the next
+    search does not re-read the file it just wrote. Never raises: an index
+    that cannot be patched is invalidated instead.
+    """
+    index = _existing(root)
+    if index is None:
+        return
+    try:
+        rel = _relative(index, root, rel_path)
+        if rel is None:
+            index.invalidate()
+        else:
+            index.file_written(rel, content)
+    except Exception as e:  # pragma: no cover - defensive
+        logger.warning(f"Could not update file index for {rel_path}: {e}")
+        index.invalidate()
+
+
+def note_directory_created(root: str, rel_dir: str) -> None:
+    """Record that a directory under ``root`` was created."""
+    index = _existing(root)
+    if index is None:
+        return
+    try:
+        rel = _relative(index, root, rel_dir)
+        if rel is None:
+            index.invalidate()
+        else:
+            index.directory_created(rel)
+    except Exception as e:  # pragma: no cover - defensive
+        logger.warning(f"Could not update file index for {rel_dir}: {e}")
+        index.invalidate()
+
+
+def note_path_removed(root: str, rel_path: str) -> None:
+    """Record that a file or directory (and everything under it) was removed."""
+    index = _existing(root)
+    if index is None:
+        return
+    try:
+        rel = _relative(index, root, rel_path)
+        if rel is None:
+            index.invalidate()
+        else:
+            index.path_removed(rel)
+    except Exception as e:  # pragma: no cover - defensive
+        logger.warning(f"Could not update file index for {rel_path}: {e}")
+        index.invalidate()
+
+
+def invalidate(root: str) -> None:
+    """Force the next access to re-walk ``root`` (after a wholesale rewrite)."""
+    index = _existing(root)
+    if index is not None:
+        index.invalidate()
+
+
+def discard(root: str) -> None:
+    """Drop the index for a tree that no longer exists (a removed worktree)."""
+    if not root:
+        return
+    with _indexes_lock:
+        _indexes.pop(_key(root), None)
@@ -0,0 +1,164 @@
+"""
+Git plumbing for the hot version-control paths: status, stage, commit and
+rev-parse.
+
+A checkpoint is taken before every agent run and a commit after every file
+change, and each used to be four or five ``git`` processes (plus a global
+``os.sync()`` and a sleep). With ``pygit2`` installed, ``Pygit2Backend``
+does the same work inside this process through libgit2; without it,
+``SubprocessBackend`` keeps the plain ``git`` CLI path. Both read the
+working tree straight from the filesystem, which already sees every write
+this or any other process has completed — no sync is needed for that.
+
+``settings.IMAGI_GIT_BACKEND`` picks one: 'auto' (pygit2 when importable,
+the default), 'pygit2' or 'subprocess'. The rest of VersionControlService
+(worktrees, merges, resets, log) stays on the CLI: those run rarely, and
+git's own porcelain is the reference behaviour there.
+"""
+
+import logging
+import subprocess
+
+from django.conf import settings
+
+try:
+    import pygit2
+except ImportError:  # optional dependency
+    pygit2 = None
+
+logger = logging.getLogger(__name__)
+
+# Identity for commits in a repo with no user.name/user.email configured
+# (initialize_repo sets the same pair).
+DEFAULT_AUTHOR = ('Imagi', 'system@imagi.ai')
+
+
+class GitBackendError(RuntimeError):
+    """A git operation failed; the message carries git's own explanation."""
+
+
+class SubprocessBackend:
+    """The ``git`` command-line tool, one process per operation."""
+
+    name = 'subprocess'
+
+    def _run(self, project_path, *args):
+        result = subprocess.run(
+            ['git', *args], cwd=project_path, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise GitBackendError(result.stderr.strip() or f"git {args[0]} failed")
+        return result.stdout
+
+    def is_dirty(self, project_path) -> bool:
+        return bool(self._run(project_path, 'status', '--porcelain').strip())
+
+    def head(self, project_path):
+        """HEAD's commit hash, or None in a repo with no commits yet."""
+        result = subprocess.run(
+            ['git', 'rev-parse', '--verify', '-q', 'HEAD'],
+            cwd=project_path, capture_output=True, text=True,
+        )
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def commit_all(self, project_path, message, allow_empty=False):
+        """Stage every change and commit it; returns the new hash or None."""
+        if not allow_empty and not self.is_dirty(project_path):
+            return None
+        self._run(project_path, 'add', '-A')
+        args = ['commit', '-q', '-m', message]
+        if allow_empty:
+            args.insert(1, '--allow-empty')
+        self._run(project_path, *args)
+        return self.head(project_path)
+
+
+class Pygit2Backend:
+    """libgit2 in-process: no fork/exec, one index read and write per commit."""
+
+    name = 'pygit2'
+
+    def _open(self, project_path):
+        try:
+            return pygit2.Repository(project_path)
+        except (pygit2.GitError, KeyError) as e:
+            raise GitBackendError(f"Not a git repository: {project_path} ({e})")
+
+    def _changes(self, repo) -> dict:
+        """Path -> status flags, as `git status --porcelain` would list them."""
+        return {
+            path: flags
+            for path, flags in repo.status().items()
+            if flags & ~pygit2.GIT_STATUS_IGNORED
+        }
+
+    def is_dirty(self, project_path) -> bool:
+        return bool(self._changes(self._open(project_path)))
+
+    def head(self, project_path):
+        repo = self._open(project_path)
+        if repo.head_is_unborn:
+            return None
+        return str(repo.head.target)
+
+    def commit_all(self, project_path, message, allow_empty=False):
+        repo = self._open(project_path)
+        changes = self._changes(repo)
+        if not allow_empty and not changes:
+            return None
+        try:
+            # `git add -A`, driven by the status pass just made: only the
+            # changed paths are touched, the rest of the index is reused.
+            index = repo.index
+            for path, flags in changes.items():
+                if flags & pygit2.GIT_STATUS_WT_DELETED:
+                    index.remove(path)
+                elif flags & (
+                    pygit2.GIT_STATUS_WT_NEW
+                    | pygit2.GIT_STATUS_WT_MODIFIED
+                    | pygit2.GIT_STATUS_WT_TYPECHANGE
+                    | pygit2.GIT_STATUS_WT_RENAMED
+                ):
+                    index.add(path)
+            index.write()
+            tree = index.write_tree()
+
+            parents = []
+            if not repo.head_is_unborn:
+                head_commit = repo.head.peel(pygit2.Commit)
+                if tree == head_commit.tree_id and not allow_empty:
+                    return None
+                parents = [head_commit.id]
+            try:
+                signature = repo.default_signature
+            except (KeyError, pygit2.GitError):
+                signature = pygit2.Signature(*DEFAULT_AUTHOR)
+            commit_id = repo.create_commit(
+                'HEAD', signature, signature, _with_newline(message), tree, parents
+            )
+        except pygit2.GitError as e:
+            raise GitBackendError(str(e))
+        return str(commit_id)
+
+
+def _with_newline(message: str) -> str:
+    """`git commit -m` stores the message newline-terminated; match it."""
+    message = (message or '').strip()
+    return message + '\n' if message else message
+
+
+_BACKENDS = {
+    'subprocess': SubprocessBackend,
+    'pygit2': Pygit2Backend,
+}
+
+
+def get_backend():
+    """The configured backend ('auto' prefers pygit2 when it is installed)."""
+    choice = getattr(settings, 'IMAGI_GIT_BACKEND', 'auto') or 'auto'
+    if choice == 'auto':
+        choice = 'pygit2' if pygit2 is not None else 'subprocess'
+    if choice == 'pygit2' and pygit2 is None:
+        logger.warning("IMAGI_GIT_BACKEND=pygit2 but pygit2 is not installed; using git subprocesses")
+        choice = 'subprocess'
+    return _BACKENDS.get(choice, SubprocessBackend)()
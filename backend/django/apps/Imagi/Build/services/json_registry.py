@@ -0,0 +1,76 @@
+"""
+Host-wide JSON registries, shared by every worker process on the host.
+
+The port leases, the shared preview browser and the agent run queue each
+keep a small JSON file under a shared root:
+
+    with json_registry.locked(path, 'port lease registry') as data:
+        data['leases'][key] = lease  # written back on exit
+
+The ``flock`` is taken on a sibling ``<path>.lock`` file, never on the data
+file itself, so that a write can replace the data file whole: the new
+content goes to a temporary file in the same directory and ``os.replace``
+swaps it in. A worker that dies mid-write leaves the previous registry
+intact rather than a truncated one (which the next reader would have to
+discard, forgetting every lease in it).
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+LOCK_SUFFIX = '.lock'
+
+
+def _read(path, label):
+    try:
+        with open(path, 'r') as fh:
+            data = json.loads(fh.read() or '{}')
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning(f"Discarding unreadable {label} {path}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(json.dumps(data))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextlib.contextmanager
+def locked(path, label, write=True):
+    """The registry dict at ``path``, locked against every other process.
+
+    With ``write``, changes made inside the block are written back on exit
+    (atomically); without it the lock is shared and nothing is written.
+    ``label`` names the registry in the warning logged if it is unreadable.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + LOCK_SUFFIX, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+        try:
+            data = _read(path, label)
+            yield data
+            if write:
+                _write(path, data)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
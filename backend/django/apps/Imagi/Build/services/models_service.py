@@ -33,6 +33,8 @@ MODELS = {
         'capabilities': ['code_generation', 'chat', 'analysis'],
         'maxTokens': 128000,
         'input_price_per_m_tokens': 6,
+        # Input tokens served from the provider's prompt cache.
+        'cached_input_price_per_m_tokens': 0.6,
         'output_price_per_m_tokens': 30,
         'api_version': 'responses',  # Uses OpenAI Responses API
         'supports_temperature': False,
@@ -48,6 +50,7 @@ MODELS = {
         'capabilities': ['code_generation', 'chat', 'analysis'],
         'maxTokens': 128000,
         'input_price_per_m_tokens': 3,
+        'cached_input_price_per_m_tokens': 0.3,
         'output_price_per_m_tokens': 15,
         'api_version': 'responses',  # Uses OpenAI Responses API
         'supports_temperature': False,
@@ -63,6 +66,7 @@ MODELS = {
         'capabilities': ['code_generation', 'chat', 'analysis'],
         'maxTokens': 128000,
         'input_price_per_m_tokens': 1,
+        'cached_input_price_per_m_tokens': 0.1,
         'output_price_per_m_tokens': 5,
         'api_version': 'responses',  # Uses OpenAI Responses API
         'supports_temperature': False,
@@ -184,14 +188,19 @@ def get_backend_model_id(model_id: str) -> str:
         return model['backend_model']
     return model_id
 
-def compute_cost_usd(model_id: str, input_tokens: int, output_tokens: int):
+def compute_cost_usd(
+    model_id: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0
+):
     """
     Compute the USD cost of a run from a suite model's per-million-token pricing.
 
     Args:
         model_id: The public suite model ID (e.g. 'gpt-5.6-sol')
-        input_tokens: Input tokens consumed by the run
+        input_tokens: Input tokens consumed by the run, cached ones included
         output_tokens: Output tokens produced by the run
+        cached_input_tokens: How many of the input tokens were served from
+            the provider's prompt cache, priced at the cached-input rate
+            (the full input rate for a model without one)
 
     Returns:
         float or None: The cost in USD, or None when the model (or its
@@ -204,8 +213,11 @@ def compute_cost_usd(model_id: str, input_tokens: int, output_tokens: int):
     output_price = model.get('output_price_per_m_tokens')
     if input_price is None or output_price is None:
         return None
+    cached_price = model.get('cached_input_price_per_m_tokens', input_price)
+    cached = min(cached_input_tokens or 0, input_tokens or 0)
     cost = (
-        (input_tokens or 0) * input_price
+        ((input_tokens or 0) - cached) * input_price
+        + cached * cached_price
         + (output_tokens or 0) * output_price
     ) / 1_000_000
     return round(cost, 6)
@@ -0,0 +1,203 @@
+"""
+Host-wide port leases for preview dev servers and preview browsers.
+
+Picking a port used to mean scanning every connection of every process on
+the host (``psutil.process_iter``) for each candidate in a 20-port window,
+which took seconds on a busy host and capped it at about 20 previews.
+Instead, every port handed out is recorded in a small registry shared by all
+worker processes on the host, and a candidate is checked by trying to
+``bind()`` it — one syscall, which also catches ports held by programs that
+never took a lease:
+
+    port = port_leases.lease('frontend', owner='42')
+    process = subprocess.Popen([...])
+    port_leases.attach(port, process.pid)
+    ...
+    port_leases.release_owner('42')
+
+The registry is a JSON file under PROJECTS_ROOT, guarded by ``flock`` and
+replaced whole on write (see json_registry). The ports belong to this host,
+so the registry must too — a database table would be shared across hosts.
+Each lease records its owner, kind and the PID that serves it. A lease is
+reclaimed when its process has died (or its PID was reused), or — for a
+lease never attached to a process — once LEASE_LAUNCH_TTL has passed. So
+crashed workers and killed servers never strand ports.
+
+Ranges come from ``settings.IMAGI_PREVIEW_PORT_RANGES`` (kind -> (low,
+high)), far wider than the old windows. A per-kind cursor walks each range
+round-robin, so the next free port is usually the first one tried.
+"""
+
+import contextlib
+import errno
+import logging
+import os
+import socket
+import time
+
+import psutil
+from django.conf import settings
+
+from . import json_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT_RANGES = {
+    'backend': (8080, 8999),
+    'frontend': (5174, 5999),
+    'cdp': (9300, 9999),
+}
+
+# Ports never handed out whatever the ranges say: Imagi's own Django (8000)
+# and Vite (5173) dev servers.
+RESERVED_PORTS = frozenset({5173, 8000})
+
+# How long a lease may sit without a process attached (the gap between
+# leasing a port and the server process existing).
+LEASE_LAUNCH_TTL = 60
+
+REGISTRY_FILENAME = '.preview_port_leases.json'
+
+
+class PortsExhausted(RuntimeError):
+    """Every port in a kind's range is leased or bound."""
+
+
+def _ranges():
+    return getattr(settings, 'IMAGI_PREVIEW_PORT_RANGES', None) or DEFAULT_PORT_RANGES
+
+
+def _registry_path():
+    return os.path.join(settings.PROJECTS_ROOT, REGISTRY_FILENAME)
+
+
+@contextlib.contextmanager
+def _registry():
+    """The registry dict, locked against every other process on the host.
+
+    Changes made inside the block are written back on exit.
+    """
+    with json_registry.locked(_registry_path(), 'port lease registry') as data:
+        data.setdefault('leases', {})
+        data.setdefault('cursors', {})
+        yield data
+
+
+def _process_alive(pid, started):
+    try:
+        process = psutil.Process(pid)
+        if process.status() == psutil.STATUS_ZOMBIE:
+            return False
+        # A recycled PID belongs to a different process.
+        return started is None or abs(process.create_time() - started) < 1
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.Error):
+        return False
+
+
+def _live(lease, now):
+    pid = lease.get('pid')
+    if pid:
+        return _process_alive(pid, lease.get('started'))
+    return lease.get('expires', 0) > now
+
+
+def _bindable(port):
+    """Whether nothing is listening on ``port`` (one bind(), no scan)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # Match the dev servers, which set SO_REUSEADDR: a port whose last
+        # connection is in TIME_WAIT is free for them.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('127.0.0.1', port))
+        except OSError as e:
+            if e.errno not in (errno.EADDRINUSE, errno.EACCES, errno.EADDRNOTAVAIL):
+                logger.debug(f"bind() on port {port} failed: {e}")
+            return False
+    return True
+
+
+def is_listening(port):
+    """Whether something accepts connections on 127.0.0.1:``port``."""
+    if not port:
+        return False
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.5)
+        return sock.connect_ex(('127.0.0.1', int(port))) == 0
+
+
+def lease(kind, owner):
+    """Lease a free port of ``kind`` for ``owner``; raises PortsExhausted.
+
+    An owner holds at most one lease per kind: leasing again replaces the
+    old one, and prefers the same port when it is still free so a
+    restarted server keeps its URL.
+    """
+    low, high = _ranges()[kind]
+    owner = str(owner)
+    now = time.time()
+    with _registry() as data:
+        leases = data['leases']
+        previous = None
+        for key, held in list(leases.items()):
+            if held.get('owner') == owner and held.get('kind') == kind:
+                previous = int(key)
+                del leases[key]
+            elif not _live(held, now):
+                del leases[key]
+
+        span = high - low + 1
+        start = data['cursors'].get(kind, low)
+        candidates = [previous] if previous is not None else []
+        candidates += [low + (start - low + i) % span for i in range(span)]
+        for port in candidates:
+            if port in RESERVED_PORTS or str(port) in leases or not low <= port <= high:
+                continue
+            if not _bindable(port):
+                continue
+            leases[str(port)] = {
+                'kind': kind,
+                'owner': owner,
+                'pid': None,
+                'started': None,
+                'expires': now + LEASE_LAUNCH_TTL,
+            }
+            data['cursors'][kind] = low + (port - low + 1) % span
+            return port
+    raise PortsExhausted(f"No free {kind} port in {low}-{high}")
+
+
+def attach(port, pid):
+    """Bind a lease to the process serving it; it lives as long as that process."""
+    try:
+        started = psutil.Process(pid).create_time()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.Error):
+        started = None
+    with _registry() as data:
+        held = data['leases'].get(str(port))
+        if held is not None:
+            held['pid'] = pid
+            held['started'] = started
+
+
+def release(port):
+    with _registry() as data:
+        data['leases'].pop(str(port), None)
+
+
+def release_owner(owner, kinds=None):
+    """Drop ``owner``'s leases (of ``kinds``, or all of them)."""
+    owner = str(owner)
+    with _registry() as data:
+        for key, held in list(data['leases'].items()):
+            if held.get('owner') == owner and (kinds is None or held.get('kind') in kinds):
+                del data['leases'][key]
+
+
+def leases():
+    """Snapshot of the live leases: {port: lease}."""
+    now = time.time()
+    with _registry() as data:
+        for key, held in list(data['leases'].items()):
+            if not _live(held, now):
+                del data['leases'][key]
+        return {int(key): dict(held) for key, held in data['leases'].items()}
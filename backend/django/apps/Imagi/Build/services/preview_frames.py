@@ -0,0 +1,207 @@
+"""
+Binary frame transport and tile deltas for the browser preview (the frame
+and input endpoints).
+
+A frame payload from BrowserPreviewService carries the screenshot as the
+base64 text Chromium returns, which the JSON response then encodes again
+and the client decodes: a third more bytes on the wire, and hundreds of KB
+of string handling per frame on the worker. A client that asks for it gets
+the JPEG itself instead, as the response body, with the rest of the payload
+(path, history, console errors, etag) as JSON in the X-Preview-State
+header:
+
+    Accept: image/jpeg                               -> a full frame
+    Accept: image/jpeg, application/x-imagi-tiles    -> full frame or tiles
+
+A 204 means the client's frame (its etag) is still current.
+
+Tiles: when the client also accepts FRAME_TILES_TYPE and the worker still
+knows what the client's etag looked like, only the TILE_SIZE squares that
+changed are sent, each as its own JPEG, concatenated in the body; the state
+header lists them as ``tiles: [[x, y, width, height, byte_length], ...]``
+in device pixels of a ``frame_size`` frame. The client paints them over the
+frame it has. Hover highlights, blinking carets and small re-renders then
+cost a few KB instead of a full frame. Where most tiles change (a scroll,
+a navigation), or the client's base is unknown to this worker, a full
+frame is sent as before.
+
+What a frame looked like is remembered as one hash per tile, not as pixels,
+so the per-worker memory is small. Frames are decoded to YCbCr, without
+the colour conversion. Tiles are aligned to JPEG's 16 pixel blocks, so the
+luma of an unchanged tile decodes to identical bytes in two captures and a
+plain hash comparison finds it. Chroma is upsampled across block edges,
+which lets a change bleed a pixel or two into the next tile. A tile's
+chroma is therefore hashed without its CHROMA_BLEED border.
+
+Tiles need Pillow to decode and re-encode frames. Without it
+``tiles_supported()`` is False and tile-capable clients get full frames.
+"""
+
+import base64
+import io
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+from .browser_preview_service import FRAME_JPEG_QUALITY
+
+logger = logging.getLogger(__name__)
+
+FRAME_TYPE = 'image/jpeg'
+FRAME_TILES_TYPE = 'application/x-imagi-tiles'
+STATE_HEADER = 'X-Preview-State'
+
+# Device pixels; a multiple of the 16px JPEG block (see the module docstring).
+TILE_SIZE = 128
+# Border of a tile's chroma left out of its hash (see the module docstring).
+CHROMA_BLEED = 2
+# Beyond this share of the frame changed, a full frame is cheaper to send
+# and to paint.
+MAX_DELTA_AREA = 0.5
+# Frames whose tile hashes this worker keeps, across all previews.
+TILE_CACHE_SIZE = 256
+# The state header has to fit the proxy's response-header buffer (see
+# proxy_buffer_size in the frontend's nginx.conf), but the title, path and
+# console errors are whatever the previewed page makes them. In the header
+# each is cut to STATE_TEXT_LIMIT characters, and if the header still runs
+# past STATE_HEADER_LIMIT bytes the console errors, then the title, are left
+# out. The tile list is bounded by MAX_DELTA_AREA and always kept.
+STATE_TEXT_LIMIT = 200
+STATE_HEADER_LIMIT = 16 * 1024
+
+_tile_hashes = OrderedDict()  # (owner, etag) -> ((width, height), [hash per tile])
+_lock = threading.Lock()
+
+
+def tiles_supported():
+    return Image is not None
+
+
+def negotiate(request):
+    """The frame encoding the request asks for: None (JSON), 'jpeg' or 'tiles'."""
+    accept = request.headers.get('Accept', '')
+    if FRAME_TYPE not in accept:
+        return None
+    if FRAME_TILES_TYPE in accept and tiles_supported():
+        return 'tiles'
+    return 'jpeg'
+
+
+def _grid(width, height):
+    for y in range(0, height, TILE_SIZE):
+        for x in range(0, width, TILE_SIZE):
+            yield x, y, min(TILE_SIZE, width - x), min(TILE_SIZE, height - y)
+
+
+def _tile_hashes_of(image):
+    if image.mode != 'YCbCr':  # e.g. greyscale: every byte is exact
+        return [zlib.crc32(image.crop((x, y, x + w, y + h)).tobytes())
+                for x, y, w, h in _grid(*image.size)]
+    luma, *chroma = image.split()
+    hashes = []
+    for x, y, w, h in _grid(*image.size):
+        crc = zlib.crc32(luma.crop((x, y, x + w, y + h)).tobytes())
+        inner = (x + CHROMA_BLEED, y + CHROMA_BLEED, x + w - CHROMA_BLEED, y + h - CHROMA_BLEED)
+        if inner[0] < inner[2] and inner[1] < inner[3]:
+            for plane in chroma:
+                crc = zlib.crc32(plane.crop(inner).tobytes(), crc)
+        hashes.append(crc)
+    return hashes
+
+
+def _remember(owner, etag, size, hashes):
+    with _lock:
+        _tile_hashes[(owner, etag)] = (size, hashes)
+        _tile_hashes.move_to_end((owner, etag))
+        while len(_tile_hashes) > TILE_CACHE_SIZE:
+            _tile_hashes.popitem(last=False)
+
+
+def _recall(owner, etag):
+    with _lock:
+        return _tile_hashes.get((owner, etag))
+
+
+def _delta(owner, jpeg, etag, base_etag):
+    """Changed tiles as [(x, y, w, h, jpeg_bytes)], or None for a full frame."""
+    try:
+        image = Image.open(io.BytesIO(jpeg))
+        image.draft('YCbCr', image.size)
+        image.load()
+    except Exception as e:  # a frame Pillow cannot read is still a frame
+        logger.warning(f"Could not decode preview frame for tiling: {e}")
+        return None
+    hashes = _tile_hashes_of(image)
+    _remember(owner, etag, image.size, hashes)
+    base = _recall(owner, base_etag) if isinstance(base_etag, str) else None
+    if base is None or base[0] != image.size:
+        return None
+
+    grid = list(_grid(*image.size))
+    dirty = [grid[i] for i, h in enumerate(hashes) if h != base[1][i]]
+    if sum(w * h for _x, _y, w, h in dirty) > MAX_DELTA_AREA * image.width * image.height:
+        return None
+    tiles = []
+    for x, y, w, h in dirty:
+        out = io.BytesIO()
+        image.crop((x, y, x + w, y + h)).save(out, 'JPEG', quality=FRAME_JPEG_QUALITY)
+        tiles.append((x, y, w, h, out.getvalue()))
+    return tiles, image.size
+
+
+def render(payload, owner, mode, base_etag=None):
+    """Encode a frame payload for a binary client.
+
+    ``mode`` is what negotiate() returned; ``base_etag`` is the etag of the
+    frame the client has. Returns (content_type, body, state): the state is
+    the payload without its frame, and content_type is None when there is
+    no new frame to send.
+    """
+    state = dict(payload)
+    data = state.pop('frame', None)
+    if not data:
+        return None, b'', state
+    jpeg = base64.b64decode(data)
+    if mode != 'tiles' or Image is None:
+        return FRAME_TYPE, jpeg, state
+
+    delta = _delta(owner, jpeg, state.get('etag'), base_etag)
+    if delta is None:
+        return FRAME_TYPE, jpeg, state
+    tiles, size = delta
+    state['frame_size'] = list(size)
+    state['tiles'] = [[x, y, w, h, len(body)] for x, y, w, h, body in tiles]
+    return FRAME_TILES_TYPE, b''.join(body for *_rect, body in tiles), state
+
+
+def _encode_state(state):
+    # ensure_ascii keeps console error text legal in a header value.
+    return json.dumps(state, ensure_ascii=True, separators=(',', ':'))
+
+
+def state_header(state):
+    """The X-Preview-State value for ``state``, within STATE_HEADER_LIMIT."""
+    state = dict(state)
+    for field in ('title', 'path'):
+        if isinstance(state.get(field), str):
+            state[field] = state[field][:STATE_TEXT_LIMIT]
+    if state.get('console_errors'):
+        state['console_errors'] = [
+            {**error, 'text': str(error.get('text', ''))[:STATE_TEXT_LIMIT]}
+            for error in state['console_errors']
+        ]
+    header = _encode_state(state)
+    for field in ('console_errors', 'title'):
+        if len(header) <= STATE_HEADER_LIMIT:
+            break
+        if state.pop(field, None) is not None:
+            logger.info(f"Preview state header too large; leaving out {field}")
+            header = _encode_state(state)
+    return header
@@ -0,0 +1,328 @@
+"""
+Warm pool of pre-booted preview dev servers (used by PreviewService).
+
+Every preview start used to launch ``manage.py runserver`` and ``npm run
+dev`` from nothing: a fresh interpreter importing Django, a fresh Node
+loading Vite and its plugins, before either even looked at the project.
+Most previews open right after project creation, on the same scaffold and
+so the same shared dependency slot (see frontend_dependencies), so that
+work is identical every time.
+
+When enabled (IMAGI_PREVIEW_POOL_SIZE, off by default), this module keeps
+that many idle runtimes of each kind per worker process, already through
+that work and waiting on stdin for a project
+(assets/preview_django_runtime.py, assets/preview_vite_runtime.mjs):
+
+    process = preview_pool.claim('frontend', key, binding, log_path)
+    if process is None:
+        ...  # cold start, as before
+
+Binding points a runtime at the project tree: it is sent the project's
+directory, port and environment, and serves from there. Neither Vite nor
+runserver can move a running server to a new root, so a runtime is booted
+up to the point where the root is needed and no further. Its log file is
+moved to the project's log path, and from then on it is an ordinary dev
+server process of the preview.
+
+Runtimes start with the restricted child environment, like any preview
+server, and exit on their own when their stdin closes — i.e. when the
+worker that owns the pool goes away. A claimed runtime is replaced in the
+background; idle ones older than POOL_MAX_IDLE are recycled.
+
+Frontend runtimes load Vite from a dependency store slot, so they are only
+kept for the scaffold's slot and only bind to projects linked to it; any
+other project (or an empty pool) is a miss and starts cold. Hits, misses
+and idle counts are reported by ``stats()``; bind latency is recorded with
+the startup percentiles (see PreviewService._startup_report).
+"""
+
+import filecmp
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 0
+
+# Idle runtimes older than this are replaced rather than bound, so a long
+# idle worker does not serve previews from a stale boot.
+POOL_MAX_IDLE = 30 * 60
+
+POOL_DIRNAME = '.preview_pool'
+
+# Printed by a runtime once it has booted; only booted runtimes are claimed.
+READY_MARKER = 'imagi-preview-pool: ready'
+
+_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+DJANGO_RUNTIME = os.path.join(_ASSETS_DIR, 'preview_django_runtime.py')
+VITE_RUNTIME = os.path.join(_ASSETS_DIR, 'preview_vite_runtime.mjs')
+# Name of the Vite runtime inside a store slot, where 'vite' resolves.
+VITE_RUNTIME_NAME = '.imagi-preview-runtime.mjs'
+
+KINDS = ('backend', 'frontend')
+
+
+class WarmRuntime:
+    """One idle, pre-booted dev server process."""
+
+    def __init__(self, kind, key, process, log_path):
+        self.kind = kind
+        self.key = key
+        self.process = process
+        self.log_path = log_path
+        self.spawned = time.monotonic()
+        self._booted = False
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def booted(self):
+        if not self._booted:
+            try:
+                with open(self.log_path, 'r', errors='replace') as f:
+                    self._booted = READY_MARKER in f.read(4096)
+            except OSError:
+                pass
+        return self._booted
+
+    def stale(self, now):
+        return now - self.spawned > POOL_MAX_IDLE
+
+    def discard(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        try:
+            os.remove(self.log_path)
+        except OSError:
+            pass
+
+
+_idle = {}  # (kind, key) -> deque of WarmRuntime
+_refilling = set()  # (kind, key) with a refill in flight
+_counts = {kind: {'hits': 0, 'misses': 0} for kind in KINDS}
+_lock = threading.Lock()
+
+
+def pool_size():
+    return max(0, int(getattr(settings, 'IMAGI_PREVIEW_POOL_SIZE', DEFAULT_POOL_SIZE)))
+
+
+def _pool_dir():
+    return os.path.join(settings.PROJECTS_ROOT, POOL_DIRNAME)
+
+
+def backend_key():
+    """Backend runtimes are interchangeable: all run Imagi's interpreter."""
+    return sys.executable
+
+
+def frontend_key(frontend_path):
+    """The store slot a frontend's node_modules links to, or None if unlinked."""
+    node_modules = os.path.join(frontend_path, 'node_modules')
+    if not os.path.islink(node_modules):
+        return None
+    return os.path.dirname(os.path.realpath(node_modules))
+
+
+def scaffold_slot():
+    """The store slot of the scaffold's dependency set, if it is installed."""
+    from apps.Imagi.ProjectManager.services.codegen import templates as tpl
+
+    from . import frontend_dependencies as deps
+
+    signature = deps.dependency_signature(tpl.frontend_package_json('imagi-template'))
+    slot = os.path.realpath(os.path.join(deps.store_root(), signature))
+    if not os.path.isdir(os.path.join(slot, 'node_modules', 'vite')):
+        return None
+    return slot
+
+
+def _pooled_keys():
+    keys = [('backend', backend_key())]
+    slot = scaffold_slot()
+    if slot and shutil.which('node'):
+        keys.append(('frontend', slot))
+    return keys
+
+
+def _install_vite_runtime(slot):
+    target = os.path.join(slot, VITE_RUNTIME_NAME)
+    if os.path.exists(target) and filecmp.cmp(VITE_RUNTIME, target, shallow=False):
+        return target
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(VITE_RUNTIME, tmp)
+    os.replace(tmp, target)
+    return target
+
+
+def _spawn(kind, key):
+    from .preview_service import child_env
+
+    pool_dir = _pool_dir()
+    os.makedirs(pool_dir, exist_ok=True)
+    log_path = os.path.join(pool_dir, f"{kind}-{uuid.uuid4().hex}.log")
+    if kind == 'backend':
+        command, cwd = [key, DJANGO_RUNTIME], pool_dir
+    else:
+        command, cwd = [shutil.which('node') or 'node', _install_vite_runtime(key)], key
+    with open(log_path, 'w') as log_fh:
+        process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=log_fh,
+            stderr=subprocess.STDOUT,
+            env=child_env(),
+        )
+    return WarmRuntime(kind, key, process, log_path)
+
+
+def _fill(kind, key):
+    """Top the pool for (kind, key) up to its size, dropping dead and stale runtimes."""
+    now = time.monotonic()
+    with _lock:
+        runtimes = _idle.setdefault((kind, key), deque())
+        dropped = [r for r in runtimes if not r.alive() or r.stale(now)]
+        for runtime in dropped:
+            runtimes.remove(runtime)
+        missing = pool_size() - len(runtimes)
+    for runtime in dropped:
+        runtime.discard()
+    spawned = []
+    for _ in range(max(0, missing)):
+        try:
+            spawned.append(_spawn(kind, key))
+        except Exception as e:
+            logger.warning(f"Could not start a warm {kind} preview runtime: {e}")
+            break
+    with _lock:
+        _idle[(kind, key)].extend(spawned)
+
+
+def _refill_in_background(kind, key):
+    with _lock:
+        if (kind, key) in _refilling:
+            return
+        _refilling.add((kind, key))
+
+    def refill():
+        try:
+            _fill(kind, key)
+        finally:
+            with _lock:
+                _refilling.discard((kind, key))
+
+    threading.Thread(target=refill, name=f"preview-pool-{kind}", daemon=True).start()
+
+
+def warm():
+    """Start filling every pool this worker keeps (in the background)."""
+    if not pool_size():
+        return
+    try:
+        keys = _pooled_keys()
+    except Exception as e:
+        logger.warning(f"Could not determine preview pool keys: {e}")
+        return
+    for kind, key in keys:
+        _refill_in_background(kind, key)
+
+
+def _take(kind, key):
+    """Pop a booted, live runtime for (kind, key); None when there is none."""
+    now = time.monotonic()
+    dropped = []
+    taken = None
+    with _lock:
+        runtimes = _idle.get((kind, key)) or deque()
+        for runtime in list(runtimes):
+            if not runtime.alive() or runtime.stale(now):
+                runtimes.remove(runtime)
+                dropped.append(runtime)
+            elif runtime.booted():
+                runtimes.remove(runtime)
+                taken = runtime
+                break
+    for runtime in dropped:
+        runtime.discard()
+    return taken
+
+
+def _bind(runtime, binding, log_path):
+    # Move the log first: the same file (same inode) the runtime has been
+    # writing to becomes the project's server log.
+    os.replace(runtime.log_path, log_path)
+    runtime.log_path = log_path
+    runtime.process.stdin.write((json.dumps(binding) + '\n').encode('utf-8'))
+    runtime.process.stdin.close()
+
+
+def claim(kind, key, binding, log_path):
+    """Bind an idle runtime of ``kind`` for ``key`` to a project.
+
+    ``binding`` is what the runtime needs to serve the project (see the
+    runtime scripts); its output goes to ``log_path`` from then on. Returns
+    the runtime's process, or None on a miss — the caller then starts the
+    server cold. Either way the pool is refilled in the background.
+    """
+    if not pool_size():
+        return None
+    runtime = _take(kind, key) if key is not None else None
+    process = None
+    if runtime is not None:
+        try:
+            _bind(runtime, binding, log_path)
+            process = runtime.process
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not bind warm {kind} runtime: {e}")
+            runtime.discard()
+    with _lock:
+        _counts[kind]['hits' if process else 'misses'] += 1
+    if (kind, key) in _pooled_keys():
+        _refill_in_background(kind, key)
+    return process
+
+
+def stats():
+    """Pool size, idle runtimes and hit rate per kind, for this worker."""
+    with _lock:
+        idle = {kind: 0 for kind in KINDS}
+        for (kind, _key), runtimes in _idle.items():
+            idle[kind] += len(runtimes)
+        counts = {kind: dict(values) for kind, values in _counts.items()}
+    report = {'size': pool_size(), 'idle': idle}
+    for kind, values in counts.items():
+        total = values['hits'] + values['misses']
+        report[kind] = {
+            **values,
+            'hit_rate': round(values['hits'] / total, 3) if total else None,
+        }
+    return report
+
+
+def shutdown():
+    """Stop every idle runtime and forget the counters."""
+    with _lock:
+        runtimes = [r for pool in _idle.values() for r in pool]
+        _idle.clear()
+        for values in _counts.values():
+            values.update(hits=0, misses=0)
+    for runtime in runtimes:
+        runtime.discard()
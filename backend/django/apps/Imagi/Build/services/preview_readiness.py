@@ -0,0 +1,201 @@
+"""
+Readiness probing for the preview dev servers (used by PreviewService).
+
+Starting a preview used to sleep fixed amounts — about 11 seconds in all —
+whatever the servers actually needed. Each server is now watched until it
+is serving:
+
+- its log is tailed for the server's own startup line (Django's "Starting
+  development server at", Vite's "ready in" / "Local:" banner). The line is
+  only a hint — it makes the next probe fire immediately — except that
+  Vite's "Local:" URL also reports the port Vite really bound, which can
+  differ from the one asked for;
+- its port is probed over HTTP, with backoff from 50ms to 500ms. Any HTTP
+  response counts: a 404 from a project with no root route is still a
+  server ready to render;
+- its process is polled, so a crash fails the start at once with the log
+  tail instead of waiting out the timeout.
+
+Both servers are probed in one loop, so a dual-stack start waits for the
+slower of the two, not their sum.
+
+Startup durations are kept per process (the last STARTUP_SAMPLES starts)
+and summarised as percentiles in the start payload.
+"""
+
+import http.client
+import logging
+import math
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PROBE_INITIAL_DELAY = 0.05
+PROBE_MAX_DELAY = 0.5
+PROBE_HTTP_TIMEOUT = 1.0
+
+# Starts remembered per phase for the latency percentiles.
+STARTUP_SAMPLES = 200
+
+DJANGO_READY_PATTERN = re.compile(r'Starting development server at')
+VITE_READY_PATTERN = re.compile(r'ready in \d+|Local:\s+https?://')
+# Vite moves to the next free port when the requested one is taken and says
+# so only in this line.
+VITE_LOCAL_URL = re.compile(r'Local:\s+https?://[^\s:/]+:(\d+)')
+
+_ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+
+class ServerExited(Exception):
+    """A dev server process exited before it became ready."""
+
+    def __init__(self, probe):
+        self.probe = probe
+        super().__init__(f"{probe.name} exited with code {probe.process.returncode}")
+
+
+class ServerProbe:
+    """Watches one launched dev server until it answers HTTP."""
+
+    def __init__(self, name, process, port, log_path, ready_pattern, port_pattern=None):
+        self.name = name
+        self.process = process
+        self.port = port
+        self.log_path = log_path
+        self.ready_pattern = ready_pattern
+        self.port_pattern = port_pattern
+        self.started = time.monotonic()
+        self.ready_at = None
+        self.saw_ready_line = False
+        self._log_offset = 0
+        self._log_buffer = ''
+
+    @property
+    def elapsed_ms(self):
+        end = self.ready_at if self.ready_at is not None else time.monotonic()
+        return int((end - self.started) * 1000)
+
+    def _scan_log(self):
+        """Read what the server logged since the last scan; True on news."""
+        try:
+            with open(self.log_path, 'r', errors='replace') as f:
+                f.seek(self._log_offset)
+                chunk = f.read()
+                self._log_offset = f.tell()
+        except OSError:
+            return False
+        if not chunk:
+            return False
+        # Keep a partial trailing line for the next read.
+        text = _ANSI_ESCAPE.sub('', self._log_buffer + chunk)
+        lines = text.split('\n')
+        self._log_buffer = lines.pop()
+        news = False
+        for line in lines:
+            if self.port_pattern:
+                match = self.port_pattern.search(line)
+                if match:
+                    self.port = int(match.group(1))
+            if not self.saw_ready_line and self.ready_pattern.search(line):
+                self.saw_ready_line = True
+                news = True
+        return news
+
+    def _http_ok(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=PROBE_HTTP_TIMEOUT)
+        try:
+            conn.request('GET', '/')
+            conn.getresponse().read(0)
+            return True
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+    def check(self):
+        """True once the server is serving; raises ServerExited if it died.
+
+        Otherwise 'hint' when the log has just announced readiness (probe
+        again without backing off), or False.
+        """
+        if self.ready_at is not None:
+            return True
+        news = self._scan_log()
+        if self.process is not None and self.process.poll() is not None:
+            raise ServerExited(self)
+        if self._http_ok():
+            self.ready_at = time.monotonic()
+            return True
+        return 'hint' if news else False
+
+
+def wait_until_ready(probes, timeout):
+    """Probe every server until all answer or ``timeout`` seconds pass.
+
+    Returns the probes still not ready at the deadline (empty on success);
+    raises ServerExited as soon as any server process dies.
+    """
+    deadline = time.monotonic() + timeout
+    delay = PROBE_INITIAL_DELAY
+    pending = list(probes)
+    while pending:
+        hinted = False
+        still = []
+        for probe in pending:
+            result = probe.check()
+            if result is True:
+                logger.info(f"{probe.name} ready on port {probe.port} in {probe.elapsed_ms}ms")
+                continue
+            hinted = hinted or result == 'hint'
+            still.append(probe)
+        pending = still
+        if not pending or time.monotonic() >= deadline:
+            break
+        if hinted:
+            delay = PROBE_INITIAL_DELAY
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, PROBE_MAX_DELAY)
+    return pending
+
+
+# ---------------------------------------------------------------------------
+# Startup latency statistics (per process)
+# ---------------------------------------------------------------------------
+
+_samples = {}  # phase -> deque of milliseconds
+_samples_lock = threading.Lock()
+
+
+def record_startup(phase, elapsed_ms):
+    with _samples_lock:
+        _samples.setdefault(phase, deque(maxlen=STARTUP_SAMPLES)).append(int(elapsed_ms))
+
+
+def _percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    rank = math.ceil(fraction * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def startup_percentiles():
+    """{phase: {'count', 'p50', 'p90', 'p99'}} over the remembered starts."""
+    with _samples_lock:
+        snapshot = {phase: sorted(values) for phase, values in _samples.items()}
+    return {
+        phase: {
+            'count': len(values),
+            'p50': _percentile(values, 0.50),
+            'p90': _percentile(values, 0.90),
+            'p99': _percentile(values, 0.99),
+        }
+        for phase, values in snapshot.items()
+        if values
+    }
+
+
+def reset_startup_stats():
+    with _samples_lock:
+        _samples.clear()
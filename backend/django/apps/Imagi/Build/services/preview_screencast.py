@@ -0,0 +1,156 @@
+"""
+Screencast streaming for the browser preview (the preview stream endpoint).
+
+The workspace used to poll ``BrowserPreviewService.frame`` continuously: a
+``Page.captureScreenshot`` on a pool thread per request, then a SHA-1 of the
+JPEG just to tell the client nothing had changed. An idle page cost a thread
+and a full screenshot every 1.5 seconds per open preview.
+
+This module streams instead, over one asyncio DevTools session per open
+preview, with no thread held:
+
+- ``Page.startScreencast`` makes Chromium push a frame only when the page
+  repaints, so an idle page sends nothing;
+- each frame is acknowledged (``Page.screencastFrameAck``) only once the
+  consumer has taken it off the stream, and Chromium sends no more until
+  then. A slow client therefore gets fewer frames, not a growing backlog;
+- frames arriving back to back (scrolling, animation) switch the screencast
+  to MOTION_JPEG_QUALITY, and it returns to FRAME_JPEG_QUALITY once the
+  page has been still for SETTLE_AFTER seconds. Restarting the screencast
+  emits a frame at once, so the settled page is always re-sent crisp;
+- status (path, title, history, console errors) is re-sent after
+  navigations and, at most every STATUS_MIN_INTERVAL, after repaints.
+
+The session is browser_preview_service's AsyncCdpConnection, opened with
+events. Its websocket client is the ``websockets`` package, which ships
+with ``uvicorn[standard]``. Without it ``ws_connect`` is None and the
+endpoint reports streaming as unavailable, so clients keep polling.
+"""
+
+import asyncio
+import logging
+import time
+
+from .browser_preview_service import (
+    DEFAULT_VIEWPORT,
+    FRAME_JPEG_QUALITY,
+    MOTION_JPEG_QUALITY,
+    AsyncCdpConnection,
+    BrowserNotRunning,
+    _adrive,
+    ws_connect,
+)
+
+logger = logging.getLogger(__name__)
+
+# Frames closer together than this mean the page is moving.
+MOTION_FRAME_INTERVAL = 0.2
+# Stillness after motion before the screencast returns to crisp frames.
+SETTLE_AFTER = 0.5
+# Status refreshes driven by repaints are at most this frequent.
+STATUS_MIN_INTERVAL = 1.0
+# An idle stream still sends a ping this often, so proxies keep it open.
+KEEPALIVE_INTERVAL = 15.0
+# last_active is refreshed this often while a stream is open (the same
+# throttle BrowserPreviewService._require_state applies).
+TOUCH_INTERVAL = 30.0
+
+_NAVIGATION_EVENTS = {'Page.frameNavigated', 'Page.navigatedWithinDocument'}
+_DETACH_EVENTS = {'Inspector.detached', 'Inspector.targetCrashed'}
+
+
+async def _start_screencast(session, state, quality):
+    width, height = state.get('viewport', DEFAULT_VIEWPORT)
+    dsf = float(state.get('device_scale_factor', 1))
+    await session.call('Page.stopScreencast')
+    await session.call('Page.startScreencast', {
+        'format': 'jpeg',
+        'quality': int(quality),
+        # Device pixels, matching what captureScreenshot returns.
+        'maxWidth': int(width * dsf),
+        'maxHeight': int(height * dsf),
+        'everyNthFrame': 1,
+    })
+
+
+async def _status(session, service, state):
+    return {'type': 'status', **await _adrive(session, service._status_steps(session, state))}
+
+
+async def screencast(service, state, ws_url):
+    """Yield the preview as events: 'status', 'frame' and idle 'ping's.
+
+    Runs until the consumer stops iterating (the client disconnected) or the
+    browser goes away, which raises BrowserNotRunning.
+    """
+    session = await AsyncCdpConnection.open(ws_url, events=True)
+    try:
+        width, height = state.get('viewport', DEFAULT_VIEWPORT)
+        # Emulation overrides belong to the session that sets them, so this
+        # one applies the preview's viewport too. A resize restarts the
+        # stream (the client reconnects) rather than updating it.
+        await session.call('Emulation.setDeviceMetricsOverride', {
+            'width': int(width),
+            'height': int(height),
+            'deviceScaleFactor': float(state.get('device_scale_factor', 1)),
+            'mobile': False,
+        })
+        await session.call('Page.enable')
+        yield await _status(session, service, state)
+
+        quality = FRAME_JPEG_QUALITY
+        await _start_screencast(session, state, quality)
+        last_frame = last_status = 0.0
+        last_touch = time.monotonic()
+        status_due = False
+
+        while True:
+            now = time.monotonic()
+            timeout = KEEPALIVE_INTERVAL
+            if status_due:
+                timeout = min(timeout, last_status + STATUS_MIN_INTERVAL - now)
+            if quality != FRAME_JPEG_QUALITY:
+                timeout = min(timeout, last_frame + SETTLE_AFTER - now)
+            event = await session.next_event(max(0.0, timeout))
+            now = time.monotonic()
+
+            if event is None:
+                if quality != FRAME_JPEG_QUALITY and now - last_frame >= SETTLE_AFTER:
+                    quality = FRAME_JPEG_QUALITY
+                    await _start_screencast(session, state, quality)
+                elif not status_due:
+                    yield {'type': 'ping'}
+            else:
+                method = event.get('method')
+                if method == 'Page.screencastFrame':
+                    params = event.get('params') or {}
+                    moving = now - last_frame < MOTION_FRAME_INTERVAL
+                    last_frame = now
+                    yield {'type': 'frame', 'frame': params.get('data', '')}
+                    # Acked only now that the consumer has taken the frame:
+                    # Chromium holds the next one until then.
+                    await session.send('Page.screencastFrameAck', {'sessionId': params.get('sessionId')})
+                    if moving and quality == FRAME_JPEG_QUALITY:
+                        quality = MOTION_JPEG_QUALITY
+                        await _start_screencast(session, state, quality)
+                    status_due = True
+                elif method in _NAVIGATION_EVENTS:
+                    status_due = True
+                    last_status = 0.0  # navigations update the toolbar at once
+                elif method in _DETACH_EVENTS:
+                    raise BrowserNotRunning('The preview page went away.')
+
+            if status_due and now - last_status >= STATUS_MIN_INTERVAL:
+                yield await _status(session, service, state)
+                last_status = time.monotonic()
+                status_due = False
+
+            if now - last_touch >= TOUCH_INTERVAL:
+                await asyncio.to_thread(service._require_state, True)
+                last_touch = now
+    finally:
+        try:
+            await asyncio.wait_for(session.send('Page.stopScreencast'), 1)
+        except Exception:
+            pass
+        await session.close()
@@ -13,6 +13,17 @@ import logging
 import json
 from django.conf import settings
 
+from . import port_leases, preview_pool
+from .preview_readiness import (
+    DJANGO_READY_PATTERN,
+    VITE_LOCAL_URL,
+    VITE_READY_PATTERN,
+    ServerExited,
+    ServerProbe,
+    record_startup,
+    startup_percentiles,
+    wait_until_ready,
+)
 from .safe_paths import UnsafePathError, resolve_within
 
 logger = logging.getLogger(__name__)
@@ -20,6 +31,11 @@ logger = logging.getLogger(__name__)
 # npm install for a freshly scaffolded frontend can legitimately take minutes
 NPM_INSTALL_TIMEOUT = 600
 
+# How long a preview start waits for its dev servers to answer HTTP. Vite's
+# first boot of a project pre-bundles its dependencies, which is the slow
+# case; a server still booting at the deadline is left running.
+PREVIEW_READY_TIMEOUT = 90
+
 # Lock directory created inside a generated frontend while npm install runs
 # there, so concurrent installers (the background install kicked off at
 # project creation and a preview start that finds node_modules missing)
@@ -98,6 +114,7 @@ def npm_install_lock(frontend_path, timeout=NPM_INSTALL_TIMEOUT):
 PID_SUFFIXES = ('_frontend.pid', '_backend.pid', '_server.pid', '_browser.pid')  # _server.pid predates dual-stack
 LOG_SUFFIXES = ('_frontend.log', '_backend.log', '_browser.log')
 PORTS_SUFFIX = '_preview_ports.json'
+BROWSER_PID_SUFFIX = '_browser.pid'
 BROWSER_STATE_SUFFIX = '_browser.json'
 BROWSER_PROFILE_SUFFIX = '_browser_profile'
 
@@ -153,6 +170,11 @@ class PreviewService:
         # draining would freeze the servers once the pipe buffer fills.
         self.frontend_log_file = os.path.join(self.pid_dir, f"{stem}_frontend.log")
         self.backend_log_file = os.path.join(self.pid_dir, f"{stem}_backend.log")
+        # The dev server processes this instance launched, for readiness probes.
+        self._backend_process = None
+        self._frontend_process = None
+        # Which servers of this start came from the warm pool (preview_pool).
+        self._warm = {}
 
     def ensure_preview(self):
         """Start the dev servers only if a healthy preview is not already up.
@@ -165,9 +187,9 @@ class PreviewService:
         if state:
             backend_port = state.get('backend_port')
             frontend_port = state.get('frontend_port')
-            backend_ok = bool(backend_port) and self._port_in_use(backend_port)
+            backend_ok = port_leases.is_listening(backend_port)
             # Legacy single-Django projects have no frontend server.
-            frontend_ok = not frontend_port or self._port_in_use(frontend_port)
+            frontend_ok = not frontend_port or port_leases.is_listening(frontend_port)
             if backend_ok and frontend_ok:
                 self.backend_port = backend_port
                 if frontend_port:
@@ -200,6 +222,7 @@ class PreviewService:
 
             # Stop any existing servers for this project
             self.stop_preview()
+            self._warm = {}
 
             # Check if project has the new dual-stack structure
             frontend_path = os.path.join(self.project.project_path, 'frontend', 'vuejs')
@@ -240,15 +263,14 @@ class PreviewService:
     def _start_dual_stack_preview(self, frontend_path, backend_path):
         """Start both VueJS frontend and Django backend servers."""
         logger.info("Starting dual-stack preview (VueJS + Django)")
+        started = time.monotonic()
 
-        # Start Django backend first
+        # Start Django backend first: Vite needs its port for the /api proxy
+        # target, but not the server itself, so both boot side by side.
         backend_error = self._start_django_backend(backend_path)
         if backend_error:
             raise Exception(f"Django backend failed to start: {backend_error}")
 
-        # Wait a moment for backend to start
-        time.sleep(3)
-
         # Start VueJS frontend
         frontend_error = self._start_vuejs_frontend(frontend_path)
         if frontend_error:
@@ -256,8 +278,22 @@ class PreviewService:
             self._stop_django_backend(port=self.backend_port)
             raise Exception(f"VueJS frontend failed to start: {frontend_error}")
 
-        # Wait for frontend to start
-        time.sleep(5)
+        backend_probe = ServerProbe(
+            'Django backend', self._backend_process, self.backend_port,
+            self.backend_log_file, DJANGO_READY_PATTERN,
+        )
+        frontend_probe = ServerProbe(
+            'VueJS frontend', self._frontend_process, self.frontend_port,
+            self.frontend_log_file, VITE_READY_PATTERN, port_pattern=VITE_LOCAL_URL,
+        )
+        try:
+            self._wait_for_servers([backend_probe, frontend_probe])
+        except Exception:
+            self._stop_vuejs_frontend(port=self.frontend_port)
+            self._stop_django_backend(port=self.backend_port)
+            raise
+        # Vite reports the port it really bound in its banner.
+        self.frontend_port = frontend_probe.port
 
         self._save_port_state()
 
@@ -271,9 +307,60 @@ class PreviewService:
             'preview_url': frontend_url,
             'frontend_url': frontend_url,
             'backend_url': f"http://localhost:{self.backend_port}",
-            'message': 'Full-stack development servers started successfully'
+            'message': 'Full-stack development servers started successfully',
+            'startup': self._startup_report(
+                started, backend=backend_probe, frontend=frontend_probe
+            ),
         }
 
+    def _wait_for_servers(self, probes):
+        """Block until every launched server answers HTTP (see preview_readiness).
+
+        A server that exits first fails the start with its log tail. One
+        still booting at the deadline is left running and reported as not
+        ready: a slow first Vite build is not a failure.
+        """
+        try:
+            pending = wait_until_ready(probes, PREVIEW_READY_TIMEOUT)
+        except ServerExited as e:
+            probe = e.probe
+            output = self._read_log_tail(probe.log_path)
+            logger.error(f"{probe.name} process terminated unexpectedly")
+            logger.error(f"Return code: {probe.process.returncode}")
+            logger.error(f"Output: {output}")
+            raise Exception(
+                f"{probe.name} failed to start: process exited with code "
+                f"{probe.process.returncode}: {output}"
+            )
+        for probe in pending:
+            logger.warning(
+                f"{probe.name} not answering on port {probe.port} after "
+                f"{PREVIEW_READY_TIMEOUT}s; continuing"
+            )
+
+    def _startup_report(self, started, **probes):
+        """Per-server time-to-ready for this start, plus the running percentiles.
+
+        A server bound from the warm pool is also recorded as '<phase>_bind',
+        so bind latency and cold starts can be told apart.
+        """
+        report = {}
+        for phase, probe in probes.items():
+            report[f'{phase}_ms'] = probe.elapsed_ms if probe.ready_at is not None else None
+            if probe.ready_at is not None:
+                record_startup(phase, probe.elapsed_ms)
+                if self._warm.get(phase):
+                    record_startup(f'{phase}_bind', probe.elapsed_ms)
+        ready = all(probe.ready_at is not None for probe in probes.values())
+        report['total_ms'] = int((time.monotonic() - started) * 1000)
+        report['ready'] = ready
+        if ready:
+            record_startup('total', report['total_ms'])
+        report['percentiles'] = startup_percentiles()
+        report['warm'] = {phase: bool(self._warm.get(phase)) for phase in probes}
+        report['pool'] = preview_pool.stats()
+        return report
+
     def _start_django_backend(self, backend_path):
         """Start Django backend server. Returns None on success, error text on failure."""
         try:
@@ -304,39 +391,44 @@ class PreviewService:
             # Set up environment
             env = child_env(DJANGO_SETTINGS_MODULE=f"{project_name}.settings")
 
-            # Find available port for backend (avoiding conflict with main project on 8000)
-            self.backend_port = self._find_available_port_excluding(8080, 8100, exclude_ports=[8000])
+            self.backend_port = self._lease_port('backend')
             logger.info(f"Starting Django backend on port {self.backend_port}")
 
             # Ensure PID file directory exists
             os.makedirs(os.path.dirname(self.backend_pid_file), exist_ok=True)
 
-            # Start Django development server. sys.executable is the
+            # A pre-booted runtime from the pool when one is idle; otherwise
+            # start Django's development server cold. sys.executable is the
             # interpreter running Imagi itself, which is guaranteed to exist
             # and to have Django/DRF installed (a bare 'python' may be neither).
-            with open(self.backend_log_file, 'w') as log_fh:
-                process = subprocess.Popen(
-                    [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{self.backend_port}'],
-                    cwd=backend_path,
-                    stdout=log_fh,
-                    stderr=subprocess.STDOUT,
-                    env=env
-                )
+            process = preview_pool.claim(
+                'backend', preview_pool.backend_key(),
+                {
+                    'cwd': backend_path,
+                    'port': self.backend_port,
+                    'env': {'DJANGO_SETTINGS_MODULE': env['DJANGO_SETTINGS_MODULE']},
+                },
+                self.backend_log_file,
+            )
+            self._warm['backend'] = process is not None
+            if process is None:
+                with open(self.backend_log_file, 'w') as log_fh:
+                    process = subprocess.Popen(
+                        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{self.backend_port}'],
+                        cwd=backend_path,
+                        stdout=log_fh,
+                        stderr=subprocess.STDOUT,
+                        env=env
+                    )
 
             # Save the PID
             with open(self.backend_pid_file, 'w') as f:
                 f.write(str(process.pid))
+            port_leases.attach(self.backend_port, process.pid)
 
             logger.info(f"Django backend started with PID {process.pid}")
-
-            # Wait a moment and check if process is still running
-            time.sleep(1)
-            if process.poll() is not None:
-                output = self._read_log_tail(self.backend_log_file)
-                logger.error(f"Django backend process terminated unexpectedly")
-                logger.error(f"Return code: {process.returncode}")
-                logger.error(f"Output: {output}")
-                return f"process exited with code {process.returncode}: {output}"
+            # Readiness (or an early exit) is picked up by _wait_for_servers.
+            self._backend_process = process
 
             return None
 
@@ -370,8 +462,7 @@ class PreviewService:
             if deps_error:
                 return deps_error
 
-            # Find available port for frontend (avoiding conflict with Imagi itself on 5173)
-            self.frontend_port = self._find_available_port_excluding(5174, 5200, exclude_ports=[5173])
+            self.frontend_port = self._lease_port('frontend')
             logger.info(f"Starting VueJS frontend on port {self.frontend_port}")
 
             # Set up environment for Vite. VITE_BACKEND_URL points the generated
@@ -384,33 +475,39 @@ class PreviewService:
             # Ensure PID file directory exists
             os.makedirs(os.path.dirname(self.frontend_pid_file), exist_ok=True)
 
-            # Start Vite development server
-            with open(self.frontend_log_file, 'w') as log_fh:
-                process = subprocess.Popen(
-                    # Bind to loopback only: the preview is consumed by the
-                    # headless browser running on this same host, never
-                    # directly by the user's machine.
-                    [npm, 'run', 'dev', '--', '--port', str(self.frontend_port), '--host', '127.0.0.1'],
-                    cwd=frontend_path,
-                    stdout=log_fh,
-                    stderr=subprocess.STDOUT,
-                    env=env
-                )
+            # A pre-booted Vite from the pool when one is idle for this
+            # project's dependency slot; otherwise start Vite cold. Bind to
+            # loopback only: the preview is consumed by the headless browser
+            # running on this same host, never directly by the user's machine.
+            process = preview_pool.claim(
+                'frontend', preview_pool.frontend_key(frontend_path),
+                {
+                    'root': frontend_path,
+                    'port': self.frontend_port,
+                    'host': '127.0.0.1',
+                    'env': {k: env[k] for k in ('PORT', 'VITE_BACKEND_URL')},
+                },
+                self.frontend_log_file,
+            )
+            self._warm['frontend'] = process is not None
+            if process is None:
+                with open(self.frontend_log_file, 'w') as log_fh:
+                    process = subprocess.Popen(
+                        [npm, 'run', 'dev', '--', '--port', str(self.frontend_port), '--host', '127.0.0.1'],
+                        cwd=frontend_path,
+                        stdout=log_fh,
+                        stderr=subprocess.STDOUT,
+                        env=env
+                    )
 
             # Save the PID
             with open(self.frontend_pid_file, 'w') as f:
                 f.write(str(process.pid))
+            port_leases.attach(self.frontend_port, process.pid)
 
             logger.info(f"VueJS frontend started with PID {process.pid}")
-
-            # Wait a moment and check if process is still running
-            time.sleep(2)
-            if process.poll() is not None:
-                output = self._read_log_tail(self.frontend_log_file)
-                logger.error(f"VueJS frontend process terminated unexpectedly")
-                logger.error(f"Return code: {process.returncode}")
-                logger.error(f"Output: {output}")
-                return f"process exited with code {process.returncode}: {output}"
+            # Readiness (or an early exit) is picked up by _wait_for_servers.
+            self._frontend_process = process
 
             return None
 
@@ -515,8 +612,7 @@ class PreviewService:
         if not os.path.exists(manage_py):
             raise FileNotFoundError(f"manage.py not found in {self.project.project_path}")
 
-        # Get an available port
-        port = self._find_available_port(8080, 8100)
+        port = self._lease_port('backend')
 
         # Get the project name from the path
         project_name = os.path.basename(self.project.project_path)
@@ -540,14 +636,17 @@ class PreviewService:
         # Save the PID (use backend_pid_file for legacy projects)
         with open(self.backend_pid_file, 'w') as f:
             f.write(str(process.pid))
+        port_leases.attach(port, process.pid)
 
-        # Wait for server to start
-        time.sleep(2)
-
-        # Check if the server started successfully
-        if process.poll() is not None:
-            error_output = self._read_log_tail(self.backend_log_file)
-            raise Exception(f"Server failed to start: {error_output}")
+        started = time.monotonic()
+        probe = ServerProbe(
+            'Django server', process, port, self.backend_log_file, DJANGO_READY_PATTERN,
+        )
+        try:
+            self._wait_for_servers([probe])
+        except Exception:
+            self._stop_django_backend(port=port)
+            raise
 
         self.backend_port = port
         self._save_port_state()
@@ -560,36 +659,13 @@ class PreviewService:
         return {
             'success': True,
             'preview_url': server_url,
-            'message': 'Development server started successfully'
+            'message': 'Development server started successfully',
+            'startup': self._startup_report(started, backend=probe),
         }
 
-    def _find_available_port(self, start_port, max_port):
-        """Find an available port starting from the start_port."""
-        return self._find_available_port_excluding(start_port, max_port)
-
-    def _find_available_port_excluding(self, start_port, max_port, exclude_ports=None):
-        """Find an available port starting from the start_port, excluding specified ports."""
-        if exclude_ports is None:
-            exclude_ports = []
-
-        port = start_port
-
-        while port <= max_port:
-            # Skip excluded ports
-            if port in exclude_ports:
-                port += 1
-                continue
-
-            if not self._port_in_use(port):
-                return port
-
-            port += 1
-
-        # If we reach here, return start_port and hope for the best (excluding excluded ports)
-        if start_port not in exclude_ports:
-            return start_port
-        else:
-            return start_port + 1
+    def _lease_port(self, kind):
+        """Lease a free port of ``kind`` for this project (see port_leases)."""
+        return port_leases.lease(kind, owner=sidecar_stem(self.project))
 
     @staticmethod
     def _process_connections(proc):
@@ -599,20 +675,6 @@ class PreviewService:
             return proc.net_connections()
         return proc.connections()
 
-    def _port_in_use(self, port):
-        """Check whether any process is listening on the given port."""
-        try:
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    for conn in self._process_connections(proc):
-                        if hasattr(conn, 'laddr') and conn.laddr and conn.laddr.port == port:
-                            return True
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.Error):
-                    continue
-        except Exception:
-            pass
-        return False
-
     def stop_preview(self):
         """Stop both frontend and backend development servers."""
         try:
@@ -632,6 +694,9 @@ class PreviewService:
 
             if os.path.exists(self.ports_file):
                 os.remove(self.ports_file)
+            port_leases.release_owner(
+                sidecar_stem(self.project), kinds=('backend', 'frontend')
+            )
 
             message = ', '.join(success_messages) if success_messages else 'No servers were running'
 
@@ -756,6 +821,9 @@ class PreviewService:
 
     def _kill_by_port(self, port):
         """Kill any process still listening on the given port."""
+        # The process scan is the slow part; skip it when nothing listens.
+        if not port_leases.is_listening(port):
+            return False
         stopped = False
         for proc in psutil.process_iter(['pid', 'name']):
             try:
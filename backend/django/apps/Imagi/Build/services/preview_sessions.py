@@ -0,0 +1,287 @@
+"""
+Registry and background reaper for idle browser preview sessions.
+
+Idle previews (browser plus dev servers) used to be reaped by a sweep that
+globbed every session state file under PROJECTS_ROOT and parsed each one,
+and it only ran when some preview started. The sweep cost grew with the
+number of projects, and on a quiet instance idle browsers were never
+reclaimed.
+
+Instead, each worker keeps the sessions it serves in memory, with a heap
+of their reap deadlines (last_active + BROWSER_PREVIEW_IDLE_TIMEOUT):
+
+    preview_sessions.track(state_file, state['last_active'])  # on start / touch
+    preview_sessions.forget(state_file)                       # on stop
+
+A daemon thread per worker, started when the server process boots
+(BuildConfig.ready), sleeps until the earliest deadline and reaps the
+sessions that are due. A touch only pushes a new heap entry when last_active
+moved (BrowserPreviewService throttles that to every 30 seconds); entries
+left behind by later touches are skipped when they surface. Another worker
+may have served the session since this one last saw it, so a due session's
+state file is read once before reaping, and a newer last_active reschedules
+it instead. The thread sweeps the state files once when it starts, to adopt
+sessions from workers that came before it.
+
+Memory pressure: when the host's memory use passes
+BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT, the thread reaps the least recently
+active sessions first, one at a time, until it is back under. Sessions used
+within PRESSURE_MIN_IDLE are spared, so a preview is not closed while its
+user is interacting with it.
+"""
+
+import glob
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import psutil
+from django.conf import settings
+
+from . import port_leases, shared_browser
+from .preview_service import (
+    BROWSER_PID_SUFFIX,
+    BROWSER_PROFILE_SUFFIX,
+    BROWSER_STATE_SUFFIX,
+    PORTS_SUFFIX,
+    PreviewService,
+)
+
+logger = logging.getLogger(__name__)
+
+# The reaper wakes at least this often (seconds) to check memory pressure.
+PRESSURE_CHECK_INTERVAL = 30
+
+# Sessions active within this many seconds are never evicted for memory.
+PRESSURE_MIN_IDLE = 60
+
+_lock = threading.Lock()
+_last_active = {}  # state_file -> last_active this worker knows of
+_deadlines = []  # heap of (reap_at, state_file); superseded entries skipped
+_wakeup = threading.Event()
+_reaper = None  # (pid, thread)
+_stopping = threading.Event()
+
+
+def _idle_timeout():
+    return getattr(settings, 'BROWSER_PREVIEW_IDLE_TIMEOUT', 1800) or 0
+
+
+def _pressure_threshold():
+    return getattr(settings, 'BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT', 0) or 0
+
+
+def track(state_file, last_active):
+    """Record that a session was active at ``last_active`` (epoch seconds)."""
+    timeout = _idle_timeout()
+    with _lock:
+        if _last_active.get(state_file) == last_active:
+            return
+        _last_active[state_file] = last_active
+        if timeout:
+            reap_at = last_active + timeout
+            wake = not _deadlines or reap_at < _deadlines[0][0]
+            heapq.heappush(_deadlines, (reap_at, state_file))
+        else:
+            wake = False
+    if wake:
+        _wakeup.set()
+
+
+def forget(state_file):
+    with _lock:
+        _last_active.pop(state_file, None)
+
+
+def tracked():
+    """Snapshot of this worker's sessions: {state_file: last_active}."""
+    with _lock:
+        return dict(_last_active)
+
+
+def _read_last_active(state_file):
+    """The session's last_active on disk; None when the session is gone."""
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict):
+        return None
+    return float(state.get('last_active', 0))
+
+
+def reap_due(now=None):
+    """Reap every tracked session past its deadline; returns their state files."""
+    timeout = _idle_timeout()
+    if not timeout:
+        return []
+    now = time.time() if now is None else now
+    due = []
+    with _lock:
+        while _deadlines and _deadlines[0][0] <= now:
+            reap_at, state_file = heapq.heappop(_deadlines)
+            known = _last_active.get(state_file)
+            if known is not None and known + timeout == reap_at:
+                due.append(state_file)
+
+    reaped = []
+    for state_file in due:
+        on_disk = _read_last_active(state_file)
+        if on_disk is None:
+            forget(state_file)
+        elif now - on_disk < timeout:
+            track(state_file, on_disk)  # another worker served it since
+        else:
+            reap_session(state_file, reason='idle')
+            reaped.append(state_file)
+    return reaped
+
+
+def _memory_percent():
+    return psutil.virtual_memory().percent
+
+
+def relieve_memory_pressure(now=None):
+    """Reap least recently active sessions while the host is over the
+    pressure threshold; returns their state files."""
+    threshold = _pressure_threshold()
+    if not threshold or _memory_percent() < threshold:
+        return []
+    now = time.time() if now is None else now
+    with _lock:
+        candidates = sorted(_last_active.items(), key=lambda item: item[1])
+    reaped = []
+    for state_file, _known in candidates:
+        on_disk = _read_last_active(state_file)
+        if on_disk is None:
+            forget(state_file)
+            continue
+        if now - on_disk < PRESSURE_MIN_IDLE:
+            continue
+        reap_session(state_file, reason='memory pressure')
+        reaped.append(state_file)
+        if _memory_percent() < threshold:
+            break
+    else:
+        if _memory_percent() >= threshold:
+            logger.warning(
+                f"Host memory is above {threshold}% and no idle preview is left to reap"
+            )
+    return reaped
+
+
+def reap_session(state_file, reason='idle'):
+    """Shut a preview session down from its files alone: the browser (or its
+    shared-browser context), then the dev servers PreviewService recorded.
+
+    Needs no database access, so it works for any user's project.
+    """
+    prefix = state_file[:-len(BROWSER_STATE_SUFFIX)]
+    stem = os.path.basename(prefix)
+    logger.info(f"Reaping preview session {stem} ({reason})")
+    forget(state_file)
+    try:
+        try:
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if isinstance(state, dict) and state.get('context_id'):
+            shared_browser.close_context(state['context_id'])
+        _kill_pid_file(prefix + BROWSER_PID_SUFFIX)
+        _kill_pid_file(prefix + '_frontend.pid')
+        _kill_pid_file(prefix + '_backend.pid')
+        for leftover in (state_file, prefix + PORTS_SUFFIX):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        shutil.rmtree(prefix + BROWSER_PROFILE_SUFFIX, ignore_errors=True)
+        port_leases.release_owner(stem)
+    except Exception as e:
+        logger.warning(f"Could not reap preview session {stem}: {e}")
+
+
+def _kill_pid_file(pid_file):
+    if not os.path.exists(pid_file):
+        return
+    try:
+        with open(pid_file, 'r') as f:
+            pid = int(f.read().strip())
+        process = psutil.Process(pid)
+        for proc in process.children(recursive=True) + [process]:
+            PreviewService._stop_process(proc)
+    except (OSError, ValueError, psutil.NoSuchProcess, psutil.AccessDenied):
+        pass
+    try:
+        os.remove(pid_file)
+    except OSError:
+        pass
+
+
+def adopt_existing():
+    """Track every session with a state file on disk (the one full sweep)."""
+    root = getattr(settings, 'PROJECTS_ROOT', None)
+    if not root or not os.path.isdir(root):
+        return
+    for state_file in glob.glob(os.path.join(root, '*', f'*{BROWSER_STATE_SUFFIX}')):
+        last_active = _read_last_active(state_file)
+        if last_active is not None:
+            track(state_file, last_active)
+
+
+def _next_wait():
+    with _lock:
+        next_deadline = _deadlines[0][0] if _deadlines else None
+    wait = PRESSURE_CHECK_INTERVAL
+    if next_deadline is not None:
+        wait = min(wait, next_deadline - time.time())
+    return max(0.0, wait)
+
+
+def _run():
+    try:
+        adopt_existing()
+    except Exception as e:
+        logger.warning(f"Could not adopt existing preview sessions: {e}")
+    while not _stopping.is_set():
+        try:
+            reap_due()
+            relieve_memory_pressure()
+        except Exception as e:  # the reaper must outlive any one bad session
+            logger.warning(f"Preview session reaper failed: {e}")
+        _wakeup.wait(_next_wait())
+        _wakeup.clear()
+
+
+def ensure_reaper():
+    """Start this worker's reaper thread if it is not running."""
+    global _reaper
+    if not _idle_timeout() and not _pressure_threshold():
+        return
+    with _lock:
+        # A forked worker inherits the parent's bookkeeping, not its threads.
+        if _reaper and _reaper[0] == os.getpid() and _reaper[1].is_alive():
+            return
+        _stopping.clear()
+        thread = threading.Thread(target=_run, name='preview-session-reaper', daemon=True)
+        _reaper = (os.getpid(), thread)
+    thread.start()
+
+
+def shutdown():
+    """Stop the reaper thread and forget every tracked session."""
+    global _reaper
+    _stopping.set()
+    _wakeup.set()
+    with _lock:
+        reaper, _reaper = _reaper, None
+        _last_active.clear()
+        _deadlines.clear()
+    if reaper and reaper[1] is not threading.current_thread():
+        reaper[1].join(timeout=5)
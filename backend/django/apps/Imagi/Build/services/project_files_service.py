@@ -15,7 +15,12 @@ Design
   PROJECTS_ROOT). When disk and database disagree, disk wins.
 - Every mutation touches disk first, then writes through to the mirror:
   the file services and agent tools call ``record_file`` / ``remove_file``
-  / ``remove_directory`` after touching disk.
+  / ``remove_directory`` after touching disk. During an agent run those
+  write-throughs are coalesced into a per-project batch (``mirror_batch``)
+  that flushes in one transaction.
+- Row content is stored once per distinct content in a shared,
+  compressed blob table (``file_blobs``): the scaffold every project ships
+  costs one copy, not one per project.
 - ``import_project_from_disk`` refreshes the mirror from disk (backfills,
   or re-syncs after a git reset rewrites the working copy);
   ``hydrate_project`` goes the other way, and is only used to restore a
@@ -23,13 +28,19 @@ Design
   explicitly asked.
 """
 
+import hashlib
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.db import transaction
 
 from apps.Imagi.Build.models import ProjectFile
+from apps.Imagi.Build.services import file_blobs, file_index
 
 logger = logging.getLogger(__name__)
 
@@ -127,12 +138,66 @@ def mirror_suppressed(project) -> bool:
     return bool(getattr(project, '_suppress_db_mirror', False))
 
 
+def content_hash(content: str) -> str:
+    """The ProjectFile.content_hash of a text (sha256 of its UTF-8 bytes)."""
+    return hashlib.sha256(content.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def _mirror_fields(rel_path: str, content: str, mtime_ns: int) -> dict:
+    """The mirror columns a row for this content carries.
+
+    The content itself goes to the shared blob store (see file_blobs); the
+    row points at it by hash, so callers must ``file_blobs.store`` it in the
+    same transaction that writes the row.
+    """
+    encoded = content.encode('utf-8', errors='ignore')
+    digest = hashlib.sha256(encoded).hexdigest()
+    return {
+        'inline_content': '',
+        'blob_id': digest,
+        'file_type': _file_type_for(rel_path),
+        'size': len(encoded),
+        'content_hash': digest,
+        'mtime_ns': mtime_ns,
+    }
+
+
+# Columns a bulk upsert rewrites when the row already exists.
+_UPSERT_FIELDS = [
+    'inline_content', 'blob', 'file_type', 'size', 'content_hash', 'mtime_ns', 'updated_at',
+]
+
+
+def _disk_mtime_ns(project_root: str, rel_path: str) -> int:
+    """A file's mtime, or 0 (never matches, so the next import re-reads it)."""
+    try:
+        return os.stat(os.path.join(project_root, rel_path)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _read_disk_content(project_root: str, rel_path: str, st=None):
+    """Read a file's text off disk for the mirror, or None if it can't be stored."""
+    full_path = os.path.join(project_root, rel_path)
+    try:
+        size = st.st_size if st is not None else os.path.getsize(full_path)
+        if size > MAX_SYNCED_FILE_BYTES:
+            logger.warning(f"Skipping DB sync for oversized file: {rel_path}")
+            return None
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Could not read {rel_path} for DB sync: {e}")
+        return None
+
+
 def record_file(project, rel_path: str, content: str = None):
     """Upsert the database copy of a project file.
 
     Reads the content from disk when not provided. Returns the ProjectFile
-    row, or None when the path is not syncable (binary/ignored/too large)
-    or the mirror is suppressed for a worktree run.
+    row, or None when the path is not syncable (binary/ignored/too large),
+    the mirror is suppressed for a worktree run, or the write was queued
+    into the project's open mirror batch (see ``mirror_batch``).
     """
     ensure_workspace_tier('write a project file')
     if mirror_suppressed(project):
@@ -140,41 +205,40 @@ def record_file(project, rel_path: str, content: str = None):
     rel_path = _normalize_rel_path(rel_path)
     if not is_syncable_path(rel_path):
         return None
+    if _enqueue(project, written=rel_path):
+        return None
+    return _upsert_file(project, rel_path, content)
 
+
+def _upsert_file(project, rel_path: str, content: str = None):
+    """record_file's immediate write: one update_or_create for one file."""
     if content is None:
-        full_path = os.path.join(project.project_path, rel_path)
-        try:
-            if os.path.getsize(full_path) > MAX_SYNCED_FILE_BYTES:
-                logger.warning(f"Skipping DB sync for oversized file: {rel_path}")
-                return None
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except (OSError, UnicodeDecodeError) as e:
-            logger.warning(f"Could not read {rel_path} for DB sync: {e}")
+        content = _read_disk_content(project.project_path, rel_path)
+        if content is None:
             return None
 
     if len(content.encode('utf-8', errors='ignore')) > MAX_SYNCED_FILE_BYTES:
         logger.warning(f"Skipping DB sync for oversized content: {rel_path}")
         return None
 
-    row, _created = ProjectFile.objects.update_or_create(
-        project=project,
-        path=rel_path,
-        defaults={
-            'content': content,
-            'file_type': _file_type_for(rel_path),
-            'size': len(content.encode('utf-8', errors='ignore')),
-        },
-    )
+    fields = _mirror_fields(rel_path, content, _disk_mtime_ns(project.project_path, rel_path))
+    with transaction.atomic():
+        file_blobs.store({fields['content_hash']: content})
+        row, _created = ProjectFile.objects.update_or_create(
+            project=project, path=rel_path, defaults=fields,
+        )
     return row
 
 
 def remove_file(project, rel_path: str) -> int:
-    """Delete the database copy of a project file. Returns rows deleted."""
+    """Delete the database copy of a project file. Returns rows deleted
+    (0 when the delete was queued into an open mirror batch)."""
     ensure_workspace_tier('delete a project file')
     if mirror_suppressed(project):
         return 0
     rel_path = _normalize_rel_path(rel_path)
+    if _enqueue(project, written=rel_path):
+        return 0
     deleted, _ = ProjectFile.objects.filter(project=project, path=rel_path).delete()
     return deleted
 
@@ -187,6 +251,8 @@ def remove_directory(project, rel_dir: str) -> int:
     rel_dir = _normalize_rel_path(rel_dir).rstrip('/')
     if not rel_dir:
         raise ValueError("Refusing to remove database files for the project root")
+    if _enqueue(project, removed_dir=rel_dir):
+        return 0
     deleted, _ = ProjectFile.objects.filter(
         project=project, path__startswith=rel_dir + '/'
     ).delete()
@@ -194,77 +260,453 @@ def remove_directory(project, rel_dir: str) -> int:
 
 
 def get_db_content(project, rel_path: str):
-    """Return the database copy's content for a file, or None if absent."""
+    """Return the database copy's content for a file, or None if absent.
+
+    A write to this path still waiting in an open mirror batch is flushed
+    first, so a reader never sees the mirror lag behind a write it made.
+    """
     rel_path = _normalize_rel_path(rel_path)
-    row = ProjectFile.objects.filter(project=project, path=rel_path).only('content').first()
-    return row.content if row else None
+    batch = _batch_for(project)
+    if batch is not None and batch.is_pending(rel_path):
+        batch.flush()
+    row = ProjectFile.objects.filter(project=project, path=rel_path).values_list(
+        *_CONTENT_COLUMNS
+    ).first()
+    return _stored_text(*row) if row else None
+
+
+# What a read of a row's content selects: the blob it points at, joined in
+# the same query, and the inline column for rows that predate the blobs.
+_CONTENT_COLUMNS = ('inline_content', 'blob__data', 'blob__compression')
+
+
+def _stored_text(inline_content, blob_data, blob_compression) -> str:
+    if blob_data is None:
+        return inline_content
+    return file_blobs.decode(blob_data, blob_compression)
+
+
+# ---------------------------------------------------------------------------
+# Per-run mirror batching
+# ---------------------------------------------------------------------------
+#
+# An agent run edits the same handful of files over and over, and each
+# write-through above is its own autocommitted SELECT + INSERT/UPDATE. While
+# a run holds a batch open for its project, write-throughs only mark the
+# path dirty (repeated writes coalesce to one entry); the batch flushes every
+# MIRROR_FLUSH_INTERVAL seconds and when the run ends, as one transaction:
+# a bulk upsert for the dirty files that exist plus one delete for the rest.
+#
+# A flush re-reads every dirty path off disk rather than replaying queued
+# content, so it is idempotent — flushing twice, or flushing a path the run
+# wrote and then deleted, leaves the mirror equal to disk either way. A
+# process that dies with writes still queued loses at most one interval of
+# mirror updates and nothing on disk; ``import_project_from_disk`` (the
+# sync_project_files command) repairs the mirror from disk as it always has.
+
+# Seconds a queued write may wait before the next write-through flushes it.
+MIRROR_FLUSH_INTERVAL = 5.0
+
+# Open batches by project id, shared by every thread in this process.
+_batches = {}
+_batches_lock = threading.Lock()
+
+
+class _MirrorBatch:
+    """Dirty paths (and removed directories) queued for one project."""
+
+    def __init__(self, project_id: int, project_root: str):
+        self.project_id = project_id
+        self.project_root = project_root
+        self.depth = 1
+        self.dirty = set()
+        self.removed_dirs = set()
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # Serializes flushes: each one reads disk inside it, so a later flush
+        # can never commit older content over a newer one.
+        self._flush_lock = threading.Lock()
+
+    def add(self, written: str = None, removed_dir: str = None) -> bool:
+        """Queue a change; returns True when an interval flush is due."""
+        with self._lock:
+            if removed_dir is not None:
+                prefix = removed_dir + '/'
+                self.dirty = {p for p in self.dirty if not p.startswith(prefix)}
+                self.removed_dirs.add(removed_dir)
+            if written is not None:
+                self.dirty.add(written)
+            return time.monotonic() - self.last_flush >= MIRROR_FLUSH_INTERVAL
+
+    def is_pending(self, rel_path: str) -> bool:
+        with self._lock:
+            return rel_path in self.dirty or any(
+                rel_path.startswith(d + '/') for d in self.removed_dirs
+            )
+
+    def flush(self) -> dict:
+        """Write every queued change through in one transaction.
+
+        Returns {'upserted': n, 'deleted': n}. On a database error the
+        changes are re-queued for the next flush and the error re-raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty, self.dirty = self.dirty, set()
+                removed_dirs, self.removed_dirs = self.removed_dirs, set()
+                self.last_flush = time.monotonic()
+            if not dirty and not removed_dirs:
+                return {'upserted': 0, 'deleted': 0}
+
+            rows = []
+            contents = {}
+            gone = []
+            for rel_path in sorted(dirty):
+                if not os.path.isfile(os.path.join(self.project_root, rel_path)):
+                    gone.append(rel_path)
+                    continue
+                mtime_ns = _disk_mtime_ns(self.project_root, rel_path)
+                content = _read_disk_content(self.project_root, rel_path)
+                if content is None:
+                    # Unstorable now (oversized, not UTF-8): leave the row as
+                    # it was, exactly like an unbatched record_file.
+                    continue
+                fields = _mirror_fields(rel_path, content, mtime_ns)
+                contents[fields['content_hash']] = content
+                rows.append(ProjectFile(project_id=self.project_id, path=rel_path, **fields))
+
+            try:
+                deleted = 0
+                with transaction.atomic():
+                    for rel_dir in sorted(removed_dirs):
+                        # Only rows whose file is still gone: a write that
+                        # bypassed the batch (an import during a task apply)
+                        # may have put files back under the directory.
+                        under = ProjectFile.objects.filter(
+                            project_id=self.project_id, path__startswith=rel_dir + '/'
+                        ).exclude(path__in=dirty).values_list('path', flat=True)
+                        missing = [
+                            path for path in under
+                            if not os.path.isfile(os.path.join(self.project_root, path))
+                        ]
+                        if missing:
+                            count, _ = ProjectFile.objects.filter(
+                                project_id=self.project_id, path__in=missing
+                            ).delete()
+                            deleted += count
+                    if gone:
+                        count, _ = ProjectFile.objects.filter(
+                            project_id=self.project_id, path__in=gone
+                        ).delete()
+                        deleted += count
+                    if rows:
+                        file_blobs.store(contents)
+                        ProjectFile.objects.bulk_create(
+                            rows,
+                            update_conflicts=True,
+                            unique_fields=['project', 'path'],
+                            update_fields=_UPSERT_FIELDS,
+                        )
+            except Exception:
+                with self._lock:
+                    self.dirty |= dirty
+                    self.removed_dirs |= removed_dirs
+                raise
+            return {'upserted': len(rows), 'deleted': deleted}
+
+
+def _batch_for(project):
+    """The open mirror batch for a project instance, or None."""
+    if mirror_suppressed(project):
+        return None
+    with _batches_lock:
+        batch = _batches.get(getattr(project, 'id', None))
+    # A re-pointed instance (another root) never shares the canonical batch.
+    if batch is None or batch.project_root != project.project_path:
+        return None
+    return batch
+
+
+def mirror_batched(project) -> bool:
+    """Whether write-throughs for this project instance are being batched."""
+    return _batch_for(project) is not None
+
+
+def _enqueue(project, written: str = None, removed_dir: str = None) -> bool:
+    """Queue a write-through into the project's open batch, if it has one.
+
+    Returns False when no batch is open, so the caller writes through
+    immediately. An interval flush that fails is logged and retried on the
+    next flush — the write itself is already safe on disk.
+    """
+    batch = _batch_for(project)
+    if batch is None:
+        return False
+    if batch.add(written=written, removed_dir=removed_dir):
+        try:
+            batch.flush()
+        except Exception as e:
+            logger.warning(f"Deferred DB-mirror flush failed for project {batch.project_id}: {e}")
+    return True
+
+
+def open_mirror_batch(project_id: int, project_root: str) -> None:
+    """Start batching DB-mirror writes for a project (re-entrant)."""
+    with _batches_lock:
+        batch = _batches.get(project_id)
+        if batch is not None and batch.project_root == project_root:
+            batch.depth += 1
+            return
+        if batch is not None:
+            # The project moved under an open batch; write its queue out
+            # under the old root before starting over.
+            _flush_quietly(batch)
+        _batches[project_id] = _MirrorBatch(project_id, project_root)
+
+
+def close_mirror_batch(project_id: int) -> dict:
+    """Flush the project's batch; the outermost close also stops batching.
+
+    Never raises: it runs from run cleanup paths. A flush that fails leaves
+    the mirror behind disk until the next write-through or import.
+    """
+    with _batches_lock:
+        batch = _batches.get(project_id)
+        if batch is None:
+            return {'upserted': 0, 'deleted': 0}
+        batch.depth -= 1
+        if batch.depth <= 0:
+            del _batches[project_id]
+    return _flush_quietly(batch)
+
+
+def _flush_quietly(batch) -> dict:
+    try:
+        return batch.flush()
+    except Exception as e:
+        logger.warning(f"DB-mirror flush failed for project {batch.project_id}: {e}")
+        return {'upserted': 0, 'deleted': 0}
+
+
+@contextmanager
+def mirror_batch(project):
+    """Batch every DB-mirror write-through for ``project`` inside the block."""
+    if mirror_suppressed(project) or not getattr(project, 'project_path', None):
+        yield
+        return
+    open_mirror_batch(project.id, project.project_path)
+    try:
+        yield
+    finally:
+        close_mirror_batch(project.id)
 
 
 # ---------------------------------------------------------------------------
 # Bulk sync (DB -> disk and disk -> DB)
 # ---------------------------------------------------------------------------
 
+# Rows whose content one hydration query fetches; bounds memory per chunk.
+HYDRATE_CHUNK_SIZE = 200
+
+# Threads writing hydrated files; file writes release the GIL, so a small
+# pool overlaps the filesystem latency of a large project.
+HYDRATE_WRITE_WORKERS = 8
+
+
+def _disk_matches(full_path: str, size: int, digest: str) -> bool:
+    """Whether the file on disk already holds the row's content."""
+    try:
+        if not digest or os.path.getsize(full_path) != size:
+            return False
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return content_hash(f.read()) == digest
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def _write_hydrated_file(full_path: str, stored) -> None:
+    # Decoded here, on the pool thread: zlib releases the GIL too.
+    with open(full_path, 'w', encoding='utf-8') as f:
+        f.write(_stored_text(*stored))
+
+
 def hydrate_project(project, overwrite: bool = False) -> dict:
     """Materialize the working copy on disk from the database rows.
 
     Writes each ProjectFile to ``project.project_path``. Files already on
     disk are left alone unless ``overwrite`` is set, so a development
-    checkout with newer local edits is never clobbered by accident.
+    checkout with newer local edits is never clobbered by accident (with
+    ``overwrite``, a file whose content already matches is still skipped).
+
+    The rows' (path, size, hash) are read first to decide what to write;
+    only the content of those files is then streamed, HYDRATE_CHUNK_SIZE
+    rows per query, and written by a bounded thread pool while the next
+    chunk is fetched. Every target directory is created once up front.
     """
     project_root = project.project_path
-    written = 0
+    wanted = []
     skipped = 0
-
-    for row in ProjectFile.objects.filter(project=project).iterator():
-        full_path = os.path.join(project_root, row.path.replace('/', os.sep))
-        if os.path.exists(full_path) and not overwrite:
+    for pk, path, size, digest in ProjectFile.objects.filter(
+        project=project
+    ).values_list('id', 'path', 'size', 'content_hash').order_by('path'):
+        full_path = os.path.join(project_root, path.replace('/', os.sep))
+        if os.path.exists(full_path) and (not overwrite or _disk_matches(full_path, size, digest)):
             skipped += 1
             continue
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(row.content)
-        written += 1
+        wanted.append((pk, full_path))
+
+    for directory in sorted({os.path.dirname(full_path) for _pk, full_path in wanted}):
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        written = _write_hydrated_files(project, wanted)
+    finally:
+        if wanted:
+            # Even a hydration that failed partway changed the tree.
+            file_index.invalidate(project_root)
 
     logger.info(f"Hydrated project {project.id}: {written} files written, {skipped} already present")
     return {'written': written, 'skipped': skipped}
 
 
+def _write_hydrated_files(project, wanted) -> int:
+    """Stream the content of ``wanted`` ((id, full_path) pairs) onto disk."""
+    if not wanted:
+        return 0
+    written = 0
+    paths_by_id = dict(wanted)
+    ids = [pk for pk, _full_path in wanted]
+    with ThreadPoolExecutor(
+        max_workers=HYDRATE_WRITE_WORKERS, thread_name_prefix=f'hydrate-{project.id}'
+    ) as pool:
+        in_flight = []
+        for i in range(0, len(ids), HYDRATE_CHUNK_SIZE):
+            rows = ProjectFile.objects.filter(
+                id__in=ids[i:i + HYDRATE_CHUNK_SIZE]
+            ).values_list('id', *_CONTENT_COLUMNS)
+            futures = [
+                pool.submit(_write_hydrated_file, paths_by_id[pk], stored)
+                for pk, *stored in rows
+            ]
+            # At most two chunks' content in memory: drain the older chunk
+            # while this one's writes start, then fetch the next.
+            for future in in_flight:
+                future.result()
+                written += 1
+            in_flight = futures
+        for future in in_flight:
+            future.result()
+            written += 1
+    return written
+
+
+# Rows per bulk statement, kept well under every backend's parameter limit.
+IMPORT_BATCH_SIZE = 500
+
+
 def import_project_from_disk(project, prune: bool = True) -> dict:
     """Import/refresh the database copy from the working copy on disk.
 
     Used to backfill existing projects and to re-sync after operations that
     rewrite the working copy wholesale (e.g. a git version reset). When
     ``prune`` is set, rows whose files no longer exist on disk are deleted.
+
+    Only what changed is written. The existing rows' (size, mtime, hash) are
+    loaded in one query; a file whose size and mtime still match is skipped
+    without being read, and one whose content hashes the same only has its
+    mtime refreshed. New and changed files go out in bulk upserts, stale rows
+    in bulk deletes, all in one transaction. Returns the counts:
+    ``synced`` (files the mirror now holds), ``created``, ``updated``,
+    ``unchanged`` and ``pruned``.
     """
     project_root = project.project_path
     if not project_root or not os.path.isdir(project_root):
         raise ValueError(f"Project {project.id} has no directory on disk to import from")
 
+    existing = {
+        path: (size, mtime_ns, digest, pk)
+        for pk, path, size, mtime_ns, digest in ProjectFile.objects.filter(
+            project=project
+        ).values_list('id', 'path', 'size', 'mtime_ns', 'content_hash')
+    }
+
     seen = set()
-    synced = 0
-    # Batch every per-file upsert into a single transaction. Without this each
-    # record_file() auto-commits on its own — one fsync per file — which makes
-    # importing a freshly scaffolded project (hundreds of files) needlessly
-    # slow, especially on SQLite. One commit at the end instead of hundreds.
+    upserts = []
+    contents = {}
+    touched = []
+    created = 0
+    unchanged = 0
+    for root, dirs, filenames in os.walk(project_root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
+        for filename in sorted(filenames):
+            abs_path = os.path.join(root, filename)
+            rel_path = _normalize_rel_path(os.path.relpath(abs_path, project_root))
+            if not is_syncable_path(rel_path):
+                continue
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            known = existing.get(rel_path)
+            if known and known[2] and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                seen.add(rel_path)
+                unchanged += 1
+                continue
+
+            content = _read_disk_content(project_root, rel_path, st=st)
+            if content is None:
+                continue
+            fields = _mirror_fields(rel_path, content, st.st_mtime_ns)
+            if fields['size'] > MAX_SYNCED_FILE_BYTES:
+                continue
+            seen.add(rel_path)
+            if known and known[2] == fields['content_hash']:
+                # Same content, new mtime (a checkout rewrote it unchanged):
+                # record the mtime so the next import skips it unread.
+                touched.append(ProjectFile(id=known[3], mtime_ns=st.st_mtime_ns))
+                unchanged += 1
+                continue
+            if not known:
+                created += 1
+            contents[fields['content_hash']] = content
+            upserts.append(ProjectFile(project=project, path=rel_path, **fields))
+
+    stale = sorted(set(existing) - seen) if prune else []
+
+    # One transaction for the whole refresh: a reader sees the mirror either
+    # before or after the sync, and SQLite pays one fsync instead of hundreds.
+    pruned = 0
     with transaction.atomic():
-        for root, dirs, filenames in os.walk(project_root):
-            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
-            for filename in sorted(filenames):
-                abs_path = os.path.join(root, filename)
-                rel_path = _normalize_rel_path(os.path.relpath(abs_path, project_root))
-                if not is_syncable_path(rel_path):
-                    continue
-                if record_file(project, rel_path) is not None:
-                    seen.add(rel_path)
-                    synced += 1
-
-        pruned = 0
-        if prune:
-            stale = ProjectFile.objects.filter(project=project).exclude(path__in=seen)
-            pruned, _ = stale.delete()
-
-    logger.info(f"Imported project {project.id} from disk: {synced} files synced, {pruned} stale rows pruned")
-    return {'synced': synced, 'pruned': pruned}
+        if upserts:
+            file_blobs.store(contents)
+            ProjectFile.objects.bulk_create(
+                upserts,
+                batch_size=IMPORT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['project', 'path'],
+                update_fields=_UPSERT_FIELDS,
+            )
+        if touched:
+            ProjectFile.objects.bulk_update(touched, ['mtime_ns'], batch_size=IMPORT_BATCH_SIZE)
+        for i in range(0, len(stale), IMPORT_BATCH_SIZE):
+            count, _ = ProjectFile.objects.filter(
+                project=project, path__in=stale[i:i + IMPORT_BATCH_SIZE]
+            ).delete()
+            pruned += count
+
+    result = {
+        'synced': len(seen),
+        'created': created,
+        'updated': len(upserts) - created,
+        'unchanged': unchanged,
+        'pruned': pruned,
+    }
+    logger.info(
+        f"Imported project {project.id} from disk: {result['synced']} files synced "
+        f"({created} created, {result['updated']} updated, {unchanged} unchanged), "
+        f"{pruned} stale rows pruned"
+    )
+    return result
 
 
 def ensure_working_copy(project) -> bool:
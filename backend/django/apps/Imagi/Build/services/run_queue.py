@@ -0,0 +1,350 @@
+"""
+Host-wide admission control for agent runs.
+
+Admission used to be two count queries in agent_stream: the agent_busy guard
+(any fresh run_started_at in the project) and a per-user ceiling of three
+fresh runs, answered with a 429. Both raced, as their comments said, nothing
+bounded a host or a model's quota, and a crashed run held its marker until a
+ten-minute staleness window ran out.
+
+Every run agent_stream starts now takes a lease in this queue first:
+
+    run_queue.enqueue(run_id, user_id=..., project_id=..., conversation_id=...,
+                      kind='chat', model='gpt-5')   # Busy / QueueFull
+    while not (status := run_queue.poll(run_id))['admitted']:
+        ...  # report status['position'] / status['eta_seconds']
+    run_queue.heartbeat(run_id)                     # while running
+    run_queue.release(run_id)                       # when it ends
+
+agent_runs does this for its runs (see agent_runs._execute), so a run waits
+for a slot instead of being refused, and its stream reports where it stands
+in line.
+
+Slots: at most AGENT_RUN_MAX_CONCURRENT runs on the host, of which at most
+AGENT_RUN_MAX_CONCURRENT_PER_USER per user and, for a model listed in
+AGENT_RUN_MAX_CONCURRENT_PER_MODEL, that many on the model. Waiting runs are
+admitted fair-share rather than first-come: the run whose user (then whose
+project) has the fewest runs going goes first, so one user's burst of task
+dispatches cannot starve everyone queued behind it. The per-user ceiling
+still bounds how far concurrent runs can overshoot the usage allowance,
+which is checked before a run and debited after it.
+
+Leases: a lease is live while its worker heartbeats it (every
+HEARTBEAT_INTERVAL; a waiting run's polls count) and its worker process is
+alive. A lease that misses AGENT_RUN_LEASE_TTL, or whose worker died, is
+reclaimed by the next caller; its conversation is remembered as lost for a
+while, so a run_started_at its dead run left behind is not taken as a run in
+flight (see api.views._conversation_is_running).
+
+The busy guard is checked inside enqueue, under the registry lock, so two
+simultaneous submits to the same project can no longer both pass.
+
+The registry is a JSON file beside the run logs, guarded by ``flock`` like
+the port lease registry: the slots belong to this host's workers. Runs
+started outside agent_stream (the initial build's blocking runs) do not take
+a lease and are still judged by their run_started_at.
+"""
+
+import contextlib
+import logging
+import math
+import os
+import time
+
+import psutil
+from django.conf import settings
+
+from . import json_registry, port_leases
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILENAME = 'queue.json'
+
+# Kinds whose runs edit the project's canonical tree: one at a time per
+# project (task runs edit their own worktree). Mirrors CANONICAL_TREE_KINDS.
+CANONICAL_KINDS = ('chat', 'lead')
+
+# How often (seconds) a running run refreshes its lease, and a waiting one
+# polls for a slot.
+HEARTBEAT_INTERVAL = 15
+POLL_INTERVAL = 1.0
+
+# How long (seconds) a conversation whose lease was reclaimed is remembered
+# as lost.
+LOST_MEMORY = 600
+
+# Starting guess (seconds) for a run's duration, before any run has ended;
+# the ETA then follows a moving average of real runs.
+DEFAULT_RUN_SECONDS = 120
+RUN_SECONDS_WEIGHT = 0.2
+
+
+class Busy(Exception):
+    """The run would edit a tree another live run of the project is editing."""
+
+
+class QueueFull(Exception):
+    """The user already has AGENT_RUN_MAX_QUEUED_PER_USER runs waiting."""
+
+
+class LeaseLost(Exception):
+    """The run's lease was reclaimed (it missed its heartbeats)."""
+
+
+def _registry_path():
+    root = getattr(settings, 'AGENT_RUN_LOG_ROOT', None) or os.path.join(
+        settings.PROJECTS_ROOT, '.agent_runs'
+    )
+    return os.path.join(root, REGISTRY_FILENAME)
+
+
+def _limits():
+    return {
+        'host': getattr(settings, 'AGENT_RUN_MAX_CONCURRENT', 8),
+        'user': getattr(settings, 'AGENT_RUN_MAX_CONCURRENT_PER_USER', 3),
+        'model': getattr(settings, 'AGENT_RUN_MAX_CONCURRENT_PER_MODEL', None) or {},
+        'queued': getattr(settings, 'AGENT_RUN_MAX_QUEUED_PER_USER', 10),
+    }
+
+
+def _ttl():
+    return getattr(settings, 'AGENT_RUN_LEASE_TTL', 60)
+
+
+@contextlib.contextmanager
+def _registry(write=True):
+    """The registry dict, locked against every other process on the host.
+
+    With ``write``, changes made inside the block are written back on exit.
+    """
+    with json_registry.locked(_registry_path(), 'run queue registry', write=write) as data:
+        data.setdefault('leases', {})
+        data.setdefault('lost', {})
+        data.setdefault('run_seconds', DEFAULT_RUN_SECONDS)
+        yield data
+
+
+def _live(lease, now):
+    if now - lease['heartbeat'] > _ttl():
+        return False
+    return port_leases._process_alive(lease['pid'], lease.get('started'))
+
+
+def _expire(data, now):
+    """Reclaim dead leases, remembering their conversations as lost."""
+    for run_id, lease in list(data['leases'].items()):
+        if not _live(lease, now):
+            logger.warning(f"Reclaiming the {lease['state']} lease of agent run {run_id}")
+            del data['leases'][run_id]
+            if lease.get('conversation_id') is not None:
+                data['lost'][str(lease['conversation_id'])] = now
+    for conversation_id, since in list(data['lost'].items()):
+        if now - since > LOST_MEMORY:
+            del data['lost'][conversation_id]
+
+
+def _busy(leases, user_id, project_id, kind, conversation_id):
+    for lease in leases.values():
+        if lease['user_id'] != user_id or lease['project_id'] != project_id:
+            continue
+        if conversation_id is not None and lease['conversation_id'] == conversation_id:
+            # The same task again is busy; a chat/lead conversation is only
+            # guarded against the project's other canonical-tree runs.
+            if kind == 'task':
+                return True
+            continue
+        if kind in CANONICAL_KINDS and lease['kind'] in CANONICAL_KINDS:
+            return True
+    return False
+
+
+def _admit(data, now):
+    """Admit waiting runs into free slots, fairest first; returns the runs
+    still waiting, in the order they will be admitted."""
+    limits = _limits()
+    leases = data['leases']
+    running = [lease for lease in leases.values() if lease['state'] == 'running']
+    by_user, by_project, by_model = {}, {}, {}
+
+    def count(lease):
+        by_user[lease['user_id']] = by_user.get(lease['user_id'], 0) + 1
+        project = (lease['user_id'], lease['project_id'])
+        by_project[project] = by_project.get(project, 0) + 1
+        by_model[lease['model']] = by_model.get(lease['model'], 0) + 1
+
+    for lease in running:
+        count(lease)
+    total = len(running)
+
+    def fair(item):
+        lease = item[1]
+        return (
+            by_user.get(lease['user_id'], 0),
+            by_project.get((lease['user_id'], lease['project_id']), 0),
+            lease['enqueued'],
+        )
+
+    waiting = [(run_id, lease) for run_id, lease in leases.items() if lease['state'] == 'waiting']
+    while waiting and total < limits['host']:
+        fits = [
+            item for item in waiting
+            if by_user.get(item[1]['user_id'], 0) < limits['user']
+            and by_model.get(item[1]['model'], 0) < limits['model'].get(item[1]['model'], math.inf)
+        ]
+        if not fits:
+            break
+        run_id, lease = min(fits, key=fair)
+        lease['state'] = 'running'
+        lease['admitted'] = now
+        count(lease)
+        total += 1
+        waiting.remove((run_id, lease))
+    return [run_id for run_id, _lease in sorted(waiting, key=fair)]
+
+
+def enqueue(run_id, user_id, project_id=None, conversation_id=None, kind='chat', model=''):
+    """Queue a run for a slot.
+
+    Raises Busy when a live run already edits the tree this one would
+    (see _busy), and QueueFull when the user has too many runs waiting.
+    """
+    try:
+        started = psutil.Process().create_time()
+    except psutil.Error:
+        started = None
+    now = time.time()
+    with _registry() as data:
+        _expire(data, now)
+        leases = data['leases']
+        if _busy(leases, user_id, project_id, kind, conversation_id):
+            raise Busy(run_id)
+        waiting = sum(
+            1 for lease in leases.values()
+            if lease['user_id'] == user_id and lease['state'] == 'waiting'
+        )
+        if waiting >= _limits()['queued']:
+            raise QueueFull(run_id)
+        leases[run_id] = {
+            'user_id': user_id,
+            'project_id': project_id,
+            'conversation_id': conversation_id,
+            'kind': kind,
+            'model': model,
+            'state': 'waiting',
+            'enqueued': now,
+            'heartbeat': now,
+            'pid': os.getpid(),
+            'started': started,
+        }
+        if conversation_id is not None:
+            data['lost'].pop(str(conversation_id), None)
+
+
+def poll(run_id):
+    """Try to admit the run; refreshes its lease.
+
+    Returns ``{'admitted': True}``, or ``{'admitted': False, 'position': n,
+    'eta_seconds': s}`` with ``n`` runs ahead of it. Raises LeaseLost if the
+    run is no longer queued.
+    """
+    now = time.time()
+    with _registry() as data:
+        _expire(data, now)
+        lease = data['leases'].get(run_id)
+        if lease is None:
+            raise LeaseLost(run_id)
+        lease['heartbeat'] = now
+        waiting = _admit(data, now)
+        if lease['state'] == 'running':
+            return {'admitted': True}
+        position = waiting.index(run_id)
+        slots = max(1, _limits()['host'])
+        eta = data['run_seconds'] * (position // slots + 1)
+        return {'admitted': False, 'position': position, 'eta_seconds': round(eta)}
+
+
+def heartbeat(run_id):
+    """Refresh a run's lease. Returns False if it was already reclaimed."""
+    with _registry() as data:
+        lease = data['leases'].get(run_id)
+        if lease is None:
+            return False
+        lease['heartbeat'] = time.time()
+        return True
+
+
+def bind(run_id, conversation_id):
+    """Record the conversation a run turned out to be (a new chat's id is
+    only known once the run creates it)."""
+    with _registry() as data:
+        lease = data['leases'].get(run_id)
+        if lease is not None:
+            lease['conversation_id'] = conversation_id
+
+
+def release(run_id):
+    """Give up a run's lease, freeing its slot for the next waiting run."""
+    now = time.time()
+    with _registry() as data:
+        lease = data['leases'].pop(run_id, None)
+        if lease is not None and lease.get('admitted'):
+            data['run_seconds'] += RUN_SECONDS_WEIGHT * (
+                (now - lease['admitted']) - data['run_seconds']
+            )
+
+
+def snapshot():
+    """What the queue knows of conversations, from one read of the registry.
+
+    Returns ``{'leases': {conversation_id: 'waiting' | 'running'}, 'lost':
+    {conversation_id: since}}``: the state of each conversation's live
+    lease, and when the lease of each conversation whose run died was
+    reclaimed. Callers serializing many conversations take one snapshot
+    for all of them.
+    """
+    now = time.time()
+    leases, lost = {}, {}
+    with _registry(write=False) as data:
+        for lease in data['leases'].values():
+            conversation_id = lease.get('conversation_id')
+            if conversation_id is None:
+                continue
+            if _live(lease, now):
+                leases[conversation_id] = lease['state']
+            else:
+                lost[conversation_id] = now  # reclaimed by the next writer
+        for conversation_id, since in data['lost'].items():
+            lost.setdefault(int(conversation_id), since)
+    for conversation_id in leases:
+        lost.pop(conversation_id, None)
+    return {'leases': leases, 'lost': lost}
+
+
+def conversation_lease(conversation_id):
+    """The conversation's lease state: ``{'state': 'waiting' | 'running'}``,
+    ``{'state': 'lost', 'since': t}`` when its last run's lease was
+    reclaimed at ``t``, or None when the queue knows nothing of it."""
+    queue = snapshot()
+    if conversation_id in queue['leases']:
+        return {'state': queue['leases'][conversation_id]}
+    since = queue['lost'].get(conversation_id)
+    return {'state': 'lost', 'since': since} if since is not None else None
+
+
+def project_busy(user_id, project_id, kinds=CANONICAL_KINDS, exclude_conversation_id=None):
+    """Whether a live lease of ``kinds`` is queued or running in the project."""
+    now = time.time()
+    with _registry(write=False) as data:
+        return any(
+            lease['user_id'] == user_id
+            and lease['project_id'] == project_id
+            and lease['kind'] in kinds
+            and (exclude_conversation_id is None or lease.get('conversation_id') != exclude_conversation_id)
+            and _live(lease, now)
+            for lease in data['leases'].values()
+        )
+
+
+def lost_conversations():
+    """{conversation_id: since} for conversations whose lease was reclaimed."""
+    return snapshot()['lost']
@@ -0,0 +1,171 @@
+"""
+Literal prefilter index for ``grep_files``.
+
+A regular expression can only match text that contains the literal runs the
+expression cannot avoid: ``class\\s+\\w+View`` needs ``class`` and ``View``,
+``use(Auth|Payment)Store`` needs ``use`` and ``Store`` plus either ``Auth``
+or ``Payment``. ``plan_query`` extracts those requirements from the parsed
+pattern, and ``LiteralIndex`` answers "which files contain this literal?"
+from the file index's cached texts — so a search narrows to the handful of
+files that can match before any regex runs. The regex still decides every
+match; the index only ever rules files *out*, and a pattern with nothing to
+plan on (a bare ``.``, a case-insensitive search) scans every file as before.
+
+Why literals rather than trigram postings: in pure Python, cutting a
+project's text into trigrams costs seconds for a 2k-file tree — more than
+ten linear scans — while a substring test over text already in memory runs
+in C at memory speed. So postings are built per *queried* literal, on first
+use, and kept (LRU) for the repeat searches an agent run is full of.
+
+The index lives inside ``file_index.ProjectIndex``, covers exactly the files
+whose text that index has loaded, and is maintained by the same write hooks.
+"""
+
+import re
+from collections import OrderedDict
+
+try:  # Python 3.11+
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse
+    import sre_constants
+
+# A plan is a disjunction of conjunctions; nested alternations multiply out,
+# and past this many branches the nested alternation is dropped from the plan
+# (it then narrows nothing, which is always safe).
+MAX_PLAN_ALTERNATIVES = 16
+
+# Distinct literals whose postings a tree keeps, least recently used evicted.
+MAX_CACHED_LITERALS = 256
+
+
+# ---------------------------------------------------------------------------
+# Query planning: which literals must a match contain?
+# ---------------------------------------------------------------------------
+
+def _plan(subpattern) -> list:
+    """Alternatives (lists of literals) one of which every match satisfies."""
+    alternatives = [[]]
+    run = []
+
+    def flush():
+        if run:
+            literal = ''.join(run)
+            run.clear()
+            for alternative in alternatives:
+                alternative.append(literal)
+
+    def require(sub_alternatives):
+        nonlocal alternatives
+        product = [a + b for a in alternatives for b in sub_alternatives]
+        if len(product) <= MAX_PLAN_ALTERNATIVES:
+            alternatives = product
+
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            _group, add_flags, _del_flags, inner = av
+            if not add_flags & re.IGNORECASE:
+                require(_plan(inner))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            flush()
+            min_count, _max_count, inner = av
+            if min_count >= 1:
+                require(_plan(inner))
+        elif op is sre_constants.BRANCH:
+            flush()
+            branches = []
+            for branch in av[1]:
+                branches.extend(_plan(branch))
+            require(branches)
+        else:
+            # Character classes, wildcards, anchors, lookarounds and
+            # backreferences pin down no literal.
+            flush()
+    flush()
+    return alternatives
+
+
+def plan_query(pattern: str, flags: int = 0):
+    """The literal requirements of a search pattern, or None if it has none.
+
+    Returns a list of alternatives, each a list of literals: text can only
+    match if, for at least one alternative, it contains all of that
+    alternative's literals. None means the search cannot be narrowed.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, RecursionError):
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    alternatives = _plan(parsed)
+    if not alternatives or any(not literals for literals in alternatives):
+        # One branch with no literal means any text may match.
+        return None
+    return [sorted(set(literals), key=len, reverse=True) for literals in alternatives]
+
+
+def text_may_match(text: str, alternatives) -> bool:
+    """Exact check of one text against a plan (substring tests, no regex)."""
+    return any(all(lit in text for lit in literals) for literals in alternatives)
+
+
+# ---------------------------------------------------------------------------
+# The index
+# ---------------------------------------------------------------------------
+
+class LiteralIndex:
+    """Per-literal postings (the set of paths containing it) over loaded texts.
+
+    Postings are computed the first time a literal is queried and then kept
+    exact by ``update``/``discard`` as texts change. Not thread-safe on its
+    own: ``ProjectIndex`` calls it under its lock.
+    """
+
+    def __init__(self):
+        self._postings = OrderedDict()  # literal -> set of rel_paths
+
+    def update(self, rel_path: str, text: str) -> None:
+        """A file's text was (re)loaded: refresh its membership everywhere."""
+        for literal, paths in self._postings.items():
+            if literal in text:
+                paths.add(rel_path)
+            else:
+                paths.discard(rel_path)
+
+    def discard(self, rel_path: str) -> None:
+        """A file's text is no longer known (rewritten unread, or removed)."""
+        for paths in self._postings.values():
+            paths.discard(rel_path)
+
+    def clear(self) -> None:
+        self._postings.clear()
+
+    def candidates(self, alternatives, texts) -> set:
+        """Paths among ``texts`` (rel_path -> text) that may satisfy a plan."""
+        hits = set()
+        for literals in alternatives:
+            matching = None
+            for literal in literals:
+                paths = self._postings_for(literal, texts)
+                matching = set(paths) if matching is None else matching & paths
+                if not matching:
+                    break
+            if matching:
+                hits |= matching
+        return hits
+
+    def _postings_for(self, literal: str, texts) -> set:
+        paths = self._postings.get(literal)
+        if paths is None:
+            paths = {rel_path for rel_path, text in texts.items() if literal in text}
+            self._postings[literal] = paths
+            while len(self._postings) > MAX_CACHED_LITERALS:
+                self._postings.popitem(last=False)
+        else:
+            self._postings.move_to_end(literal)
+        return paths
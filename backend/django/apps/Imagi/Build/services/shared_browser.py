@@ -0,0 +1,409 @@
+"""
+One Chromium shared by every browser preview on the host.
+
+By default each previewed project gets a Chromium process of its own, with
+its own profile directory, at a few hundred MB of RSS each until the idle
+reaper reclaims it. With ``settings.BROWSER_PREVIEW_SHARED`` on, previews
+instead open a browser context (``Target.createBrowserContext``) in one
+Chromium per host. A context is an isolated, in-memory profile: cookies,
+storage and cache are not shared between projects. Each context holds one
+page target, the project's preview page, and costs a renderer rather than
+a browser:
+
+    session = shared_browser.open_context(owner, url, state_file, executable)
+    ...  # drive ws://127.0.0.1:<cdp_port>/devtools/page/<target_id>
+    shared_browser.close_context(session['context_id'])
+
+The browser and its contexts are recorded in a small registry under
+PROJECTS_ROOT, guarded by ``flock`` like port_leases: whichever worker
+first needs the browser launches it (under a lock of its own, so the
+registry is never held across a launch or a DevTools call), and every
+worker sees the same contexts. A project's own state file (see
+BrowserPreviewService) records its context and target ids instead of a PID.
+
+Memory: before a context is opened, the browser's resident memory (all of
+its processes) is checked against ``BROWSER_PREVIEW_MEMORY_BUDGET_MB``.
+Over budget, the least recently active contexts are closed until the new
+one fits, each context counted at the browser's average per context. Only
+contexts idle for EVICT_MIN_IDLE are candidates, so previews in use are
+never closed under their users; an evicted preview simply reports that it
+is not running, and the workspace starts it again.
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import time
+
+import psutil
+import requests
+from django.conf import settings
+from websocket import create_connection, WebSocketException
+
+from . import json_registry, port_leases
+from .preview_service import PreviewService
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILENAME = '.preview_shared_browser.json'
+PROFILE_DIRNAME = '.preview_shared_browser_profile'
+LOG_FILENAME = '.preview_shared_browser.log'
+LAUNCH_LOCK_FILENAME = '.preview_shared_browser.launch.lock'
+
+# The owner of the shared browser's CDP port lease.
+LEASE_OWNER = 'shared-browser'
+
+# A context must have been idle this long (seconds) to be evicted for memory.
+EVICT_MIN_IDLE = 60
+
+# How long a freshly launched browser has to expose its DevTools endpoint.
+LAUNCH_TIMEOUT = 30
+
+
+class SharedBrowserError(RuntimeError):
+    """The shared browser could not be launched or could not open a context."""
+
+
+def enabled():
+    return bool(getattr(settings, 'BROWSER_PREVIEW_SHARED', False))
+
+
+def _memory_budget():
+    return int(getattr(settings, 'BROWSER_PREVIEW_MEMORY_BUDGET_MB', 0) or 0) * 1024 * 1024
+
+
+def _registry_path():
+    return os.path.join(settings.PROJECTS_ROOT, REGISTRY_FILENAME)
+
+
+@contextlib.contextmanager
+def _registry():
+    """The registry dict, locked against every other process on the host.
+
+    Changes made inside the block are written back on exit.
+    """
+    with json_registry.locked(_registry_path(), 'shared browser registry') as data:
+        data.setdefault('browser', None)
+        data.setdefault('contexts', {})
+        yield data
+
+
+@contextlib.contextmanager
+def _browser_session(port):
+    """A ``call(method, params)`` on the browser's own DevTools target.
+
+    Browser contexts and targets are created and closed there, not through
+    any page.
+    """
+    try:
+        version = requests.get(f'http://127.0.0.1:{port}/json/version', timeout=5).json()
+        # suppress_origin: see CdpConnection.
+        ws = create_connection(version['webSocketDebuggerUrl'], timeout=15, suppress_origin=True)
+    except (requests.RequestException, ValueError, KeyError, WebSocketException, OSError) as e:
+        raise SharedBrowserError(f'The shared preview browser is not reachable: {e}')
+    next_id = 0
+
+    def call(method, params=None):
+        nonlocal next_id
+        next_id += 1
+        msg_id = next_id
+        try:
+            ws.send(json.dumps({'id': msg_id, 'method': method, 'params': params or {}}))
+            while True:
+                payload = json.loads(ws.recv())
+                if payload.get('id') == msg_id:
+                    break
+        except (WebSocketException, OSError, ValueError) as e:
+            raise SharedBrowserError(f'{method}: {e}')
+        if 'error' in payload:
+            raise SharedBrowserError(f"{method}: {payload['error'].get('message', 'unknown CDP error')}")
+        return payload.get('result', {})
+
+    try:
+        yield call
+    finally:
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+
+def _alive(browser):
+    if not browser:
+        return False
+    if not port_leases._process_alive(browser.get('pid'), browser.get('started')):
+        return False
+    try:
+        requests.get(f"http://127.0.0.1:{browser['cdp_port']}/json/version", timeout=2)
+    except requests.RequestException:
+        return False
+    return True
+
+
+def _launch(executable):
+    root = settings.PROJECTS_ROOT
+    profile_dir = os.path.join(root, PROFILE_DIRNAME)
+    os.makedirs(profile_dir, exist_ok=True)
+    # A profile inherited from a previous container carries its lock; see
+    # BrowserPreviewService._clear_singleton_locks.
+    for name in ('SingletonLock', 'SingletonSocket', 'SingletonCookie'):
+        try:
+            os.unlink(os.path.join(profile_dir, name))
+        except OSError:
+            pass
+
+    port_leases.release_owner(LEASE_OWNER)
+    cdp_port = port_leases.lease('cdp', owner=LEASE_OWNER)
+    # The flags are the per-project browser's; see _launch_chromium.
+    args = [
+        executable,
+        '--headless',
+        f'--remote-debugging-port={cdp_port}',
+        '--remote-debugging-address=127.0.0.1',
+        f'--user-data-dir={profile_dir}',
+        '--no-first-run',
+        '--no-default-browser-check',
+        '--disable-dev-shm-usage',
+        '--disable-gpu',
+        '--disable-background-networking',
+        '--mute-audio',
+        '--no-sandbox',
+        'about:blank',
+    ]
+    logger.info(f"Launching shared preview browser on CDP port {cdp_port}")
+    with open(os.path.join(root, LOG_FILENAME), 'w') as log_fh:
+        process = subprocess.Popen(args, stdout=log_fh, stderr=subprocess.STDOUT)
+    port_leases.attach(cdp_port, process.pid)
+
+    deadline = time.time() + LAUNCH_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SharedBrowserError('The shared preview browser exited on startup.')
+        try:
+            requests.get(f'http://127.0.0.1:{cdp_port}/json/version', timeout=2)
+            break
+        except requests.RequestException:
+            time.sleep(0.25)
+    else:
+        process.kill()
+        raise SharedBrowserError('The shared preview browser did not expose its DevTools endpoint in time.')
+
+    try:
+        started = psutil.Process(process.pid).create_time()
+    except psutil.Error:
+        started = None
+    return {'pid': process.pid, 'started': started, 'cdp_port': cdp_port}
+
+
+@contextlib.contextmanager
+def _launch_lock():
+    """Serializes launching the browser across the host's processes.
+
+    Held apart from the registry lock: a launch waits up to LAUNCH_TIMEOUT,
+    and other workers' registry reads (has_context on every preview probe,
+    close_context, the reaper) must not wait behind it.
+    """
+    path = os.path.join(settings.PROJECTS_ROOT, LAUNCH_LOCK_FILENAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _ensure_browser(executable):
+    """The registry's live browser, launching one (and forgetting the old
+    browser's contexts, which died with it) when there is none."""
+    with _registry() as data:
+        browser = data['browser']
+    if _alive(browser):
+        return browser
+    with _launch_lock():
+        # Another worker may have launched it while this one waited.
+        with _registry() as data:
+            browser = data['browser']
+        if _alive(browser):
+            return browser
+        if browser and port_leases._process_alive(browser.get('pid'), browser.get('started')):
+            # Running but not answering DevTools: hung, so replace it.
+            try:
+                process = psutil.Process(browser['pid'])
+                for proc in process.children(recursive=True) + [process]:
+                    PreviewService._stop_process(proc)
+            except psutil.Error:
+                pass
+        launched = _launch(executable)
+        with _registry() as data:
+            _forget_contexts(data)
+            data['browser'] = launched
+        return launched
+
+
+def _forget_contexts(data):
+    for context in data['contexts'].values():
+        _remove(context.get('state_file'))
+    data['contexts'] = {}
+
+
+def _remove(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _last_active(context):
+    """When the context's project last used its preview (0 if unknown)."""
+    try:
+        with open(context['state_file'], 'r') as f:
+            return float(json.load(f).get('last_active', 0))
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return 0.0
+
+
+def _rss(pid):
+    """Resident memory of a browser and all of its child processes."""
+    try:
+        process = psutil.Process(pid)
+        total = 0
+        for proc in [process] + process.children(recursive=True):
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except psutil.Error:
+        return 0
+
+
+def _evict_for_new_context(browser, contexts, call):
+    """Close least recently active contexts until one more fits the budget.
+
+    ``contexts`` is a snapshot of the registry's; returns the ids closed,
+    for the caller to drop from the registry.
+    """
+    budget = _memory_budget()
+    if not budget or not contexts:
+        return []
+    rss = _rss(browser['pid'])
+    per_context = rss / len(contexts)
+    now = time.time()
+    candidates = sorted(
+        (
+            (active, context_id)
+            for context_id, context in contexts.items()
+            for active in (_last_active(context),)
+            if now - active >= EVICT_MIN_IDLE
+        ),
+    )
+    evicted = []
+    for _active, context_id in candidates:
+        if rss + per_context <= budget:
+            break
+        _dispose(call, context_id, contexts[context_id])
+        rss -= per_context
+        evicted.append(context_id)
+    if rss + per_context > budget:
+        logger.warning(
+            f"Shared preview browser is over its memory budget ({rss // (1024 * 1024)} MB "
+            f"with {len(contexts)} contexts); none idle enough to evict"
+        )
+    return evicted
+
+
+def _dispose(call, context_id, context):
+    logger.info(f"Closing shared preview browser context of {context.get('owner', '?')}")
+    try:
+        call('Target.disposeBrowserContext', {'browserContextId': context_id})
+    except SharedBrowserError as e:
+        # Already gone; the registry entry was all that was left.
+        logger.info(f"Could not dispose browser context {context_id}: {e}")
+    # Without its state file the project's next request reports the preview
+    # as not running, rather than reaching for a page that no longer exists.
+    _remove(context.get('state_file'))
+
+
+def open_context(owner, url, state_file, executable, viewport=None):
+    """Open ``url`` in a new context of the shared browser, launching it if needed.
+
+    ``state_file`` is the project's session state; it is removed if the
+    context is later evicted. Returns ``{'pid', 'cdp_port', 'context_id',
+    'target_id'}``.
+
+    The registry lock is taken only to read and to record contexts; the
+    launch and the DevTools calls happen outside it.
+    """
+    browser = _ensure_browser(executable)
+    with _registry() as data:
+        snapshot = {context_id: dict(context) for context_id, context in data['contexts'].items()}
+    with _browser_session(browser['cdp_port']) as call:
+        evicted = _evict_for_new_context(browser, snapshot, call)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} idle preview context(s) to stay within the memory budget")
+        context_id = call('Target.createBrowserContext')['browserContextId']
+        params = {'url': url, 'browserContextId': context_id}
+        if viewport:
+            # Headless honours these, so the first paint is at the
+            # preview's size rather than the default window's.
+            params['width'], params['height'] = (int(v) for v in viewport)
+        try:
+            target_id = call('Target.createTarget', params)['targetId']
+        except SharedBrowserError:
+            _dispose(call, context_id, {'owner': owner})
+            raise
+    context = {
+        'owner': str(owner),
+        'target_id': target_id,
+        'state_file': state_file,
+        'opened': time.time(),
+    }
+    with _registry() as data:
+        for evicted_id in evicted:
+            data['contexts'].pop(evicted_id, None)
+        current = data['browser'] or {}
+        if (current.get('pid'), current.get('started')) != (browser['pid'], browser['started']):
+            # Replaced while the context was being opened: it died with the
+            # old browser.
+            raise SharedBrowserError('The shared preview browser restarted; try again.')
+        data['contexts'][context_id] = context
+    return {
+        'pid': browser['pid'],
+        'cdp_port': browser['cdp_port'],
+        'context_id': context_id,
+        'target_id': target_id,
+    }
+
+
+def close_context(context_id):
+    """Close a context (and its page). Never stops the shared browser."""
+    with _registry() as data:
+        context = data['contexts'].get(context_id)
+        browser = data['browser']
+    if context is not None and _alive(browser):
+        try:
+            with _browser_session(browser['cdp_port']) as call:
+                _dispose(call, context_id, context)
+        except SharedBrowserError as e:
+            logger.info(f"Could not reach the shared browser to close a context: {e}")
+    with _registry() as data:
+        data['contexts'].pop(context_id, None)
+
+
+def has_context(context_id):
+    """Whether ``context_id`` is an open context of the live shared browser."""
+    with _registry() as data:
+        known = context_id in data['contexts']
+        browser = data['browser']
+    return known and _alive(browser)
+
+
+def contexts():
+    """Snapshot of the open contexts: {context_id: context}."""
+    with _registry() as data:
+        return {context_id: dict(context) for context_id, context in data['contexts'].items()}
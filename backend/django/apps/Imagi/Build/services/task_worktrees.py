@@ -0,0 +1,312 @@
+"""
+Cheap materialization of task worktrees.
+
+``git worktree add`` checks out the whole project (frontend, backend and
+scaffold) for every dispatched task, and it used to do so under the
+canonical repo lock. The initial build dispatches one task per page and
+best-of-N several at once, so each dispatch waited behind the previous
+one's full checkout.
+
+VersionControlService.create_task_worktree now holds the lock only for
+``git worktree add --no-checkout`` (the branch and the worktree's
+bookkeeping), and fills the worktree in afterwards, outside the lock:
+
+    stats = task_worktrees.materialize(project_path, worktree_path)
+
+Two ways to fill it in, picked per filesystem:
+
+- ``reflink``: where the filesystem supports ``FICLONE`` (btrfs, XFS with
+  reflink, ...), each tracked file is cloned from the canonical tree. A
+  clone shares its data blocks with the original until either is written,
+  so a task costs inodes rather than a copy of the project. The clones are
+  then checked against the task's commit (``git update-index --refresh``),
+  and any file the canonical tree had edited since is checked out from the
+  object database instead.
+- ``checkout``: anywhere else, the files are written from the object
+  database, as ``git worktree add`` did.
+
+Hardlinks are not used: agents and the file services rewrite files in
+place, which would write through a hardlink into the canonical tree. An
+overlay mount would need privileges the workers do not have.
+
+Either way the worktree's ``node_modules`` is a symlink to the shared
+dependency store (see frontend_dependencies), like the canonical tree's,
+instead of being missing until a preview installs it.
+
+Filling in is not atomic, so create_task_worktree holds ``worktree_lock``
+(an flock on a ``<worktree>.lock`` file beside it) from its reuse check
+through materialize: a second dispatch of the same task waits for the
+first and then finds the worktree complete. A worktree counts as complete
+only once materialize has removed the MATERIALIZING_MARKER it leaves in
+the worktree's git dir while it works. The index alone is no proof, since
+the reflink path writes it before checking out the files that differ.
+"""
+
+import contextlib
+import errno
+import fcntl
+import glob
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# FICLONE from <linux/fs.h>: clone a whole file's extents into another.
+FICLONE = 0x40049409
+
+# Where a project's frontend dependencies live, relative to the project.
+FRONTEND_NODE_MODULES = os.path.join('frontend', 'vuejs', 'node_modules')
+
+# Directory name suffix of a task worktree; see task_worktree_path.
+_WORKTREE_RE = re.compile(r'--wt-(\d+)$')
+
+# Suffix of the lock file beside each worktree (see worktree_lock).
+LOCK_SUFFIX = '.lock'
+# In the worktree's git dir from the start of materialize until it is done.
+MATERIALIZING_MARKER = 'imagi-materializing'
+
+# Errors that mean "this filesystem cannot clone", not "this file failed".
+_NO_REFLINK_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+_lock = threading.Lock()
+_reflink_devices = {}  # (src st_dev, dst st_dev) -> whether FICLONE works
+
+
+def _reflink_enabled():
+    return bool(getattr(settings, 'TASK_WORKTREE_REFLINK', True))
+
+
+def _git(cwd, *args, input=None, check=True):
+    return subprocess.run(
+        ['git', *args], cwd=cwd, input=input, capture_output=True, check=check
+    )
+
+
+def _clone_file(src, dst, mode):
+    """Reflink ``src`` to a new file ``dst``; raises OSError if it cannot."""
+    with open(src, 'rb') as src_fh:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        try:
+            fcntl.ioctl(fd, FICLONE, src_fh.fileno())
+        finally:
+            os.close(fd)
+
+
+def _tracked_files(worktree_path):
+    """(path, executable) for each regular file in the worktree's HEAD."""
+    out = _git(worktree_path, 'ls-tree', '-r', '-z', '--full-tree', 'HEAD').stdout
+    files = []
+    for entry in out.split(b'\0'):
+        if not entry:
+            continue
+        meta, path = entry.split(b'\t', 1)
+        mode = meta.split(b' ', 1)[0]
+        # Symlinks (120000) and submodules (160000) are left to git.
+        if mode in (b'100644', b'100755'):
+            files.append((os.fsdecode(path), mode == b'100755'))
+    return files
+
+
+def _clone_tree(project_path, worktree_path, files):
+    """Reflink each file from the canonical tree; returns the paths cloned,
+    or None when the filesystem cannot clone at all."""
+    key = (os.stat(project_path).st_dev, os.stat(os.path.dirname(worktree_path)).st_dev)
+    with _lock:
+        if _reflink_devices.get(key) is False:
+            return None
+    cloned = set()
+    made_dirs = set()
+    for path, executable in files:
+        src = os.path.join(project_path, path)
+        if not os.path.isfile(src) or os.path.islink(src):
+            continue  # gone or replaced in the canonical tree: checked out below
+        dst = os.path.join(worktree_path, path)
+        parent = os.path.dirname(dst)
+        if parent not in made_dirs:
+            os.makedirs(parent, exist_ok=True)
+            made_dirs.add(parent)
+        try:
+            _clone_file(src, dst, 0o777 if executable else 0o666)
+        except OSError as e:
+            if e.errno in _NO_REFLINK_ERRNOS and not cloned:
+                try:
+                    os.remove(dst)
+                except OSError:
+                    pass
+                with _lock:
+                    _reflink_devices[key] = False
+                return None
+            continue  # this one file is checked out below
+        cloned.add(path)
+    with _lock:
+        _reflink_devices[key] = True
+    return cloned
+
+
+def _checkout_mismatches(worktree_path):
+    """Check out every file that differs from the index; returns (paths, bytes)."""
+    # Stat info of the fresh index is empty, so --refresh hashes each clone
+    # and records the ones that match; -q keeps it going past the rest.
+    _git(worktree_path, 'update-index', '-q', '--refresh', check=False)
+    out = _git(worktree_path, 'diff-files', '--name-only', '-z').stdout
+    paths = [path for path in out.split(b'\0') if path]
+    if not paths:
+        return set(), 0
+    _git(worktree_path, 'checkout-index', '-f', '-u', '-z', '--stdin', input=b'\0'.join(paths) + b'\0')
+    paths = {os.fsdecode(path) for path in paths}
+    return paths, sum(_size(os.path.join(worktree_path, path)) for path in paths)
+
+
+def _size(path):
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+
+@contextlib.contextmanager
+def worktree_lock(worktree_path):
+    """Serialize creating and filling in one task worktree across processes.
+
+    The lock file sits beside the worktree, not in it, so it can be taken
+    before the worktree exists and is never part of the task's tree.
+    """
+    with open(worktree_path + LOCK_SUFFIX, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _gitdir(worktree_path):
+    """The worktree's own git dir (under the canonical .git), or None."""
+    try:
+        with open(os.path.join(worktree_path, '.git'), 'r') as f:
+            gitdir = f.read().strip().split('gitdir:', 1)[1].strip()
+    except (OSError, IndexError):
+        return None
+    return os.path.join(worktree_path, gitdir)
+
+
+def needs_materialize(worktree_path):
+    """Whether a worktree was added but not completely filled in, e.g.
+    because the process creating it died halfway."""
+    gitdir = _gitdir(worktree_path)
+    if gitdir is None:
+        return False
+    return (
+        not os.path.exists(os.path.join(gitdir, 'index'))
+        or os.path.exists(os.path.join(gitdir, MATERIALIZING_MARKER))
+    )
+
+
+def materialize(project_path, worktree_path):
+    """Fill in a worktree added with ``--no-checkout``.
+
+    Returns stats for the caller to report: ``{'mode': 'reflink' |
+    'checkout', 'files', 'cloned', 'written_bytes', 'materialize_ms'}``.
+    ``written_bytes`` is the file data actually written; cloned files
+    share the canonical tree's blocks and are not counted.
+    """
+    started = time.monotonic()
+    gitdir = _gitdir(worktree_path)
+    marker = os.path.join(gitdir, MATERIALIZING_MARKER) if gitdir else None
+    if marker:
+        open(marker, 'w').close()
+    files = _tracked_files(worktree_path)
+    cloned = None
+    if _reflink_enabled():
+        cloned = _clone_tree(project_path, worktree_path, files)
+
+    if cloned is None:
+        mode = 'checkout'
+        _git(worktree_path, 'reset', '--hard', '--quiet')
+        written = sum(_size(os.path.join(worktree_path, path)) for path, _x in files)
+    else:
+        mode = 'reflink'
+        _git(worktree_path, 'read-tree', 'HEAD')
+        fixed, written = _checkout_mismatches(worktree_path)
+        cloned -= fixed
+
+    link_node_modules(project_path, worktree_path)
+    if marker:
+        os.remove(marker)  # last: only now is the worktree complete
+    return {
+        'mode': mode,
+        'files': len(files),
+        'cloned': len(cloned or ()),
+        'written_bytes': written,
+        'materialize_ms': round((time.monotonic() - started) * 1000),
+    }
+
+
+def link_node_modules(project_path, worktree_path):
+    """Point the worktree's node_modules where the canonical tree's points.
+
+    Only a canonical symlink into the shared store is mirrored; a real
+    per-project install is not shared with tasks. The link is added to the
+    repo's exclude file so a task never commits it.
+    """
+    canonical = os.path.join(project_path, FRONTEND_NODE_MODULES)
+    link = os.path.join(worktree_path, FRONTEND_NODE_MODULES)
+    if not os.path.islink(canonical) or os.path.lexists(link):
+        return False
+    if not os.path.isdir(os.path.dirname(link)):
+        return False
+    try:
+        os.symlink(os.readlink(canonical), link)
+    except OSError as e:
+        logger.warning(f"Could not link {link}: {e}")
+        return False
+    _exclude(worktree_path, '/' + FRONTEND_NODE_MODULES.replace(os.sep, '/'))
+    return True
+
+
+def _exclude(worktree_path, pattern):
+    common = _git(worktree_path, 'rev-parse', '--git-common-dir', check=False).stdout.decode().strip()
+    if not common:
+        return
+    exclude = os.path.join(worktree_path, common, 'info', 'exclude')
+    try:
+        with open(exclude, 'r') as f:
+            if pattern in f.read().splitlines():
+                return
+    except OSError:
+        os.makedirs(os.path.dirname(exclude), exist_ok=True)
+    with open(exclude, 'a') as f:
+        f.write(f'{pattern}\n')
+
+
+def disk_usage(path):
+    """Bytes allocated under ``path``, not following symlinks.
+
+    An upper bound for reflinked worktrees: blocks still shared with the
+    canonical tree are counted as if they were the worktree's own.
+    """
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def find_worktrees(root=None):
+    """Every task worktree directory under PROJECTS_ROOT.
+
+    Yields ``(worktree_path, project_path, conversation_id)``.
+    """
+    root = root or settings.PROJECTS_ROOT
+    for path in sorted(glob.glob(os.path.join(glob.escape(root), '*', '*--wt-*'))):
+        match = _WORKTREE_RE.search(path)
+        if match and os.path.isdir(path):
+            yield path, path[:match.start()], int(match.group(1))
@@ -31,6 +31,7 @@ from apps.Imagi.Build.services.create_file_service import CreateFileService
 from apps.Imagi.Build.services.delete_file_service import DeleteFileService
 from apps.Imagi.Build.services.directory_service import DirectoryService
 from apps.Imagi.Build.services.safe_paths import resolve_within
+from apps.Imagi.Build.services import file_index, search_index
 
 logger = logging.getLogger(__name__)
 
@@ -223,6 +224,14 @@ def _sync_db_mirror(project, file_path: str, should_exist: bool) -> None:
         return
 
     try:
+        if project_files_service.mirror_batched(project):
+            # The run's batch re-reads disk when it flushes, so queueing the
+            # path is the whole repair — no per-call SELECT against the mirror.
+            if should_exist:
+                project_files_service.record_file(project, file_path)
+            else:
+                project_files_service.remove_file(project, file_path)
+            return
         exists = project_files_service.get_db_content(project, file_path) is not None
         if should_exist and not exists:
             project_files_service.record_file(project, file_path)
@@ -268,6 +277,49 @@ def _iter_project_files(project_path: str):
             yield abs_path, os.path.relpath(abs_path, project_path)
 
 
+def _read_search_text(abs_path: str):
+    """Text of a file for grep, or None when it is too large or not UTF-8."""
+    try:
+        if os.path.getsize(abs_path) > GREP_MAX_FILE_BYTES:
+            return None
+        with open(abs_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _iter_searchable_files(project_root: str, search_root: str, plan=None):
+    """Yield (rel_to_project, load_text) for every file grep should consider.
+
+    Served from the project's file index, so repeated searches in one run
+    read each file from disk at most once, and — given a query ``plan`` —
+    narrowed by its literal index to the files that can match at all.
+    ``load_text`` is a callable so files the include filter rejects are
+    never read. A search rooted inside a directory the index skips (an
+    explicit 'node_modules/...' path) walks the disk directly, as it always
+    has.
+    """
+    rel_root = os.path.relpath(search_root, project_root)
+    rel_root = '' if rel_root == '.' else rel_root
+    if rel_root and any(p in SKIP_DIRS or p.startswith('.') for p in rel_root.split(os.sep)):
+        for abs_path, _ in _iter_project_files(search_root):
+            yield (
+                os.path.relpath(abs_path, project_root),
+                lambda abs_path=abs_path: _read_search_text(abs_path),
+            )
+        return
+
+    index = file_index.get_index(project_root)
+    paths = index.files(under=rel_root)
+    if plan is not None:
+        paths = index.narrow(paths, plan)
+    for rel_path in paths:
+        stat = index.stat(rel_path)
+        if stat is None or stat[0] > GREP_MAX_FILE_BYTES:
+            continue
+        yield rel_path, lambda rel_path=rel_path: index.read_text(rel_path)
+
+
 # ---------------------------------------------------------------------------
 # Implementation functions (plain, unit-testable)
 # ---------------------------------------------------------------------------
@@ -360,6 +412,7 @@ def edit_file_impl(
 
     with open(full_path, 'w', encoding='utf-8') as f:
         f.write(new_content)
+    file_index.note_file_written(project.project_path, file_path, new_content)
 
     # Write through to the database copy of the project
     from apps.Imagi.Build.services import project_files_service
@@ -390,17 +443,18 @@ def grep_impl(
     truncated = False
     deadline = time.monotonic() + GREP_TIME_BUDGET_SECONDS
 
-    for abs_path, _ in _iter_project_files(search_root):
-        rel_to_project = os.path.relpath(abs_path, project_root)
-        if include and not fnmatch.fnmatch(os.path.basename(abs_path), include) \
+    # The literals any match must contain: lets the file index skip files
+    # that cannot match before a single regex runs (None = scan everything).
+    plan = search_index.plan_query(pattern)
+
+    for rel_to_project, load_text in _iter_searchable_files(project_root, search_root, plan):
+        if include and not fnmatch.fnmatch(os.path.basename(rel_to_project), include) \
                 and not fnmatch.fnmatch(rel_to_project, include):
             continue
-        try:
-            if os.path.getsize(abs_path) > GREP_MAX_FILE_BYTES:
-                continue
-            with open(abs_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-        except (OSError, UnicodeDecodeError):
+        text = load_text()
+        if text is None:
+            continue
+        if plan is not None and not search_index.text_may_match(text, plan):
             continue
 
         files_scanned += 1
@@ -441,9 +495,9 @@ def glob_impl(project, pattern: str, max_results: int = GLOB_MAX_RESULTS) -> dic
 
     results = []
     truncated = False
-    for abs_path, rel_path in _iter_project_files(project_root):
+    for rel_path in file_index.get_index(project_root).files():
         rel_posix = rel_path.replace(os.sep, '/')
-        if regex.match(rel_posix) or fnmatch.fnmatch(os.path.basename(abs_path), pattern):
+        if regex.match(rel_posix) or fnmatch.fnmatch(os.path.basename(rel_path), pattern):
             results.append(rel_posix)
             if len(results) >= max_results:
                 truncated = True
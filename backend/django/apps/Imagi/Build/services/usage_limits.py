@@ -22,6 +22,7 @@ def record_usage(
     output_tokens,
     cost_usd=None,
     conversation_id=None,
+    cached_input_tokens=0,
 ):
     """Record a run's usage and metered cost — see usage_service.record_usage.
 
@@ -37,4 +38,5 @@ def record_usage(
         output_tokens,
         cost_usd=cost_usd,
         conversation_id=conversation_id,
+        cached_input_tokens=cached_input_tokens,
     )
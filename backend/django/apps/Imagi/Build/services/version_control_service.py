@@ -9,14 +9,16 @@ This service handles git operations for project versioning, including:
 
 import contextlib
 import fcntl
+import functools
 import logging
 import os
 import shutil
 import subprocess
-import datetime
 import time
+import datetime
 from django.shortcuts import get_object_or_404
 from apps.Imagi.ProjectManager.models import Project as PMProject
+from . import commit_history, file_index, git_backend, task_worktrees
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +67,24 @@ def task_base_ref(conversation_id: int) -> str:
     return f"refs/imagi/task-base/{conversation_id}"
 
 
+# Times merge_task_worktree recomputes an in-memory merge because canonical
+# HEAD moved under it, before merging in the working tree instead.
+MERGE_ATTEMPTS = 3
+
+
+@functools.lru_cache(maxsize=1)
+def _merge_tree_supported():
+    """Whether this git has `merge-tree --write-tree` (git 2.38+)."""
+    try:
+        version = subprocess.run(
+            ['git', 'version'], capture_output=True, text=True, check=True
+        ).stdout
+        major, minor = (int(part) for part in version.split()[2].split('.')[:2])
+    except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+        return False
+    return (major, minor) >= (2, 38)
+
+
 @contextlib.contextmanager
 def canonical_repo_lock(project_path):
     """Serialize canonical-repo git mutations for one project.
@@ -111,67 +131,6 @@ class VersionControlService:
     def __init__(self, project=None):
         self.project = project
         
-    def _wait_for_file_system_sync(self, project_path, file_path=None, max_wait=5):
-        """
-        Wait for file system operations to complete and ensure files are visible to git.
-        
-        Args:
-            project_path (str): Path to the project directory
-            file_path (str): Specific file path to check (optional)
-            max_wait (int): Maximum time to wait in seconds
-        """
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            try:
-                # Force file system sync on Unix systems
-                if hasattr(os, 'sync'):
-                    os.sync()
-                
-                # If a specific file was mentioned, verify it exists
-                if file_path and file_path != '/':
-                    # Remove leading slash and check if file exists
-                    clean_path = file_path.lstrip('/')
-                    full_path = os.path.join(project_path, clean_path)
-                    
-                    if os.path.exists(full_path):
-                        # File exists, check if git can see any changes
-                        status_result = subprocess.run(
-                            ['git', 'status', '--porcelain'],
-                            cwd=project_path,
-                            capture_output=True,
-                            text=True
-                        )
-                        
-                        if status_result.returncode == 0 and status_result.stdout.strip():
-                            # Git can see changes, we're good to go
-                            return True
-                
-                # For general sync or when no specific file is provided
-                # Just ensure git status command works and wait a bit
-                status_result = subprocess.run(
-                    ['git', 'status', '--porcelain'],
-                    cwd=project_path,
-                    capture_output=True,
-                    text=True
-                )
-                
-                if status_result.returncode == 0:
-                    # If there are changes or if we're not checking a specific file, we're good
-                    if not file_path or file_path == '/' or status_result.stdout.strip():
-                        time.sleep(0.1)  # Small additional buffer
-                        return True
-                
-                # Wait a bit before checking again
-                time.sleep(0.2)
-                
-            except Exception:
-                # If anything fails, just wait a bit more
-                time.sleep(0.2)
-        
-        # Return True after max wait time to avoid blocking forever
-        return True
-        
     def initialize_repo(self, project_path):
         """
         Initialize a git repository for the project if it doesn't exist.
@@ -223,16 +182,12 @@ class VersionControlService:
                 with open(gitignore_path, 'w') as f:
                     f.write("__pycache__/\n*.py[cod]\n*$py.class\n*.so\n.env\ndb.sqlite3\n")
             
-            # Wait for file system to sync before initial commit
-            self._wait_for_file_system_sync(project_path)
-            
             # Add all files and create initial commit
-            subprocess.run(['git', 'add', '.'], cwd=project_path, capture_output=True, text=True, check=True)
-            subprocess.run(['git', 'commit', '-m', 'Initial commit'], cwd=project_path, capture_output=True, text=True, check=True)
-            
+            git_backend.get_backend().commit_all(project_path, 'Initial commit')
+
             return True
-            
-        except subprocess.CalledProcessError:
+
+        except (subprocess.CalledProcessError, git_backend.GitBackendError):
             return False
         except Exception:
             return False
@@ -240,12 +195,17 @@ class VersionControlService:
     def commit_changes(self, project_path, message=None, file_path=None):
         """
         Commit all current changes to the git repository.
-        
+
+        Status, staging and the commit run through the configured git backend
+        (in-process libgit2 when available, see git_backend). Files written
+        by any process are already visible to git when their write returns,
+        so there is nothing to wait for first.
+
         Args:
             project_path (str): Path to the project directory
             message (str): Commit message, defaults to timestamped message
-            file_path (str): Specific file that was changed (for sync verification)
-            
+            file_path (str): Specific file that was changed (informational)
+
         Returns:
             dict: Result of the operation containing success status and commit hash
         """
@@ -255,52 +215,35 @@ class VersionControlService:
             if not os.path.exists(git_dir):
                 if not self.initialize_repo(project_path):
                     return {'success': False, 'message': 'Failed to initialize git repository'}
-            
-            # Wait for file system operations to complete
-            self._wait_for_file_system_sync(project_path, file_path)
-            
-            # Check if there are any changes to commit
-            status = subprocess.run(
-                ['git', 'status', '--porcelain'],
-                cwd=project_path,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            
-            if not status.stdout.strip():
-                return {'success': True, 'message': 'No changes to commit', 'commit_hash': None}
-            
-            # Stage all changes and commit
-            subprocess.run(['git', 'add', '.'], cwd=project_path, capture_output=True, text=True, check=True)
-            
+
             # Create commit message if not provided
             if not message:
                 message = f"Changes made at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            
-            subprocess.run(['git', 'commit', '-m', message], cwd=project_path, capture_output=True, text=True, check=True)
-            
-            # Get the commit hash
-            hash_result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=project_path, capture_output=True, text=True, check=True)
-            commit_hash = hash_result.stdout.strip()
-            
+
+            commit_hash = git_backend.get_backend().commit_all(project_path, message)
+            if not commit_hash:
+                return {'success': True, 'message': 'No changes to commit', 'commit_hash': None}
+
             return {'success': True, 'message': 'Successfully committed changes', 'commit_hash': commit_hash}
-            
-        except subprocess.CalledProcessError as e:
-            return {'success': False, 'message': f"Error committing changes: {e.stderr}"}
+
+        except git_backend.GitBackendError as e:
+            return {'success': False, 'message': f"Error committing changes: {e}"}
         except Exception as e:
             return {'success': False, 'message': f"Error committing changes: {str(e)}"}
-    
-    def get_commit_history(self, user, project_id):
+
+    def get_commit_history(self, user, project_id, before=None, limit=None):
         """
-        Get the commit history for a project.
+        Get one page of the commit history for a project, newest first.
         
         Args:
             user: The user making the request
             project_id (int): The ID of the project
+            before (str, optional): Cursor; list the commits after this hash
+            limit (int, optional): Page size (commit_history.DEFAULT_PAGE_SIZE)
             
         Returns:
-            dict: Result of the operation containing success status and commit history
+            dict: Result of the operation containing success status, the
+            page of commits and ``next_cursor`` (None on the last page)
         """
         try:
             project = get_object_or_404(PMProject, id=project_id, user=user)
@@ -313,39 +256,17 @@ class VersionControlService:
             if not os.path.exists(git_dir):
                 if not self.initialize_repo(project.project_path):
                     return {'success': False, 'message': 'Failed to initialize git repository'}
-                return {'success': True, 'commits': []}
+                return {'success': True, 'commits': [], 'next_cursor': None}
             
-            # Get commit history
-            result = subprocess.run(
-                ['git', 'log', '--pretty=format:%H|%s|%an|%ad|%ar', '--date=iso'],
-                cwd=project.project_path,
-                capture_output=True,
-                text=True
+            commits, next_cursor = commit_history.page(
+                project.project_path,
+                before=before,
+                limit=limit or commit_history.DEFAULT_PAGE_SIZE,
             )
+            return {'success': True, 'commits': commits, 'next_cursor': next_cursor}
             
-            if result.returncode != 0:
-                if "fatal: your current branch 'master' does not have any commits yet" in result.stderr:
-                    return {'success': True, 'commits': []}
-                return {'success': False, 'message': f"Error getting commit history: {result.stderr}"}
-            
-            # Parse commit history
-            commits = []
-            for line in result.stdout.strip().split('\n'):
-                if not line:
-                    continue
-                
-                parts = line.split('|')
-                if len(parts) >= 5:
-                    commits.append({
-                        'hash': parts[0],
-                        'message': parts[1],
-                        'author': parts[2],
-                        'date': parts[3],
-                        'relative_date': parts[4]
-                    })
-            
-            return {'success': True, 'commits': commits}
-            
+        except commit_history.UnknownCursor as e:
+            return {'success': False, 'message': f"Unknown history cursor: {e}"}
         except Exception as e:
             return {'success': False, 'message': f"Error getting commit history: {str(e)}"}
     
@@ -391,6 +312,7 @@ class VersionControlService:
 
             if reset_result.returncode != 0:
                 return {'success': False, 'message': f"Error resetting to commit {commit_hash}: {reset_result.stderr}"}
+            file_index.invalidate(target_path)
 
             # The reset rewrote the working copy wholesale — bring the
             # database copy of the project files back in sync with disk.
@@ -432,30 +354,21 @@ class VersionControlService:
                 return commit_result
 
             # Nothing to commit — the checkpoint is the current HEAD.
-            hash_result = subprocess.run(
-                ['git', 'rev-parse', 'HEAD'],
-                cwd=project_path,
-                capture_output=True,
-                text=True
-            )
-            if hash_result.returncode != 0:
+            backend = git_backend.get_backend()
+            commit_hash = backend.head(project_path)
+            if not commit_hash:
                 # A repo with no commits yet (fresh init): create an empty
                 # baseline commit so there is something to restore to.
-                subprocess.run(
-                    ['git', 'commit', '--allow-empty', '-m', 'Initial checkpoint'],
-                    cwd=project_path, capture_output=True, text=True, check=True
-                )
-                hash_result = subprocess.run(
-                    ['git', 'rev-parse', 'HEAD'],
-                    cwd=project_path, capture_output=True, text=True, check=True
+                commit_hash = backend.commit_all(
+                    project_path, 'Initial checkpoint', allow_empty=True
                 )
             return {
                 'success': True,
-                'commit_hash': hash_result.stdout.strip(),
+                'commit_hash': commit_hash,
                 'message': 'Checkpoint at current HEAD'
             }
-        except subprocess.CalledProcessError as e:
-            return {'success': False, 'commit_hash': None, 'message': f"Error creating checkpoint: {e.stderr}"}
+        except git_backend.GitBackendError as e:
+            return {'success': False, 'commit_hash': None, 'message': f"Error creating checkpoint: {e}"}
         except Exception as e:
             return {'success': False, 'commit_hash': None, 'message': f"Error creating checkpoint: {str(e)}"}
 
@@ -504,6 +417,12 @@ class VersionControlService:
         branch task/<id> forked from the canonical HEAD, so parallel tasks
         each edit their own tree and merge back explicitly on accept.
 
+        Only the branch and the worktree's bookkeeping are created under the
+        canonical lock (`git worktree add --no-checkout`); the files are
+        filled in afterwards by task_worktrees.materialize, reflinked from
+        the canonical tree where the filesystem allows, so parallel
+        dispatches no longer queue behind each other's checkouts.
+
         Args:
             snapshot_pending: When True (the default), pending canonical
                 changes are committed first so the task forks from what is
@@ -513,80 +432,68 @@ class VersionControlService:
                 so the task forks from the last committed HEAD instead.
 
         Returns:
-            dict: {'success': bool, 'worktree_path': str | None, 'message': str}
+            dict: {'success': bool, 'worktree_path': str | None, 'message': str,
+            'stats': dict} — stats (on creation only) has the materialize
+            stats plus 'lock_ms' and 'create_ms'.
         """
+        started = time.monotonic()
         try:
             worktree_path = task_worktree_path(project_path, conversation_id)
             branch = task_branch(conversation_id)
 
-            if os.path.isdir(worktree_path):
-                return {
-                    'success': True,
-                    'worktree_path': worktree_path,
-                    'message': 'Task worktree already exists',
-                }
+            # Held from the reuse check until the files are in, so a second
+            # dispatch of this task waits and then reuses the finished tree
+            # instead of filling it in alongside the first.
+            with task_worktrees.worktree_lock(worktree_path):
+                if os.path.isdir(worktree_path) and not task_worktrees.needs_materialize(worktree_path):
+                    return {
+                        'success': True,
+                        'worktree_path': worktree_path,
+                        'message': 'Task worktree already exists',
+                    }
 
-            # Serialized per project: parallel dispatches (the best-of-N
-            # form fires several without awaiting) would otherwise race on
-            # .git/index.lock.
-            with canonical_repo_lock(project_path):
-                # The branch forks from HEAD, so make sure one exists.
-                head_exists = subprocess.run(
-                    ['git', 'rev-parse', '--verify', '--quiet', 'HEAD'],
-                    cwd=project_path, capture_output=True, text=True
-                ).returncode == 0
-                if snapshot_pending or not head_exists:
-                    checkpoint = self.ensure_checkpoint(
-                        project_path, f'Checkpoint before task {conversation_id}'
+                # Serialized per project: parallel dispatches (the best-of-N
+                # form fires several without awaiting) would otherwise race on
+                # .git/index.lock.
+                with canonical_repo_lock(project_path):
+                    locked = time.monotonic()
+                    failure = self._add_task_worktree(
+                        project_path, conversation_id, branch, worktree_path, snapshot_pending
                     )
-                    if not checkpoint.get('success'):
-                        return {
-                            'success': False,
-                            'worktree_path': None,
-                            'message': checkpoint.get('message', 'Could not checkpoint the project'),
-                        }
-
-                # Drop stale bookkeeping from a worktree directory that was
-                # deleted without `git worktree remove`.
-                subprocess.run(
-                    ['git', 'worktree', 'prune'],
-                    cwd=project_path, capture_output=True, text=True
-                )
+                    lock_ms = round((time.monotonic() - locked) * 1000)
+                if failure:
+                    return failure
 
-                branch_exists = subprocess.run(
-                    ['git', 'rev-parse', '--verify', f'refs/heads/{branch}'],
-                    cwd=project_path, capture_output=True, text=True
-                ).returncode == 0
-                if branch_exists:
-                    cmd = ['git', 'worktree', 'add', worktree_path, branch]
-                else:
-                    cmd = ['git', 'worktree', 'add', '-b', branch, worktree_path]
-
-                result = subprocess.run(
-                    cmd, cwd=project_path, capture_output=True, text=True
-                )
-                if result.returncode != 0:
+                try:
+                    stats = task_worktrees.materialize(project_path, worktree_path)
+                except (OSError, subprocess.CalledProcessError) as e:
+                    # Half-filled: drop it, so the next dispatch starts over
+                    # rather than reusing a tree with files missing.
+                    with canonical_repo_lock(project_path):
+                        subprocess.run(
+                            ['git', 'worktree', 'remove', '--force', worktree_path],
+                            cwd=project_path, capture_output=True, text=True
+                        )
+                    shutil.rmtree(worktree_path, ignore_errors=True)
+                    detail = e.stderr.decode(errors='replace') if getattr(e, 'stderr', None) else str(e)
                     return {
                         'success': False,
                         'worktree_path': None,
-                        'message': f"Error creating task worktree: {result.stderr}",
+                        'message': f"Error creating task worktree: {detail}",
                     }
-
-                # Record the fork point for a freshly-created branch, so an
-                # accept can detect a canonical restore to before it. A
-                # pre-existing branch keeps its original base ref (or none,
-                # for branches created before the ref existed).
-                if not branch_exists:
-                    subprocess.run(
-                        ['git', 'update-ref', task_base_ref(conversation_id), 'HEAD'],
-                        cwd=project_path, capture_output=True, text=True
-                    )
-
-            return {
-                'success': True,
-                'worktree_path': worktree_path,
-                'message': 'Task worktree created',
-            }
+                stats['lock_ms'] = lock_ms
+                stats['create_ms'] = round((time.monotonic() - started) * 1000)
+                logger.info(
+                    f"Task worktree {conversation_id} ready in {stats['create_ms']} ms "
+                    f"({stats['mode']}: {stats['cloned']}/{stats['files']} files cloned, "
+                    f"{stats['written_bytes']} bytes written, canonical lock held {lock_ms} ms)"
+                )
+                return {
+                    'success': True,
+                    'worktree_path': worktree_path,
+                    'message': 'Task worktree created',
+                    'stats': stats,
+                }
         except Exception as e:
             return {
                 'success': False,
@@ -594,6 +501,67 @@ class VersionControlService:
                 'message': f"Error creating task worktree: {str(e)}",
             }
 
+    def _add_task_worktree(self, project_path, conversation_id, branch, worktree_path, snapshot_pending):
+        """The locked part of create_task_worktree: checkpoint, then add the
+        worktree without checking it out. Returns a failure dict, or None."""
+        if os.path.isdir(worktree_path):
+            # Added but never filled in (its creator died halfway): the
+            # bookkeeping and branch are there, so start the files over.
+            return None
+
+        # The branch forks from HEAD, so make sure one exists.
+        head_exists = subprocess.run(
+            ['git', 'rev-parse', '--verify', '--quiet', 'HEAD'],
+            cwd=project_path, capture_output=True, text=True
+        ).returncode == 0
+        if snapshot_pending or not head_exists:
+            checkpoint = self.ensure_checkpoint(
+                project_path, f'Checkpoint before task {conversation_id}'
+            )
+            if not checkpoint.get('success'):
+                return {
+                    'success': False,
+                    'worktree_path': None,
+                    'message': checkpoint.get('message', 'Could not checkpoint the project'),
+                }
+
+        # Drop stale bookkeeping from a worktree directory that was
+        # deleted without `git worktree remove`.
+        subprocess.run(
+            ['git', 'worktree', 'prune'],
+            cwd=project_path, capture_output=True, text=True
+        )
+
+        branch_exists = subprocess.run(
+            ['git', 'rev-parse', '--verify', f'refs/heads/{branch}'],
+            cwd=project_path, capture_output=True, text=True
+        ).returncode == 0
+        if branch_exists:
+            cmd = ['git', 'worktree', 'add', '--no-checkout', worktree_path, branch]
+        else:
+            cmd = ['git', 'worktree', 'add', '--no-checkout', '-b', branch, worktree_path]
+
+        result = subprocess.run(
+            cmd, cwd=project_path, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return {
+                'success': False,
+                'worktree_path': None,
+                'message': f"Error creating task worktree: {result.stderr}",
+            }
+
+        # Record the fork point for a freshly-created branch, so an
+        # accept can detect a canonical restore to before it. A
+        # pre-existing branch keeps its original base ref (or none,
+        # for branches created before the ref existed).
+        if not branch_exists:
+            subprocess.run(
+                ['git', 'update-ref', task_base_ref(conversation_id), 'HEAD'],
+                cwd=project_path, capture_output=True, text=True
+            )
+        return None
+
     def remove_task_worktree(self, project_path, conversation_id):
         """Remove a task conversation's worktree and branch.
 
@@ -626,6 +594,11 @@ class VersionControlService:
                     )
             if os.path.isdir(worktree_path):
                 shutil.rmtree(worktree_path, ignore_errors=True)
+            try:
+                os.remove(worktree_path + task_worktrees.LOCK_SUFFIX)
+            except FileNotFoundError:
+                pass
+            file_index.discard(worktree_path)
             return {'success': True, 'message': 'Task worktree removed'}
         except Exception as e:
             return {'success': False, 'message': f"Error removing task worktree: {str(e)}"}
@@ -635,11 +608,21 @@ class VersionControlService:
 
         Commits pending changes on both sides first (the same auto-commit
         style the workspace uses everywhere), then merges task/<id> into
-        the canonical branch. On conflict the merge is aborted — leaving
-        the canonical tree untouched — and MergeConflict is raised. If the
-        canonical tree was restored to before the task's fork point while
-        the task was pending, StaleForkPoint is raised before anything is
-        touched: merging would silently resurrect the restored-away history.
+        the canonical branch. On conflict MergeConflict is raised and the
+        canonical tree is left untouched. If the canonical tree was restored
+        to before the task's fork point while the task was pending,
+        StaleForkPoint is raised before anything is touched: merging would
+        silently resurrect the restored-away history.
+
+        The merge itself is computed in the object database (`git merge-tree
+        --write-tree`) without holding the canonical lock: the initial build
+        merges one task per page and best-of-N several, and each used to
+        serialize the others behind a full working-tree merge. The lock is
+        taken twice, briefly: to snapshot canonical HEAD, then to move it to
+        the result and check out only the paths that changed. If HEAD moved
+        in between (another merge landed), the merge is recomputed on top.
+        Gits older than 2.38 lack merge-tree's in-memory mode and merge in
+        the working tree under the lock, as before.
 
         Returns:
             dict: {'success': bool, 'message': str, 'commit_hash': str | None}
@@ -661,55 +644,167 @@ class VersionControlService:
                 'message': worktree_commit.get('message', 'Could not commit task changes'),
             }
 
-        with canonical_repo_lock(project_path):
-            # A restore/reset while the task was pending moved canonical HEAD
-            # to before the fork point; merging the branch (whose ancestry
-            # contains the undone commits) would re-apply them wholesale.
-            base = subprocess.run(
-                ['git', 'rev-parse', '--verify', '--quiet', task_base_ref(conversation_id)],
-                cwd=project_path, capture_output=True, text=True
-            )
-            if base.returncode == 0:
-                fork_point = base.stdout.strip()
-                ancestor = subprocess.run(
-                    ['git', 'merge-base', '--is-ancestor', fork_point, 'HEAD'],
-                    cwd=project_path, capture_output=True, text=True
-                )
-                if ancestor.returncode == 1:
-                    raise StaleForkPoint(
-                        'The project was restored to an earlier version after '
-                        'this draft was made, so accepting it would undo that '
-                        'restore.'
-                    )
-
-            # And any pending canonical edits, so the merge target is clean.
-            canonical_commit = self.commit_changes(
-                project_path, f'Checkpoint before merging task {conversation_id}'
-            )
-            if not canonical_commit.get('success'):
+        if _merge_tree_supported():
+            try:
+                for _attempt in range(MERGE_ATTEMPTS):
+                    with canonical_repo_lock(project_path):
+                        ours = self._prepare_merge_target(project_path, conversation_id)
+                        if isinstance(ours, dict):
+                            return ours  # the canonical checkpoint failed
+                    result = self._merge_in_memory(project_path, conversation_id, ours)
+                    with canonical_repo_lock(project_path):
+                        if self._advance_canonical(project_path, ours, result, branch):
+                            file_index.invalidate(project_path)
+                            return {
+                                'success': True,
+                                'message': f'Task {conversation_id} merged',
+                                'commit_hash': result,
+                            }
+                    logger.info(f"Canonical tree moved while merging task {conversation_id}; retrying")
+            except subprocess.CalledProcessError as e:
                 return {
                     'success': False,
-                    'message': canonical_commit.get('message', 'Could not commit canonical changes'),
+                    'message': f"Error merging task {conversation_id}: {(e.stderr or '').strip() or e}",
                 }
 
-            merge = subprocess.run(
-                ['git', 'merge', '--no-edit', branch],
+        with canonical_repo_lock(project_path):
+            ours = self._prepare_merge_target(project_path, conversation_id)
+            if isinstance(ours, dict):
+                return ours
+            return self._merge_in_working_tree(project_path, conversation_id)
+
+    def _prepare_merge_target(self, project_path, conversation_id):
+        """Refuse stale forks and commit pending canonical edits (call under
+        the canonical lock). Returns canonical HEAD, or a failure result."""
+        # A restore/reset while the task was pending moved canonical HEAD
+        # to before the fork point; merging the branch (whose ancestry
+        # contains the undone commits) would re-apply them wholesale.
+        base = subprocess.run(
+            ['git', 'rev-parse', '--verify', '--quiet', task_base_ref(conversation_id)],
+            cwd=project_path, capture_output=True, text=True
+        )
+        if base.returncode == 0:
+            fork_point = base.stdout.strip()
+            ancestor = subprocess.run(
+                ['git', 'merge-base', '--is-ancestor', fork_point, 'HEAD'],
                 cwd=project_path, capture_output=True, text=True
             )
-            if merge.returncode != 0:
-                subprocess.run(
-                    ['git', 'merge', '--abort'],
-                    cwd=project_path, capture_output=True, text=True
-                )
-                detail = (merge.stdout or '').strip() or (merge.stderr or '').strip()
-                raise MergeConflict(
-                    detail or f'Task {conversation_id} conflicts with the current project state'
+            if ancestor.returncode == 1:
+                raise StaleForkPoint(
+                    'The project was restored to an earlier version after '
+                    'this draft was made, so accepting it would undo that '
+                    'restore.'
                 )
 
-            hash_result = subprocess.run(
-                ['git', 'rev-parse', 'HEAD'],
+        # And any pending canonical edits, so the merge target is clean.
+        canonical_commit = self.commit_changes(
+            project_path, f'Checkpoint before merging task {conversation_id}'
+        )
+        if not canonical_commit.get('success'):
+            return {
+                'success': False,
+                'message': canonical_commit.get('message', 'Could not commit canonical changes'),
+            }
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=project_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    def _merge_in_memory(self, project_path, conversation_id, ours):
+        """The commit canonical HEAD should move to, computed without the
+        working tree or the lock: ``ours`` itself when the branch is already
+        merged, the branch head for a fast-forward, else a new merge commit.
+        Raises MergeConflict."""
+        branch = task_branch(conversation_id)
+        theirs = subprocess.run(
+            ['git', 'rev-parse', f'refs/heads/{branch}'],
+            cwd=project_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+        def is_ancestor(commit, of):
+            return subprocess.run(
+                ['git', 'merge-base', '--is-ancestor', commit, of],
                 cwd=project_path, capture_output=True, text=True
+            ).returncode == 0
+
+        if is_ancestor(theirs, ours):
+            return ours
+        if is_ancestor(ours, theirs):
+            return theirs
+
+        merge = subprocess.run(
+            ['git', 'merge-tree', '--write-tree', '--name-only', ours, theirs],
+            cwd=project_path, capture_output=True, text=True
+        )
+        if merge.returncode == 1:
+            # <tree>, the conflicted paths, a blank line, then git's messages.
+            _tree, _sep, rest = merge.stdout.partition('\n')
+            paths, _sep, messages = rest.partition('\n\n')
+            detail = messages.strip() or (
+                f"Conflicting files: {', '.join(paths.split())}" if paths.strip() else ''
+            )
+            raise MergeConflict(
+                detail or f'Task {conversation_id} conflicts with the current project state'
+            )
+        if merge.returncode != 0:
+            raise subprocess.CalledProcessError(
+                merge.returncode, merge.args, merge.stdout, merge.stderr
+            )
+        tree = merge.stdout.split('\n', 1)[0].strip()
+        return subprocess.run(
+            ['git', 'commit-tree', tree, '-p', ours, '-p', theirs, '-m', f"Merge branch '{branch}'"],
+            cwd=project_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    def _advance_canonical(self, project_path, ours, result, branch):
+        """Move canonical HEAD from ``ours`` to ``result``, rewriting only
+        the paths that differ (call under the canonical lock). False when
+        HEAD is no longer ``ours`` or an edit made since is in the way."""
+        head = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=project_path, capture_output=True, text=True
+        ).stdout.strip()
+        if head != ours:
+            return False
+        if result == ours:
+            return True
+        # Two-tree read-tree is checkout's switch: only paths that differ
+        # between the trees are written, and it refuses (changing nothing)
+        # if one of them has an edit made since the snapshot.
+        checkout = subprocess.run(
+            ['git', 'read-tree', '-m', '-u', ours, result],
+            cwd=project_path, capture_output=True, text=True
+        )
+        if checkout.returncode != 0:
+            return False
+        subprocess.run(
+            ['git', 'update-ref', '-m', f'merge {branch}', 'HEAD', result, ours],
+            cwd=project_path, capture_output=True, text=True, check=True
+        )
+        return True
+
+    def _merge_in_working_tree(self, project_path, conversation_id):
+        """`git merge` in the canonical working tree (call under the lock)."""
+        branch = task_branch(conversation_id)
+        merge = subprocess.run(
+            ['git', 'merge', '--no-edit', branch],
+            cwd=project_path, capture_output=True, text=True
+        )
+        if merge.returncode != 0:
+            subprocess.run(
+                ['git', 'merge', '--abort'],
+                cwd=project_path, capture_output=True, text=True
+            )
+            detail = (merge.stdout or '').strip() or (merge.stderr or '').strip()
+            raise MergeConflict(
+                detail or f'Task {conversation_id} conflicts with the current project state'
             )
+        file_index.invalidate(project_path)
+
+        hash_result = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=project_path, capture_output=True, text=True
+        )
         return {
             'success': True,
             'message': f'Task {conversation_id} merged',
@@ -8,6 +8,7 @@ import logging
 from datetime import datetime
 from rest_framework.exceptions import ValidationError, NotFound
 from apps.Imagi.ProjectManager.models import Project
+from . import file_index
 from .safe_paths import resolve_safe
 
 logger = logging.getLogger(__name__)
@@ -302,42 +303,15 @@ class ViewFileService:
             if not project_path or not os.path.exists(project_path):
                 return {}
 
-            skip_dirs = {
-                'node_modules', '__pycache__', '.git', 'dist', 'build',
-                'staticfiles', 'media', '.venv', 'venv',
-            }
-
-            tree = {}
-
-            for root, dirs, filenames in os.walk(project_path):
-                # Depth check
-                rel_root = os.path.relpath(root, project_path)
-                if rel_root == '.':
-                    rel_root = ''
-                depth = rel_root.count(os.sep) if rel_root else 0
-                if depth >= max_depth:
-                    dirs[:] = []
-                    continue
-
-                # Prune
-                dirs[:] = sorted(d for d in dirs if d not in skip_dirs and not d.startswith('.'))
-
-                visible_files = sorted(
-                    f for f in filenames
-                    if not f.startswith('.')
-                    and os.path.splitext(f)[1].lower() in {
-                        '.vue', '.ts', '.tsx', '.js', '.jsx', '.css',
-                        '.json', '.html', '.py', '.md', '.txt',
-                    }
-                )
-
-                key = rel_root if rel_root else '.'
-                tree[key] = {
-                    'dirs': list(dirs),
-                    'files': visible_files,
-                }
-
-            return tree
+            # Served from the project's file index: the agent asks for the
+            # tree repeatedly within a run, and only the first call walks.
+            return file_index.get_index(project_path).directory_tree(
+                max_depth=max_depth,
+                extensions={
+                    '.vue', '.ts', '.tsx', '.js', '.jsx', '.css',
+                    '.json', '.html', '.py', '.md', '.txt',
+                },
+            )
         except Exception as e:
             logger.error(f"Error building directory tree: {str(e)}")
             raise
@@ -354,6 +328,7 @@ class ViewFileService:
             # Write content to file with UTF-8 encoding
             with open(full_path, 'w', encoding='utf-8') as f:
                 f.write(content)
+            file_index.note_file_written(project_path, file_path, content)
 
             # Write through to the database copy of the project
             project = self._resolve_project(project_id)
@@ -0,0 +1,209 @@
+"""
+Tests for detached agent runs (services.agent_runs) and the stream
+endpoints that tail them.
+
+Covers:
+- a run's events are logged in order and replayed after a given id
+- a tail follows a run that is still producing events
+- cancelling stops the run's generator, from its log alone; cancelling a
+  run whose log was pruned reports it over
+- a run whose worker died reports run_lost instead of hanging
+- agent_stream frames carry ids; agent_run_stream resumes after
+  Last-Event-ID and only for the run's owner
+- finished logs past their retention are pruned, live ones kept
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from apps.Imagi.Build.services import agent_runs
+
+
+async def _events(*events, delay=0):
+    for event in events:
+        if delay:
+            await asyncio.sleep(delay)
+        yield event
+
+
+async def _collect(run_id, after=None):
+    return [item async for item in agent_runs.tail(run_id, after=after)]
+
+
+class AgentRunsTestCase(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='agent_runs_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(AGENT_RUN_LOG_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = root
+
+
+class RunLogTests(AgentRunsTestCase):
+    def test_events_are_logged_and_replayed_after_an_id(self):
+        run_id = agent_runs.start(1, _events(
+            {'type': 'start', 'conversation_id': 4},
+            {'type': 'delta', 'text': 'Hi'},
+            {'type': 'done', 'success': True},
+        ))
+
+        everything = async_to_sync(_collect)(run_id)
+        self.assertEqual([event_id for event_id, _e in everything], [0, 1, 2, 3])
+        self.assertEqual(everything[0][1], {'type': 'run', 'run_id': run_id})
+        self.assertEqual(everything[3][1]['type'], 'done')
+
+        rest = async_to_sync(_collect)(run_id, after=1)
+        self.assertEqual([event['type'] for _id, event in rest], ['delta', 'done'])
+
+    def test_tail_follows_a_live_run(self):
+        run_id = agent_runs.start(1, _events(
+            {'type': 'delta', 'text': 'a'},
+            {'type': 'delta', 'text': 'b'},
+            {'type': 'done', 'success': True},
+            delay=0.2,
+        ))
+
+        events = [event for _id, event in async_to_sync(_collect)(run_id)]
+
+        self.assertEqual([event['type'] for event in events], ['run', 'delta', 'delta', 'done'])
+
+    def test_cancel_stops_the_run(self):
+        unwound = []
+
+        async def endless():
+            yield {'type': 'start', 'conversation_id': 9}
+            try:
+                await asyncio.sleep(60)
+                yield {'type': 'done'}
+            finally:
+                unwound.append(True)
+
+        run_id = agent_runs.start(1, endless())
+        deadline = time.time() + 5
+        while not os.path.exists(agent_runs._conversation_pointer(9)) and time.time() < deadline:
+            time.sleep(0.05)
+
+        self.assertTrue(agent_runs.cancel_conversation(9))
+        events = [event for _id, event in async_to_sync(_collect)(run_id)]
+
+        self.assertEqual(events[-1]['code'], 'cancelled')
+        self.assertEqual(unwound, [True])
+        self.assertFalse(os.path.exists(agent_runs._conversation_pointer(9)))
+        self.assertFalse(agent_runs.cancel(run_id))  # already over
+
+    def test_cancelling_a_pruned_run_reports_it_over(self):
+        log = agent_runs.RunLog.create('dd44', 1)
+        os.remove(log.path)
+
+        self.assertFalse(agent_runs.cancel('dd44'))
+
+    def test_run_of_a_dead_worker_is_reported_lost(self):
+        log = agent_runs.RunLog.create('abc123', 1)
+        log.append({'type': 'delta', 'text': 'half'})
+
+        with mock.patch.object(agent_runs, '_writer_alive', return_value=False):
+            events = [event for _id, event in async_to_sync(_collect)('abc123')]
+
+        self.assertEqual([event['type'] for event in events], ['run', 'delta', 'error'])
+        self.assertEqual(events[-1]['code'], 'run_lost')
+
+    def test_unknown_runs_are_not_found(self):
+        for run_id in ('0123abcd', '../etc/passwd'):
+            with self.assertRaises(agent_runs.RunNotFound):
+                agent_runs.owner(run_id)
+
+
+class PruneTests(AgentRunsTestCase):
+    def test_only_finished_logs_past_retention_are_pruned(self):
+        finished = agent_runs.RunLog.create('aaa1', 1)
+        finished.close()
+        live = agent_runs.RunLog.create('bbb2', 1)
+        recent = agent_runs.RunLog.create('ccc3', 1)
+        recent.close()
+        old = time.time() - 7200
+        for log in (finished, live):
+            os.utime(log.path, (old, old))
+
+        self.assertEqual(agent_runs.prune(), 1)
+
+        self.assertFalse(os.path.exists(finished.path))
+        self.assertTrue(os.path.exists(live.path))  # its worker is this one
+        self.assertTrue(os.path.exists(recent.path))
+
+
+class FakeAgentService:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def process_stream(self, **kwargs):
+        yield {'type': 'start', 'conversation_id': 1}
+        yield {'type': 'delta', 'text': 'Hello'}
+        yield {'type': 'done', 'success': True}
+
+
+class RunStreamEndpointTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='agent_runs_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(AGENT_RUN_LOG_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username='runs', password='pw123456')
+        self.token = Token.objects.create(user=self.user)
+
+    @staticmethod
+    def _frames(response):
+        async def drain(stream):
+            return b''.join([chunk async for chunk in stream])
+
+        body = async_to_sync(drain)(response.streaming_content).decode()
+        return [frame for frame in body.split('\n\n') if frame]
+
+    def _start(self):
+        with mock.patch('apps.Imagi.Build.api.views.ImagiAgentService', FakeAgentService):
+            resp = self.client.post(
+                reverse('agent_stream'), data='{"message": "hi", "project_id": 1}',
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Token {self.token.key}',
+            )
+        self.assertEqual(resp.status_code, 200)
+        return self._frames(resp)
+
+    def test_stream_frames_carry_ids_and_resume_after_the_last_one(self):
+        frames = self._start()
+
+        self.assertTrue(frames[0].startswith('id: 0\ndata: {"type": "run"'))
+        self.assertTrue(frames[-1].startswith('id: 3\n'))
+        run_id = frames[0].split('"run_id": "')[1].split('"')[0]
+
+        resp = self.client.get(
+            reverse('agent_run_stream', args=[run_id]),
+            HTTP_AUTHORIZATION=f'Token {self.token.key}',
+            HTTP_LAST_EVENT_ID='1',
+        )
+        resumed = self._frames(resp)
+        self.assertEqual([frame.split('\n')[0] for frame in resumed], ['id: 2', 'id: 3'])
+        self.assertIn('"done"', resumed[-1])
+
+    def test_only_the_owner_can_resume_a_run(self):
+        run_id = self._start()[0].split('"run_id": "')[1].split('"')[0]
+        other = User.objects.create_user(username='other', password='pw123456')
+        token = Token.objects.create(user=other)
+
+        resp = self.client.get(
+            reverse('agent_run_stream', args=[run_id]),
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+
+        self.assertEqual(resp.status_code, 404)
@@ -7,10 +7,12 @@ loading. The tools are tested through their plain implementation functions so
 no OpenAI calls are made.
 """
 
+import asyncio
 import os
 import shutil
 import tempfile
 import time
+from io import StringIO
 from datetime import timedelta
 from types import SimpleNamespace
 from unittest.mock import PropertyMock, patch
@@ -18,7 +20,9 @@ from unittest.mock import PropertyMock, patch
 from agents import MaxTurnsExceeded
 from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
@@ -39,6 +43,7 @@ from apps.Imagi.Build.services.base_agent import (
     _capped_run_note,
     compact_history,
     extract_run_metadata,
+    get_agent,
     lead_claims_unmade_dispatch,
     make_run_bounds_hook,
 )
@@ -50,6 +55,7 @@ from apps.Imagi.Build.services.coding_agent import (
     LEAD_AGENT_INSTRUCTIONS,
     PROJECT_MEMORY_MAX_CHARS,
     create_coding_agent,
+    get_dynamic_coding_instructions,
     load_project_memory,
 )
 from apps.Imagi.Build.services.tools import (
@@ -274,14 +280,14 @@ class CompactHistoryTests(SimpleTestCase):
             {'role': 'user', 'content': 'hello'},
             {'role': 'assistant', 'content': 'hi'},
         ]
-        self.assertEqual(compact_history(messages, max_chars=1000), messages)
+        self.assertEqual(compact_history(messages, max_tokens=250), messages)
 
     def test_long_history_is_compacted(self):
         messages = [
             {'role': 'user', 'content': f'message number {i} ' + 'x' * 200}
             for i in range(20)
         ]
-        compacted = compact_history(messages, max_chars=1000)
+        compacted = compact_history(messages, max_tokens=250)
         self.assertLess(len(compacted), len(messages))
         # First message is the compaction summary
         self.assertIn('Conversation compacted', compacted[0]['content'])
@@ -294,7 +300,7 @@ class CompactHistoryTests(SimpleTestCase):
             {'role': 'user', 'content': 'a' * 5000},
             {'role': 'assistant', 'content': 'b' * 5000},
         ]
-        compacted = compact_history(messages, max_chars=100)
+        compacted = compact_history(messages, max_tokens=25)
         self.assertEqual(compacted[-1]['content'], 'b' * 5000)
 
 
@@ -408,6 +414,82 @@ class ProcessStreamTests(TestCase):
         # The reply is persisted exactly once, from the run's final output.
         self.assertEqual(self.persisted, ['All done.'])
 
+    def test_title_is_generated_after_done_without_holding_it(self):
+        saved = []
+        conversation = SimpleNamespace(id=7, kind='chat', title='', save=lambda **kw: saved.append(kw))
+        self.service._prepare_run = lambda **kwargs: (
+            conversation, self.context, [{'role': 'user', 'content': kwargs['user_input']}]
+        )
+        self.service._is_first_reply = lambda conv: True
+        order = []
+
+        async def generate(user_input, reply):
+            order.append('generating')
+            return 'Build A Page'
+
+        async def collect():
+            async for event in self.service.process_stream(
+                user_input='build me a page', user=self.user, project_id=1
+            ):
+                order.append(event['type'])
+
+        with patch.object(type(self.service), 'agent', new_callable=PropertyMock) as mock_agent, \
+                patch('apps.Imagi.Build.services.base_agent.Runner') as mock_runner, \
+                patch('apps.Imagi.Build.services.base_agent.generate_conversation_title', generate):
+            mock_agent.return_value = SimpleNamespace()
+            mock_runner.run_streamed.return_value = _FakeStreamedRun([_delta_event('Hi')])
+            async_to_sync(collect)()
+
+        self.assertEqual(order, ['start', 'delta', 'done', 'generating', 'title'])
+        self.assertEqual(conversation.title, 'Build A Page')
+        # The run marker was cleared before the title landed.
+        self.assertEqual(
+            saved, [{'update_fields': ['run_started_at']}, {'update_fields': ['title', 'updated_at']}]
+        )
+
+    def test_title_is_saved_when_the_run_is_cancelled_after_done(self):
+        conversation = SimpleNamespace(id=7, kind='chat', title='', save=lambda **kw: None)
+        self.service._prepare_run = lambda **kwargs: (
+            conversation, self.context, [{'role': 'user', 'content': kwargs['user_input']}]
+        )
+        self.service._is_first_reply = lambda conv: True
+
+        async def scenario():
+            naming = asyncio.Event()
+
+            async def generate(user_input, reply):
+                await naming.wait()
+                return 'Build A Page'
+
+            async def consume(done):
+                async for event in self.service.process_stream(
+                    user_input='build me a page', user=self.user, project_id=1
+                ):
+                    if event['type'] == 'done':
+                        done.set()
+
+            with patch('apps.Imagi.Build.services.base_agent.generate_conversation_title', generate):
+                done = asyncio.Event()
+                run = asyncio.ensure_future(consume(done))
+                await done.wait()
+                await asyncio.sleep(0.05)  # parked on the title
+                run.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await run
+                naming.set()
+                for _ in range(20):
+                    if conversation.title:
+                        break
+                    await asyncio.sleep(0.01)
+
+        with patch.object(type(self.service), 'agent', new_callable=PropertyMock) as mock_agent, \
+                patch('apps.Imagi.Build.services.base_agent.Runner') as mock_runner:
+            mock_agent.return_value = SimpleNamespace()
+            mock_runner.run_streamed.return_value = _FakeStreamedRun([_delta_event('Hi')])
+            async_to_sync(scenario)()
+
+        self.assertEqual(conversation.title, 'Build A Page')
+
     def test_reports_tool_calls_and_plan(self):
         self.context.plan = [{'step': 'write the page', 'status': 'done'}]
         events = self._run(_FakeStreamedRun([
@@ -509,6 +591,32 @@ class ProcessStreamTests(TestCase):
             compute_cost_usd(self.service.model, 1_000_000, 100_000),
         )
 
+    def test_cached_input_is_reported_metered_and_keyed_per_conversation(self):
+        run = _FakeStreamedRun([_delta_event('ok')])
+        run.context_wrapper = SimpleNamespace(usage=SimpleNamespace(
+            input_tokens=1_000_000, output_tokens=0,
+            input_tokens_details=SimpleNamespace(cached_tokens=800_000),
+        ))
+
+        with patch('apps.Imagi.Build.services.base_agent.Runner') as mock_runner, \
+                patch.object(type(self.service), 'agent', new_callable=PropertyMock):
+            mock_runner.run_streamed.return_value = run
+            events = async_to_sync(self._collect)()
+            run_config = mock_runner.run_streamed.call_args.kwargs['run_config']
+
+        usage = events[-1]['usage']
+        self.assertEqual(usage['cached_input_tokens'], 800_000)
+        self.assertEqual(
+            usage['cost_usd'],
+            compute_cost_usd(self.service.model, 1_000_000, 0, cached_input_tokens=800_000),
+        )
+        self.assertLess(usage['cost_usd'], compute_cost_usd(self.service.model, 1_000_000, 0))
+        self.assertEqual(UsageEvent.objects.get(user=self.user).cached_input_tokens, 800_000)
+        # Every run of the conversation shares one provider cache key.
+        self.assertEqual(
+            run_config.model_settings.extra_args, {'prompt_cache_key': 'imagi-conversation-7'}
+        )
+
     def test_done_event_omits_usage_when_unavailable(self):
         # The fake run exposes no context_wrapper, mirroring an SDK result
         # without tracked usage: the field must be absent, not zeroed.
@@ -800,11 +908,12 @@ class ConversationMessagesMetadataTests(TestCase):
 
 
 class ConversationTotalTokensTests(TestCase):
-    """Serialized conversations aggregate token usage across their messages."""
+    """Conversations carry running usage counters, kept as messages land."""
 
     def setUp(self):
         self.user = User.objects.create_user(username='tokens', password='pw123456')
         self.client.force_login(self.user)
+        self.service = ImagiAgentService()
 
     def _conversation(self):
         return AgentConversation.objects.create(
@@ -817,17 +926,18 @@ class ConversationTotalTokensTests(TestCase):
             conversation=conversation, role='user', content='hi',
             metadata={'checkpoint': 'abc123'},  # non-usage metadata is ignored
         )
-        AgentMessage.objects.create(
-            conversation=conversation, role='assistant', content='one',
-            metadata={'usage': {'input_tokens': 1000, 'output_tokens': 200}},
+        self.service.add_assistant_message(
+            conversation, 'one',
+            {'usage': {'input_tokens': 1000, 'output_tokens': 200}},
         )
         # A run whose usage was never captured contributes nothing.
-        AgentMessage.objects.create(
-            conversation=conversation, role='assistant', content='untracked',
+        self.service.add_assistant_message(conversation, 'untracked')
+        self.service.add_assistant_message(
+            conversation, 'garbled', {'usage': {'input_tokens': '7', 'output_tokens': 1}},
         )
-        AgentMessage.objects.create(
-            conversation=conversation, role='assistant', content='two',
-            metadata={'usage': {'input_tokens': 50, 'output_tokens': 5, 'cost_usd': 0.01}},
+        self.service.add_assistant_message(
+            conversation, 'two',
+            {'usage': {'input_tokens': 50, 'output_tokens': 5, 'cost_usd': 0.01}},
         )
 
         resp = self.client.get(
@@ -837,18 +947,72 @@ class ConversationTotalTokensTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         [conversation_data] = resp.json()
         self.assertEqual(conversation_data['total_tokens'], 1255)
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.input_tokens, conversation.output_tokens), (1050, 205))
 
     def test_total_tokens_null_when_no_message_has_usage(self):
         # Absent usage means unknown — null, never 0.
         conversation = self._conversation()
         AgentMessage.objects.create(conversation=conversation, role='user', content='hi')
-        AgentMessage.objects.create(conversation=conversation, role='assistant', content='yo')
+        self.service.add_assistant_message(conversation, 'yo')
 
         resp = self.client.get(reverse('conversation_detail', args=[conversation.id]))
 
         self.assertEqual(resp.status_code, 200)
         self.assertIsNone(resp.json()['total_tokens'])
 
+    def test_metered_cost_accumulates_from_usage_events(self):
+        conversation = self._conversation()
+        usage = {'input_tokens': 100, 'output_tokens': 10, 'cost_usd': 0.25}
+        self.service._record_usage_event(self.user, 'gpt-5.6-terra', usage, conversation)
+        self.service._record_usage_event(self.user, 'gpt-5.6-terra', usage, conversation)
+
+        resp = self.client.get(reverse('conversation_detail', args=[conversation.id]))
+
+        self.assertEqual(resp.json()['cost_usd'], 0.5)
+        # Metering alone never claims tokens for the transcript.
+        self.assertIsNone(resp.json()['total_tokens'])
+
+    def test_cache_hit_rate_from_cached_input(self):
+        conversation = self._conversation()
+        self.assertIsNone(conversation.cache_hit_rate)
+        self.service.add_assistant_message(
+            conversation, 'cold', {'usage': {'input_tokens': 1000, 'output_tokens': 10}},
+        )
+        self.service.add_assistant_message(
+            conversation, 'warm',
+            {'usage': {'input_tokens': 1000, 'output_tokens': 10, 'cached_input_tokens': 900}},
+        )
+
+        resp = self.client.get(reverse('conversation_detail', args=[conversation.id]))
+
+        self.assertEqual(resp.json()['cache_hit_rate'], 0.45)
+
+    def test_backfill_rebuilds_counters_from_history(self):
+        from django.core.management import call_command
+
+        conversation = self._conversation()
+        AgentMessage.objects.create(
+            conversation=conversation, role='assistant', content='old',
+            metadata={'usage': {'input_tokens': 30, 'output_tokens': 3, 'cached_input_tokens': 12}},
+        )
+        UsageEvent.objects.create(
+            user=self.user, model_name='gpt-5.6-terra', input_tokens=30,
+            output_tokens=3, total_tokens=33, cost_usd='0.125',
+            conversation_id=conversation.id,
+        )
+        untouched = self._conversation()
+
+        call_command('backfill_conversation_usage', stdout=StringIO())
+        call_command('backfill_conversation_usage', stdout=StringIO())  # idempotent
+
+        conversation.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual(conversation.total_tokens, 33)
+        self.assertEqual(conversation.cached_input_tokens, 12)
+        self.assertEqual(float(conversation.cost_usd), 0.125)
+        self.assertIsNone(untouched.total_tokens)
+
 
 class CheckpointTests(TestCase):
     """Per-message checkpoints: stamp on the user message, restore rewinds
@@ -927,6 +1091,38 @@ class CheckpointTests(TestCase):
         # ...and the restored-to message plus everything after it are gone.
         self.assertEqual(conversation.messages.count(), 0)
 
+    def test_restore_drops_the_removed_replies_usage(self):
+        project, conversation = self._conversation_with_project()
+        service = ImagiAgentService()
+        service.add_assistant_message(
+            conversation, 'kept', {'usage': {'input_tokens': 100, 'output_tokens': 10}},
+        )
+        checkpoint = self._write_commit('page.txt', 'original', 'v1')
+        restored = AgentMessage.objects.create(
+            conversation=conversation, role='user', content='again',
+            metadata={'checkpoint': checkpoint},
+        )
+        service.add_assistant_message(
+            conversation, 'removed',
+            {'usage': {'input_tokens': 900, 'output_tokens': 90, 'cached_input_tokens': 800}},
+        )
+        service._record_usage_event(
+            self.user, 'gpt-5.6-sol', {'input_tokens': 900, 'output_tokens': 90, 'cost_usd': 0.5},
+            conversation,
+        )
+
+        resp = self.client.post(
+            reverse('conversation_restore_checkpoint', args=[conversation.id]),
+            data={'message_id': restored.id}, content_type='application/json',
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.total_tokens, 110)
+        self.assertEqual(conversation.cached_input_tokens, 0)
+        # The run was metered; rewinding the thread doesn't refund it.
+        self.assertEqual(float(conversation.cost_usd), 0.5)
+
     def test_restore_rejected_without_checkpoint(self):
         project, conversation = self._conversation_with_project()
         msg = AgentMessage.objects.create(
@@ -968,6 +1164,59 @@ class ComputeCostTests(SimpleTestCase):
     def test_unknown_model_returns_none(self):
         self.assertIsNone(compute_cost_usd('gpt-oops', 1000, 1000))
 
+    def test_cached_input_is_billed_at_the_cached_rate(self):
+        # Sol: $6/M uncached input, $0.60/M cached
+        self.assertEqual(
+            compute_cost_usd('gpt-5.6-sol', 1_000_000, 0, cached_input_tokens=500_000), 3.3
+        )
+
+
+class PromptPrefixTests(TestCase):
+    """The prompt's leading part (instructions, tools, history) stays
+    byte-identical across a conversation's runs, so the provider's prompt
+    cache can serve it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='prefix', password='pw123456')
+        self.service = ImagiAgentService()
+        self.service.get_project_info = lambda project_id, user: {
+            'project_name': 'Shop', 'project_description': 'A shop',
+            'project_path': None,
+        }
+
+    def test_instructions_do_not_depend_on_the_open_file(self):
+        agent = create_coding_agent()
+
+        def instructions(current_file):
+            context = AgentContext(
+                user_id=1, project_name='Shop', current_file=current_file
+            )
+            return get_dynamic_coding_instructions(SimpleNamespace(context=context), agent)
+
+        self.assertEqual(
+            instructions({'path': 'src/App.vue'}), instructions({'path': 'src/Cart.vue'})
+        )
+
+    def test_open_file_travels_after_the_history(self):
+        conversation = AgentConversation.objects.create(user=self.user, project_id=1)
+        AgentMessage.objects.create(conversation=conversation, role='user', content='first')
+        AgentMessage.objects.create(conversation=conversation, role='assistant', content='done')
+
+        _conversation, _context, messages = self.service._prepare_run(
+            user_input='and now the cart', user=self.user, project_id=1,
+            conversation_id=conversation.id, current_file={'path': 'src/Cart.vue'},
+        )
+
+        self.assertEqual([m['content'] for m in messages[:2]], ['first', 'done'])
+        self.assertEqual(messages[2]['role'], 'developer')
+        self.assertIn('src/Cart.vue', messages[2]['content'])
+        self.assertEqual(messages[3], {'role': 'user', 'content': 'and now the cart'})
+
+    def test_agents_are_shared_across_services(self):
+        self.assertIs(ImagiAgentService().agent, ImagiAgentService().agent)
+        self.assertIs(get_agent('gpt-5.6-terra', None, 'lead'), get_agent('gpt-5.6-terra', None, 'lead'))
+        self.assertIsNot(get_agent('gpt-5.6-terra', 'high', 'chat'), get_agent('gpt-5.6-terra', 'low', 'chat'))
+
 
 class RunBoundsHookTests(SimpleTestCase):
     """The cost and wall-clock bounds that stop a long run."""
@@ -1455,6 +1704,68 @@ class MessagePreviewTests(SimpleTestCase):
         self.assertEqual(self._preview('\n\n---\n'), '')
 
 
+class ConversationListQueryTests(TestCase):
+    """Listing costs the same handful of queries however many threads exist."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lister', password='pw123456')
+        self.client.force_login(self.user)
+
+    def _add_tasks(self, count):
+        for i in range(count):
+            task = AgentConversation.objects.create(
+                user=self.user, model_name='gpt-5.6-terra', project_id=1, kind='task'
+            )
+            AgentMessage.objects.create(conversation=task, role='user', content=f'brief {i}')
+            AgentMessage.objects.create(
+                conversation=task, role='assistant', content=f'done {i}',
+                metadata={'usage': {'input_tokens': 10, 'output_tokens': i}},
+            )
+
+    def _list(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(
+                reverse('conversations_list_create'), {'project_id': 1, **params}
+            )
+        self.assertEqual(resp.status_code, 200)
+        return resp, len(queries)
+
+    def test_query_count_does_not_grow_with_conversations(self):
+        self._add_tasks(2)
+        _, few = self._list()
+        self._add_tasks(20)
+        resp, many = self._list()
+
+        self.assertEqual(many, few)
+        self.assertEqual(len(resp.json()), 22)
+
+    def test_run_queue_is_read_once_per_listing(self):
+        from apps.Imagi.Build.services import run_queue
+
+        self._add_tasks(5)
+        with patch.object(run_queue, 'snapshot', wraps=run_queue.snapshot) as snapshot:
+            resp, _ = self._list()
+
+        self.assertEqual(len(resp.json()), 5)
+        snapshot.assert_called_once_with()
+
+    def test_annotated_rows_match_the_single_row_shape(self):
+        self._add_tasks(3)
+        resp, _ = self._list()
+        for row in resp.json():
+            detail = self.client.get(reverse('conversation_detail', args=[row['id']])).json()
+            self.assertEqual(row, detail)
+
+    def test_limit_and_offset_page_the_list(self):
+        self._add_tasks(5)
+        everything = [row['id'] for row in self._list()[0].json()]
+
+        resp, _ = self._list(limit=2, offset=2)
+
+        self.assertEqual([row['id'] for row in resp.json()], everything[2:4])
+        self.assertEqual(resp['X-Total-Count'], '5')
+
+
 class ConversationBriefTests(TestCase):
     """What a task was asked to do — the line its card shows while it runs."""
 
@@ -1678,7 +1989,11 @@ class TaskTurnCapTests(TestCase):
         self.service._finalize_task_run = lambda conv, ctx, content: None
         self.service._clear_run_started = lambda conv: None
         self.service._record_usage_event = lambda *a, **kw: None
-        self.service.autoname_from_first_reply = lambda *a, **kw: ''
+
+        async def no_title(*args, **kwargs):
+            return None
+
+        self.service.autoname_from_first_reply = no_title
         self.service._continuation_allowed = lambda user: True
         self.service._park_capped_task = lambda cid: self.parked.append(cid)
 
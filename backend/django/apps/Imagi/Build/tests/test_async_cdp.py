@@ -0,0 +1,229 @@
+"""
+Tests for the preview's asyncio DevTools client (AsyncCdpConnection, the
+command drivers and the async interaction methods of BrowserPreviewService),
+against a fake DevTools websocket.
+
+Covers:
+- concurrent calls on one connection resolve by id, whatever the reply order
+- CDP errors raise CdpError; a closed socket fails pending calls
+- closing the connection fails calls in flight at once
+- a CdpError is thrown into the steps generator at the failing command
+- aframe reuses the worker's pooled connection across calls
+- a pooled connection that went away is replaced on the next call
+- a CDP error reply keeps the pooled connection
+"""
+
+import asyncio
+import json
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import browser_preview_service as bps
+from apps.Imagi.Build.services.browser_preview_service import (
+    AsyncCdpConnection,
+    BrowserNotRunning,
+    BrowserPreviewService,
+    CdpError,
+)
+
+try:
+    from websockets.asyncio.server import serve
+except ImportError:  # pragma: no cover
+    serve = None
+
+
+class FakeBrowser:
+    """A DevTools page endpoint that can hold back or fail replies."""
+
+    def __init__(self):
+        self.connections = 0
+        self.calls = []
+        self.held = []
+        self.hold = set()
+        self.sockets = []
+
+    async def handler(self, socket):
+        self.connections += 1
+        self.sockets.append(socket)
+        async for message in socket:
+            msg = json.loads(message)
+            self.calls.append(msg['method'])
+            reply = json.dumps({'id': msg['id'], **self._reply(msg)})
+            if msg['method'] in self.hold:
+                self.held.append(reply)
+                continue
+            await socket.send(reply)
+            # Replies held back go out after a later one: out of order.
+            while self.held:
+                await socket.send(self.held.pop())
+
+    @staticmethod
+    def _reply(msg):
+        method = msg['method']
+        if method == 'Broken.method':
+            return {'error': {'message': 'no such method'}}
+        if method == 'Echo':
+            return {'result': msg['params']}
+        if method == 'Page.getNavigationHistory':
+            return {'result': {
+                'currentIndex': 0,
+                'entries': [{'id': 1, 'url': 'http://127.0.0.1:5174/cart', 'title': 'Cart'}],
+            }}
+        if method == 'Page.captureScreenshot':
+            return {'result': {'data': 'ZnJhbWU='}}
+        return {'result': {}}
+
+
+class AsyncCdpTestCase(SimpleTestCase):
+    def setUp(self):
+        if serve is None or bps.ws_connect is None:
+            self.skipTest('websockets is not installed')
+        self.browser = FakeBrowser()
+
+    async def _serve(self):
+        server = await serve(self.browser.handler, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        return server, f'ws://127.0.0.1:{port}/'
+
+
+class AsyncCdpConnectionTests(AsyncCdpTestCase):
+    async def test_concurrent_calls_resolve_by_id(self):
+        self.browser.hold = {'Echo'}
+        server, url = await self._serve()
+        conn = await AsyncCdpConnection.open(url)
+        try:
+            first = asyncio.ensure_future(conn.call('Echo', {'n': 1}))
+            await asyncio.sleep(0.05)
+            # The first reply is held until this one has been answered.
+            second = await conn.call('Runtime.evaluate', {'expression': '1'})
+            self.assertEqual(second, {})
+            self.assertEqual(await first, {'n': 1})
+        finally:
+            await conn.close()
+            server.close()
+
+    async def test_errors_and_closed_sockets(self):
+        server, url = await self._serve()
+        conn = await AsyncCdpConnection.open(url)
+        try:
+            with self.assertRaisesRegex(CdpError, 'no such method'):
+                await conn.call('Broken.method')
+
+            self.browser.hold = {'Echo'}
+            pending = asyncio.ensure_future(conn.call('Echo'))
+            await asyncio.sleep(0.05)
+            await self.browser.sockets[0].close()
+            with self.assertRaises(BrowserNotRunning):
+                await pending
+            self.assertTrue(conn.closed)
+            with self.assertRaises(BrowserNotRunning):
+                await conn.call('Echo')
+        finally:
+            await conn.close()
+            server.close()
+
+    async def test_close_fails_calls_in_flight(self):
+        self.browser.hold = {'Echo'}
+        server, url = await self._serve()
+        conn = await AsyncCdpConnection.open(url)
+        try:
+            pending = asyncio.ensure_future(conn.call('Echo'))
+            await asyncio.sleep(0.05)
+            await conn.close()
+            # Well under CDP_CALL_TIMEOUT: the call fails with the close.
+            with self.assertRaises(BrowserNotRunning):
+                await asyncio.wait_for(pending, 1)
+            self.assertTrue(conn.closed)
+        finally:
+            server.close()
+
+    def test_cdp_errors_are_thrown_into_steps(self):
+        class Conn:
+            def call(self, method, params=None):
+                if method == 'Broken.method':
+                    raise CdpError('nope')
+                return {'ok': method}
+
+        def steps():
+            try:
+                yield ('Broken.method', {})
+            except CdpError:
+                fallback = yield ('Fallback', {})
+            return fallback
+
+        self.assertEqual(bps._drive(Conn(), steps()), {'ok': 'Fallback'})
+
+
+class AsyncPreviewCallTests(AsyncCdpTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp(prefix='async_cdp_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(PROJECTS_ROOT=root):
+            self.service = BrowserPreviewService(
+                SimpleNamespace(id=8, name='Cart', user=SimpleNamespace(id=1))
+            )
+        self.state = {
+            'cdp_port': 9555,
+            'app_url': 'http://127.0.0.1:5174',
+            'viewport': [800, 600],
+            'device_scale_factor': 1,
+        }
+        patcher = mock.patch.object(BrowserPreviewService, '_require_state', return_value=self.state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _aframe_twice(self, between=None):
+        server, url = await self._serve()
+        page = {'webSocketDebuggerUrl': url}
+        try:
+            with mock.patch.object(bps, '_resolve_page_target', return_value=page):
+                first = await self.service.aframe()
+                if between:
+                    await between()
+                second = await self.service.aframe(etag=first['etag'])
+        finally:
+            for task in bps._async_pool().values():
+                await (await task)['conn'].close()
+            bps._async_pool().clear()
+            server.close()
+        return first, second
+
+    async def test_aframe_reuses_the_pooled_connection(self):
+        first, second = await self._aframe_twice()
+
+        self.assertEqual(first['path'], '/cart')
+        self.assertEqual(first['frame'], 'ZnJhbWU=')
+        self.assertIsNone(second['frame'])  # unchanged since the client's etag
+        self.assertEqual(self.browser.connections, 1)
+        # Viewport and console watch are set up once per connection.
+        self.assertEqual(self.browser.calls.count('Emulation.setDeviceMetricsOverride'), 1)
+        self.assertEqual(self.browser.calls.count('Page.enable'), 1)
+
+    async def test_dropped_connection_is_replaced(self):
+        async def drop():
+            await self.browser.sockets[0].close()
+            await asyncio.sleep(0.05)
+
+        _first, second = await self._aframe_twice(between=drop)
+
+        self.assertEqual(second['path'], '/cart')
+        self.assertEqual(self.browser.connections, 2)
+
+    async def test_cdp_error_keeps_the_pooled_connection(self):
+        def broken(conn):
+            yield ('Broken.method', {})
+
+        async def fail_one_command():
+            with self.assertRaisesRegex(CdpError, 'no such method'):
+                await self.service._awith_page(self.state, broken)
+
+        _first, second = await self._aframe_twice(between=fail_one_command)
+
+        self.assertEqual(second['path'], '/cart')
+        self.assertEqual(self.browser.connections, 1)
+        self.assertEqual(self.browser.calls.count('Broken.method'), 1)  # not retried
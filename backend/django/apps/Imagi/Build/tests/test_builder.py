@@ -528,6 +528,11 @@ class PreviewEndpointTests(APITestCase):
         self.assertFalse(body['running'])
         self.assertIn('error', body)
 
+    def test_stream_reports_browser_not_running_as_409(self):
+        resp = self.client.get(reverse('api-preview-stream', args=[self.project.id]))
+        self.assertEqual(resp.status_code, 409)
+        self.assertFalse(resp.json()['running'])
+
     def test_input_reports_browser_not_running_as_409(self):
         resp = self.client.post(
             reverse('api-preview-input', args=[self.project.id]),
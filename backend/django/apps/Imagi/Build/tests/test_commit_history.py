@@ -0,0 +1,130 @@
+"""
+Tests for the paged commit history behind VersionControlHistoryView
+(services.commit_history).
+
+Covers:
+- cursor pagination walks the whole log exactly once, in `git log` order
+- subjects with '|' (the old parser's separator) survive intact
+- an unchanged HEAD is served from cache without running `git log`
+- new commits on top are walked incrementally; a reset drops the cache
+- an unknown cursor fails without walking the log
+- relative dates match git's own %ar wording
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.Imagi.Build.services import commit_history
+
+
+def _git(cwd, *args, env=None):
+    return subprocess.run(
+        ['git', *args], cwd=cwd, capture_output=True, text=True, check=True,
+        env={**os.environ, **(env or {})},
+    ).stdout.strip()
+
+
+class CommitHistoryTests(SimpleTestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='commit_history_')
+        self.addCleanup(lambda: shutil.rmtree(self.repo, ignore_errors=True))
+        self.addCleanup(commit_history.discard, self.repo)
+        _git(self.repo, 'init', '-q')
+        _git(self.repo, 'config', 'user.email', 't@t.co')
+        _git(self.repo, 'config', 'user.name', 'T')
+
+    def _commit(self, message):
+        _git(self.repo, 'commit', '-q', '--allow-empty', '-m', message)
+        return _git(self.repo, 'rev-parse', 'HEAD')
+
+    def _log_calls(self):
+        return mock.patch.object(
+            commit_history, '_run_log', wraps=commit_history._run_log
+        )
+
+    def test_empty_repo(self):
+        self.assertEqual(commit_history.page(self.repo), ([], None))
+
+    def test_cursor_pages_cover_log_in_order(self):
+        for i in range(7):
+            self._commit(f'change {i}')
+        expected = _git(self.repo, 'log', '--format=%H').splitlines()
+
+        seen, cursor = [], None
+        while True:
+            commits, cursor = commit_history.page(self.repo, before=cursor, limit=3)
+            seen.extend(c['hash'] for c in commits)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, expected)
+
+    def test_subjects_with_separators_parse_exactly(self):
+        self._commit('fix: a | b || c')
+        commits, _ = commit_history.page(self.repo)
+        self.assertEqual(commits[0]['message'], 'fix: a | b || c')
+        self.assertEqual(commits[0]['author'], 'T')
+
+    def test_unchanged_head_is_served_from_cache(self):
+        for i in range(3):
+            self._commit(f'change {i}')
+        first, _ = commit_history.page(self.repo)
+
+        with self._log_calls() as run_log:
+            again, _ = commit_history.page(self.repo)
+
+        self.assertEqual(run_log.call_count, 0)
+        self.assertEqual(again, first)
+
+    def test_new_commits_are_walked_incrementally(self):
+        for i in range(3):
+            self._commit(f'change {i}')
+        commit_history.page(self.repo)
+        newest = self._commit('on top')
+
+        with self._log_calls() as run_log:
+            commits, _ = commit_history.page(self.repo)
+
+        self.assertEqual(run_log.call_count, 1)
+        self.assertIn('..', run_log.call_args.args[1])
+        self.assertEqual([c['hash'] for c in commits][0], newest)
+        self.assertEqual(len(commits), 4)
+
+    def test_reset_drops_cache_and_old_cursors(self):
+        base = self._commit('base')
+        dropped = self._commit('dropped')
+        commit_history.page(self.repo)
+        _git(self.repo, 'reset', '-q', '--hard', base)
+
+        commits, _ = commit_history.page(self.repo)
+
+        self.assertEqual([c['hash'] for c in commits], [base])
+        with self.assertRaises(commit_history.UnknownCursor):
+            commit_history.page(self.repo, before=dropped)
+
+    def test_unknown_cursor_fails_without_walking_the_log(self):
+        base = self._commit('base')
+        self._commit('top')
+        _git(self.repo, 'checkout', '-q', '-b', 'side', base)
+        elsewhere = self._commit('on another branch')
+        _git(self.repo, 'checkout', '-q', '-')
+
+        for cursor in ('not-a-hash', 'f' * 40, elsewhere):
+            with self._log_calls() as run_log, self.assertRaises(commit_history.UnknownCursor):
+                commit_history.page(self.repo, before=cursor)
+            run_log.assert_not_called()
+
+    def test_relative_date_matches_git(self):
+        now = 1_700_000_000
+        for seconds in (5, 600, 7200, 3 * 86400, 20 * 86400, 100 * 86400,
+                        400 * 86400, 800 * 86400, 3000 * 86400):
+            _git(self.repo, 'commit', '-q', '--allow-empty', '-m', 'aged',
+                 env={'GIT_AUTHOR_DATE': f'@{now - seconds} +0000'})
+            git_says = _git(self.repo, 'log', '-1', '--format=%ar',
+                            env={'GIT_TEST_DATE_NOW': str(now)})
+            self.assertEqual(commit_history.relative_date(now - seconds, now), git_says)
@@ -0,0 +1,115 @@
+"""
+Tests for incremental history compaction (services.conversation_history).
+
+Covers:
+- a history over its token budget folds its oldest messages into a
+  persisted checkpoint, keeping the newest verbatim
+- later runs start from the checkpoint instead of re-reading and
+  re-summarizing what it covers, and their prefix stays byte-stable
+  until the next compaction
+- the summary drops its oldest lines past its own budget
+- a restore that removes checkpointed messages discards the checkpoint
+- token counts are cached by digest, not by the text itself, and bounded
+"""
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from apps.Imagi.Build.models import AgentConversation, AgentMessage
+from apps.Imagi.Build.services import conversation_history
+
+
+class CompactionCheckpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', password='pw123456')
+        self.conversation = AgentConversation.objects.create(user=self.user, project_id=1)
+
+    def _say(self, n, size=400):
+        role = 'user' if n % 2 == 0 else 'assistant'
+        return AgentMessage.objects.create(
+            conversation=self.conversation, role=role, content=f'message {n} ' + 'x' * size
+        )
+
+    def test_over_budget_history_is_checkpointed(self):
+        sent = [self._say(n) for n in range(10)]
+
+        history = conversation_history.build(self.conversation, max_tokens=500)
+
+        self.conversation.refresh_from_db()
+        through = self.conversation.history_compacted_through
+        self.assertIsNotNone(through)
+        self.assertIn('message 0', self.conversation.history_summary)
+        self.assertTrue(history[0]['content'].startswith(conversation_history.SUMMARY_HEADER))
+        kept = [m for m in sent if m.id > through]
+        self.assertEqual([h['content'] for h in history[1:]], [m.content for m in kept])
+        self.assertEqual(history[-1]['content'], sent[-1].content)
+
+    def test_later_runs_start_from_the_checkpoint_with_a_stable_prefix(self):
+        for n in range(10):
+            self._say(n)
+        first = conversation_history.build(self.conversation, max_tokens=500)
+        # Checkpointed messages are never read again.
+        AgentMessage.objects.filter(
+            id__lte=self.conversation.history_compacted_through
+        ).update(content='rewritten')
+        self._say(10, size=10)
+
+        with self.assertNumQueries(1):
+            second = conversation_history.build(self.conversation, max_tokens=500)
+
+        self.assertEqual(second[:len(first)], first)
+        self.assertEqual(len(second), len(first) + 1)
+
+    def test_restore_before_the_checkpoint_discards_it(self):
+        sent = [self._say(n) for n in range(10)]
+        conversation_history.build(self.conversation, max_tokens=500)
+
+        conversation_history.rewind(self.conversation, sent[-1].id)  # after it: kept
+        self.assertIsNotNone(self.conversation.history_compacted_through)
+        conversation_history.rewind(self.conversation, sent[1].id)
+
+        self.conversation.refresh_from_db()
+        self.assertIsNone(self.conversation.history_compacted_through)
+        self.assertEqual(self.conversation.history_summary, '')
+
+
+class SummaryBudgetTests(SimpleTestCase):
+    def test_oldest_summary_lines_are_dropped_past_the_budget(self):
+        messages = [{'role': 'user', 'content': f'topic {n} ' + 'y' * 200} for n in range(40)]
+
+        summary, folded = conversation_history.compact(
+            '', messages, max_tokens=400, summary_max_tokens=100
+        )
+
+        lines = summary.splitlines()
+        self.assertGreater(folded, 0)
+        self.assertEqual(lines[0], conversation_history.DROPPED_LINE)
+        self.assertIn(f'topic {folded - 1} ', lines[-1])
+        self.assertNotIn('topic 0 ', summary)
+        self.assertLessEqual(conversation_history.count_tokens(summary), 100 + 10)
+
+
+class TokenCountCacheTests(SimpleTestCase):
+    def setUp(self):
+        conversation_history._token_counts.clear()
+        self.addCleanup(conversation_history._token_counts.clear)
+
+    def test_counts_are_cached_by_digest_and_bounded(self):
+        text = 'cached ' + 'z' * 10_000
+        with mock.patch.object(
+            conversation_history, '_encode_count', wraps=conversation_history._encode_count,
+        ) as encode:
+            first = conversation_history.count_tokens(text)
+            self.assertEqual(conversation_history.count_tokens(text), first)
+        encode.assert_called_once_with(text)
+        self.assertTrue(all(
+            isinstance(key, bytes) and len(key) == 16
+            for key in conversation_history._token_counts
+        ))
+
+        with mock.patch.object(conversation_history, 'TOKEN_CACHE_SIZE', 3):
+            for n in range(5):
+                conversation_history.count_tokens(f'line {n}')
+        self.assertEqual(len(conversation_history._token_counts), 3)
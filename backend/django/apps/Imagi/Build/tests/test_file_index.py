@@ -0,0 +1,128 @@
+"""
+Tests for the per-project file index behind the agent's discovery tools
+(services.file_index).
+
+Covers:
+- the index reproduces the walk it replaced (file order, directory tree)
+- repeated searches are served from memory instead of re-reading disk
+- the existing write paths keep the index current without a rescan
+- invalidate() picks up changes made behind the services' backs
+"""
+
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from apps.Imagi.Build.services import file_index
+from apps.Imagi.Build.services.create_file_service import CreateFileService
+from apps.Imagi.Build.services.directory_service import DirectoryService
+from apps.Imagi.Build.services.tools import _iter_project_files, glob_impl, grep_impl
+from apps.Imagi.Build.services.view_file_service import ViewFileService
+
+
+class FileIndexTestBase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='file_index_')
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        self.addCleanup(file_index.discard, self.root)
+        # The services mirror to the DB through a real Project; these tests
+        # only exercise the disk side, so the mirror is suppressed.
+        self.project = SimpleNamespace(
+            id=1, project_path=self.root, _suppress_db_mirror=True
+        )
+
+        self._write('frontend/vuejs/src/App.vue', '<template>\n  <div>App</div>\n</template>\n')
+        self._write('frontend/vuejs/src/apps/home/router/index.ts', "import { createRouter } from 'vue-router'\n")
+        self._write('frontend/vuejs/node_modules/pkg/index.js', 'createRouter\n')
+        self._write('backend/django/manage.py', "print('manage')\n")
+        self._write('README.md', '# readme\n')
+
+    def _write(self, rel_path, content):
+        full = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return full
+
+
+class IndexMatchesWalkTests(FileIndexTestBase):
+    def test_file_order_matches_os_walk(self):
+        walked = [rel for _, rel in _iter_project_files(self.root)]
+        self.assertEqual(file_index.get_index(self.root).files(), walked)
+
+    def test_directory_tree_shape(self):
+        tree = ViewFileService(project=self.project).get_directory_tree(max_depth=3)
+
+        self.assertEqual(list(tree)[0], '.')
+        self.assertEqual(tree['.'], {'dirs': ['backend', 'frontend'], 'files': ['README.md']})
+        self.assertEqual(tree['frontend/vuejs'], {'dirs': ['src'], 'files': []})
+        # Depth-capped directories are listed by their parent, not expanded.
+        self.assertIn('apps', tree['frontend/vuejs/src']['dirs'])
+        self.assertNotIn('frontend/vuejs/src/apps', tree)
+        self.assertNotIn('frontend/vuejs/node_modules', tree)
+
+
+class IndexCachingTests(FileIndexTestBase):
+    def test_repeated_grep_reads_each_file_once(self):
+        grep_impl(self.project, 'createRouter')
+        with patch('builtins.open', side_effect=AssertionError('re-read from disk')):
+            result = grep_impl(self.project, 'createRouter')
+        self.assertEqual(result['match_count'], 1)
+
+    def test_glob_does_not_rewalk(self):
+        glob_impl(self.project, '*.py')
+        with patch('os.walk', side_effect=AssertionError('re-walked')):
+            self.assertEqual(glob_impl(self.project, '*.py')['files'], ['backend/django/manage.py'])
+
+
+class IndexMaintenanceTests(FileIndexTestBase):
+    def test_created_file_is_visible_without_rescan(self):
+        grep_impl(self.project, 'x')
+        CreateFileService(project=self.project).create_file({
+            'name': 'frontend/vuejs/src/views/About.vue',
+            'content': '<template>About createRouter</template>',
+            'type': 'vue',
+        })
+
+        with patch('os.walk', side_effect=AssertionError('re-walked')):
+            result = grep_impl(self.project, 'createRouter')
+            tree = ViewFileService(project=self.project).get_directory_tree()
+
+        self.assertEqual(
+            [m['file'] for m in result['matches']],
+            ['frontend/vuejs/src/apps/home/router/index.ts', 'frontend/vuejs/src/views/About.vue'],
+        )
+        self.assertIn('views', tree['frontend/vuejs/src']['dirs'])
+
+    def test_deleted_directory_drops_out(self):
+        glob_impl(self.project, '*')
+        DirectoryService(project=self.project).delete_directory('frontend/vuejs/src/apps', recursive=True)
+
+        self.assertEqual(grep_impl(self.project, 'createRouter')['match_count'], 0)
+        tree = ViewFileService(project=self.project).get_directory_tree()
+        self.assertEqual(tree['frontend/vuejs/src']['dirs'], [])
+
+    def test_invalidate_picks_up_external_changes(self):
+        grep_impl(self.project, 'x')
+        self._write('backend/django/settings.py', 'createRouter = None\n')
+        self.assertEqual(grep_impl(self.project, 'createRouter')['match_count'], 1)
+
+        file_index.invalidate(self.root)
+
+        self.assertEqual(grep_impl(self.project, 'createRouter')['match_count'], 2)
+
+    def test_worktree_gets_its_own_index(self):
+        worktree = tempfile.mkdtemp(prefix='file_index_wt_')
+        self.addCleanup(lambda: shutil.rmtree(worktree, ignore_errors=True))
+        self.addCleanup(file_index.discard, worktree)
+        with open(os.path.join(worktree, 'only_here.py'), 'w') as f:
+            f.write('createRouter\n')
+
+        task_project = SimpleNamespace(project_path=worktree, _suppress_db_mirror=True)
+
+        self.assertEqual(glob_impl(task_project, '*.py')['files'], ['only_here.py'])
+        self.assertEqual(glob_impl(self.project, '*.py')['files'], ['backend/django/manage.py'])
@@ -0,0 +1,129 @@
+"""
+Tests for the git backends behind VersionControlService's commit paths
+(services.git_backend).
+
+Both backends run the same cases against real throwaway repos and are
+checked with the git CLI, so the in-process libgit2 path is held to exactly
+what `git add -A && git commit` would have produced.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import git_backend
+from apps.Imagi.Build.services.version_control_service import VersionControlService
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ['git', *args], cwd=cwd, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+class BackendCases:
+    backend_class = None
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='git_backend_')
+        self.addCleanup(lambda: shutil.rmtree(self.repo, ignore_errors=True))
+        _git(self.repo, 'init', '-q')
+        _git(self.repo, 'config', 'user.email', 't@t.co')
+        _git(self.repo, 'config', 'user.name', 'T')
+        self.backend = self.backend_class()
+
+    def _write(self, name, content):
+        path = os.path.join(self.repo, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_unborn_head_and_empty_baseline(self):
+        self.assertIsNone(self.backend.head(self.repo))
+        commit = self.backend.commit_all(self.repo, 'Initial checkpoint', allow_empty=True)
+        self.assertEqual(commit, _git(self.repo, 'rev-parse', 'HEAD'))
+
+    def test_commit_stages_additions_edits_and_deletions(self):
+        self._write('keep.txt', 'one')
+        self._write('gone.txt', 'bye')
+        first = self.backend.commit_all(self.repo, 'first')
+
+        self._write('keep.txt', 'two')
+        self._write('src/new.vue', '<template/>')
+        os.remove(os.path.join(self.repo, 'gone.txt'))
+        second = self.backend.commit_all(self.repo, 'second')
+
+        self.assertEqual(second, _git(self.repo, 'rev-parse', 'HEAD'))
+        self.assertEqual(_git(self.repo, 'rev-parse', 'HEAD~1'), first)
+        self.assertEqual(_git(self.repo, 'log', '-1', '--format=%s|%an'), 'second|T')
+        self.assertEqual(
+            _git(self.repo, 'ls-tree', '-r', '--name-only', 'HEAD').splitlines(),
+            ['keep.txt', 'src/new.vue'],
+        )
+        self.assertEqual(_git(self.repo, 'status', '--porcelain'), '')
+
+    def test_clean_and_ignored_only_trees_do_not_commit(self):
+        self._write('.gitignore', '*.log\n')
+        self.backend.commit_all(self.repo, 'first')
+        head = self.backend.head(self.repo)
+
+        self._write('debug.log', 'noise')
+
+        self.assertFalse(self.backend.is_dirty(self.repo))
+        self.assertIsNone(self.backend.commit_all(self.repo, 'nothing'))
+        self.assertEqual(self.backend.head(self.repo), head)
+
+    def test_commit_in_linked_worktree_advances_its_branch(self):
+        self._write('app.txt', 'hello')
+        self.backend.commit_all(self.repo, 'initial')
+        worktree = self.repo + '--wt'
+        self.addCleanup(lambda: shutil.rmtree(worktree, ignore_errors=True))
+        _git(self.repo, 'worktree', 'add', '-q', '-b', 'task/1', worktree)
+
+        with open(os.path.join(worktree, 'app.txt'), 'w') as f:
+            f.write('variant')
+        commit = self.backend.commit_all(worktree, 'task edit')
+
+        self.assertEqual(_git(self.repo, 'rev-parse', 'task/1'), commit)
+        self.assertNotEqual(_git(self.repo, 'rev-parse', 'HEAD'), commit)
+
+
+class SubprocessBackendTests(BackendCases, SimpleTestCase):
+    backend_class = git_backend.SubprocessBackend
+
+
+@unittest.skipIf(git_backend.pygit2 is None, 'pygit2 is not installed')
+class Pygit2BackendTests(BackendCases, SimpleTestCase):
+    backend_class = git_backend.Pygit2Backend
+
+
+class BackendSelectionTests(SimpleTestCase):
+    @override_settings(IMAGI_GIT_BACKEND='subprocess')
+    def test_explicit_subprocess(self):
+        self.assertIsInstance(git_backend.get_backend(), git_backend.SubprocessBackend)
+
+    @override_settings(IMAGI_GIT_BACKEND='pygit2')
+    def test_pygit2_falls_back_when_missing(self):
+        with mock.patch.object(git_backend, 'pygit2', None):
+            self.assertIsInstance(git_backend.get_backend(), git_backend.SubprocessBackend)
+
+    def test_commit_changes_never_calls_os_sync(self):
+        repo = tempfile.mkdtemp(prefix='git_backend_')
+        self.addCleanup(lambda: shutil.rmtree(repo, ignore_errors=True))
+        with open(os.path.join(repo, 'a.txt'), 'w') as f:
+            f.write('a')
+
+        with mock.patch('os.sync', side_effect=AssertionError('global sync')):
+            service = VersionControlService()
+            self.assertTrue(service.initialize_repo(repo))
+            with open(os.path.join(repo, 'a.txt'), 'w') as f:
+                f.write('b')
+            result = service.commit_changes(repo, 'edit')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['commit_hash'], _git(repo, 'rev-parse', 'HEAD'))
@@ -0,0 +1,99 @@
+"""
+Tests for the preview port lease registry (services.port_leases).
+
+Covers:
+- leases are distinct per owner and stable for one owner
+- ports bound outside the registry are skipped with a bind(), no process scan
+- leases of dead processes and never-attached leases are reclaimed
+- an exhausted range fails loudly
+- a write that fails midway leaves the previous registry intact
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import json_registry, port_leases
+
+
+def _free_block(size):
+    """The first port of ``size`` consecutive ports nothing listens on."""
+    for low in range(42000, 60000, 50):
+        if all(port_leases._bindable(p) for p in range(low, low + size)):
+            return low
+    raise RuntimeError('no free port block')
+
+
+class PortLeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='port_leases_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.low = _free_block(3)
+        settings = override_settings(
+            PROJECTS_ROOT=self.root,
+            IMAGI_PREVIEW_PORT_RANGES={'backend': (self.low, self.low + 2)},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Allocation must never fall back to scanning every process.
+        scan = mock.patch('psutil.process_iter', side_effect=AssertionError('process scan'))
+        scan.start()
+        self.addCleanup(scan.stop)
+
+    def test_owners_get_distinct_ports_and_keep_their_own(self):
+        first = port_leases.lease('backend', owner=1)
+        second = port_leases.lease('backend', owner=2)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(port_leases.lease('backend', owner=1), first)
+        self.assertEqual(len(port_leases.leases()), 2)
+
+    def test_ports_bound_elsewhere_are_skipped(self):
+        with socket.socket() as squatter:
+            squatter.bind(('127.0.0.1', self.low))
+            squatter.listen()
+            self.assertNotEqual(port_leases.lease('backend', owner=1), self.low)
+            self.assertTrue(port_leases.is_listening(self.low))
+
+    def test_dead_process_leases_are_reclaimed(self):
+        ports = [port_leases.lease('backend', owner=i) for i in range(3)]
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        port_leases.attach(ports[0], process.pid)
+
+        self.assertEqual(port_leases.lease('backend', owner=9), ports[0])
+
+    def test_unattached_leases_expire(self):
+        for i in range(3):
+            port_leases.lease('backend', owner=i)
+        with self.assertRaises(port_leases.PortsExhausted):
+            port_leases.lease('backend', owner=9)
+
+        with mock.patch.object(port_leases, 'LEASE_LAUNCH_TTL', -1):
+            for i in range(3):
+                port_leases.lease('backend', owner=i)
+        self.assertIn(port_leases.lease('backend', owner=9), range(self.low, self.low + 3))
+
+    def test_release_owner_frees_its_ports(self):
+        port = port_leases.lease('backend', owner=1)
+        port_leases.release_owner(1)
+        self.assertNotIn(port, port_leases.leases())
+
+    def test_failed_write_keeps_the_previous_registry(self):
+        port = port_leases.lease('backend', owner=1)
+
+        with mock.patch.object(json_registry.os, 'replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                port_leases.lease('backend', owner=2)
+
+        self.assertEqual(port_leases.lease('backend', owner=1), port)
+        self.assertEqual(
+            sorted(os.listdir(self.root)),
+            [port_leases.REGISTRY_FILENAME, port_leases.REGISTRY_FILENAME + json_registry.LOCK_SUFFIX],
+        )
@@ -0,0 +1,183 @@
+"""
+Tests for the preview's binary frame transport (services.preview_frames).
+
+Covers:
+- Accept negotiation: JSON by default, JPEG or tiles on request
+- a binary frame is the raw JPEG, with the rest of the payload as state
+- tiles carry only the squares that changed against the client's etag
+- unknown bases and mostly-changed frames fall back to a full frame
+- the state header stays bounded whatever the page's title and errors
+- the frame endpoint answers binary clients with a body, or 204 when current
+"""
+
+import base64
+import io
+import json
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from apps.Imagi.Build.services import preview_frames
+from apps.Imagi.Build.services.browser_preview_service import BrowserPreviewService
+from apps.Imagi.ProjectManager.models import Project as PMProject
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # pragma: no cover
+    Image = None
+
+BOTH = f'{preview_frames.FRAME_TYPE}, {preview_frames.FRAME_TILES_TYPE}'
+
+
+def _jpeg(size=(512, 256), box=None, fill='red'):
+    image = Image.new('RGB', size, 'white')
+    if box:
+        ImageDraw.Draw(image).rectangle(box, fill=fill)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=70)
+    return out.getvalue()
+
+
+def _patch_frame(payload):
+    return mock.patch.object(BrowserPreviewService, 'aframe', new_callable=mock.AsyncMock, return_value=payload)
+
+
+def _payload(jpeg, etag):
+    return {'path': '/', 'etag': etag, 'frame': base64.b64encode(jpeg).decode('ascii')}
+
+
+class NegotiateTests(SimpleTestCase):
+    def _request(self, accept):
+        return SimpleNamespace(headers={'Accept': accept} if accept else {})
+
+    def test_json_unless_a_frame_type_is_accepted(self):
+        self.assertIsNone(preview_frames.negotiate(self._request('')))
+        self.assertIsNone(preview_frames.negotiate(self._request('application/json')))
+        self.assertEqual(preview_frames.negotiate(self._request('image/jpeg')), 'jpeg')
+
+    def test_tiles_only_with_pillow(self):
+        with mock.patch.object(preview_frames, 'Image', None):
+            self.assertEqual(preview_frames.negotiate(self._request(BOTH)), 'jpeg')
+        if Image is not None:
+            self.assertEqual(preview_frames.negotiate(self._request(BOTH)), 'tiles')
+
+
+class RenderTests(SimpleTestCase):
+    def setUp(self):
+        preview_frames._tile_hashes.clear()
+        self.addCleanup(preview_frames._tile_hashes.clear)
+
+    def test_binary_frame_is_the_raw_jpeg(self):
+        jpeg = b'\xff\xd8 not really a jpeg \xff\xd9'
+        content_type, body, state = preview_frames.render(_payload(jpeg, 'a'), 1, 'jpeg')
+        self.assertEqual(content_type, preview_frames.FRAME_TYPE)
+        self.assertEqual(body, jpeg)
+        self.assertEqual(state, {'path': '/', 'etag': 'a'})
+
+    def test_no_frame_means_current(self):
+        content_type, body, state = preview_frames.render(
+            {'path': '/', 'etag': 'a', 'frame': None}, 1, 'jpeg',
+        )
+        self.assertIsNone(content_type)
+        self.assertEqual(body, b'')
+        self.assertEqual(json.loads(preview_frames.state_header(state)), {'path': '/', 'etag': 'a'})
+
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_tiles_carry_only_changed_squares(self):
+        preview_frames.render(_payload(_jpeg(), 'base'), 1, 'tiles')
+        changed = _jpeg(box=(140, 10, 200, 60))  # inside the tile at (128, 0)
+
+        content_type, body, state = preview_frames.render(
+            _payload(changed, 'next'), 1, 'tiles', base_etag='base',
+        )
+
+        self.assertEqual(content_type, preview_frames.FRAME_TILES_TYPE)
+        self.assertEqual(state['frame_size'], [512, 256])
+        self.assertEqual([t[:4] for t in state['tiles']], [[128, 0, 128, 128]])
+        self.assertEqual(len(body), state['tiles'][0][4])
+        tile = Image.open(io.BytesIO(body))
+        self.assertEqual(tile.size, (128, 128))
+        self.assertLess(len(body), len(changed))
+
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_unknown_base_or_large_change_sends_a_full_frame(self):
+        preview_frames.render(_payload(_jpeg(), 'base'), 1, 'tiles')
+        moved = _jpeg(box=(0, 0, 511, 200))
+
+        for owner, base in ((1, 'missing'), (2, 'base'), (1, 'base')):
+            content_type, body, state = preview_frames.render(
+                _payload(moved, 'next'), owner, 'tiles', base_etag=base,
+            )
+            self.assertEqual(content_type, preview_frames.FRAME_TYPE)
+            self.assertEqual(body, moved)
+            self.assertNotIn('tiles', state)
+
+    def test_state_header_is_bounded(self):
+        state = {
+            'path': '/' + 'p' * 5000,
+            'title': '\u00e9' * 5000,
+            'console_errors': [{'level': 'error', 'text': 'x' * 500, 'ts': 1}] * 5,
+            'etag': 'a',
+        }
+        decoded = json.loads(preview_frames.state_header(state))
+        self.assertEqual(len(decoded['title']), preview_frames.STATE_TEXT_LIMIT)
+        self.assertEqual(len(decoded['path']), preview_frames.STATE_TEXT_LIMIT)
+        self.assertEqual(len(decoded['console_errors'][0]['text']), preview_frames.STATE_TEXT_LIMIT)
+        self.assertEqual(len(state['title']), 5000)  # the payload itself is untouched
+
+        # Past the byte limit, console errors then the title are left out.
+        state['tiles'] = [[0, 0, 128, 128, 1000]] * 750
+        header = preview_frames.state_header(state)
+        self.assertLessEqual(len(header), preview_frames.STATE_HEADER_LIMIT)
+        decoded = json.loads(header)
+        self.assertNotIn('console_errors', decoded)
+        self.assertEqual(len(decoded['tiles']), 750)
+
+
+class BinaryFrameEndpointTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='binaryframes', password='pw123456')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        projects_root = tempfile.mkdtemp(prefix='preview_frames_root_')
+        self.addCleanup(lambda: shutil.rmtree(projects_root, ignore_errors=True))
+        overrides = override_settings(PROJECTS_ROOT=projects_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.project = PMProject.objects.create(
+            user=self.user, name='Binary Frames', project_path=projects_root,
+        )
+        self.url = reverse('api-preview-frame', args=[self.project.id])
+
+    def test_binary_client_gets_the_jpeg_and_state_header(self):
+        jpeg = b'\xff\xd8frame\xff\xd9'
+        with _patch_frame(_payload(jpeg, 'e1')):
+            resp = self.client.get(self.url, HTTP_ACCEPT='image/jpeg')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'image/jpeg')
+        self.assertEqual(resp.content, jpeg)
+        self.assertEqual(json.loads(resp[preview_frames.STATE_HEADER]), {'path': '/', 'etag': 'e1'})
+
+    def test_current_frame_is_204(self):
+        payload = {'path': '/', 'etag': 'e1', 'frame': None}
+        with _patch_frame(payload) as frame:
+            resp = self.client.get(self.url, {'etag': 'e1'}, HTTP_ACCEPT='image/jpeg')
+
+        frame.assert_called_once_with(etag='e1')
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(json.loads(resp[preview_frames.STATE_HEADER])['etag'], 'e1')
+
+    def test_json_clients_are_unchanged(self):
+        payload = _payload(b'\xff\xd8frame\xff\xd9', 'e1')
+        with _patch_frame(dict(payload)):
+            resp = self.client.get(self.url)
+
+        self.assertEqual(resp.json(), payload)
@@ -0,0 +1,201 @@
+"""
+Tests for the warm preview runtime pool (services.preview_pool).
+
+Covers:
+- a pre-booted Django runtime binds to a project and serves it
+- a pre-booted Vite runtime binds to a project root with its port and env
+- misses (empty pool, unlinked frontend) are counted and start nothing
+- dead idle runtimes are dropped instead of claimed
+- the pool is off unless IMAGI_PREVIEW_POOL_SIZE is set
+"""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from unittest import mock, skipUnless
+
+import psutil
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import preview_pool
+from apps.Imagi.Build.services.preview_readiness import (
+    DJANGO_READY_PATTERN,
+    VITE_READY_PATTERN,
+    ServerProbe,
+    wait_until_ready,
+)
+
+FAKE_VITE = """
+import http from 'node:http'
+export async function createServer({ root, server }) {
+  let httpServer
+  return {
+    async listen() {
+      httpServer = http.createServer((req, res) => {
+        res.end(JSON.stringify({
+          root, cwd: process.cwd(), backend: process.env.VITE_BACKEND_URL,
+        }))
+      })
+      await new Promise((resolve) => httpServer.listen(server.port, server.host, resolve))
+    },
+    printUrls() {
+      console.log(`  Local:   http://${server.host}:${server.port}/`)
+    },
+  }
+}
+"""
+
+MANAGE_PY = """
+import os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'site_config.settings')
+from django.core.management import execute_from_command_line
+execute_from_command_line(sys.argv)
+"""
+
+SETTINGS_PY = """
+SECRET_KEY = 'test'
+DEBUG = True
+ALLOWED_HOSTS = ['*']
+ROOT_URLCONF = 'site_config.urls'
+INSTALLED_APPS = []
+DATABASES = {}
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _kill_tree(process):
+    try:
+        parent = psutil.Process(process.pid)
+        for proc in parent.children(recursive=True) + [parent]:
+            proc.kill()
+    except psutil.NoSuchProcess:
+        pass
+    process.wait()
+
+
+class PreviewPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='preview_pool_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(PROJECTS_ROOT=self.root, IMAGI_PREVIEW_POOL_SIZE=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(preview_pool.shutdown)
+        # Refills would boot more runtimes behind the test's back.
+        refill = mock.patch.object(preview_pool, '_refill_in_background')
+        refill.start()
+        self.addCleanup(refill.stop)
+
+    def _booted(self, kind, key):
+        preview_pool._fill(kind, key)
+        runtime = preview_pool._idle[(kind, key)][0]
+        deadline = time.monotonic() + 20
+        while not runtime.booted():
+            self.assertTrue(runtime.alive(), 'warm runtime exited while booting')
+            self.assertLess(time.monotonic(), deadline, 'warm runtime never booted')
+            time.sleep(0.05)
+        return runtime
+
+    def _serve(self, name, process, port, log_path, pattern):
+        self.addCleanup(_kill_tree, process)
+        probe = ServerProbe(name, process, port, log_path, pattern)
+        self.assertEqual(wait_until_ready([probe], timeout=20), [])
+
+    def test_django_runtime_binds_to_a_project(self):
+        backend = os.path.join(self.root, 'backend')
+        os.makedirs(os.path.join(backend, 'site_config'))
+        for name, content in (
+            ('manage.py', MANAGE_PY),
+            ('site_config/__init__.py', ''),
+            ('site_config/settings.py', SETTINGS_PY),
+            ('site_config/urls.py', 'urlpatterns = []\n'),
+        ):
+            with open(os.path.join(backend, name), 'w') as f:
+                f.write(content)
+        runtime = self._booted('backend', preview_pool.backend_key())
+        pool_log = runtime.log_path
+        log_path = os.path.join(self.root, 'backend.log')
+        port = _free_port()
+
+        process = preview_pool.claim('backend', preview_pool.backend_key(), {
+            'cwd': backend,
+            'port': port,
+            'env': {'DJANGO_SETTINGS_MODULE': 'site_config.settings'},
+        }, log_path)
+
+        self.assertIs(process, runtime.process)
+        self._serve('Django backend', process, port, log_path, DJANGO_READY_PATTERN)
+        self.assertFalse(os.path.exists(pool_log))
+        self.assertEqual(preview_pool.stats()['backend']['hits'], 1)
+
+    @skipUnless(shutil.which('node'), 'node is not installed')
+    def test_vite_runtime_binds_to_a_project_root(self):
+        slot = os.path.join(self.root, 'slot')
+        vite = os.path.join(slot, 'node_modules', 'vite')
+        os.makedirs(vite)
+        with open(os.path.join(vite, 'package.json'), 'w') as f:
+            json.dump({'name': 'vite', 'type': 'module', 'exports': './index.js'}, f)
+        with open(os.path.join(vite, 'index.js'), 'w') as f:
+            f.write(FAKE_VITE)
+        frontend = os.path.join(self.root, 'frontend')
+        os.makedirs(frontend)
+        os.symlink(os.path.join(slot, 'node_modules'), os.path.join(frontend, 'node_modules'))
+        key = preview_pool.frontend_key(frontend)
+        self.assertEqual(key, os.path.realpath(slot))
+        self._booted('frontend', key)
+        log_path = os.path.join(self.root, 'frontend.log')
+        port = _free_port()
+
+        process = preview_pool.claim('frontend', key, {
+            'root': frontend,
+            'port': port,
+            'host': '127.0.0.1',
+            'env': {'VITE_BACKEND_URL': 'http://localhost:8123'},
+        }, log_path)
+
+        self.assertIsNotNone(process)
+        self._serve('VueJS frontend', process, port, log_path, VITE_READY_PATTERN)
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+            served = json.loads(response.read())
+        self.assertEqual(served['root'], frontend)
+        self.assertEqual(os.path.realpath(served['cwd']), os.path.realpath(frontend))
+        self.assertEqual(served['backend'], 'http://localhost:8123')
+
+    def test_misses_are_counted_and_start_nothing(self):
+        with mock.patch.object(preview_pool, '_spawn') as spawn:
+            self.assertIsNone(preview_pool.claim('backend', sys.executable, {}, 'unused.log'))
+            self.assertIsNone(preview_pool.claim('frontend', None, {}, 'unused.log'))
+        spawn.assert_not_called()
+
+        stats = preview_pool.stats()
+        self.assertEqual(stats['backend'], {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+        self.assertEqual(stats['frontend']['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_dead_idle_runtimes_are_not_claimed(self):
+        runtime = self._booted('backend', preview_pool.backend_key())
+        runtime.process.kill()
+        runtime.process.wait()
+
+        self.assertIsNone(preview_pool.claim(
+            'backend', preview_pool.backend_key(), {}, os.path.join(self.root, 'unused.log'),
+        ))
+        self.assertEqual(preview_pool.stats()['idle']['backend'], 0)
+
+    def test_pool_is_off_by_default(self):
+        with override_settings(), mock.patch.object(preview_pool, '_refill_in_background') as refill:
+            from django.conf import settings
+            del settings.IMAGI_PREVIEW_POOL_SIZE
+            self.assertEqual(preview_pool.pool_size(), 0)
+            preview_pool.warm()
+        refill.assert_not_called()
@@ -0,0 +1,165 @@
+"""
+Tests for preview startup readiness (services.preview_readiness and its use
+in PreviewService).
+
+Covers:
+- a server counts as ready the moment it answers HTTP, not after a sleep
+- a server that exits fails the wait at once, naming itself
+- Vite's banner overrides the port it was asked for
+- startup percentiles are nearest-rank over the remembered starts
+- a dual-stack start waits on both servers together and reports timings
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import preview_readiness
+from apps.Imagi.Build.services.preview_readiness import (
+    VITE_LOCAL_URL,
+    VITE_READY_PATTERN,
+    ServerExited,
+    ServerProbe,
+    wait_until_ready,
+)
+from apps.Imagi.Build.services.preview_service import PreviewService
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _http_server(port, log_path, delay=0.0):
+    """A stand-in dev server: answers HTTP on ``port`` after ``delay`` seconds."""
+    code = (
+        f"import time, http.server; time.sleep({delay}); "
+        f"http.server.test(HandlerClass=http.server.SimpleHTTPRequestHandler, "
+        f"port={port}, bind='127.0.0.1')"
+    )
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-c', code], stdout=log, stderr=subprocess.STDOUT,
+        cwd=os.path.dirname(log_path),
+    )
+    log.close()
+    return process
+
+
+class ReadinessTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='readiness_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.log = os.path.join(self.root, 'server.log')
+
+    def _spawn(self, *args, **kwargs):
+        process = _http_server(*args, **kwargs)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        return process
+
+    def test_ready_as_soon_as_http_answers(self):
+        port = _free_port()
+        process = self._spawn(port, self.log, delay=0.3)
+        probe = ServerProbe('server', process, port, self.log, VITE_READY_PATTERN)
+
+        started = time.monotonic()
+        self.assertEqual(wait_until_ready([probe], timeout=10), [])
+
+        self.assertIsNotNone(probe.ready_at)
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_exited_server_fails_fast(self):
+        with open(self.log, 'w') as log:
+            process = subprocess.Popen(
+                [sys.executable, '-c', 'import sys; sys.exit(3)'], stdout=log
+            )
+        process.wait()
+        probe = ServerProbe('VueJS frontend', process, _free_port(), self.log, VITE_READY_PATTERN)
+
+        with self.assertRaises(ServerExited) as raised:
+            wait_until_ready([probe], timeout=10)
+
+        self.assertIs(raised.exception.probe, probe)
+        self.assertIn('code 3', str(raised.exception))
+
+    def test_timeout_returns_the_pending_probe(self):
+        alive = SimpleNamespace(poll=lambda: None, returncode=None)
+        probe = ServerProbe('server', alive, _free_port(), self.log, VITE_READY_PATTERN)
+        self.assertEqual(wait_until_ready([probe], timeout=0.2), [probe])
+
+    def test_vite_banner_reports_the_bound_port(self):
+        with open(self.log, 'w') as f:
+            f.write('\x1b[32m  VITE v5.4.0  ready in 312 ms\x1b[0m\n')
+            f.write('  \x1b[32m➜\x1b[0m  Local:   http://127.0.0.1:5176/\n')
+        alive = SimpleNamespace(poll=lambda: None, returncode=None)
+        probe = ServerProbe(
+            'VueJS frontend', alive, 5174, self.log, VITE_READY_PATTERN,
+            port_pattern=VITE_LOCAL_URL,
+        )
+        with mock.patch.object(ServerProbe, '_http_ok', return_value=False):
+            self.assertEqual(probe.check(), 'hint')
+        self.assertEqual(probe.port, 5176)
+
+    def test_percentiles_are_nearest_rank(self):
+        preview_readiness.reset_startup_stats()
+        self.addCleanup(preview_readiness.reset_startup_stats)
+        for ms in range(1, 101):
+            preview_readiness.record_startup('total', ms)
+
+        stats = preview_readiness.startup_percentiles()['total']
+
+        self.assertEqual(stats, {'count': 100, 'p50': 50, 'p90': 90, 'p99': 99})
+
+
+class DualStackStartupTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='preview_start_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_servers_boot_concurrently_and_report_timings(self):
+        project = SimpleNamespace(id=7, name='Shop', user=SimpleNamespace(id=1))
+        with override_settings(PROJECTS_ROOT=self.root):
+            service = PreviewService(project)
+        processes = []
+
+        def launch(kind, delay):
+            def start(_path):
+                port = _free_port()
+                log_path = getattr(service, f'{kind}_log_file')
+                process = _http_server(port, log_path, delay=delay)
+                processes.append(process)
+                with open(getattr(service, f'{kind}_pid_file'), 'w') as f:
+                    f.write(str(process.pid))
+                setattr(service, f'{kind}_port', port)
+                setattr(service, f'_{kind}_process', process)
+            return start
+
+        with mock.patch.object(service, '_start_django_backend', side_effect=launch('backend', 1.0)), \
+                mock.patch.object(service, '_start_vuejs_frontend', side_effect=launch('frontend', 1.0)):
+            started = time.monotonic()
+            try:
+                result = service._start_dual_stack_preview('frontend', 'backend')
+                elapsed = time.monotonic() - started
+            finally:
+                for process in processes:
+                    process.kill()
+                    process.wait()
+
+        startup = result['startup']
+        self.assertTrue(startup['ready'])
+        self.assertGreaterEqual(startup['backend_ms'], 900)
+        self.assertGreaterEqual(startup['frontend_ms'], 900)
+        # Waited on together: nowhere near the sum, let alone the old sleeps.
+        self.assertLess(elapsed, 1.8)
+        self.assertIn('total', startup['percentiles'])
+        self.assertEqual(result['preview_url'], f'http://localhost:{service.frontend_port}')
@@ -0,0 +1,179 @@
+"""
+Tests for screencast streaming of the browser preview
+(services.preview_screencast), against a fake DevTools websocket.
+
+Covers:
+- the stream opens with a status event, then relays repainted frames
+- a frame is acked only after the consumer has taken it
+- back-to-back frames drop to motion quality; stillness restores it
+- navigations push a status event
+- the browser going away ends the stream with BrowserNotRunning
+"""
+
+import asyncio
+import json
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import preview_screencast
+from apps.Imagi.Build.services.browser_preview_service import (
+    FRAME_JPEG_QUALITY,
+    MOTION_JPEG_QUALITY,
+    BrowserNotRunning,
+    BrowserPreviewService,
+)
+
+try:
+    from websockets.asyncio.server import serve
+except ImportError:  # pragma: no cover
+    serve = None
+
+
+async def _next_frame(stream):
+    """The next 'frame' event, skipping status updates."""
+    async for event in stream:
+        if event['type'] == 'frame':
+            return event
+
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+class FakePage:
+    """A DevTools page endpoint: answers commands, lets the test push events."""
+
+    def __init__(self):
+        self.calls = []
+        self.acks = []
+        self.socket = None
+        self.connected = asyncio.Event()
+
+    async def handler(self, socket):
+        self.socket = socket
+        self.connected.set()
+        async for message in socket:
+            msg = json.loads(message)
+            self.calls.append((msg['method'], msg.get('params') or {}))
+            if msg['method'] == 'Page.screencastFrameAck':
+                self.acks.append(msg['params']['sessionId'])
+            await socket.send(json.dumps({'id': msg['id'], 'result': self._result(msg['method'])}))
+
+    @staticmethod
+    def _result(method):
+        if method == 'Page.getNavigationHistory':
+            return {
+                'currentIndex': 0,
+                'entries': [{'id': 1, 'url': 'http://127.0.0.1:5174/about', 'title': 'About'}],
+            }
+        if method == 'Runtime.evaluate':
+            return {'result': {'type': 'object', 'value': []}}
+        return {}
+
+    async def push(self, method, params=None):
+        await self.socket.send(json.dumps({'method': method, 'params': params or {}}))
+
+    def qualities(self):
+        return [p['quality'] for m, p in self.calls if m == 'Page.startScreencast']
+
+
+class ScreencastTests(SimpleTestCase):
+    def setUp(self):
+        if serve is None:
+            self.skipTest('websockets is not installed')
+        root = tempfile.mkdtemp(prefix='screencast_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(PROJECTS_ROOT=root):
+            self.service = BrowserPreviewService(
+                SimpleNamespace(id=3, name='Shop', user=SimpleNamespace(id=1))
+            )
+        self.state = {
+            'app_url': 'http://127.0.0.1:5174',
+            'viewport': [800, 600],
+            'device_scale_factor': 2,
+        }
+
+    async def _open(self):
+        page = FakePage()
+        server = await serve(page.handler, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        stream = preview_screencast.screencast(self.service, self.state, f'ws://127.0.0.1:{port}/')
+        return page, server, stream
+
+    async def test_status_then_frames_acked_after_consumption(self):
+        page, server, stream = await self._open()
+        try:
+            status = await stream.__anext__()
+            self.assertEqual(status['type'], 'status')
+            self.assertEqual(status['path'], '/about')
+            self.assertEqual(status['title'], 'About')
+
+            pending = asyncio.ensure_future(_next_frame(stream))
+            await asyncio.sleep(0.05)
+            start = [p for m, p in page.calls if m == 'Page.startScreencast'][0]
+            self.assertEqual((start['maxWidth'], start['maxHeight']), (1600, 1200))
+            self.assertEqual(start['quality'], FRAME_JPEG_QUALITY)
+
+            await page.push('Page.screencastFrame', {'data': 'AAAA', 'sessionId': 1})
+            frame = await asyncio.wait_for(pending, 2)
+            self.assertEqual(frame, {'type': 'frame', 'frame': 'AAAA'})
+            await asyncio.sleep(0.05)
+            self.assertEqual(page.acks, [])  # consumer has not asked for more
+
+            next_event = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.05)
+            self.assertEqual(page.acks, [1])
+            await _cancel(next_event)
+        finally:
+            await stream.aclose()
+            server.close()
+
+    async def test_motion_drops_quality_until_the_page_settles(self):
+        page, server, stream = await self._open()
+        try:
+            with mock.patch.object(preview_screencast, 'SETTLE_AFTER', 0.1):
+                await stream.__anext__()  # status
+                for session in (1, 2):
+                    pending = asyncio.ensure_future(_next_frame(stream))
+                    await asyncio.sleep(0.02)
+                    await page.push('Page.screencastFrame', {'data': 'AA', 'sessionId': session})
+                    await asyncio.wait_for(pending, 2)
+                next_event = asyncio.ensure_future(stream.__anext__())
+                await asyncio.sleep(0.05)
+                self.assertEqual(page.qualities()[-1], MOTION_JPEG_QUALITY)
+                await asyncio.sleep(0.3)
+                self.assertEqual(page.qualities()[-1], FRAME_JPEG_QUALITY)
+                await _cancel(next_event)
+        finally:
+            await stream.aclose()
+            server.close()
+
+    async def test_navigation_pushes_status(self):
+        page, server, stream = await self._open()
+        try:
+            await stream.__anext__()
+            await page.push('Page.frameNavigated', {'frame': {'id': 'main'}})
+            event = await asyncio.wait_for(stream.__anext__(), 2)
+            self.assertEqual(event['type'], 'status')
+        finally:
+            await stream.aclose()
+            server.close()
+
+    async def test_closed_browser_ends_the_stream(self):
+        page, server, stream = await self._open()
+        try:
+            await stream.__anext__()
+            await page.socket.close()
+            with self.assertRaises(BrowserNotRunning):
+                await asyncio.wait_for(stream.__anext__(), 2)
+        finally:
+            await stream.aclose()
+            server.close()
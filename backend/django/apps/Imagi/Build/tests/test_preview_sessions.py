@@ -0,0 +1,152 @@
+"""
+Tests for the preview session registry and reaper (services.preview_sessions).
+
+Covers:
+- only sessions past their deadline are reaped, and their files removed
+- a session another worker touched since is rescheduled, not reaped
+- superseded deadlines of touched sessions are skipped
+- memory pressure reaps the least recently used sessions first, sparing
+  ones in use
+- the reaper thread wakes for an earlier deadline and reaps on its own
+- server processes start the reaper at boot; other commands do not
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.apps import apps
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.apps import _serves_requests
+from apps.Imagi.Build.services import preview_sessions
+
+
+class PreviewSessionsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='preview_sessions_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.pid_dir = os.path.join(self.root, 'pids')
+        os.makedirs(self.pid_dir)
+        settings = override_settings(
+            PROJECTS_ROOT=self.root,
+            BROWSER_PREVIEW_IDLE_TIMEOUT=600,
+            BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        preview_sessions.shutdown()
+        self.addCleanup(preview_sessions.shutdown)
+
+    def _session(self, stem, last_active):
+        """Write a session's state and ports files; track it like a worker would."""
+        state_file = os.path.join(self.pid_dir, f'{stem}_browser.json')
+        self._write(state_file, last_active)
+        with open(os.path.join(self.pid_dir, f'{stem}_preview_ports.json'), 'w') as f:
+            json.dump({'frontend_port': 5200}, f)
+        preview_sessions.track(state_file, last_active)
+        return state_file
+
+    @staticmethod
+    def _write(state_file, last_active):
+        with open(state_file, 'w') as f:
+            json.dump({'cdp_port': 9400, 'pid': 1, 'last_active': last_active}, f)
+
+
+class IdleReapTests(PreviewSessionsTestCase):
+    def test_only_expired_sessions_are_reaped(self):
+        now = time.time()
+        idle = self._session('1_1', now - 700)
+        active = self._session('1_2', now - 10)
+
+        self.assertEqual(preview_sessions.reap_due(now), [idle])
+
+        self.assertFalse(os.path.exists(idle))
+        self.assertFalse(os.path.exists(os.path.join(self.pid_dir, '1_1_preview_ports.json')))
+        self.assertTrue(os.path.exists(active))
+        self.assertEqual(set(preview_sessions.tracked()), {active})
+
+    def test_session_touched_elsewhere_is_rescheduled(self):
+        now = time.time()
+        state_file = self._session('1_1', now - 700)
+        self._write(state_file, now - 5)  # another worker served it
+
+        self.assertEqual(preview_sessions.reap_due(now), [])
+
+        self.assertTrue(os.path.exists(state_file))
+        self.assertEqual(preview_sessions.tracked()[state_file], now - 5)
+        self.assertEqual(preview_sessions.reap_due(now + 600), [state_file])
+
+    def test_superseded_deadlines_are_skipped(self):
+        now = time.time()
+        state_file = self._session('1_1', now - 700)
+        self._write(state_file, now)
+        preview_sessions.track(state_file, now)  # touched by this worker
+
+        with mock.patch.object(preview_sessions, '_read_last_active') as read:
+            self.assertEqual(preview_sessions.reap_due(now), [])
+        read.assert_not_called()
+
+
+class MemoryPressureTests(PreviewSessionsTestCase):
+    def test_least_recently_used_sessions_go_first(self):
+        now = time.time()
+        newer = self._session('1_1', now - 300)
+        oldest = self._session('1_2', now - 500)
+        in_use = self._session('1_3', now - 5)
+        readings = iter([95, 95, 80])
+
+        with override_settings(BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT=90), \
+                mock.patch.object(preview_sessions, '_memory_percent', side_effect=lambda: next(readings)):
+            reaped = preview_sessions.relieve_memory_pressure(now)
+
+        self.assertEqual(reaped, [oldest, newer])
+        self.assertTrue(os.path.exists(in_use))
+
+    def test_sessions_in_use_are_spared(self):
+        in_use = self._session('1_1', time.time() - 5)
+
+        with override_settings(BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT=90), \
+                mock.patch.object(preview_sessions, '_memory_percent', return_value=99), \
+                self.assertLogs(preview_sessions.logger, 'WARNING'):
+            self.assertEqual(preview_sessions.relieve_memory_pressure(), [])
+
+        self.assertTrue(os.path.exists(in_use))
+
+
+class ReaperThreadTests(PreviewSessionsTestCase):
+    def test_reaper_wakes_for_an_earlier_deadline(self):
+        preview_sessions.ensure_reaper()
+        time.sleep(0.1)  # asleep until the pressure check, nothing to reap
+        state_file = self._session('1_1', time.time() - 599.8)
+
+        deadline = time.time() + 5
+        while os.path.exists(state_file) and time.time() < deadline:
+            time.sleep(0.05)
+
+        self.assertFalse(os.path.exists(state_file))
+
+
+class ReaperAtBootTests(SimpleTestCase):
+    def test_server_processes_are_recognized(self):
+        self.assertTrue(_serves_requests(['/usr/local/bin/gunicorn', 'imagi.asgi:application'], {}))
+        self.assertTrue(_serves_requests(['manage.py', 'runserver'], {'RUN_MAIN': 'true'}))
+        self.assertTrue(_serves_requests(['manage.py', 'runserver', '--noreload'], {}))
+        self.assertFalse(_serves_requests(['manage.py', 'runserver'], {}))  # the reloader
+        self.assertFalse(_serves_requests(['manage.py', 'migrate'], {}))
+        self.assertFalse(_serves_requests([], {}))
+
+    def test_ready_starts_the_reaper_in_server_processes(self):
+        config = apps.get_app_config('Build')
+        with mock.patch.object(preview_sessions, 'ensure_reaper') as ensure_reaper:
+            with mock.patch('apps.Imagi.Build.apps._serves_requests', return_value=True):
+                config.ready()
+                with override_settings(IMAGI_ROLE='web'):
+                    config.ready()
+            with mock.patch('apps.Imagi.Build.apps._serves_requests', return_value=False):
+                config.ready()
+
+        ensure_reaper.assert_called_once_with()
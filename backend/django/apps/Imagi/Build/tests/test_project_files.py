@@ -7,19 +7,22 @@ Covers:
   tool implementations keep ProjectFile rows in sync with disk
 - bulk sync: import_project_from_disk (backfill) and hydrate_project
   (materializing a working copy from the database)
+- mirror batching: a run's write-throughs coalesce into one flush
+- blob storage: content is deduplicated across projects and compressed
 - ensure_working_copy: production cold-start behaviour
 """
 
 import os
 import shutil
 import tempfile
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.test import TestCase, override_settings
 
 from apps.Imagi.ProjectManager.models import Project as PMProject
-from apps.Imagi.Build.models import ProjectFile
-from apps.Imagi.Build.services import project_files_service
+from apps.Imagi.Build.models import ProjectFile, ProjectFileBlob
+from apps.Imagi.Build.services import file_blobs, project_files_service
 from apps.Imagi.Build.services.create_file_service import CreateFileService
 from apps.Imagi.Build.services.delete_file_service import DeleteFileService
 from apps.Imagi.Build.services.directory_service import DirectoryService
@@ -165,6 +168,39 @@ class BulkSyncTests(ProjectFilesTestCase):
             ['backend/django/manage.py', 'frontend/vuejs/src/App.vue'],
         )
 
+    def test_import_writes_only_changed_files(self):
+        self._write_disk_file('frontend/vuejs/src/App.vue', '<template/>')
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v1\n')
+        self._write_disk_file('backend/django/manage.py', '# manage\n')
+        project_files_service.import_project_from_disk(self.project)
+
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v2\n')
+        os.remove(os.path.join(self.project_root, 'backend/django/manage.py'))
+        # Rewritten with identical content: a new mtime, but the same hash.
+        self._write_disk_file('frontend/vuejs/src/App.vue', '<template/>')
+        os.utime(os.path.join(self.project_root, 'frontend/vuejs/src/App.vue'), ns=(1, 1))
+
+        result = project_files_service.import_project_from_disk(self.project)
+
+        self.assertEqual(result, {
+            'synced': 2, 'created': 0, 'updated': 1, 'unchanged': 1, 'pruned': 1,
+        })
+        self.assertEqual(self._db_content('frontend/vuejs/src/main.ts'), 'v2\n')
+        row = ProjectFile.objects.get(project=self.project, path='frontend/vuejs/src/App.vue')
+        self.assertEqual(row.mtime_ns, 1)
+        self.assertEqual(row.content_hash, project_files_service.content_hash('<template/>'))
+
+    def test_unchanged_import_reads_nothing(self):
+        self._write_disk_file('frontend/vuejs/src/App.vue', '<template/>')
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v1\n')
+        project_files_service.import_project_from_disk(self.project)
+
+        with patch('builtins.open', side_effect=AssertionError('re-read from disk')), \
+                self.assertNumQueries(3):  # load rows + the transaction's savepoint pair
+            result = project_files_service.import_project_from_disk(self.project)
+
+        self.assertEqual(result['unchanged'], 2)
+
     def test_hydrate_project_materializes_files_from_db(self):
         ProjectFile.objects.create(
             project=self.project, path='frontend/vuejs/src/App.vue', content='<template/>'
@@ -179,6 +215,36 @@ class BulkSyncTests(ProjectFilesTestCase):
         with open(os.path.join(self.project_root, 'frontend/vuejs/src/App.vue')) as f:
             self.assertEqual(f.read(), '<template/>')
 
+    def test_hydrate_streams_chunks_and_fetches_only_needed_content(self):
+        for i in range(5):
+            project_files_service.record_file(
+                self.project, f'frontend/vuejs/src/c{i % 2}/F{i}.ts', content=f'export const f = {i}\n'
+            )
+        project_files_service.record_file(self.project, 'README.md', content='# present\n')
+        shutil.rmtree(self.project_root)
+        self._write_disk_file('README.md', '# present\n')
+
+        # 1 metadata query + 3 chunked content queries for the 5 missing files
+        with patch.object(project_files_service, 'HYDRATE_CHUNK_SIZE', 2), \
+                self.assertNumQueries(4):
+            result = project_files_service.hydrate_project(self.project)
+
+        self.assertEqual(result, {'written': 5, 'skipped': 1})
+        with open(os.path.join(self.project_root, 'frontend/vuejs/src/c0/F4.ts')) as f:
+            self.assertEqual(f.read(), 'export const f = 4\n')
+
+    def test_hydrate_overwrite_skips_identical_files(self):
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/App.vue', content='<template/>')
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/main.ts', content='db copy')
+        self._write_disk_file('frontend/vuejs/src/App.vue', '<template/>')
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'local edit')
+
+        result = project_files_service.hydrate_project(self.project, overwrite=True)
+
+        self.assertEqual(result, {'written': 1, 'skipped': 1})
+        with open(os.path.join(self.project_root, 'frontend/vuejs/src/main.ts')) as f:
+            self.assertEqual(f.read(), 'db copy')
+
     def test_hydrate_does_not_clobber_existing_files_without_overwrite(self):
         self._write_disk_file('frontend/vuejs/src/App.vue', 'local edit')
         ProjectFile.objects.create(
@@ -217,6 +283,154 @@ class BulkSyncTests(ProjectFilesTestCase):
             self.assertEqual(f.read(), 'on disk')
 
 
+class MirrorBatchTests(ProjectFilesTestCase):
+    """Per-run batching: write-throughs queue and coalesce, then reach the
+    database in one flush that re-reads disk (so flushing is idempotent)."""
+
+    def _edit(self, old, new):
+        edit_file_impl(self.project, 'frontend/vuejs/src/main.ts', old_string=old, new_string=new)
+
+    def test_repeated_edits_coalesce_into_one_flush(self):
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v0\n')
+
+        with project_files_service.mirror_batch(self.project):
+            with self.assertNumQueries(0):
+                self._edit('v0', 'v1')
+                self._edit('v1', 'v2')
+                self._edit('v2', 'v3')
+            self.assertIsNone(self._db_content('frontend/vuejs/src/main.ts'))
+
+        self.assertEqual(self._db_content('frontend/vuejs/src/main.ts'), 'v3\n')
+
+    def test_flush_follows_disk_for_writes_then_deletes(self):
+        ProjectFile.objects.create(project=self.project, path='frontend/vuejs/src/Old.vue', content='old')
+        self._write_disk_file('frontend/vuejs/src/apps/blog/index.ts', 'x')
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/apps/blog/index.ts')
+
+        with project_files_service.mirror_batch(self.project):
+            CreateFileService(project=self.project).create_file({
+                'name': 'frontend/vuejs/src/Temp.vue', 'content': '<template/>', 'type': 'vue',
+            })
+            DeleteFileService(project=self.project).delete_file('frontend/vuejs/src/Temp.vue')
+            project_files_service.remove_file(self.project, 'frontend/vuejs/src/Old.vue')
+            DirectoryService(project=self.project).delete_directory(
+                'frontend/vuejs/src/apps/blog', recursive=True
+            )
+            self._write_disk_file('frontend/vuejs/src/apps/blog/index.ts', 'back again')
+            project_files_service.record_file(self.project, 'frontend/vuejs/src/apps/blog/index.ts')
+
+        self.assertEqual(
+            [(row.path, row.content) for row in self.project.files.all()],
+            [('frontend/vuejs/src/apps/blog/index.ts', 'back again')],
+        )
+
+    def test_removed_directory_keeps_files_restored_outside_the_batch(self):
+        self._write_disk_file('frontend/vuejs/src/apps/blog/index.ts', 'x')
+        self._write_disk_file('frontend/vuejs/src/apps/blog/Post.vue', 'post')
+        project_files_service.import_project_from_disk(self.project)
+
+        with project_files_service.mirror_batch(self.project):
+            DirectoryService(project=self.project).delete_directory(
+                'frontend/vuejs/src/apps/blog', recursive=True
+            )
+            # Restored by a write the batch never sees (an import's row
+            # already matches disk, so nothing is queued for it).
+            self._write_disk_file('frontend/vuejs/src/apps/blog/index.ts', 'x')
+
+        self.assertEqual(
+            [row.path for row in self.project.files.all()],
+            ['frontend/vuejs/src/apps/blog/index.ts'],
+        )
+
+    def test_reads_see_pending_writes(self):
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v0\n')
+        with project_files_service.mirror_batch(self.project):
+            self._edit('v0', 'v1')
+            self.assertEqual(
+                project_files_service.get_db_content(self.project, 'frontend/vuejs/src/main.ts'),
+                'v1\n',
+            )
+
+    def test_interval_flush(self):
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v0\n')
+        with project_files_service.mirror_batch(self.project), \
+                patch.object(project_files_service, 'MIRROR_FLUSH_INTERVAL', 0):
+            self._edit('v0', 'v1')
+            self.assertEqual(self._db_content('frontend/vuejs/src/main.ts'), 'v1\n')
+
+    def test_failed_flush_requeues(self):
+        self._write_disk_file('frontend/vuejs/src/main.ts', 'v0\n')
+        project_files_service.open_mirror_batch(self.project.id, self.project_root)
+        self.addCleanup(project_files_service.close_mirror_batch, self.project.id)
+        self._edit('v0', 'v1')
+        batch = project_files_service._batches[self.project.id]
+
+        with patch.object(ProjectFile.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                batch.flush()
+
+        self.assertEqual(batch.flush(), {'upserted': 1, 'deleted': 0})
+        self.assertEqual(batch.flush(), {'upserted': 0, 'deleted': 0})
+        self.assertEqual(self._db_content('frontend/vuejs/src/main.ts'), 'v1\n')
+
+    def test_worktree_instance_is_not_batched(self):
+        with project_files_service.mirror_batch(self.project):
+            self.project._suppress_db_mirror = True
+            self.assertFalse(project_files_service.mirror_batched(self.project))
+            self.project._suppress_db_mirror = False
+            self.assertTrue(project_files_service.mirror_batched(self.project))
+        self.assertFalse(project_files_service.mirror_batched(self.project))
+
+
+class BlobStorageTests(ProjectFilesTestCase):
+    """Row content lives in shared, content-addressed blobs."""
+
+    def test_identical_content_is_stored_once(self):
+        other_root = tempfile.mkdtemp(prefix='project_files_')
+        self.addCleanup(lambda: shutil.rmtree(other_root, ignore_errors=True))
+        other = PMProject.objects.create(user=self.user, name="Other", project_path=other_root)
+        scaffold = 'export default { name: "App" }\n' * 40
+
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/App.ts', content=scaffold)
+        project_files_service.record_file(other, 'frontend/vuejs/src/App.ts', content=scaffold)
+
+        self.assertEqual(ProjectFileBlob.objects.count(), 1)
+        blob = ProjectFileBlob.objects.get()
+        self.assertEqual(blob.compression, 'zlib')
+        self.assertLess(len(bytes(blob.data)), len(scaffold))
+        self.assertEqual(project_files_service.get_db_content(other, 'frontend/vuejs/src/App.ts'), scaffold)
+        self.assertEqual(self._db_content('frontend/vuejs/src/App.ts'), scaffold)
+
+    @override_settings(PROJECT_FILE_BLOB_COMPRESSION='')
+    def test_uncompressed_blobs_hydrate(self):
+        content = 'x = 1\n' * 100
+        project_files_service.record_file(self.project, 'backend/django/app.py', content=content)
+        self.assertEqual(ProjectFileBlob.objects.get().compression, '')
+
+        project_files_service.hydrate_project(self.project)
+
+        with open(os.path.join(self.project_root, 'backend/django/app.py')) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_inline_rows_still_read_and_hydrate(self):
+        ProjectFile.objects.create(project=self.project, path='frontend/vuejs/src/Legacy.vue', content='inline')
+
+        self.assertEqual(
+            project_files_service.get_db_content(self.project, 'frontend/vuejs/src/Legacy.vue'), 'inline'
+        )
+        project_files_service.hydrate_project(self.project)
+        with open(os.path.join(self.project_root, 'frontend/vuejs/src/Legacy.vue')) as f:
+            self.assertEqual(f.read(), 'inline')
+
+    def test_orphaned_blobs_are_pruned(self):
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/main.ts', content='v1')
+        project_files_service.record_file(self.project, 'frontend/vuejs/src/main.ts', content='v2')
+        self.assertEqual(ProjectFileBlob.objects.count(), 2)
+
+        self.assertEqual(file_blobs.prune_orphans(), 1)
+        self.assertEqual(self._db_content('frontend/vuejs/src/main.ts'), 'v2')
+
+
 class ReadFallbackTests(ProjectFilesTestCase):
     def test_get_file_content_falls_back_to_db(self):
         ProjectFile.objects.create(
@@ -0,0 +1,271 @@
+"""
+Tests for the agent run queue (services.run_queue) and how runs and the
+busy guards use it.
+
+Covers:
+- waiting runs are admitted fair-share: the user with fewer runs going
+  first, whatever the enqueue order
+- host, per-user and per-model slots bound what is admitted; the rest wait
+  with a position and an ETA
+- a canonical-tree run is refused while another is live in the project;
+  task runs are not
+- a user's queue is bounded (QueueFull)
+- a lease that misses its heartbeats is reclaimed, and its conversation's
+  leftover run_started_at no longer counts as running
+- a queued agent run logs its place in line, starts when a slot frees and
+  releases its lease at 'done', before any trailing event
+- a run whose lease is reclaimed mid-run is stopped with run_lost
+"""
+
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.Imagi.Build.api.views import _conversation_is_running, _project_has_running_conversation
+from apps.Imagi.Build.models import AgentConversation
+from apps.Imagi.Build.services import agent_runs, run_queue
+
+
+class RunQueueTestCase(SimpleTestCase):
+    limits = {}
+
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix='run_queue_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(
+            AGENT_RUN_LOG_ROOT=root,
+            AGENT_RUN_MAX_CONCURRENT=self.limits.get('host', 8),
+            AGENT_RUN_MAX_CONCURRENT_PER_USER=self.limits.get('user', 3),
+            AGENT_RUN_MAX_CONCURRENT_PER_MODEL=self.limits.get('model', {}),
+            AGENT_RUN_MAX_QUEUED_PER_USER=self.limits.get('queued', 10),
+            AGENT_RUN_LEASE_TTL=60,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def _enqueue(run_id, user_id, project_id=1, kind='task', model='m', conversation_id=None):
+        run_queue.enqueue(
+            run_id, user_id=user_id, project_id=project_id,
+            conversation_id=conversation_id, kind=kind, model=model,
+        )
+
+
+class FairShareTests(RunQueueTestCase):
+    limits = {'host': 2}
+
+    def test_user_with_fewer_runs_going_is_admitted_first(self):
+        self._enqueue('a1', user_id=1)
+        self.assertTrue(run_queue.poll('a1')['admitted'])
+        self._enqueue('a2', user_id=1)
+        self._enqueue('a3', user_id=1)
+        self._enqueue('b1', user_id=2)
+
+        self.assertFalse(run_queue.poll('a2')['admitted'])  # b1 took the last slot
+        self.assertTrue(run_queue.poll('b1')['admitted'])
+        status = run_queue.poll('a3')
+        self.assertEqual((status['admitted'], status['position']), (False, 1))
+        self.assertEqual(run_queue.poll('a2')['position'], 0)
+
+        run_queue.release('b1')
+        self.assertTrue(run_queue.poll('a2')['admitted'])
+
+    def test_eta_grows_with_the_position(self):
+        for n in range(4):
+            self._enqueue(f'r{n}', user_id=n)
+            run_queue.poll(f'r{n}')
+
+        self.assertEqual(run_queue.poll('r2')['eta_seconds'], run_queue.DEFAULT_RUN_SECONDS)
+        self.assertEqual(run_queue.poll('r3')['eta_seconds'], run_queue.DEFAULT_RUN_SECONDS)
+
+
+class SlotLimitTests(RunQueueTestCase):
+    limits = {'user': 1, 'model': {'big': 1}, 'queued': 2}
+
+    def test_per_user_and_per_model_slots(self):
+        self._enqueue('a1', user_id=1)
+        self._enqueue('a2', user_id=1)
+        self._enqueue('b1', user_id=2, model='big')
+        self._enqueue('c1', user_id=3, model='big')
+
+        admitted = {run_id for run_id in ('a1', 'a2', 'b1', 'c1') if run_queue.poll(run_id)['admitted']}
+
+        self.assertEqual(admitted, {'a1', 'b1'})
+
+    def test_a_users_queue_is_bounded(self):
+        self._enqueue('a1', user_id=1)
+        self._enqueue('a2', user_id=1)
+
+        with self.assertRaises(run_queue.QueueFull):
+            self._enqueue('a3', user_id=1)
+        self._enqueue('b1', user_id=2)
+
+
+class BusyTests(RunQueueTestCase):
+    def test_one_canonical_tree_run_per_project(self):
+        self._enqueue('lead', user_id=1, kind='lead', conversation_id=5)
+
+        with self.assertRaises(run_queue.Busy):
+            self._enqueue('chat', user_id=1, kind='chat')
+        self._enqueue('other', user_id=1, project_id=2, kind='chat')
+        self._enqueue('task', user_id=1, kind='task', conversation_id=6)
+        with self.assertRaises(run_queue.Busy):
+            self._enqueue('task-again', user_id=1, kind='task', conversation_id=6)
+
+        self.assertTrue(run_queue.project_busy(1, 1))
+        run_queue.release('lead')
+        self.assertFalse(run_queue.project_busy(1, 1))
+
+
+class LeaseExpiryTests(RunQueueTestCase, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='queue', password='pw123456')
+
+    def test_silent_lease_is_reclaimed_and_its_marker_ignored(self):
+        conversation = AgentConversation.objects.create(
+            user=self.user, project_id=1, kind='chat', run_started_at=timezone.now(),
+        )
+        self._enqueue('dead', user_id=self.user.id, kind='chat', conversation_id=conversation.id)
+        self.assertTrue(run_queue.poll('dead')['admitted'])
+        self.assertTrue(_conversation_is_running(conversation))
+
+        with run_queue._registry() as data:
+            data['leases']['dead']['heartbeat'] = time.time() - 120
+
+        self.assertFalse(_conversation_is_running(conversation))
+        self.assertFalse(_project_has_running_conversation(self.user, 1))
+        self._enqueue('next', user_id=self.user.id, kind='chat')  # not busy
+        self.assertFalse(run_queue.heartbeat('dead'))
+
+        # A marker set after the loss is a new run outside the queue.
+        conversation.run_started_at = timezone.now() + timedelta(seconds=1)
+        self.assertTrue(_conversation_is_running(conversation))
+
+
+async def _events(*events):
+    for event in events:
+        yield event
+
+
+class QueuedRunTests(RunQueueTestCase):
+    limits = {'host': 1}
+
+    def test_queued_run_waits_for_a_slot_then_releases_it(self):
+        self._enqueue('holder', user_id=1)
+        self.assertTrue(run_queue.poll('holder')['admitted'])
+
+        run_id = agent_runs.start(2, _events(
+            {'type': 'start', 'conversation_id': 7},
+            {'type': 'done', 'success': True},
+        ), admission={'project_id': 3, 'kind': 'chat', 'model': 'm'})
+
+        log_path = agent_runs._log_path(run_id)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with open(log_path) as fh:
+                if '"queued"' in fh.read():
+                    break
+            time.sleep(0.05)
+        run_queue.release('holder')
+
+        async def collect():
+            return [event async for _id, event in agent_runs.tail(run_id)]
+
+        events = async_to_sync(collect)()
+        self.assertEqual(
+            [event['type'] for event in events], ['run', 'queued', 'start', 'done']
+        )
+        self.assertEqual(events[1]['position'], 0)
+        self.assertIsNone(run_queue.conversation_lease(7))  # released, not lost
+        self.assertFalse(run_queue.project_busy(2, 3))
+
+
+    def test_slot_is_released_at_done(self):
+        titled = threading.Event()
+        self.addCleanup(titled.set)
+
+        async def title_after_done():
+            yield {'type': 'start', 'conversation_id': 9}
+            yield {'type': 'done', 'success': True}
+            await asyncio.to_thread(titled.wait, 5)
+            yield {'type': 'title', 'title': 'Later'}
+
+        run_id = agent_runs.start(2, title_after_done(), admission={
+            'project_id': 3, 'kind': 'chat', 'model': 'm',
+        })
+        log_path = agent_runs._log_path(run_id)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with open(log_path) as fh:
+                if '"done"' in fh.read():
+                    break
+            time.sleep(0.02)
+        while run_queue.project_busy(2, 3) and time.time() < deadline:
+            time.sleep(0.02)
+
+        self.assertFalse(run_queue.project_busy(2, 3))
+        with open(log_path) as fh:
+            self.assertNotIn('"title"', fh.read())
+
+
+    def test_run_whose_lease_is_reclaimed_is_stopped(self):
+        unwound = threading.Event()
+
+        async def endless():
+            yield {'type': 'start', 'conversation_id': 11}
+            try:
+                await asyncio.sleep(60)
+                yield {'type': 'done', 'success': True}
+            finally:
+                unwound.set()
+
+        with mock.patch.object(run_queue, 'HEARTBEAT_INTERVAL', 0.05):
+            run_id = agent_runs.start(2, endless(), admission={
+                'project_id': 3, 'kind': 'chat', 'model': 'm',
+            })
+            deadline = time.time() + 5
+            while run_queue.conversation_lease(11) != {'state': 'running'} and time.time() < deadline:
+                time.sleep(0.02)
+            # Reclaimed as if its heartbeats had stalled past the TTL.
+            with run_queue._registry() as data:
+                del data['leases'][run_id]
+
+            async def collect():
+                return [event async for _id, event in agent_runs.tail(run_id)]
+
+            events = async_to_sync(collect)()
+
+        self.assertEqual(events[-1]['code'], 'run_lost')
+        self.assertTrue(unwound.is_set())
+
+
+class QueuedRunCancelTests(RunQueueTestCase):
+    limits = {'host': 0}
+
+    def test_cancelling_a_waiting_run_gives_up_its_place(self):
+        run_id = agent_runs.start(1, _events({'type': 'done'}), admission={
+            'project_id': 1, 'conversation_id': 8, 'kind': 'task', 'model': 'm',
+        })
+        deadline = time.time() + 5
+        while run_queue.conversation_lease(8) is None and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(run_queue.conversation_lease(8), {'state': 'waiting'})
+
+        self.assertTrue(agent_runs.cancel_conversation(8))
+
+        async def collect():
+            return [event async for _id, event in agent_runs.tail(run_id)]
+
+        events = async_to_sync(collect)()
+        self.assertEqual(events[-1]['code'], 'cancelled')
+        self.assertIsNone(run_queue.conversation_lease(8))
@@ -0,0 +1,101 @@
+"""
+Tests for grep_files' literal prefilter (services.search_index).
+
+Covers:
+- query planning: the literals a pattern's every match must contain
+- the prefilter never changes results, only how many files are scanned
+- postings stay exact as files are edited through the write paths
+- the ReDoS guard still runs ahead of any planning
+"""
+
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from apps.Imagi.Build.services import file_index
+from apps.Imagi.Build.services.search_index import plan_query, text_may_match
+from apps.Imagi.Build.services.tools import grep_impl
+from apps.Imagi.Build.services.view_file_service import ViewFileService
+
+
+class PlanQueryTests(SimpleTestCase):
+    def test_plain_literal(self):
+        self.assertEqual(plan_query('createRouter'), [['createRouter']])
+
+    def test_literals_around_classes(self):
+        self.assertEqual(plan_query(r'class\s+\w+View'), [['class', 'View']])
+
+    def test_top_level_alternation(self):
+        plan = plan_query('useAuthStore|usePaymentStore')
+        self.assertTrue(text_may_match('const s = usePaymentStore()', plan))
+        self.assertFalse(text_may_match('const s = useCartStore()', plan))
+
+    def test_nested_alternation_multiplies_out(self):
+        plan = plan_query('use(Auth|Payment)Store')
+        self.assertEqual(len(plan), 2)
+        self.assertTrue(text_may_match('useAuthStore', plan))
+        self.assertFalse(text_may_match('useCartStore', plan))
+
+    def test_optional_parts_are_not_required(self):
+        self.assertEqual(plan_query('colou?r'), [['colo', 'r']])
+
+    def test_unplannable_patterns(self):
+        self.assertIsNone(plan_query('.'))
+        self.assertIsNone(plan_query(r'\w+'))
+        self.assertIsNone(plan_query('(?i)router'))
+        self.assertIsNone(plan_query('router|.*'))
+
+
+class PrefilteredGrepTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='search_index_')
+        self.addCleanup(lambda: shutil.rmtree(self.root, ignore_errors=True))
+        self.addCleanup(file_index.discard, self.root)
+        self.project = SimpleNamespace(id=1, project_path=self.root, _suppress_db_mirror=True)
+        for i in range(20):
+            self._write(f'frontend/vuejs/src/components/Widget{i}.vue', '<template><div/></template>\n')
+        self._write('frontend/vuejs/src/router/index.ts', "import { createRouter } from 'vue-router'\n")
+        self._write('backend/django/apps/home/views.py', 'class HomeView(APIView):\n    pass\n')
+
+    def _write(self, rel_path, content):
+        full = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_warm_search_scans_only_candidate_files(self):
+        cold = grep_impl(self.project, r'class\s+\w+View')
+        warm = grep_impl(self.project, r'class\s+\w+View')
+
+        self.assertEqual(cold['matches'], warm['matches'])
+        self.assertEqual(warm['match_count'], 1)
+        self.assertEqual(warm['files_scanned'], 1)
+
+    def test_unplannable_pattern_scans_everything(self):
+        grep_impl(self.project, 'x')
+        result = grep_impl(self.project, r'\w+', max_results=1000)
+        self.assertEqual(result['files_scanned'], 22)
+
+    def test_postings_follow_edits(self):
+        grep_impl(self.project, 'createRouter')
+        ViewFileService(project=self.project).update_file(
+            'frontend/vuejs/src/components/Widget3.vue',
+            "<script>import { createRouter } from 'vue-router'</script>\n",
+        )
+        ViewFileService(project=self.project).update_file(
+            'frontend/vuejs/src/router/index.ts', 'export default []\n'
+        )
+
+        result = grep_impl(self.project, 'createRouter')
+
+        self.assertEqual(
+            [m['file'] for m in result['matches']],
+            ['frontend/vuejs/src/components/Widget3.vue'],
+        )
+
+    def test_redos_guard_runs_first(self):
+        with self.assertRaises(ValueError):
+            grep_impl(self.project, '(a+)+$')
@@ -0,0 +1,209 @@
+"""
+Tests for the shared preview browser (services.shared_browser) and the
+browser preview sessions that live in it, with the browser's DevTools
+endpoint faked.
+
+Covers:
+- each project opens its own context and page in the one browser
+- over the memory budget, the least recently active idle contexts are closed
+- previews in use are never evicted, even over budget
+- a relaunched browser forgets the contexts that died with the old one
+- the registry stays readable while the browser launches
+- a shared session drives only its own page target
+- stopping a shared session closes its context, never the browser
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.Imagi.Build.services import browser_preview_service as bps
+from apps.Imagi.Build.services import shared_browser
+from apps.Imagi.Build.services.browser_preview_service import BrowserNotRunning, BrowserPreviewService
+
+MB = 1024 * 1024
+
+
+class FakeBrowserTarget:
+    """The browser-level DevTools target: contexts and pages."""
+
+    def __init__(self):
+        self.contexts = set()
+        self.calls = []
+        self._next = 0
+
+    def call(self, method, params=None):
+        params = params or {}
+        self.calls.append((method, params))
+        self._next += 1
+        if method == 'Target.createBrowserContext':
+            context_id = f'ctx-{self._next}'
+            self.contexts.add(context_id)
+            return {'browserContextId': context_id}
+        if method == 'Target.createTarget':
+            return {'targetId': f"page-of-{params['browserContextId']}"}
+        if method == 'Target.disposeBrowserContext':
+            self.contexts.discard(params['browserContextId'])
+        return {}
+
+
+class SharedBrowserTestCase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='shared_browser_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(
+            PROJECTS_ROOT=self.root,
+            BROWSER_PREVIEW_SHARED=True,
+            BROWSER_PREVIEW_MEMORY_BUDGET_MB=1000,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.target = FakeBrowserTarget()
+        self.launches = 0
+        self.alive = True
+        self.rss = 100 * MB
+
+        def launch(executable):
+            self.launches += 1
+            self.alive = True
+            return {'pid': 4000 + self.launches, 'started': None, 'cdp_port': 9400}
+
+        def session(port):
+            return mock.MagicMock(__enter__=lambda _self: self.target.call, __exit__=lambda *a: False)
+
+        for name, fake in (
+            ('_launch', launch),
+            ('_alive', lambda browser: bool(browser) and self.alive),
+            ('_browser_session', session),
+            ('_rss', lambda pid: self.rss),
+        ):
+            patcher = mock.patch.object(shared_browser, name, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The fake browser's PIDs are made up: never signal whatever owns them.
+        patcher = mock.patch.object(shared_browser.port_leases, '_process_alive', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _state_file(self, owner, last_active):
+        path = os.path.join(self.root, f'{owner}_browser_state.json')
+        with open(path, 'w') as f:
+            json.dump({'last_active': last_active}, f)
+        return path
+
+    def _open(self, owner, last_active=None):
+        state_file = self._state_file(owner, time.time() if last_active is None else last_active)
+        return shared_browser.open_context(owner, 'http://127.0.0.1:5174/', state_file, 'chromium')
+
+
+class SharedBrowserTests(SharedBrowserTestCase):
+    def test_each_project_gets_its_own_context_and_page(self):
+        first = self._open('1_1')
+        second = self._open('1_2')
+
+        self.assertEqual(self.launches, 1)
+        self.assertEqual((first['pid'], first['cdp_port']), (second['pid'], second['cdp_port']))
+        self.assertNotEqual(first['context_id'], second['context_id'])
+        self.assertEqual(first['target_id'], f"page-of-{first['context_id']}")
+        self.assertEqual(
+            self.target.calls[1],
+            ('Target.createTarget', {
+                'url': 'http://127.0.0.1:5174/', 'browserContextId': first['context_id'],
+            }),
+        )
+        self.assertEqual(set(shared_browser.contexts()), {first['context_id'], second['context_id']})
+
+    def test_least_recently_active_idle_contexts_are_evicted_over_budget(self):
+        now = time.time()
+        oldest = self._open('1_1', last_active=now - 3600)
+        older = self._open('1_2', last_active=now - 600)
+        recent = self._open('1_3', last_active=now - 300)
+        self.rss = 1000 * MB  # three contexts at ~333 MB each: full
+
+        newest = self._open('1_4')
+
+        open_now = set(shared_browser.contexts())
+        self.assertEqual(open_now, {older['context_id'], recent['context_id'], newest['context_id']})
+        self.assertNotIn(oldest['context_id'], self.target.contexts)
+        # The evicted project's session state is gone, so it reads as stopped.
+        self.assertFalse(os.path.exists(os.path.join(self.root, '1_1_browser_state.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.root, '1_2_browser_state.json')))
+
+    def test_previews_in_use_are_not_evicted(self):
+        self._open('1_1')
+        self._open('1_2')
+        self.rss = 5000 * MB
+
+        with self.assertLogs(shared_browser.logger, 'WARNING'):
+            self._open('1_3')
+
+        self.assertEqual(len(shared_browser.contexts()), 3)
+
+    def test_relaunched_browser_forgets_dead_contexts(self):
+        self._open('1_1')
+        self.alive = False
+
+        session = self._open('1_2')
+
+        self.assertEqual(self.launches, 2)
+        self.assertEqual(set(shared_browser.contexts()), {session['context_id']})
+        self.assertFalse(os.path.exists(os.path.join(self.root, '1_1_browser_state.json')))
+
+
+    def test_registry_is_not_locked_while_launching(self):
+        seen = []
+
+        def slow_launch(executable):
+            reader = threading.Thread(target=lambda: seen.append(shared_browser.has_context('x')))
+            reader.start()
+            reader.join(timeout=2)
+            seen.append(reader.is_alive())
+            return {'pid': 4100, 'started': None, 'cdp_port': 9400}
+
+        shared_browser._launch.side_effect = slow_launch
+        self._open('1_1')
+
+        self.assertEqual(seen, [False, False])  # answered, and not left waiting
+
+
+class SharedPreviewSessionTests(SharedBrowserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = BrowserPreviewService(
+            SimpleNamespace(id=5, name='Blog', user=SimpleNamespace(id=1))
+        )
+
+    def test_session_drives_only_its_own_page(self):
+        session = self._open('1_5')
+        state = {**session, 'app_url': 'http://127.0.0.1:5174'}
+        targets = [
+            {'id': 'page-of-someone-else', 'type': 'page', 'url': 'http://127.0.0.1:5175/'},
+            {'id': session['target_id'], 'type': 'page', 'url': 'http://127.0.0.1:5174/'},
+        ]
+        listing = mock.Mock(json=mock.Mock(return_value=targets))
+        with mock.patch.object(bps.requests, 'get', return_value=listing):
+            self.assertEqual(bps._resolve_page_target(9400, state)['id'], session['target_id'])
+            with self.assertRaises(BrowserNotRunning):
+                bps._resolve_page_target(9400, {**state, 'target_id': 'page-closed'})
+        self.assertNotEqual(bps._pool_key(state), bps._pool_key({**state, 'target_id': 'other'}))
+
+    def test_stop_closes_the_context_not_the_browser(self):
+        session = self._open('1_5')
+        self.service._save_state({**session, 'last_active': time.time()})
+        kill_by_port = mock.patch.object(self.service.servers, '_kill_by_port').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.service._kill_browser()
+
+        kill_by_port.assert_not_called()
+        self.assertNotIn(session['context_id'], self.target.contexts)
+        self.assertEqual(shared_browser.contexts(), {})
+        self.assertIsNone(self.service._load_state())
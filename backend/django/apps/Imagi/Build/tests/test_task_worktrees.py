@@ -5,18 +5,26 @@ Covers the worktree lifecycle at the service level (create/merge/remove,
 conflict handling) against real throwaway git repos, the kind-scoped busy
 guards (tasks run in parallel with the lead; canonical-tree runs stay
 serialized), the single-lead invariant, review-status transitions, and the
-accept/dismiss review endpoints.
+accept/dismiss review endpoints, and how worktrees are materialized
+(outside the canonical lock, reflinked where the filesystem allows, once
+per worktree and resumed if interrupted) and pruned when leaked.
 """
 
+import errno
+import fcntl
 import os
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
+from io import StringIO
 
 from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.db import IntegrityError, transaction
-from django.test import SimpleTestCase, TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
@@ -29,6 +37,7 @@ from apps.Imagi.Build.models import (
     AgentMessage,
     ProjectFile,
 )
+from apps.Imagi.Build.services import task_worktrees
 from apps.Imagi.Build.services.base_agent import AgentContext, ImagiAgentService
 from apps.Imagi.Build.services.tools import (
     DISPATCH_GOAL_MAX_CHARS,
@@ -163,6 +172,62 @@ class WorktreeServiceTests(GitRepoTestMixin, SimpleTestCase):
         with open(os.path.join(self.repo, 'app.txt')) as f:
             self.assertEqual(f.read(), 'canonical edit')
 
+    def test_merge_commit_is_built_without_the_working_tree(self):
+        worktree = self.service.create_task_worktree(self.repo, 7)['worktree_path']
+        canonical = self._write_commit(self.repo, 'other.txt', 'canonical', 'canonical change')
+        with open(os.path.join(worktree, 'feature.txt'), 'w') as f:
+            f.write('task output')
+
+        with patch('apps.Imagi.Build.services.version_control_service.subprocess.run',
+                   wraps=subprocess.run) as run:
+            result = self.service.merge_task_worktree(self.repo, 7)
+
+        self.assertTrue(result['success'])
+        commands = [call.args[0][1] for call in run.call_args_list]
+        self.assertIn('merge-tree', commands)
+        self.assertNotIn('merge', commands)
+        parents = _git(self.repo, 'rev-list', '--parents', '-n', '1', 'HEAD').stdout.split()
+        self.assertEqual(parents[0], result['commit_hash'])
+        self.assertEqual(parents[1], canonical)
+        self.assertEqual(_git(self.repo, 'status', '--porcelain').stdout, '')
+        with open(os.path.join(self.repo, 'feature.txt')) as f:
+            self.assertEqual(f.read(), 'task output')
+
+    def test_merge_recomputed_when_canonical_moves_meanwhile(self):
+        worktree = self.service.create_task_worktree(self.repo, 7)['worktree_path']
+        with open(os.path.join(worktree, 'feature.txt'), 'w') as f:
+            f.write('task output')
+        compute = VersionControlService._merge_in_memory
+        landed = []
+
+        def merge_racing_another(service, project_path, conversation_id, ours):
+            result = compute(service, project_path, conversation_id, ours)
+            if not landed:  # another merge lands before this one takes the lock
+                landed.append(self._write_commit(self.repo, 'other.txt', 'x', 'other merge'))
+            return result
+
+        with patch.object(VersionControlService, '_merge_in_memory', merge_racing_another):
+            result = self.service.merge_task_worktree(self.repo, 7)
+
+        self.assertTrue(result['success'])
+        history = _git(self.repo, 'rev-list', 'HEAD').stdout.split()
+        self.assertIn(landed[0], history)
+        for name in ('feature.txt', 'other.txt'):
+            self.assertTrue(os.path.exists(os.path.join(self.repo, name)))
+
+    def test_merge_in_the_working_tree_on_older_git(self):
+        worktree = self.service.create_task_worktree(self.repo, 7)['worktree_path']
+        self._write_commit(self.repo, 'other.txt', 'canonical', 'canonical change')
+        with open(os.path.join(worktree, 'feature.txt'), 'w') as f:
+            f.write('task output')
+
+        with patch('apps.Imagi.Build.services.version_control_service._merge_tree_supported',
+                   return_value=False):
+            result = self.service.merge_task_worktree(self.repo, 7)
+
+        self.assertTrue(result['success'])
+        self.assertTrue(os.path.exists(os.path.join(self.repo, 'feature.txt')))
+
     def test_merge_without_worktree_fails_cleanly(self):
         result = self.service.merge_task_worktree(self.repo, 99)
         self.assertFalse(result['success'])
@@ -245,6 +310,201 @@ class WorktreeServiceTests(GitRepoTestMixin, SimpleTestCase):
         self.assertTrue(os.path.isfile(git_pointer))
 
 
+class CopyOnWriteWorktreeTests(GitRepoTestMixin, SimpleTestCase):
+    """Worktrees are added under the lock and filled in outside it."""
+
+    def setUp(self):
+        self.repo = self._make_repo()
+        self.service = VersionControlService()
+        task_worktrees._reflink_devices.clear()
+        self.addCleanup(task_worktrees._reflink_devices.clear)
+
+    @staticmethod
+    def _fake_clone(src, dst, mode):
+        shutil.copyfile(src, dst)
+        os.chmod(dst, mode & 0o755)
+
+    def test_canonical_lock_is_released_before_files_are_filled_in(self):
+        materialize = task_worktrees.materialize
+        lock_free = []
+
+        def probe_lock(project_path, worktree_path):
+            fd = os.open(project_path, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                lock_free.append(True)
+            finally:
+                os.close(fd)
+            return materialize(project_path, worktree_path)
+
+        with patch.object(task_worktrees, 'materialize', side_effect=probe_lock):
+            result = self.service.create_task_worktree(self.repo, 7)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(lock_free, [True])
+        stats = result['stats']
+        for key in ('mode', 'files', 'written_bytes', 'lock_ms', 'create_ms'):
+            self.assertIn(key, stats)
+        self.assertEqual(stats['files'], 1)
+
+    def test_reflinked_files_are_checked_against_the_task_commit(self):
+        self._write_commit(self.repo, 'other.txt', 'unchanged', 'second file')
+        with open(os.path.join(self.repo, 'app.txt'), 'w') as f:
+            f.write('half-written lead edit')
+
+        with patch.object(task_worktrees, '_clone_file', side_effect=self._fake_clone):
+            result = self.service.create_task_worktree(self.repo, 7, snapshot_pending=False)
+
+        worktree = result['worktree_path']
+        self.assertEqual(result['stats']['mode'], 'reflink')
+        # The dirty canonical file was replaced with the committed one.
+        self.assertEqual(result['stats']['cloned'], 1)
+        self.assertEqual(result['stats']['written_bytes'], len('hello'))
+        with open(os.path.join(worktree, 'app.txt')) as f:
+            self.assertEqual(f.read(), 'hello')
+        self.assertEqual(_git(worktree, 'status', '--porcelain').stdout, '')
+
+    def test_filesystem_without_reflink_falls_back_to_checkout(self):
+        unsupported = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+        with patch.object(task_worktrees, '_clone_file', side_effect=unsupported) as clone:
+            first = self.service.create_task_worktree(self.repo, 7)
+            second = self.service.create_task_worktree(self.repo, 8)
+
+        self.assertEqual(first['stats']['mode'], 'checkout')
+        self.assertEqual(second['stats']['mode'], 'checkout')
+        self.assertEqual(clone.call_count, 1)  # remembered for the filesystem
+        with open(os.path.join(second['worktree_path'], 'app.txt')) as f:
+            self.assertEqual(f.read(), 'hello')
+
+    def test_node_modules_links_to_the_canonical_store(self):
+        store = tempfile.mkdtemp(prefix='dep_store_')
+        self.addCleanup(shutil.rmtree, store, ignore_errors=True)
+        frontend = os.path.join(self.repo, 'frontend', 'vuejs')
+        os.makedirs(frontend)
+        self._write_commit(self.repo, os.path.join('frontend', 'vuejs', 'package.json'), '{}', 'frontend')
+        os.symlink(store, os.path.join(frontend, 'node_modules'))
+
+        worktree = self.service.create_task_worktree(self.repo, 7, snapshot_pending=False)['worktree_path']
+
+        link = os.path.join(worktree, 'frontend', 'vuejs', 'node_modules')
+        self.assertEqual(os.readlink(link), store)
+        # Never committed by the task.
+        self.assertEqual(_git(worktree, 'status', '--porcelain').stdout, '')
+
+    def test_worktree_left_unfilled_is_filled_in_on_reuse(self):
+        worktree = task_worktree_path(self.repo, 7)
+        _git(self.repo, 'worktree', 'add', '--no-checkout', '-b', task_branch(7), worktree)
+
+        result = self.service.create_task_worktree(self.repo, 7)
+
+        self.assertEqual(result['message'], 'Task worktree created')
+        with open(os.path.join(worktree, 'app.txt')) as f:
+            self.assertEqual(f.read(), 'hello')
+
+    def test_worktree_interrupted_after_its_index_is_filled_in_on_reuse(self):
+        fill_in = task_worktrees._checkout_mismatches
+
+        def die_after_the_index(worktree_path):
+            raise KeyboardInterrupt  # the process dying, not a handled error
+
+        with patch.object(task_worktrees, '_clone_file', side_effect=self._fake_clone), \
+                patch.object(task_worktrees, '_checkout_mismatches', side_effect=die_after_the_index):
+            with self.assertRaises(KeyboardInterrupt):
+                self.service.create_task_worktree(self.repo, 7)
+        worktree = task_worktree_path(self.repo, 7)
+        self.assertTrue(task_worktrees.needs_materialize(worktree))
+
+        with patch.object(task_worktrees, '_checkout_mismatches', side_effect=fill_in):
+            result = self.service.create_task_worktree(self.repo, 7)
+
+        self.assertEqual(result['message'], 'Task worktree created')
+        self.assertFalse(task_worktrees.needs_materialize(worktree))
+
+    def test_concurrent_dispatches_of_one_task_fill_it_in_once(self):
+        materialize = task_worktrees.materialize
+        filling = threading.Event()
+        release = threading.Event()
+
+        def slow_materialize(project_path, worktree_path):
+            filling.set()
+            release.wait(5)
+            return materialize(project_path, worktree_path)
+
+        results = []
+        with patch.object(task_worktrees, 'materialize', side_effect=slow_materialize) as fill:
+            first = threading.Thread(
+                target=lambda: results.append(self.service.create_task_worktree(self.repo, 7))
+            )
+            first.start()
+            self.assertTrue(filling.wait(5))
+            second = threading.Thread(
+                target=lambda: results.append(self.service.create_task_worktree(self.repo, 7))
+            )
+            second.start()
+            time.sleep(0.2)
+            release.set()
+            first.join(5)
+            second.join(5)
+
+        self.assertEqual(fill.call_count, 1)
+        self.assertEqual(
+            sorted(result['message'] for result in results),
+            ['Task worktree already exists', 'Task worktree created'],
+        )
+
+    def test_remove_deletes_the_worktree_lock_file(self):
+        worktree = self.service.create_task_worktree(self.repo, 7)['worktree_path']
+        self.assertTrue(os.path.exists(worktree + task_worktrees.LOCK_SUFFIX))
+
+        self.service.remove_task_worktree(self.repo, 7)
+
+        self.assertFalse(os.path.exists(worktree + task_worktrees.LOCK_SUFFIX))
+
+
+class PruneTaskWorktreesTests(GitRepoTestMixin, TestCase):
+    """The prune_task_worktrees command deletes only unowned, old worktrees."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='prune', password='pw123456')
+        root = tempfile.mkdtemp(prefix='prune_wt_')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(PROJECTS_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.repo = os.path.join(root, str(self.user.id), 'proj')
+        os.makedirs(self.repo)
+        _git(self.repo, 'init')
+        _git(self.repo, 'config', 'user.email', 't@t.co')
+        _git(self.repo, 'config', 'user.name', 'T')
+        self._write_commit(self.repo, 'app.txt', 'hello', 'initial')
+        self.service = VersionControlService()
+
+    def test_only_unowned_worktrees_are_pruned(self):
+        owner = AgentConversation.objects.create(user=self.user, kind='task')
+        owned = self.service.create_task_worktree(self.repo, owner.id)['worktree_path']
+        owner.worktree_path = owned
+        owner.save(update_fields=['worktree_path'])
+        leaked = self.service.create_task_worktree(self.repo, owner.id + 1)['worktree_path']
+        fresh = self.service.create_task_worktree(self.repo, owner.id + 2)['worktree_path']
+        old = time.time() - 2 * 3600
+        for path in (owned, leaked):
+            os.utime(path, (old, old))
+
+        out = StringIO()
+        call_command('prune_task_worktrees', stdout=out)
+
+        self.assertTrue(os.path.isdir(owned))
+        self.assertFalse(os.path.exists(leaked))
+        self.assertTrue(os.path.isdir(fresh))  # may not be recorded yet
+        self.assertIn('Pruned 1 leaked task worktrees', out.getvalue())
+        branch_check = _git(
+            self.repo, 'rev-parse', '--verify', f'refs/heads/{task_branch(owner.id + 1)}',
+            check=False,
+        )
+        self.assertNotEqual(branch_check.returncode, 0)
+
+
 class BusyGuardMatrixTests(TestCase):
     """Kind-scoped busy guards: tasks run in parallel, canonical runs don't."""
 
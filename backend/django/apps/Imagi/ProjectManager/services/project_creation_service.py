@@ -233,6 +233,10 @@ class ProjectCreationService:
                 from apps.Imagi.Build.services.frontend_dependencies import link_frontend_dependencies
                 if link_frontend_dependencies(frontend_path):
                     logger.info(f"Background: linked shared frontend dependencies for {frontend_path}")
+                    # The first preview usually follows creation: have warm
+                    # runtimes booting for it by then.
+                    from apps.Imagi.Build.services import preview_pool
+                    preview_pool.warm()
                     return
 
                 logger.info(f"Background: shared store unavailable, installing npm dependencies in: {frontend_path}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payments', '0004_meter_usage_in_dollars'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usageevent',
+            name='cached_input_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -164,6 +164,8 @@ class UsageEvent(models.Model):
     input_tokens = models.BigIntegerField(default=0)
     output_tokens = models.BigIntegerField(default=0)
     total_tokens = models.BigIntegerField(default=0)
+    # How many of input_tokens the provider served from its prompt cache.
+    cached_input_tokens = models.BigIntegerField(default=0)
     # What this run drew from the plan allowance. 6 decimal places because a
     # short run on the cheapest model costs well under a cent, and rounding
     # those to zero would make small runs free.
@@ -49,6 +49,7 @@ def record_usage(
     output_tokens,
     cost_usd=None,
     conversation_id=None,
+    cached_input_tokens=0,
 ):
     """Record one run's usage as an append-only UsageEvent.
 
@@ -59,6 +60,9 @@ def record_usage(
     cost_usd is the caller's computed cost for the run. When it is absent (the
     model had no pricing), the cost is estimated at the fallback rate rather
     than stored as zero — a run we couldn't price still consumed allowance.
+
+    cached_input_tokens is how many of the input tokens the provider served
+    from its prompt cache; cost_usd already prices them at the cached rate.
     """
     if not input_tokens and not output_tokens:
         return None
@@ -74,6 +78,7 @@ def record_usage(
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         total_tokens=input_tokens + output_tokens,
+        cached_input_tokens=int(cached_input_tokens or 0),
         cost_usd=cost,
         conversation_id=conversation_id,
     )
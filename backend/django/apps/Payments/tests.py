@@ -215,6 +215,13 @@ class RecordUsageTests(APITestCase):
         self.assertEqual(event.conversation_id, 7)
         self.assertEqual(UsageEvent.objects.count(), 1)
 
+    def test_records_cached_input_tokens(self):
+        event = record_usage(
+            self.user, 'gpt-5.6-terra', 1000, 200, cost_usd=0.004, cached_input_tokens=600
+        )
+        self.assertEqual(event.cached_input_tokens, 600)
+        self.assertEqual(record_usage(self.user, 'gpt-5.6-terra', 10, 1).cached_input_tokens, 0)
+
     def test_skips_when_usage_absent(self):
         # Absent usage means unknown, never free: no zero-token rows.
         self.assertIsNone(record_usage(self.user, 'gpt-5.6-terra', None, None))
@@ -247,6 +247,9 @@ CORS_ALLOWED_ORIGINS = os.environ.get(
     'http://localhost:5173,http://127.0.0.1:5173'
 ).split(',')
 CORS_ALLOW_CREDENTIALS = True
+# Binary preview frames carry their navigation state in a response header
+# (Build/services/preview_frames.py), which cross-origin clients must read.
+CORS_EXPOSE_HEADERS = ['X-Preview-State']
 
 CSRF_TRUSTED_ORIGINS = os.environ.get(
     'DJANGO_CSRF_TRUSTED_ORIGINS',
@@ -398,6 +401,38 @@ PROJECTS_ROOT = os.path.expanduser(
     os.environ.get('PROJECTS_ROOT', _DEFAULT_PROJECTS_ROOT)
 )
 
+# Codec for the content-addressed blobs behind the Build.ProjectFile mirror
+# (see Build/services/file_blobs.py): 'zlib', 'zstd' (needs the optional
+# zstandard package; falls back to zlib without it) or '' to store raw. Each
+# blob records its own codec, so changing this only affects new blobs.
+PROJECT_FILE_BLOB_COMPRESSION = os.environ.get('PROJECT_FILE_BLOB_COMPRESSION', 'zlib').strip().lower()
+
+# How VersionControlService commits (checkpoints before agent runs, commits
+# after file changes): 'pygit2' runs git in-process through libgit2,
+# 'subprocess' shells out to the git CLI, 'auto' picks pygit2 when it is
+# installed (the Docker image installs it). See Build/services/git_backend.py.
+IMAGI_GIT_BACKEND = os.environ.get('IMAGI_GIT_BACKEND', 'auto').strip().lower()
+
+# Port ranges the preview dev servers and preview browsers lease from (see
+# Build/services/port_leases.py), as 'low-high'. Each live preview holds one
+# port of each kind, so a range's size is how many previews this host can
+# run at once.
+IMAGI_PREVIEW_PORT_RANGES = {
+    kind: tuple(int(bound) for bound in os.environ.get(env, default).split('-', 1))
+    for kind, env, default in (
+        ('backend', 'PREVIEW_BACKEND_PORTS', '8080-8999'),
+        ('frontend', 'PREVIEW_FRONTEND_PORTS', '5174-5999'),
+        ('cdp', 'PREVIEW_CDP_PORTS', '9300-9999'),
+    )
+}
+
+# Idle pre-booted preview runtimes (Django and Vite) each worker process keeps
+# per kind, so a preview start binds one to the project instead of booting a
+# dev server from nothing (see Build/services/preview_pool.py). Each idle
+# runtime is a process held by every worker, so the pool is opt-in: 0 (the
+# default) turns it off.
+IMAGI_PREVIEW_POOL_SIZE = int(os.environ.get('IMAGI_PREVIEW_POOL_SIZE', '0'))
+
 # Shared, content-addressed store of installed frontend dependencies. Every
 # generated project ships the same package.json, so instead of installing a
 # private node_modules per project (slow, and re-run on every production
@@ -428,9 +463,50 @@ FRONTEND_DEP_STORE_ROOT = os.path.expanduser(
 BROWSER_PREVIEW_EXECUTABLE = os.environ.get('BROWSER_PREVIEW_EXECUTABLE', '')
 
 # Preview sessions (browser + dev servers) idle longer than this many seconds
-# are shut down opportunistically when another preview starts. 0 disables.
+# are shut down by each worker's background reaper (see
+# Build/services/preview_sessions.py). 0 disables.
 BROWSER_PREVIEW_IDLE_TIMEOUT = int(os.environ.get('BROWSER_PREVIEW_IDLE_TIMEOUT', '1800'))
 
+# When the host's memory use passes this percentage, the reaper shuts down
+# the least recently used previews first until it is back under. 0 disables.
+BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT = int(os.environ.get('BROWSER_PREVIEW_MEMORY_PRESSURE_PERCENT', '90'))
+
+# Host every preview in one shared Chromium, each project in an isolated
+# browser context, instead of a Chromium process per project (see
+# Build/services/shared_browser.py). A context costs a renderer, not a
+# browser, so a host serves several times more previews at once. When the
+# shared browser's memory passes the budget (MB, 0 for none), the least
+# recently active idle previews are closed to make room for new ones.
+BROWSER_PREVIEW_SHARED = os.environ.get('BROWSER_PREVIEW_SHARED', 'False').lower() in ('true', '1', 'yes')
+BROWSER_PREVIEW_MEMORY_BUDGET_MB = int(os.environ.get('BROWSER_PREVIEW_MEMORY_BUDGET_MB', '2048'))
+
+# Agent runs execute on a scheduler thread per worker, detached from the
+# client's stream, and append their events to a log the streams tail (see
+# Build/services/agent_runs.py). Finished logs are kept this many seconds so
+# a client that lost its connection can still replay the end of a run.
+AGENT_RUN_LOG_ROOT = os.environ.get('AGENT_RUN_LOG_ROOT', '') or os.path.join(PROJECTS_ROOT, '.agent_runs')
+AGENT_RUN_LOG_RETENTION = int(os.environ.get('AGENT_RUN_LOG_RETENTION', '3600'))
+
+# Agent runs wait in a host-wide queue for a slot (see
+# Build/services/run_queue.py): at most AGENT_RUN_MAX_CONCURRENT on the host,
+# AGENT_RUN_MAX_CONCURRENT_PER_USER per user and, per model, the limits in
+# AGENT_RUN_MAX_CONCURRENT_PER_MODEL ("model=n,model=n"; unlisted models are
+# bounded only by the host). A user may have AGENT_RUN_MAX_QUEUED_PER_USER
+# runs waiting before new ones are refused. A run's slot is reclaimed once it
+# misses heartbeats for AGENT_RUN_LEASE_TTL seconds.
+AGENT_RUN_MAX_CONCURRENT = int(os.environ.get('AGENT_RUN_MAX_CONCURRENT', '8'))
+AGENT_RUN_MAX_CONCURRENT_PER_USER = int(os.environ.get('AGENT_RUN_MAX_CONCURRENT_PER_USER', '3'))
+AGENT_RUN_MAX_CONCURRENT_PER_MODEL = {
+    model.strip(): int(limit)
+    for model, _sep, limit in (
+        entry.partition('=')
+        for entry in os.environ.get('AGENT_RUN_MAX_CONCURRENT_PER_MODEL', '').split(',')
+        if '=' in entry
+    )
+}
+AGENT_RUN_MAX_QUEUED_PER_USER = int(os.environ.get('AGENT_RUN_MAX_QUEUED_PER_USER', '10'))
+AGENT_RUN_LEASE_TTL = int(os.environ.get('AGENT_RUN_LEASE_TTL', '60'))
+
 
 # Marketing / Twilio
 # Public base URL Twilio uses for webhooks (delivery status callbacks and
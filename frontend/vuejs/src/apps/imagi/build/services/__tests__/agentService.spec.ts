@@ -147,6 +147,112 @@ describe('AgentService.streamAgent', () => {
     expect(result.response).toBe('partial')
   })
 
+  it('reports the run\'s place in the server queue before it starts', async () => {
+    vi.mocked(fetch).mockResolvedValue(
+      streamingResponse([
+        sse({ type: 'run', run_id: 'abc0' }),
+        sse({ type: 'queued', position: 2, eta_seconds: 240 }),
+        sse({ type: 'queued', position: 0, eta_seconds: 120 }),
+        sse({ type: 'start', conversation_id: 4 }),
+        sse({ type: 'done', response: 'Hi', conversation_id: 4 }),
+      ]) as any,
+    )
+
+    const queued: Array<[number, number]> = []
+    const result = await call({ onQueued: (p: number, eta: number) => queued.push([p, eta]) })
+
+    expect(queued).toEqual([[2, 240], [0, 120]])
+    expect(result.response).toBe('Hi')
+  })
+
+  it('resolves on done and delivers the title that follows it', async () => {
+    let releaseTitle!: () => void
+    const titleReady = new Promise<void>(resolve => { releaseTitle = resolve })
+    const encoder = new TextEncoder()
+    const chunks = [
+      sse({ type: 'start', conversation_id: 4 }),
+      sse({ type: 'done', response: 'Hi', conversation_id: 4 }),
+    ]
+    let i = 0
+    vi.mocked(fetch).mockResolvedValue({
+      ok: true,
+      body: {
+        getReader: () => ({
+          read: async () => {
+            if (i < chunks.length) return { value: encoder.encode(chunks[i++]), done: false }
+            if (i++ === chunks.length) {
+              await titleReady
+              return { value: encoder.encode(sse({ type: 'title', conversation_id: 4, title: 'Say Hi' })), done: false }
+            }
+            return { value: undefined, done: true }
+          },
+        }),
+      },
+    } as any)
+
+    const titles: string[] = []
+    const result = await call({ onTitle: (_id: number, title: string) => titles.push(title) })
+
+    expect(result.response).toBe('Hi')
+    expect(titles).toEqual([])
+    releaseTitle()
+    await vi.waitFor(() => expect(titles).toEqual(['Say Hi']))
+  })
+
+  it('resumes a dropped stream after the last event id it saw', async () => {
+    const framed = (id: number, event: object) => `id: ${id}\n${sse(event)}`
+    vi.mocked(fetch)
+      .mockResolvedValueOnce(
+        streamingResponse([
+          framed(0, { type: 'run', run_id: 'abc1' }),
+          framed(1, { type: 'delta', text: 'Hel' }),
+        ]) as any,
+      )
+      .mockResolvedValueOnce(
+        streamingResponse([
+          framed(2, { type: 'delta', text: 'lo' }),
+          framed(3, { type: 'done', response: 'Hello', conversation_id: 4 }),
+        ]) as any,
+      )
+
+    const deltas: string[] = []
+    const result = await call({ onDelta: (t: string) => deltas.push(t) })
+
+    expect(deltas).toEqual(['Hel', 'lo'])
+    expect(result.response).toBe('Hello')
+    const [url, init] = vi.mocked(fetch).mock.calls[1]
+    expect(url).toBe('/api/v1/agents/runs/abc1/stream/')
+    expect((init as any).headers['Last-Event-ID']).toBe('1')
+  })
+
+  it('stops the run on the backend when the caller aborts', async () => {
+    const controller = new AbortController()
+    vi.mocked(fetch).mockResolvedValue({
+      ok: true,
+      body: {
+        getReader: () => {
+          let sent = false
+          return {
+            read: async () => {
+              if (!sent) {
+                sent = true
+                return { value: new TextEncoder().encode(sse({ type: 'run', run_id: 'abc2' })), done: false }
+              }
+              controller.abort()
+              throw new DOMException('Aborted', 'AbortError')
+            },
+          }
+        },
+      },
+    } as any)
+    apiPost.mockResolvedValue({ data: {} })
+
+    await expect(
+      AgentService.streamAgent('13', { prompt: 'hi', model: 'gpt-5.6-sol' }, {}, controller.signal),
+    ).rejects.toThrow('Aborted')
+    expect(apiPost).toHaveBeenCalledWith('/v1/agents/runs/abc2/cancel/')
+  })
+
   it('surfaces a pre-stream error body with its HTTP status', async () => {
     vi.mocked(fetch).mockResolvedValue({
       ok: false,
@@ -0,0 +1,78 @@
+import { describe, it, expect, vi, beforeEach } from 'vitest'
+import { PreviewService, PreviewNotRunningError } from '../previewService'
+
+const { apiGet, apiPost } = vi.hoisted(() => ({ apiGet: vi.fn(), apiPost: vi.fn() }))
+
+vi.mock('@/shared/services/api', () => ({
+  default: { get: apiGet, post: apiPost },
+  getAuthToken: () => 'test-token',
+}))
+
+const bytes = (...values: number[]) => new Uint8Array(values).buffer
+
+function binaryResponse(state: object, data: ArrayBuffer, contentType = 'image/jpeg', status = 200) {
+  return {
+    status,
+    data,
+    headers: { 'x-preview-state': JSON.stringify(state), 'content-type': contentType },
+  }
+}
+
+describe('PreviewService binary frames', () => {
+  beforeEach(() => {
+    apiGet.mockReset()
+    apiPost.mockReset()
+  })
+
+  it('asks for JPEG and returns the body as the frame image', async () => {
+    apiGet.mockResolvedValue(binaryResponse({ path: '/about', etag: 'e1' }, bytes(1, 2, 3)))
+
+    const f = await PreviewService.frame('7', 'e0')
+
+    expect(apiGet.mock.calls[0][1]).toMatchObject({
+      params: { etag: 'e0' },
+      responseType: 'arraybuffer',
+      headers: { Accept: 'image/jpeg' },
+    })
+    expect(f.path).toBe('/about')
+    expect(f.etag).toBe('e1')
+    expect(f.image?.size).toBe(3)
+    expect(f.tiles).toBeUndefined()
+  })
+
+  it('reports a 204 as an unchanged frame', async () => {
+    apiGet.mockResolvedValue(binaryResponse({ etag: 'e1' }, bytes(), '', 204))
+
+    const f = await PreviewService.frame('7', 'e1')
+
+    expect(f.frame).toBeNull()
+    expect(f.image).toBeUndefined()
+  })
+
+  it('splits a tiles body by the lengths in the state header', async () => {
+    apiPost.mockResolvedValue(
+      binaryResponse(
+        { etag: 'e2', frame_size: [256, 128], tiles: [[0, 0, 128, 128, 2], [128, 0, 128, 128, 3]] },
+        bytes(1, 2, 3, 4, 5),
+        'application/x-imagi-tiles'
+      )
+    )
+
+    const f = await PreviewService.sendInput('7', [{ kind: 'mouse', type: 'mouseMoved' }], 'e1', {
+      tiles: true,
+    })
+
+    expect(apiPost.mock.calls[0][2].headers.Accept).toContain('application/x-imagi-tiles')
+    expect(f.tiles?.map(t => [t.x, t.y, t.width, t.height, t.image.size])).toEqual([
+      [0, 0, 128, 128, 2],
+      [128, 0, 128, 128, 3],
+    ])
+  })
+
+  it('reads JSON error bodies of binary requests', async () => {
+    const body = new TextEncoder().encode(JSON.stringify({ running: false, error: 'gone' }))
+    apiGet.mockRejectedValue({ response: { status: 409, data: body.buffer } })
+
+    await expect(PreviewService.frame('7')).rejects.toBeInstanceOf(PreviewNotRunningError)
+  })
+})
@@ -22,6 +22,10 @@ import { ModelsService } from '@/apps/imagi/build/services/modelsService'
  */
 /** Events the agent stream emits, in the order a run produces them. */
 export interface AgentStreamHandlers {
+  /** The run is waiting for a slot on the server: position runs are ahead
+   *  of it, and it expects to start in about etaSeconds. Fires whenever its
+   *  place in line changes, before onStart. */
+  onQueued?: (position: number, etaSeconds: number) => void
   /** info identifies the persisted user message this run started from and
    *  the pre-run checkpoint commit it can be restored to. */
   onStart?: (conversationId: number, info?: { userMessageId?: number; checkpoint?: string }) => void
@@ -113,7 +117,7 @@ interface PersistedMessageMetadata {
   tool_calls?: Array<{ name: string; args?: Record<string, string> }>
   files_changed?: string[]
   plan?: AgentPlanStep[]
-  usage?: { input_tokens?: number; output_tokens?: number; cost_usd?: number }
+  usage?: { input_tokens?: number; output_tokens?: number; cached_input_tokens?: number; cost_usd?: number }
   /** Subagents the lead dispatched during this reply (id + title refs) */
   dispatched_tasks?: Array<{ conversation_id?: number; title?: string }>
   /** Pre-run project snapshot, stamped on user messages only */
@@ -134,6 +138,11 @@ export interface ConversationMessageDto {
   checkpoint?: string
 }
 
+// A dropped agent stream is resumed this many times, waiting a little longer
+// before each attempt, before the run is reported as cut off.
+const STREAM_RESUME_ATTEMPTS = 5
+const STREAM_RESUME_DELAY_MS = 1000
+
 export const AgentService = {
   /**
    * Run the agent, surfacing output as it arrives.
@@ -212,9 +221,6 @@ export const AgentService = {
       )
     }
 
-    const reader = response.body.getReader()
-    const decoder = new TextDecoder()
-    let buffer = ''
     let done: AgentResponse | null = null
     let streamError = ''
     let streamErrorCode: string | undefined
@@ -222,12 +228,22 @@ export const AgentService = {
     const toolCalls: string[] = []
     let plan: AgentPlanStep[] = []
     let conversationId: number | undefined
+    // The run outlives this stream: its id and the last event id seen are
+    // what resuming it (or stopping it) takes.
+    let runId: string | undefined
+    let lastEventId: string | undefined
     // Tasks already handed to onTaskDispatch, so the 'done' payload's repeat
     // of them cannot start the same background run twice.
     const dispatchedIds = new Set<number>()
 
     const handleEvent = (event: any) => {
       switch (event.type) {
+        case 'run':
+          runId = event.run_id
+          break
+        case 'queued':
+          handlers.onQueued?.(event.position, event.eta_seconds)
+          break
         case 'start':
           conversationId = event.conversation_id
           handlers.onStart?.(event.conversation_id, {
@@ -290,23 +306,68 @@ export const AgentService = {
       }
     }
 
-    while (true) {
-      const { value, done: finished } = await reader.read()
-      if (finished) break
-      buffer += decoder.decode(value, { stream: true })
-
-      // SSE frames are separated by a blank line; the last chunk may be partial.
-      const frames = buffer.split('\n\n')
-      buffer = frames.pop() ?? ''
-      for (const frame of frames) {
-        const line = frame.split('\n').find(l => l.startsWith('data: '))
-        if (!line) continue
-        try {
-          handleEvent(JSON.parse(line.slice(6)))
-        } catch {
-          console.warn('Skipping malformed agent stream frame')
+    const consume = async (body: ReadableStream<Uint8Array>) => {
+      const reader = body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      const readChunk = async () => {
+        const { value, done: finished } = await reader.read()
+        if (finished) return false
+        buffer += decoder.decode(value, { stream: true })
+
+        // SSE frames are separated by a blank line; the last chunk may be partial.
+        const frames = buffer.split('\n\n')
+        buffer = frames.pop() ?? ''
+        for (const frame of frames) {
+          const lines = frame.split('\n')
+          const line = lines.find(l => l.startsWith('data: '))
+          if (!line) continue
+          try {
+            handleEvent(JSON.parse(line.slice(6)))
+          } catch {
+            console.warn('Skipping malformed agent stream frame')
+          }
+          const idLine = lines.find(l => l.startsWith('id: '))
+          if (idLine) lastEventId = idLine.slice(4)
+        }
+        return true
+      }
+      while (!done && await readChunk()) { /* until the run's result */ }
+      if (done) {
+        // What may follow the result (a new thread's title) is read in the
+        // background rather than holding the caller until it arrives.
+        void (async () => {
+          while (await readChunk()) { /* trailing events */ }
+        })().catch(() => {})
+      }
+    }
+
+    // Stop means stop the run, not just this stream: the backend keeps a
+    // run going when its client disconnects.
+    const stopRun = () => {
+      if (runId) {
+        AgentService.cancelRun(runId).catch(e => console.error('Failed to stop agent run', e))
+      }
+    }
+    signal?.addEventListener('abort', stopRun, { once: true })
+
+    try {
+      let body: ReadableStream<Uint8Array> | null = response.body
+      for (let attempt = 0; ; attempt++) {
+        if (body) {
+          try {
+            await consume(body)
+          } catch (e) {
+            // A dropped connection is resumable; a deliberate abort is not.
+            if (signal?.aborted || !runId) throw e
+          }
         }
+        if (done || streamError || signal?.aborted || !runId || attempt >= STREAM_RESUME_ATTEMPTS) break
+        await new Promise(resolve => setTimeout(resolve, STREAM_RESUME_DELAY_MS * (attempt + 1)))
+        body = await AgentService.resumeRunStream(runId, lastEventId, signal)
       }
+    } finally {
+      signal?.removeEventListener('abort', stopRun)
     }
 
     if (streamError) throw new AgentStreamError(streamError, { code: streamErrorCode })
@@ -324,6 +385,38 @@ export const AgentService = {
     }
   },
 
+  /**
+   * Reattach to a run whose stream dropped, replaying every event after
+   * lastEventId. Resolves null when the run cannot be resumed right now.
+   */
+  async resumeRunStream(
+    runId: string,
+    lastEventId?: string,
+    signal?: AbortSignal,
+  ): Promise<ReadableStream<Uint8Array> | null> {
+    const token = getAuthToken()
+    try {
+      const response = await fetch(`/api/v1/agents/runs/${runId}/stream/`, {
+        method: 'GET',
+        signal,
+        headers: {
+          'Accept': 'text/event-stream',
+          ...(token ? { Authorization: `Token ${token}` } : {}),
+          ...(lastEventId != null ? { 'Last-Event-ID': lastEventId } : {}),
+        },
+      })
+      return response.ok && response.body ? response.body : null
+    } catch (e) {
+      if (signal?.aborted) throw e
+      return null
+    }
+  },
+
+  /** Stop a run on the backend, whichever worker is executing it. */
+  async cancelRun(runId: string): Promise<void> {
+    await api.post(`/v1/agents/runs/${runId}/cancel/`)
+  },
+
   formatError(error: any): string {
     return ModelsService.formatError(error);
   },
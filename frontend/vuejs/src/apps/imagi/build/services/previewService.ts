@@ -1,12 +1,13 @@
-import api from '@/shared/services/api'
+import api, { getAuthToken } from '@/shared/services/api'
 
 /**
  * Client for the browser-based project preview.
  *
  * The backend runs the project's dev servers plus a headless Chromium on its
- * own host and exposes it through these endpoints: the workspace polls JPEG
- * frames and forwards input events, so the preview works the same whether
- * Imagi runs locally or in production.
+ * own host and exposes it through these endpoints: the workspace streams JPEG
+ * frames (polling them where streaming is unavailable) and forwards input
+ * events, so the preview works the same whether Imagi runs locally or in
+ * production.
  */
 
 /** One user-input event forwarded to the remote browser page. */
@@ -35,11 +36,26 @@ export interface PreviewConsoleError {
   ts: number
 }
 
+/** One changed square of the frame, in device pixels of `frame_size`. */
+export interface PreviewTile {
+  x: number
+  y: number
+  width: number
+  height: number
+  image: Blob
+}
+
 /** Snapshot of the remote page: navigation state plus (optionally) a frame. */
 export interface PreviewFrame {
   running?: boolean
   /** Base64 JPEG. Null when it matched the etag we already have. */
   frame?: string | null
+  /** Binary transport (frame/sendInput): the whole frame as a JPEG. */
+  image?: Blob
+  /** Binary transport with tiles: only these squares changed since the
+   *  etag the request passed — paint them over that frame. */
+  tiles?: PreviewTile[]
+  frame_size?: [number, number]
   etag?: string
   path?: string
   title?: string
@@ -75,6 +91,72 @@ export class PreviewNotRunningError extends Error {
   }
 }
 
+/** Callbacks for one open frame stream (see PreviewService.stream). */
+export interface PreviewStreamHandlers {
+  /** A repainted frame (base64 JPEG). */
+  onFrame?: (frame: string) => void
+  /** Navigation state and console errors, without a frame. */
+  onStatus?: (status: PreviewFrame) => void
+}
+
+/** Thrown when the server cannot stream frames (HTTP 501) — poll instead. */
+export class PreviewStreamUnsupportedError extends Error {
+  constructor(message = 'Frame streaming is not available.') {
+    super(message)
+    this.name = 'PreviewStreamUnsupportedError'
+  }
+}
+
+// Frames from frame() and sendInput() come back as binary (see the backend's
+// preview_frames): the JPEG as the body, everything else as JSON in a header.
+const FRAME_ACCEPT = 'image/jpeg'
+const TILES_ACCEPT = 'image/jpeg, application/x-imagi-tiles'
+const TILES_TYPE = 'application/x-imagi-tiles'
+
+/** Options for the frame-returning calls. */
+export interface PreviewFrameOptions {
+  /** The caller can paint tiles over the frame its etag names. */
+  tiles?: boolean
+}
+
+function binaryConfig(options?: PreviewFrameOptions) {
+  return {
+    responseType: 'arraybuffer' as const,
+    headers: { Accept: options?.tiles ? TILES_ACCEPT : FRAME_ACCEPT },
+  }
+}
+
+function binaryFrame(response: { status: number; data: ArrayBuffer; headers: any }): PreviewFrame {
+  const raw = response.headers?.['x-preview-state']
+  const state: PreviewFrame & { tiles?: any } = raw ? JSON.parse(raw) : {}
+  if (response.status === 204) return { ...state, frame: null }
+
+  const data = response.data
+  if (String(response.headers?.['content-type'] || '').startsWith(TILES_TYPE)) {
+    let offset = 0
+    const tiles = ((state.tiles || []) as number[][]).map(([x, y, width, height, length]) => {
+      const image = new Blob([data.slice(offset, offset + length)], { type: 'image/jpeg' })
+      offset += length
+      return { x, y, width, height, image }
+    })
+    return { ...state, tiles }
+  }
+  return { ...state, image: new Blob([data], { type: 'image/jpeg' }) }
+}
+
+// Error bodies of a binary request arrive as bytes too; rethrow reads JSON.
+function decodeErrorBody(error: any): any {
+  const data = error?.response?.data
+  if (data instanceof ArrayBuffer) {
+    try {
+      error.response.data = JSON.parse(new TextDecoder().decode(data))
+    } catch {
+      error.response.data = undefined
+    }
+  }
+  return error
+}
+
 // Starting can scaffold + npm-install a fresh project, which takes minutes.
 const START_TIMEOUT_MS = 600_000
 
@@ -120,14 +202,98 @@ export const PreviewService = {
   },
 
   /** Poll the latest frame; pass the previous etag to skip unchanged frames. */
-  async frame(projectId: string, etag?: string): Promise<PreviewFrame> {
+  async frame(
+    projectId: string,
+    etag?: string,
+    options?: PreviewFrameOptions
+  ): Promise<PreviewFrame> {
     try {
       const response = await api.get(`/v1/builder/${projectId}/preview/frame/`, {
         params: etag ? { etag } : undefined,
+        ...binaryConfig(options),
       })
-      return response.data
+      return binaryFrame(response)
     } catch (error) {
-      rethrow(error)
+      rethrow(decodeErrorBody(error))
+    }
+  },
+
+  /**
+   * Stream frames as the page repaints, until `signal` aborts or the server
+   * ends the stream. Resolves when the stream ends normally; rejects with
+   * PreviewNotRunningError when the session is gone and with
+   * PreviewStreamUnsupportedError when the server cannot stream (fall back
+   * to `frame()` polling). The stream follows the viewport it opened with;
+   * reopen it after a resize.
+   */
+  async stream(
+    projectId: string,
+    handlers: PreviewStreamHandlers,
+    signal?: AbortSignal
+  ): Promise<void> {
+    const token = getAuthToken()
+    const response = await fetch(`/api/v1/builder/${projectId}/preview/stream/`, {
+      signal,
+      headers: {
+        'Accept': 'text/event-stream',
+        ...(token ? { Authorization: `Token ${token}` } : {}),
+      },
+    })
+
+    if (!response.ok || !response.body) {
+      let detail = ''
+      try {
+        const body = await response.json()
+        detail = body?.error || body?.detail || ''
+      } catch { /* non-JSON body */ }
+      if (response.status === 409) throw new PreviewNotRunningError(detail || undefined)
+      // 404 too: a backend without the endpoint.
+      if (response.status === 501 || response.status === 404) {
+        throw new PreviewStreamUnsupportedError(detail || undefined)
+      }
+      throw new Error(detail || `Preview stream failed (${response.status})`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    const handleEvent = (event: any) => {
+      switch (event.type) {
+        case 'frame':
+          handlers.onFrame?.(event.frame)
+          break
+        case 'status':
+          handlers.onStatus?.(event)
+          break
+        case 'stopped':
+          throw new PreviewNotRunningError(event.error || undefined)
+        case 'error':
+          throw new Error(event.error || 'Preview stream failed')
+        // 'ping' only keeps the connection open.
+      }
+    }
+
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      // SSE frames are separated by a blank line; the last chunk may be partial.
+      const frames = buffer.split('\n\n')
+      buffer = frames.pop() ?? ''
+      for (const frame of frames) {
+        const line = frame.split('\n').find(l => l.startsWith('data: '))
+        if (!line) continue
+        let event: any
+        try {
+          event = JSON.parse(line.slice(6))
+        } catch {
+          console.warn('Skipping malformed preview stream frame')
+          continue
+        }
+        handleEvent(event)
+      }
     }
   },
 
@@ -135,16 +301,18 @@ export const PreviewService = {
   async sendInput(
     projectId: string,
     events: PreviewInputEvent[],
-    etag?: string
+    etag?: string,
+    options?: PreviewFrameOptions
   ): Promise<PreviewFrame> {
     try {
-      const response = await api.post(`/v1/builder/${projectId}/preview/input/`, {
-        events,
-        etag,
-      })
-      return response.data
+      const response = await api.post(
+        `/v1/builder/${projectId}/preview/input/`,
+        { events, etag },
+        binaryConfig(options)
+      )
+      return binaryFrame(response)
     } catch (error) {
-      rethrow(error)
+      rethrow(decodeErrorBody(error))
     }
   },
 
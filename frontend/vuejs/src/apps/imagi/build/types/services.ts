@@ -235,6 +235,10 @@ export interface ConversationDto {
   is_running: boolean;
   /** Tokens used across the conversation; null when never captured (unknown, not free) */
   total_tokens: number | null;
+  /** Dollars metered for the conversation's runs so far */
+  cost_usd?: number;
+  /** Share of the input tokens served from the provider's prompt cache; null before any run */
+  cache_hit_rate?: number | null;
   /** A dispatched task's brief, waiting for its run to fire (cleared server-side
    *  when the run starts). Empty for everything else. */
   queued_prompt?: string;
@@ -336,7 +340,7 @@ export interface AgentResponse {
   /** The agent's working plan for multi-step tasks */
   plan?: AgentPlanStep[];
   /** Token usage for the run; omitted when the backend could not track it */
-  usage?: { input_tokens?: number; output_tokens?: number; cost_usd?: number };
+  usage?: { input_tokens?: number; output_tokens?: number; cached_input_tokens?: number; cost_usd?: number };
   /** Background tasks the lead agent staged during this run (dispatch_task) */
   dispatched_tasks?: DispatchedTaskDto[];
   single_message?: boolean;